@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+batch_scheduler.py – multi-listing batch runs on a SQLite work queue
+
+run_test_eval.py and compare_deduplication_methods.py walk their folders one
+after another and block on each.  Here every listing is a job in a SQLite
+queue served by N worker processes:
+
+    queue       jobs(listing, kind, path, images, cost, status, attempts,
+                worker, timings, result JSON); WAL mode, claims are atomic
+                (BEGIN IMMEDIATE), so any number of processes can serve it
+    packing     jobs are claimed largest-cost first (LPT): big listings start
+                early, small ones fill the tail, so workers finish together.
+                cost = images (adjacent scan) or images² / 2 (full scan)
+    workers     spawned processes that import the engine once and keep it
+                (and the CLIP model) warm across jobs; each gets
+                cpu_count / workers Phase 1 threads (per-listing parallelism)
+    checkpoint  each listing's result is committed when it finishes; rerun
+                the same command after a crash and finished listings are
+                skipped, interrupted ones requeued.  A worker that dies is
+                replaced and its listing retried (up to --max-attempts); the
+                scheduler heartbeats its workers' jobs, so a second scheduler
+                on the same queue only requeues jobs whose heartbeat stopped.
+                Workers that keep dying before claiming a job (broken warm-up)
+                are not respawned past MAX_START_FAILURES in a row
+    throughput  listings / min and images / min while running and at the end
+
+Job kinds:
+    eval      run_test_eval.process_folder (drift-fix engine) → testeval.md
+    compare   MTB + CNN paths of compare_deduplication_methods → comparison report
+
+Usage:
+    python batch_scheduler.py eval --root . --folders 1 2 3 4 5 --workers 4
+    python batch_scheduler.py compare --root images --workers 6 --db compare_queue.sqlite
+    python batch_scheduler.py status --db batch_queue.sqlite
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import multiprocessing as mp
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from telemetry import queue_depth
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = "batch_queue.sqlite"
+HEARTBEAT_S = 10.0               # scheduler refreshes its running jobs this often
+LEASE_S = 120.0                  # running job without a heartbeat this long → requeued
+MAX_START_FAILURES = 3           # consecutive worker deaths without a claimed job
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    listing   TEXT NOT NULL,
+    kind      TEXT NOT NULL,
+    path      TEXT NOT NULL,
+    images    INTEGER NOT NULL,
+    cost      REAL NOT NULL,
+    status    TEXT NOT NULL DEFAULT 'pending',     -- pending | running | done | failed
+    attempts  INTEGER NOT NULL DEFAULT 0,
+    worker    TEXT,
+    started   REAL,
+    heartbeat REAL,
+    finished  REAL,
+    seconds   REAL,
+    result    TEXT,
+    error     TEXT,
+    PRIMARY KEY (kind, listing)
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (kind, status, cost);
+"""
+
+
+def _json_default(o: Any) -> Any:
+    if hasattr(o, "item"):                           # numpy scalars
+        return o.item()
+    if isinstance(o, (set, frozenset)):
+        return sorted(o)
+    if isinstance(o, Path):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    raise TypeError(f"Not JSON serialisable: {type(o).__name__}")
+
+
+# ─── queue ────────────────────────────────────────────────────────────────────
+class JobQueue:
+    """SQLite-backed job table; one connection per process (callers serialise threads)."""
+
+    def __init__(self, db_path: str = DEFAULT_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        if "heartbeat" not in {r[1] for r in self.conn.execute("PRAGMA table_info(jobs)")}:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")      # queues from older runs
+
+    def add(self, kind: str, listing: str, path: str, images: int, cost: float) -> bool:
+        """Enqueue a listing; False if it is already queued (kept as is, for resuming)."""
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO jobs (listing, kind, path, images, cost) VALUES (?, ?, ?, ?, ?)",
+            (listing, kind, path, images, cost))
+        return cur.rowcount == 1
+
+    def claim(self, kind: str, worker: str, max_attempts: int) -> Optional[Dict[str, Any]]:
+        """Atomically take the costliest pending job."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT listing, path, images, attempts FROM jobs "
+                "WHERE kind = ? AND status = 'pending' AND attempts < ? "
+                "ORDER BY cost DESC, listing LIMIT 1", (kind, max_attempts)).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started = ?, heartbeat = started, "
+                "attempts = attempts + 1 WHERE kind = ? AND listing = ?", (worker, time.time(), kind, row[0]))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return {"listing": row[0], "path": row[1], "images": row[2], "attempts": row[3] + 1}
+
+    def complete(self, kind: str, listing: str, result: Any, seconds: float) -> None:
+        self.conn.execute(
+            "UPDATE jobs SET status = 'done', finished = ?, seconds = ?, result = ?, error = NULL "
+            "WHERE kind = ? AND listing = ?",
+            (time.time(), seconds, json.dumps(result, default=_json_default), kind, listing))
+
+    def fail(self, kind: str, listing: str, error: str, max_attempts: int) -> None:
+        self.conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "finished = ?, error = ? WHERE kind = ? AND listing = ?",
+            (max_attempts, time.time(), error, kind, listing))
+
+    def prune(self, kind: str, keep: Sequence[str]) -> int:
+        """Delete jobs of `kind` not in `keep` (left over from an older plan)."""
+        keep = set(keep)
+        stale = [(kind, r[0]) for r in self.conn.execute("SELECT listing FROM jobs WHERE kind = ?", (kind,))
+                 if r[0] not in keep]
+        self.conn.executemany("DELETE FROM jobs WHERE kind = ? AND listing = ?", stale)
+        return len(stale)
+
+    def requeue(self, kind: str, worker: Optional[str] = None) -> int:
+        """Running jobs (of one worker, or all) back to pending."""
+        sql = "UPDATE jobs SET status = 'pending', worker = NULL WHERE kind = ? AND status = 'running'"
+        args: tuple = (kind,)
+        if worker is not None:
+            sql += " AND worker = ?"
+            args += (worker,)
+        return self.conn.execute(sql, args).rowcount
+
+    def heartbeat(self, kind: str, workers: Sequence[str]) -> None:
+        """Mark the running jobs of `workers` as still alive."""
+        self.conn.executemany("UPDATE jobs SET heartbeat = ? WHERE kind = ? AND status = 'running' AND worker = ?",
+                              [(time.time(), kind, w) for w in workers])
+
+    def requeue_expired(self, kind: str, lease_s: float) -> int:
+        """Running jobs not heartbeaten (or, without heartbeats, claimed) for `lease_s` back to pending."""
+        return self.conn.execute(
+            "UPDATE jobs SET status = 'pending', worker = NULL WHERE kind = ? AND status = 'running' "
+            "AND COALESCE(heartbeat, started) < ?", (kind, time.time() - lease_s)).rowcount
+
+    def claimed_by(self, kind: str, worker: str) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE kind = ? AND worker = ?",
+                                 (kind, worker)).fetchone()[0]
+
+    def retry_failed(self, kind: str) -> int:
+        return self.conn.execute("UPDATE jobs SET status = 'pending', attempts = 0 "
+                                 "WHERE kind = ? AND status = 'failed'", (kind,)).rowcount
+
+    def counts(self, kind: str) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs WHERE kind = ? GROUP BY status", (kind,))
+        return {"pending": 0, "running": 0, "done": 0, "failed": 0, **dict(rows.fetchall())}
+
+    def throughput(self, kind: str, since: float) -> Dict[str, float]:
+        """Listings and images finished per minute since `since`."""
+        n, images = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(images), 0) FROM jobs "
+            "WHERE kind = ? AND status = 'done' AND finished >= ?", (kind, since)).fetchone()
+        minutes = max(time.time() - since, 1e-9) / 60.0
+        return {"listings": n, "images": images,
+                "listings_per_min": n / minutes, "images_per_min": images / minutes}
+
+    def results(self, kind: str) -> List[Dict[str, Any]]:
+        rows = self.conn.execute("SELECT result FROM jobs WHERE kind = ? AND status = 'done' "
+                                 "ORDER BY listing", (kind,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# ─── listing discovery ────────────────────────────────────────────────────────
+def discover_listings(root: str, names: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Sub-folders of `root` with processed/*.jpg (optionally only `names`)."""
+    base = Path(root)
+    candidates = [base / n for n in names] if names else sorted(p for p in base.iterdir() if p.is_dir())
+    out = []
+    for folder in candidates:
+        images = list((folder / "processed").glob("*.jpg")) if (folder / "processed").is_dir() else []
+        if images:
+            out.append({"listing": folder.name, "path": str(folder), "images": len(images)})
+        else:
+            logger.warning("No processed images in %s, skipping", folder)
+    return out
+
+
+def listing_cost(images: int, full_scan: bool) -> float:
+    return images * (images - 1) / 2.0 if full_scan else float(images)
+
+
+# ─── job kinds (run inside workers) ───────────────────────────────────────────
+def _warm_eval(options: Dict[str, Any]) -> Any:
+    import dedup_fixed_drift as dedupe
+    import run_test_eval
+    dedupe.MAX_WORKERS = options["threads"]
+    if dedupe.USE_CLIP:
+        dedupe._ensure_clip_model()
+    return run_test_eval
+
+
+def _run_eval(ctx: Any, job: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    result = ctx.process_folder(job["listing"], Path(job["path"]), full_scan=options["full_scan"],
+                                shard_root=options.get("shards"))
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+    return result
+
+
+def _warm_compare(options: Dict[str, Any]) -> Any:
+    import deduplication
+    from compare_deduplication_methods import DedupComparison
+    deduplication.MAX_WORKERS = options["threads"]
+    if deduplication.USE_CLIP:
+        deduplication._ensure_clip_model()
+    return DedupComparison(options["root"], options["output"], shard_root=options.get("shards"))
+
+
+def _run_compare(ctx: Any, job: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    folder = Path(job["path"])
+    images = sorted(str(p) for p in (folder / "processed").glob("*.jpg"))
+    info = {"path": folder, "uuid": folder.name, "processed_dir": folder / "processed",
+            "image_count": len(images), "images": images}
+    cnn = dataclasses.asdict(ctx.process_folder_cnn(info))
+    for cl in cnn["clusters"]:                       # tuple keys are not JSON
+        cl["similarities"] = [[a, b, s] for (a, b), s in cl["similarities"].items()]
+    return {"folder_name": folder.name, "image_count": len(images),
+            "mtb_results": ctx.process_folder_mtb(info), "cnn_results": cnn}
+
+
+JOB_KINDS: Dict[str, Dict[str, Callable[..., Any]]] = {
+    "eval": {"warm": _warm_eval, "run": _run_eval},
+    "compare": {"warm": _warm_compare, "run": _run_compare},
+}
+
+
+def _worker_main(db_path: str, kind: str, worker: str, options: Dict[str, Any]) -> None:
+    logging.basicConfig(level=options.get("log_level", logging.WARNING),
+                        format=f"%(asctime)s [{worker}] [%(levelname)s] %(message)s", force=True)
+    queue = JobQueue(db_path)
+    ctx = JOB_KINDS[kind]["warm"](options)
+    run = JOB_KINDS[kind]["run"]
+    while True:
+        job = queue.claim(kind, worker, options["max_attempts"])
+        if job is None:
+            break
+        t0 = time.perf_counter()
+        try:
+            result = run(ctx, job, options)
+            queue.complete(kind, job["listing"], result, time.perf_counter() - t0)
+        except Exception as e:
+            logger.error("Listing %s failed (attempt %d): %s", job["listing"], job["attempts"], e)
+            queue.fail(kind, job["listing"], str(e), options["max_attempts"])
+    queue.close()
+
+
+# ─── scheduler ────────────────────────────────────────────────────────────────
+def run_batch(kind: str, listings: Sequence[Dict[str, Any]], db_path: str = DEFAULT_DB,
+              workers: int = 4, options: Optional[Dict[str, Any]] = None,
+              report_every: float = 30.0) -> Dict[str, Any]:
+    """Enqueue `listings`, serve them with `workers` processes, return counts and throughput."""
+    options = dict(options or {})
+    options.setdefault("full_scan", False)
+    options.setdefault("max_attempts", 2)
+    options.setdefault("threads", max(1, (os.cpu_count() or 1) // max(1, workers)))
+
+    queue = JobQueue(db_path)
+    requeued = queue.requeue_expired(kind, LEASE_S)  # left running by a crashed run, not a live one
+    added = sum(queue.add(kind, l["listing"], l["path"], l["images"],
+                          listing_cost(l["images"], options["full_scan"])) for l in listings)
+    logger.info("Queue %s: %d new listings, %d requeued, %s", db_path, added, requeued, queue.counts(kind))
+
+    ctx = mp.get_context("spawn")
+    procs: Dict[str, Any] = {}
+    serial = 0
+    start_failures = 0                               # consecutive deaths before claiming anything
+
+    def _spawn() -> None:
+        nonlocal serial
+        serial += 1
+        name = f"{socket.gethostname()}-{os.getpid()}-w{serial}"    # unique across schedulers
+        p = ctx.Process(target=_worker_main, args=(db_path, kind, name, options), name=name)
+        p.start()
+        procs[name] = p
+
+    since = time.time()
+    for _ in range(max(1, min(workers, queue.counts(kind)["pending"]))):
+        _spawn()
+    last_report = last_beat = time.monotonic()
+    while procs:
+        time.sleep(1.0)
+        if time.monotonic() - last_beat >= HEARTBEAT_S:
+            last_beat = time.monotonic()
+            queue.heartbeat(kind, list(procs))
+        for name, p in list(procs.items()):
+            if p.is_alive():
+                continue
+            p.join()
+            del procs[name]
+            if p.exitcode != 0:
+                start_failures = 0 if queue.claimed_by(kind, name) else start_failures + 1
+                n = queue.requeue(kind, name)
+                logger.warning("Worker %s exited with %s; requeued %d listing(s)", name, p.exitcode, n)
+                # the job it held counts as an attempt; give up once it is exhausted
+                queue.conn.execute("UPDATE jobs SET status = 'failed' WHERE kind = ? AND status = 'pending' "
+                                   "AND attempts >= ?", (kind, options["max_attempts"]))
+                if start_failures >= MAX_START_FAILURES:
+                    logger.error("%d workers in a row died before claiming a listing; not respawning",
+                                 start_failures)
+                elif queue.counts(kind)["pending"]:
+                    _spawn()
+        if time.monotonic() - last_report >= report_every:
+            last_report = time.monotonic()
+            t = queue.throughput(kind, since)
+            counts = queue.counts(kind)
+            queue_depth("batch_pending").set(counts["pending"])
+            queue_depth("batch_running").set(counts["running"])
+            logger.info("%s | %.1f listings/min, %.0f images/min", counts,
+                        t["listings_per_min"], t["images_per_min"])
+
+    summary = {"counts": queue.counts(kind), "throughput": queue.throughput(kind, since)}
+    queue.close()
+    if start_failures >= MAX_START_FAILURES:
+        raise RuntimeError(f"{kind} workers fail during warm-up (see the worker logs); "
+                           f"{summary['counts']['pending']} listings left pending in {db_path}")
+    return summary
+
+
+def write_report(kind: str, db_path: str, options: Dict[str, Any]) -> None:
+    """Aggregate report from every checkpointed result in the queue."""
+    queue = JobQueue(db_path)
+    results = queue.results(kind)
+    queue.close()
+    if kind == "eval":
+        from run_test_eval import generate_markdown_report
+        generate_markdown_report(results, output_file=options["output"])
+        return
+
+    from compare_deduplication_methods import (CNNResults, DedupComparison, DuplicateCluster,
+                                               MTBResults, PairComparison)
+    for r in results:
+        m, c = r["mtb_results"], r["cnn_results"]
+        r["mtb_results"] = MTBResults(m["folder_name"], m["images"],
+                                      [PairComparison(**pc) for pc in m["comparisons"]], set(m["dropped_images"]))
+        r["cnn_results"] = CNNResults(c["folder_name"], c["images"],
+                                      [DuplicateCluster(cl["images"], cl["kept_image"],
+                                                        {(a, b): sim for a, b, sim in cl["similarities"]},
+                                                        cl["dropped_images"])
+                                       for cl in c["clusters"]], set(c["dropped_images"]))
+    DedupComparison(options["root"], options["output"]).generate_markdown_report(results)
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Run listings as jobs on a SQLite queue with N worker processes")
+    parser.add_argument("kind", choices=sorted(JOB_KINDS) + ["status"])
+    parser.add_argument("--root", default=".", help="Directory holding listing folders (each with processed/)")
+    parser.add_argument("--folders", nargs="+", default=None, help="Only these listing folders")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"Queue database (default: {DEFAULT_DB})")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=None, help="Phase 1 threads per worker")
+    parser.add_argument("--full-scan", action="store_true")
+    parser.add_argument("--shards", default=None, help="Feature-shard directory shared by all workers")
+    parser.add_argument("--max-attempts", type=int, default=2)
+    parser.add_argument("--retry-failed", action="store_true", help="Reset failed listings before running")
+    parser.add_argument("--output", default=None, help="Aggregate report (default per kind)")
+    parser.add_argument("--verbose", action="store_true", help="Worker logs at INFO")
+    args = parser.parse_args()
+
+    if args.kind == "status":
+        queue = JobQueue(args.db)
+        for kind in JOB_KINDS:
+            print(kind, queue.counts(kind))
+        queue.close()
+        return
+
+    options = {"full_scan": args.full_scan, "shards": args.shards, "max_attempts": args.max_attempts,
+               "root": args.root, "log_level": logging.INFO if args.verbose else logging.WARNING,
+               "output": args.output or ("testeval.md" if args.kind == "eval"
+                                         else "deduplication_comparison_report.md")}
+    if args.threads:
+        options["threads"] = args.threads
+    if args.retry_failed:
+        queue = JobQueue(args.db)
+        logger.info("Reset %d failed listings", queue.retry_failed(args.kind))
+        queue.close()
+
+    listings = discover_listings(args.root, args.folders)
+    summary = run_batch(args.kind, listings, args.db, args.workers, options)
+    t = summary["throughput"]
+    logger.info("Done: %s", summary["counts"])
+    logger.info("Throughput: %d listings, %d images → %.1f listings/min, %.0f images/min",
+                t["listings"], t["images"], t["listings_per_min"], t["images_per_min"])
+    write_report(args.kind, args.db, options)
+
+
+if __name__ == "__main__":
+    main()
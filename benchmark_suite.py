@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+benchmark_suite.py – synthetic listings with known duplicates, end-to-end engine benchmarks
+
+The only test data are the two photos-* folders and the hard-coded Windows
+paths in the engines' __main__ blocks, and nothing measures throughput.  This
+module builds listings whose duplicate structure is known and measures every
+engine on them:
+
+Generator (`generate_listing`)
+    Each listing is a run of clusters.  A cluster is one base image plus 0–4
+    variants of it, written next to each other (the sequential engines only
+    compare neighbours, like real bracket sets):
+        bracket   exposure ±1/±2 EV
+        crop      5–12 % margins cropped, resized back
+        rotate    ±0.5–3°
+        jpeg      re-encoded at quality 40–75
+        aerial    small affine drift (scale / shear / shift); these clusters are
+                  named DJI_* and tagged make=DJI so the engines apply their
+                  aerial policy
+    Bases come from `--seeds` images (each used once, as a random crop) and,
+    when there are none or too few, procedural scenes (gradients, rectangles,
+    lines, noise) that share no content.  Layout is run_test_eval's
+    <listing>/processed/*.jpg plus ground_truth.json (file → cluster, aerial
+    flag, transform).
+
+Runner (`run_case`)
+    Each engine × size case runs in a fresh spawned process (clean caches,
+    per-case peak RSS).  A two-image warm-up listing loads models first, so
+    the measured time is deduplication only.  Recorded per case:
+        images_per_s, pairs_per_s   (scheduled comparisons: n-1 sequential,
+                                     n(n-1)/2 full scan; sequential engines
+                                     skip pairs whose stack was already dropped)
+        peak_rss_mb
+        precision, recall           of the dropped images against ground
+                                     truth: a drop is correct while its cluster
+                                     still keeps another image; expected drops
+                                     = images − clusters
+        clusters_exact              share of clusters left with exactly one image
+        config_hash                 engine settings (result_store.config_hash)
+
+Baseline (`compare`)
+    Results are compared with a stored baseline JSON; a throughput drop or RSS
+    growth beyond tolerance, or lower precision / recall, is a regression and
+    the command exits 1.  There is no committed baseline: record one on the
+    reference machine with --update-baseline.
+
+Usage:
+    python benchmark_suite.py generate --out bench_data --sizes 10 100 1000 --seeds seeds/
+    python benchmark_suite.py run --engines standard drift_fix cascading --sizes 10 100 \\
+        --data bench_data --out bench_results.json --baseline benchmark_baseline.json
+    python benchmark_suite.py run --update-baseline            # on the reference machine
+    python benchmark_suite.py compare bench_results.json benchmark_baseline.json
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install opencv-python numpy    (+ each engine's own dependencies)
+"""
+
+from __future__ import annotations
+
+import importlib
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# engine key → (module, entry point, full_scan)
+BENCH_ENGINES: Dict[str, Tuple[str, str, bool]] = {
+    "standard": ("deduplication", "remove_near_duplicates", False),
+    "drift_fix": ("dedup_fixed_drift", "remove_near_duplicates", False),
+    "cascading": ("deduplication_cascading", "remove_near_duplicates", False),
+    "cluster": ("deduplicationcluster", "remove_near_duplicates_clustering", True),
+    "asift": ("deduplication_asift", "remove_near_duplicates", False),
+}
+# all-pairs and ASIFT cost grows too fast for the largest listings; --no-caps lifts this
+SIZE_CAPS = {"cluster": 250, "asift": 250}
+DEFAULT_SIZES = (10, 50, 100, 250, 500, 1000)
+DEFAULT_BASELINE = "benchmark_baseline.json"
+IMAGE_SIZE = (1600, 1067)                   # width, height of generated images
+VARIANT_KINDS = ("bracket", "crop", "rotate", "jpeg")
+DUP_CLUSTER_SHARE = 0.6                     # clusters that get variants
+AERIAL_SHARE = 0.15
+MAX_VARIANTS = 4
+
+# regression tolerances (relative for speed / memory, absolute for accuracy)
+SPEED_TOLERANCE = 0.15
+RSS_TOLERANCE = 0.20
+ACCURACY_TOLERANCE = 0.02
+
+
+# ─── synthetic listings ───────────────────────────────────────────────────────
+def _procedural_scene(rng: np.random.Generator, size: Tuple[int, int] = IMAGE_SIZE) -> np.ndarray:
+    """A random but structured BGR scene (no two share content)."""
+    w, h = size
+    ramp = np.linspace(0.0, 1.0, w, dtype=np.float32)[None, :, None]
+    c0, c1 = rng.uniform(30, 225, 3), rng.uniform(30, 225, 3)
+    img = np.broadcast_to(c0 + (c1 - c0) * ramp, (h, w, 3)).astype(np.uint8).copy()
+    for _ in range(int(rng.integers(6, 16))):
+        x0, y0 = int(rng.integers(0, w - 50)), int(rng.integers(0, h - 50))
+        x1, y1 = x0 + int(rng.integers(40, w // 2)), y0 + int(rng.integers(40, h // 2))
+        cv2.rectangle(img, (x0, y0), (min(x1, w - 1), min(y1, h - 1)),
+                      tuple(int(v) for v in rng.integers(0, 256, 3)), -1)
+    for _ in range(int(rng.integers(8, 25))):
+        p0 = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        p1 = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        cv2.line(img, p0, p1, tuple(int(v) for v in rng.integers(0, 256, 3)), int(rng.integers(1, 6)))
+    for _ in range(int(rng.integers(3, 10))):
+        cv2.circle(img, (int(rng.integers(0, w)), int(rng.integers(0, h))), int(rng.integers(10, 120)),
+                   tuple(int(v) for v in rng.integers(0, 256, 3)), -1)
+    noise = rng.normal(0.0, 6.0, img.shape).astype(np.float32)
+    return np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+def _seed_base(seed: np.ndarray, rng: np.random.Generator, size: Tuple[int, int] = IMAGE_SIZE) -> np.ndarray:
+    """Random 70–100 % crop of a seed image at the listing resolution."""
+    h, w = seed.shape[:2]
+    s = rng.uniform(0.7, 1.0)
+    cw, ch = int(w * s), int(h * s)
+    x, y = int(rng.integers(0, w - cw + 1)), int(rng.integers(0, h - ch + 1))
+    return cv2.resize(seed[y:y + ch, x:x + cw], size, interpolation=cv2.INTER_AREA)
+
+
+def _variant(base: np.ndarray, kind: str, rng: np.random.Generator) -> Tuple[np.ndarray, str]:
+    """One near-duplicate of `base` and a short description of the transform."""
+    h, w = base.shape[:2]
+    if kind == "bracket":
+        ev = float(rng.choice([-2.0, -1.0, 1.0, 2.0]))
+        return np.clip(base.astype(np.float32) * (2.0 ** ev), 0, 255).astype(np.uint8), f"bracket {ev:+.0f} EV"
+    if kind == "crop":
+        m = rng.uniform(0.05, 0.12, 4)
+        x0, x1 = int(w * m[0]), w - int(w * m[1])
+        y0, y1 = int(h * m[2]), h - int(h * m[3])
+        return cv2.resize(base[y0:y1, x0:x1], (w, h), interpolation=cv2.INTER_LINEAR), "crop"
+    if kind == "rotate":
+        angle = float(rng.uniform(0.5, 3.0) * rng.choice([-1.0, 1.0]))
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        return cv2.warpAffine(base, M, (w, h), borderMode=cv2.BORDER_REFLECT), f"rotate {angle:+.1f}°"
+    if kind == "jpeg":
+        q = int(rng.integers(40, 76))
+        ok, buf = cv2.imencode(".jpg", base, [cv2.IMWRITE_JPEG_QUALITY, q])
+        return cv2.imdecode(buf, cv2.IMREAD_COLOR), f"jpeg q{q}"
+    if kind == "aerial":
+        s = rng.uniform(0.95, 1.05)
+        sh = rng.uniform(-0.04, 0.04, 2)
+        t = rng.uniform(-0.03, 0.03, 2) * (w, h)
+        M = np.array([[s, sh[0], t[0]], [sh[1], s, t[1]]], dtype=np.float64)
+        return cv2.warpAffine(base, M, (w, h), borderMode=cv2.BORDER_REFLECT), "aerial affine"
+    raise ValueError(f"Unknown variant kind '{kind}'")
+
+
+def _load_seeds(seed_dir: Optional[str]) -> List[np.ndarray]:
+    if not seed_dir:
+        return []
+    seeds = [cv2.imread(str(p), cv2.IMREAD_COLOR) for p in sorted(Path(seed_dir).iterdir())
+             if p.suffix.lower() in (".jpg", ".jpeg", ".png")]
+    return [s for s in seeds if s is not None]
+
+
+def generate_listing(out_dir: str, n_images: int, seed_dir: Optional[str] = None,
+                     rng_seed: int = 0) -> Dict[str, Any]:
+    """Write a listing of `n_images` with known clusters; returns (and saves) its ground truth."""
+    out = Path(out_dir)
+    truth_path = out / "ground_truth.json"
+    if truth_path.exists():
+        truth = json.loads(truth_path.read_text(encoding="utf-8"))
+        if truth.get("images") == n_images and truth.get("rng_seed") == rng_seed:
+            return truth                                 # already generated
+    processed = out / "processed"
+    processed.mkdir(parents=True, exist_ok=True)
+    for old in processed.glob("*.jpg"):
+        old.unlink()
+
+    rng = np.random.default_rng(rng_seed)
+    seeds = _load_seeds(seed_dir)
+    entries: Dict[str, Dict[str, Any]] = {}
+    cluster = 0
+    while len(entries) < n_images:
+        aerial = bool(rng.random() < AERIAL_SHARE)
+        room = n_images - len(entries)
+        variants = int(rng.integers(1, MAX_VARIANTS + 1)) if rng.random() < DUP_CLUSTER_SHARE else 0
+        variants = min(variants, room - 1)
+        base = _seed_base(seeds[cluster], rng) if cluster < len(seeds) else _procedural_scene(rng)
+        images = [(base, "base")]
+        for v in range(variants):
+            kind = "aerial" if aerial else VARIANT_KINDS[(cluster + v) % len(VARIANT_KINDS)]
+            images.append(_variant(base, kind, rng))
+        for k, (img, transform) in enumerate(images):
+            name = f"{len(entries):05d}_{'DJI_' if aerial else ''}c{cluster:04d}_{k}.jpg"
+            cv2.imwrite(str(processed / name), img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+            entries[name] = {"cluster": cluster, "aerial": aerial, "transform": transform}
+        cluster += 1
+
+    truth = {"images": n_images, "clusters": cluster, "rng_seed": rng_seed,
+             "seed_dir": seed_dir or "", "entries": entries}
+    truth_path.write_text(json.dumps(truth, indent=1), encoding="utf-8")
+    logger.info("Generated %s: %d images in %d clusters", out, n_images, cluster)
+    return truth
+
+
+def load_truth(listing_dir: str) -> Dict[str, Any]:
+    """ground_truth.json with entries keyed by absolute image path."""
+    truth = json.loads((Path(listing_dir) / "ground_truth.json").read_text(encoding="utf-8"))
+    processed = (Path(listing_dir) / "processed").resolve()
+    truth["entries"] = {str(processed / name): e for name, e in truth["entries"].items()}
+    return truth
+
+
+def listing_metadata(truth: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """metadata_dict for the engines (aerial clusters carry a DJI make)."""
+    return {p: ({"make": "DJI", "model": "FC3411"} if e["aerial"] else {"make": "Canon", "model": "EOS R5"})
+            for p, e in truth["entries"].items()}
+
+
+def score_against_truth(kept: Sequence[str], truth: Dict[str, Any]) -> Dict[str, float]:
+    """Precision / recall of the dropped images, and clusters left with exactly one image."""
+    entries = truth["entries"]
+    kept_set = set(kept)
+    size: Dict[int, int] = {}
+    kept_in: Dict[int, int] = {}
+    for p, e in entries.items():
+        size[e["cluster"]] = size.get(e["cluster"], 0) + 1
+        kept_in[e["cluster"]] = kept_in.get(e["cluster"], 0) + (p in kept_set)
+    dropped = len(entries) - len(kept_set & set(entries))
+    # a cluster may lose at most size-1 images; losing all of them makes one drop wrong
+    correct = sum(min(size[c] - kept_in[c], size[c] - 1) for c in size)
+    expected = len(entries) - len(size)
+    return {
+        "dropped": dropped,
+        "expected_drops": expected,
+        "precision": correct / dropped if dropped else 1.0,
+        "recall": correct / expected if expected else 1.0,
+        "clusters_exact": sum(kept_in[c] == 1 for c in size) / len(size),
+    }
+
+
+# ─── running engines ──────────────────────────────────────────────────────────
+@dataclass
+class CaseResult:
+    engine: str
+    size: int
+    seconds: float = 0.0
+    images_per_s: float = 0.0
+    pairs: int = 0
+    pairs_per_s: float = 0.0
+    peak_rss_mb: Optional[float] = None
+    precision: float = 0.0
+    recall: float = 0.0
+    clusters_exact: float = 0.0
+    dropped: int = 0
+    expected_drops: int = 0
+    config_hash: str = ""
+    skipped: str = ""
+    error: str = ""
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024   # bytes vs KiB
+    except ImportError:                            # Windows
+        from lazy_imports import lazy_module
+        psutil = lazy_module("psutil")
+        if not psutil:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", 0) / (1024 * 1024) or None
+
+
+def _call_engine(fn: Any, paths: List[str], metadata: Dict[str, Dict[str, Any]], full_scan: bool) -> List[str]:
+    groups = fn([[p] for p in paths], deduplication_flag=1, metadata_dict=metadata, full_scan=full_scan)
+    return [g[len(g) // 2] for g in groups]
+
+
+def run_case(engine: str, listing_dir: str, warmup_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Run one engine over one generated listing (call in a fresh process)."""
+    logging.getLogger().setLevel(logging.WARNING)      # per-pair INFO logging would dominate
+    module_name, entry, full_scan = BENCH_ENGINES[engine]
+    truth = load_truth(listing_dir)
+    paths = sorted(truth["entries"])
+    res = CaseResult(engine=engine, size=len(paths))
+    try:
+        module = importlib.import_module(module_name)
+        from result_store import config_hash, engine_config
+        res.config_hash = config_hash(engine_config(module))
+        fn = getattr(module, entry)
+        if warmup_dir:
+            wt = load_truth(warmup_dir)
+            _call_engine(fn, sorted(wt["entries"]), listing_metadata(wt), full_scan)
+        t0 = time.perf_counter()
+        kept = _call_engine(fn, paths, listing_metadata(truth), full_scan)
+        res.seconds = time.perf_counter() - t0
+    except Exception as e:
+        logger.error("%s on %s failed: %s", engine, listing_dir, e)
+        res.error = f"{type(e).__name__}: {e}"
+        return asdict(res)
+    n = len(paths)
+    res.pairs = n * (n - 1) // 2 if full_scan else n - 1
+    res.images_per_s = n / res.seconds if res.seconds else 0.0
+    res.pairs_per_s = res.pairs / res.seconds if res.seconds else 0.0
+    res.peak_rss_mb = _peak_rss_mb()
+    for k, v in score_against_truth(kept, truth).items():
+        setattr(res, k, v)
+    return asdict(res)
+
+
+def run_suite(engines: Sequence[str], sizes: Sequence[int], data_dir: str,
+              seed_dir: Optional[str] = None, caps: bool = True, warmup: bool = True) -> Dict[str, Any]:
+    """Generate missing listings and run every engine × size case in its own process."""
+    data = Path(data_dir)
+    warmup_dir = str(data / "warmup") if warmup else None
+    if warmup_dir:
+        generate_listing(warmup_dir, 2, seed_dir, rng_seed=10_000)
+    results: Dict[str, Any] = {}
+    ctx = get_context("spawn")
+    for size in sizes:
+        listing = str(data / f"listing_{size:05d}")
+        generate_listing(listing, size, seed_dir, rng_seed=size)
+        for engine in engines:
+            key = f"{engine}/{size}"
+            cap = SIZE_CAPS.get(engine)
+            if caps and cap is not None and size > cap:
+                results[key] = asdict(CaseResult(engine=engine, size=size,
+                                                 skipped=f"size cap {cap} (use --no-caps)"))
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                results[key] = pool.submit(run_case, engine, listing, warmup_dir).result()
+            r = results[key]
+            logger.info("%-10s %5d images: %s", engine, size, r["error"] or
+                        f"{r['images_per_s']:.1f} img/s, {r['pairs_per_s']:.1f} pairs/s, "
+                        f"P={r['precision']:.2f} R={r['recall']:.2f}")
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": host_info(), "results": results}
+
+
+def host_info() -> Dict[str, Any]:
+    return {"platform": platform.platform(), "machine": platform.machine(), "python": platform.python_version(),
+            "cpus": os.cpu_count(), "node": platform.node()}
+
+
+# ─── baseline ─────────────────────────────────────────────────────────────────
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], speed_tol: float = SPEED_TOLERANCE,
+            rss_tol: float = RSS_TOLERANCE, acc_tol: float = ACCURACY_TOLERANCE) -> Tuple[List[str], List[str]]:
+    """(regressions, notes) of `current` against `baseline`."""
+    regressions: List[str] = []
+    notes: List[str] = []
+    if current.get("host", {}).get("node") != baseline.get("host", {}).get("node"):
+        notes.append(f"baseline recorded on {baseline.get('host', {}).get('node', '?')}, "
+                     f"running on {current.get('host', {}).get('node', '?')}: speed comparisons are indicative")
+    for key, cur in sorted(current["results"].items()):
+        base = baseline.get("results", {}).get(key)
+        if cur.get("skipped"):
+            continue
+        if cur.get("error"):
+            regressions.append(f"{key}: failed ({cur['error']})")
+            continue
+        if base is None or base.get("skipped") or base.get("error"):
+            notes.append(f"{key}: no baseline")
+            continue
+        if base.get("config_hash") and cur.get("config_hash") != base["config_hash"]:
+            notes.append(f"{key}: engine config changed ({base['config_hash']} → {cur['config_hash']})")
+        for metric in ("images_per_s", "pairs_per_s"):
+            if base[metric] and cur[metric] < base[metric] * (1.0 - speed_tol):
+                regressions.append(f"{key}: {metric} {cur[metric]:.2f} < baseline {base[metric]:.2f} "
+                                   f"(-{100 * (1 - cur[metric] / base[metric]):.0f}%)")
+        if base.get("peak_rss_mb") and cur.get("peak_rss_mb") and \
+                cur["peak_rss_mb"] > base["peak_rss_mb"] * (1.0 + rss_tol):
+            regressions.append(f"{key}: peak RSS {cur['peak_rss_mb']:.0f} MB > baseline {base['peak_rss_mb']:.0f} MB")
+        for metric in ("precision", "recall"):
+            if cur[metric] < base[metric] - acc_tol:
+                regressions.append(f"{key}: {metric} {cur[metric]:.3f} < baseline {base[metric]:.3f}")
+    return regressions, notes
+
+
+def format_results(report: Dict[str, Any]) -> str:
+    lines = [f"{'case':<18}{'img/s':>9}{'pairs/s':>10}{'RSS MB':>9}{'prec':>7}{'recall':>8}{'exact':>7}"]
+    for key, r in sorted(report["results"].items(), key=lambda kv: (kv[1]["engine"], kv[1]["size"])):
+        if r.get("skipped") or r.get("error"):
+            lines.append(f"{key:<18}  {r.get('skipped') or 'ERROR ' + r['error']}")
+            continue
+        rss = f"{r['peak_rss_mb']:.0f}" if r.get("peak_rss_mb") else "-"
+        lines.append(f"{key:<18}{r['images_per_s']:>9.2f}{r['pairs_per_s']:>10.2f}{rss:>9}"
+                     f"{r['precision']:>7.2f}{r['recall']:>8.2f}{r['clusters_exact']:>7.2f}")
+    return "\n".join(lines)
+
+
+def _check_baseline(report: Dict[str, Any], baseline_path: str, args: Any) -> int:
+    if not Path(baseline_path).exists():
+        print(f"No baseline at {baseline_path}; record one with --update-baseline")
+        return 0
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    regressions, notes = compare(report, baseline, args.speed_tolerance, args.rss_tolerance,
+                                 args.accuracy_tolerance)
+    for n in notes:
+        print(f"note: {n}")
+    if regressions:
+        print(f"\n{len(regressions)} REGRESSION(S) against {baseline_path}:")
+        for r in regressions:
+            print(f"  ✗ {r}")
+        return 1
+    print(f"No regressions against {baseline_path}")
+    return 0
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Synthetic-listing benchmarks for the dedup engines")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    gen = sub.add_parser("generate", help="Write synthetic listings with ground truth")
+    gen.add_argument("--out", default="bench_data")
+    gen.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    gen.add_argument("--seeds", default=None, help="Directory of seed images (default: procedural scenes)")
+
+    run = sub.add_parser("run", help="Benchmark engines and compare with the baseline")
+    run.add_argument("--engines", nargs="+", choices=list(BENCH_ENGINES), default=list(BENCH_ENGINES))
+    run.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    run.add_argument("--data", default="bench_data", help="Generated listings (created as needed)")
+    run.add_argument("--seeds", default=None, help="Directory of seed images (default: procedural scenes)")
+    run.add_argument("--out", default="bench_results.json")
+    run.add_argument("--baseline", default=DEFAULT_BASELINE)
+    run.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    run.add_argument("--no-caps", action="store_true", help=f"Ignore per-engine size caps {SIZE_CAPS}")
+    run.add_argument("--no-warmup", action="store_true", help="Include model loading in the timed run")
+
+    cmp_ = sub.add_parser("compare", help="Compare a results file with a baseline")
+    cmp_.add_argument("results")
+    cmp_.add_argument("baseline", nargs="?", default=DEFAULT_BASELINE)
+
+    for p in (run, cmp_):
+        p.add_argument("--speed-tolerance", type=float, default=SPEED_TOLERANCE)
+        p.add_argument("--rss-tolerance", type=float, default=RSS_TOLERANCE)
+        p.add_argument("--accuracy-tolerance", type=float, default=ACCURACY_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.cmd == "generate":
+        for size in args.sizes:
+            generate_listing(str(Path(args.out) / f"listing_{size:05d}"), size, args.seeds, rng_seed=size)
+        return
+    if args.cmd == "compare":
+        report = json.loads(Path(args.results).read_text(encoding="utf-8"))
+        print(format_results(report))
+        sys.exit(_check_baseline(report, args.baseline, args))
+
+    report = run_suite(args.engines, args.sizes, args.data, args.seeds,
+                       caps=not args.no_caps, warmup=not args.no_warmup)
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(format_results(report))
+    print(f"Results written to {args.out}")
+    if args.update_baseline:
+        failed = [k for k, r in report["results"].items() if r.get("error")]
+        if failed:
+            print(f"Not updating the baseline: {len(failed)} case(s) failed ({', '.join(failed)})")
+            sys.exit(1)
+        # cases not run this time keep their previous baseline
+        if Path(args.baseline).exists():
+            old = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+            report["results"] = {**old.get("results", {}), **report["results"]}
+        Path(args.baseline).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline updated: {args.baseline}")
+        return
+    sys.exit(_check_baseline(report, args.baseline, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bounded_cache.py – memory-budgeted caches for images, features and pair metrics
+
+`@lru_cache(maxsize=512)` on `_load_gray` counts entries, not bytes: 512
+full-resolution grayscale frames is several GB.  `_metric_store` (and the
+cascade's `_pdq_store` / `_clip_store` / `_mtb_store`) were plain dicts that
+grew for the life of a batch run.  `BoundedCache` replaces both:
+
+    byte accounting   every value is sized on insert (numpy arrays, SSIMStats,
+                      dicts/tuples of them …) and the cache evicts until it is
+                      under `max_bytes` (and `max_items`, if set)
+    eviction          "lru" (default) or "lfu"; pinned keys are never evicted
+    scoping           pinned(keys) holds a listing's entries while it runs;
+                      release(keys) / release_paths() drops a finished listing
+                      from every cache at once, including pair entries
+    freshness         with track_files (the default for from_env caches), every
+                      entry remembers (mtime_ns, size) of the files its key
+                      names – a path, a memo key (path,) or a pair (a, b) –
+                      and an overwritten file reads as a miss, like the stat
+                      part of feature_shards.shard_key
+    counters          hits, misses, evictions, stale, current bytes / items
+
+The cache is a MutableMapping, so `key in store`, `store[key] = v`,
+`store.get(k)` and `store.pop(k, None)` keep working.  `memoize(cache)`
+replaces `functools.lru_cache` and keeps `cache_clear()` / `cache_info()`.
+
+Budgets come from the environment (per cache, in MB):
+    DEDUP_CACHE_GRAY_MB=256  DEDUP_CACHE_METRICS_MB=1024  DEDUP_CACHE_PAIRS_MB=32
+    DEDUP_CACHE_POLICY=lru|lfu
+Each engine module owns its caches, so a process that imports several
+engines holds one budget per engine.
+
+Usage:
+    _metric_store = BoundedCache.from_env("metrics")
+
+    @memoize(BoundedCache.from_env("gray"))
+    def _load_gray(path): ...
+
+    release_paths(listing_paths, *engine_caches(dedupe))   # after each listing
+    print(cache_report(dedupe))
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGETS_MB = {"gray": 256, "metrics": 1024, "pairs": 32}
+POLICIES = ("lru", "lfu")
+
+CacheInfo = namedtuple("CacheInfo", "name hits misses evictions items bytes max_bytes")
+
+_instances: List["weakref.ref[BoundedCache]"] = []     # for telemetry; mappings aren't hashable
+_instances_lock = threading.Lock()
+
+
+def file_signature(key: Hashable) -> tuple:
+    """(mtime_ns, size) of every string in `key` that names a file (None otherwise)."""
+    sig = []
+    for part in key if isinstance(key, tuple) else (key,):
+        if isinstance(part, str):
+            try:
+                st = os.stat(part)
+                sig.append((st.st_mtime_ns, st.st_size))
+            except (OSError, ValueError):
+                sig.append(None)                     # not a local file (S3 key, synthetic id)
+    return tuple(sig)
+
+
+def sizeof(obj: Any) -> int:
+    """Approximate retained bytes of a cached value."""
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):                     # ndarray, SSIMStats
+        return nbytes
+    if isinstance(obj, dict):
+        return 64 + sum(sizeof(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return 56 + sum(sizeof(v) for v in obj)
+    if isinstance(obj, (str, bytes)):
+        return 49 + len(obj)
+    return sys.getsizeof(obj)
+
+
+class BoundedCache(MutableMapping):
+    """Thread-safe, byte-budgeted LRU/LFU mapping with pinning and counters."""
+
+    def __init__(self, max_bytes: int, max_items: Optional[int] = None,
+                 policy: str = "lru", name: str = "", track_files: bool = False):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy '{policy}' (choose from {', '.join(POLICIES)})")
+        self.max_bytes = int(max_bytes)
+        self.max_items = max_items
+        self.policy = policy
+        self.name = name
+        self.track_files = track_files
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._size: Dict[Hashable, int] = {}
+        self._freq: Dict[Hashable, int] = {}
+        self._pins: Dict[Hashable, int] = {}
+        self._sigs: Dict[Hashable, tuple] = {}
+        self._lock = threading.RLock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.stale = 0
+        with _instances_lock:
+            _instances[:] = [r for r in _instances if r() is not None]
+            _instances.append(weakref.ref(self))
+
+    @classmethod
+    def from_env(cls, kind: str, name: Optional[str] = None, track_files: bool = True) -> "BoundedCache":
+        mb = float(os.environ.get(f"DEDUP_CACHE_{kind.upper()}_MB", DEFAULT_BUDGETS_MB[kind]))
+        return cls(int(mb * 1024 * 1024), policy=os.environ.get("DEDUP_CACHE_POLICY", "lru"),
+                   name=name or kind, track_files=track_files)
+
+    # ── freshness ─────────────────────────────────────────────────────────────
+    def _signature(self, key: Hashable) -> Optional[tuple]:
+        return file_signature(key) if self.track_files else None
+
+    def _drop_stale(self, key: Hashable, sig: Optional[tuple]) -> None:
+        """Under the lock: forget `key` if its files changed since it was stored."""
+        if sig is not None and key in self._data and self._sigs.get(key) != sig:
+            del self[key]
+            self.stale += 1
+            logger.debug("Cache %s: %s changed on disk, dropped", self.name, key)
+
+    # ── mapping protocol ──────────────────────────────────────────────────────
+    def __getitem__(self, key: Hashable) -> Any:
+        sig = self._signature(key)
+        with self._lock:
+            self._drop_stale(key, sig)
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self.hits += 1
+            self._touch(key)
+            return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self._store(key, value, self._signature(key))
+
+    def _store(self, key: Hashable, value: Any, sig: Optional[tuple]) -> None:
+        size = sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self.bytes -= self._size[key]
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._size[key] = size
+            self._freq[key] = self._freq.get(key, 0) + 1
+            if sig is not None:
+                self._sigs[key] = sig
+            self.bytes += size
+            self._evict()
+
+    def __delitem__(self, key: Hashable) -> None:
+        with self._lock:
+            del self._data[key]
+            self.bytes -= self._size.pop(key)
+            self._freq.pop(key, None)
+            self._sigs.pop(key, None)
+
+    def __contains__(self, key: object) -> bool:
+        if key not in self._data:                    # no hit/miss accounting
+            return False
+        sig = self._signature(key)
+        with self._lock:
+            self._drop_stale(key, sig)
+            return key in self._data
+
+    def __iter__(self) -> Iterator[Hashable]:
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size.clear()
+            self._freq.clear()
+            self._sigs.clear()
+            self.bytes = 0
+
+    # ── compute-on-miss ───────────────────────────────────────────────────────
+    def get_or_compute(self, key: Hashable, compute: Callable[[Hashable], Any]) -> Any:
+        """Cached value, or compute(key) stored and returned (computed outside the lock)."""
+        sig = self._signature(key)                   # taken before reading the files
+        with self._lock:
+            self._drop_stale(key, sig)
+            if key in self._data:
+                self.hits += 1
+                self._touch(key)
+                return self._data[key]
+            self.misses += 1
+        value = compute(key)
+        self._store(key, value, sig)
+        return value
+
+    # ── eviction ──────────────────────────────────────────────────────────────
+    def _touch(self, key: Hashable) -> None:
+        self._data.move_to_end(key)
+        self._freq[key] = self._freq.get(key, 0) + 1
+
+    def _victim(self) -> Optional[Hashable]:
+        candidates = (k for k in self._data if not self._pins.get(k))
+        if self.policy == "lru":
+            return next(candidates, None)            # OrderedDict: oldest first
+        return min(candidates, key=lambda k: self._freq.get(k, 0), default=None)
+
+    def _over(self) -> bool:
+        return self.bytes > self.max_bytes or (self.max_items is not None and len(self._data) > self.max_items)
+
+    def _evict(self) -> None:
+        while self._over():
+            key = self._victim()
+            if key is None:
+                logger.debug("Cache %s over budget with only pinned entries (%d bytes)", self.name, self.bytes)
+                return
+            del self[key]
+            self.evictions += 1
+
+    # ── scoping ───────────────────────────────────────────────────────────────
+    def pin(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for k in keys:
+                self._pins[k] = self._pins.get(k, 0) + 1
+
+    def unpin(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for k in keys:
+                n = self._pins.get(k, 0) - 1
+                if n > 0:
+                    self._pins[k] = n
+                else:
+                    self._pins.pop(k, None)
+            self._evict()
+
+    @contextmanager
+    def pinned(self, keys: Iterable[Hashable]) -> Iterator[None]:
+        """Keep `keys` resident (once inserted) for the duration of the block."""
+        keys = list(keys)
+        self.pin(keys)
+        try:
+            yield
+        finally:
+            self.unpin(keys)
+
+    def release(self, keys: Iterable[Hashable]) -> int:
+        """Drop `keys` (and their pins); returns bytes freed."""
+        freed = 0
+        with self._lock:
+            for k in keys:
+                self._pins.pop(k, None)
+                if k in self._data:
+                    freed += self._size[k]
+                    del self[k]
+        return freed
+
+    def release_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            return self.release([k for k in self._data if predicate(k)])
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.name, self.hits, self.misses, self.evictions,
+                         len(self._data), self.bytes, self.max_bytes)
+
+
+# ─── lru_cache replacement ────────────────────────────────────────────────────
+def memoize(cache: BoundedCache) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Positional-argument memoization into `cache` (key = args tuple)."""
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any) -> Any:
+            return cache.get_or_compute(args, lambda key: fn(*key))
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        wrapper.cache_info = cache.info
+        return wrapper
+    return decorator
+
+
+# ─── engine helpers ───────────────────────────────────────────────────────────
+def engine_caches(engine: Any) -> List[BoundedCache]:
+    """
+    Every BoundedCache an engine module holds (stores and memoized functions).
+
+    Attributes are looked up statically: a plain getattr on a `LazyModule`
+    proxy (torch, open_clip …) would import the module just to find out it
+    has no `.cache`, and fail outright where it isn't installed.
+    """
+    found: List[BoundedCache] = []
+    for value in vars(engine).values():
+        cache = value if isinstance(value, BoundedCache) else inspect.getattr_static(value, "cache", None)
+        if isinstance(cache, BoundedCache) and all(cache is not c for c in found):
+            found.append(cache)
+    return found
+
+
+def all_caches() -> List[BoundedCache]:
+    """Every live BoundedCache in the process, in creation order."""
+    with _instances_lock:
+        return [c for c in (r() for r in _instances) if c is not None]
+
+
+def release_paths(paths: Iterable[str], *caches: BoundedCache) -> int:
+    """
+    Drop everything cached for `paths`: path keys, memo keys (path,) and pair
+    keys that mention any of them.  Returns bytes freed.
+    """
+    paths = set(paths)
+
+    def _mentions(key: Hashable) -> bool:
+        if isinstance(key, tuple):
+            return any(isinstance(k, str) and k in paths for k in key)
+        return key in paths
+
+    freed = sum(c.release_where(_mentions) for c in caches)
+    logger.debug("Released %d paths (%.1f MB)", len(paths), freed / 1e6)
+    return freed
+
+
+def cache_report(engine: Any) -> str:
+    lines = ["| Cache | Items | MB | Budget MB | Hits | Misses | Evictions |",
+             "|-------|-------|----|-----------|------|--------|-----------|"]
+    for c in engine_caches(engine):
+        i = c.info()
+        lines.append(f"| {i.name} | {i.items} | {i.bytes / 1e6:.1f} | {i.max_bytes / 1e6:.0f} | "
+                     f"{i.hits} | {i.misses} | {i.evictions} |")
+    return "\n".join(lines)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+calibrate_cascade.py – data-driven stage 1 / 2 thresholds for the cascade
+
+deduplication_cascading.py exits early at stage 1 (PDQ distance ≥ reject ⇒ not
+a duplicate) and stage 2 (CLIP ≥ high ⇒ duplicate, CLIP < low ⇒ not), with
+hand-set values (PDQ_HD_CEIL, CLIP_HIGH_THRESHOLD = 85, CLIP_LOW_THRESHOLD = 70).
+This tool picks them from reference pairs instead:
+
+    reference   pair rows of a result store written by a full engine run
+                (deduplication / dedup_fixed_drift): PDQ distance, CLIP %,
+                aerial flag and the engine's decision.  With --labels, a JSON
+                lines / CSV file of (path_a, path_b, label) replaces the
+                engine's decision for the pairs it names
+    search      per class (regular, aerial), every stage-1 reject distance
+                over the observed values and, for each, the stage-2 (low,
+                high) pair that decides the most remaining pairs; kept only
+                if the pairs decided at stages 1–2 disagree with the
+                reference at most --max-disagreements times (or
+                --max-disagreement-rate of the class).  Among equally good
+                choices the one with fewer disagreements, then the more
+                conservative reject distance, wins.  CLIP cuts sit midway
+                between neighbouring observed values
+    output      a versioned JSON config (thresholds, per-class exit and
+                disagreement counts, the same for the current thresholds as
+                a baseline, and the source runs) that the cascade loads with
+                --cascade-config / $DEDUP_CASCADE_CONFIG
+
+Pairs that reach stages 3–4 are decided by SIFT and the composite exactly as
+before; only which pairs get there changes.  A class with fewer than
+--min-pairs reference pairs keeps the current thresholds.
+
+Usage:
+    python calibrate_cascade.py results --out cascade_thresholds.json
+    python calibrate_cascade.py results --engine dedup_fixed_drift --labels labels.csv --max-disagreement-rate 0.002
+    python deduplication_cascading.py --cascade-config cascade_thresholds.json
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install numpy
+    pip install pyarrow                # <-- only if the store is parquet / arrow
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from replay_decisions import REPLAYABLE_ENGINES
+from result_store import config_hash, read_table
+
+logger = logging.getLogger(__name__)
+
+CONFIG_VERSION = 1                     # deduplication_cascading.CASCADE_CONFIG_VERSION
+NO_REJECT_HD = 1000                    # above any distance, incl. 999 for a missing PDQ
+NO_ACCEPT_CLIP = 101.0                 # above any CLIP %
+DEFAULT_MIN_PAIRS = 50
+_COLUMNS = ["run_id", "engine", "ts", "path_a", "path_b", "pdq_hd", "clip", "aerial", "decision"]
+
+
+# ─── reference pairs ──────────────────────────────────────────────────────────
+def load_reference(root: str, engine: Optional[str] = None, run_id: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Pair rows of full-engine runs, the latest row per (path_a, path_b)."""
+    filters = {k: v for k, v in (("engine", engine), ("run_id", run_id)) if v}
+    cols = read_table(root, "pairs", columns=_COLUMNS, **filters)
+    keep = np.isin(cols["engine"], list(REPLAYABLE_ENGINES))
+    if not keep.all():
+        logger.info("Ignoring %d rows from non-reference engines", int((~keep).sum()))
+    cols = {k: v[keep] for k, v in cols.items()}
+    latest: Dict[Tuple[str, str], int] = {}
+    for i in np.argsort(cols["ts"], kind="stable"):
+        latest[(cols["path_a"][i], cols["path_b"][i])] = int(i)
+    idx = np.array(sorted(latest.values()), np.int64)
+    return {k: v[idx] for k, v in cols.items()}
+
+
+def load_labels(path: str) -> Dict[Tuple[str, str], bool]:
+    """(path_a, path_b) → is duplicate, from JSON lines or CSV with a `label` column."""
+    rows: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    truthy = {"1", "true", "yes", "dup", "duplicate"}
+    out: Dict[Tuple[str, str], bool] = {}
+    for r in rows:
+        label = r["label"]
+        out[(r["path_a"], r["path_b"])] = label if isinstance(label, bool) else str(label).strip().lower() in truthy
+    return out
+
+
+def apply_labels(ref: Dict[str, np.ndarray], labels: Dict[Tuple[str, str], bool]) -> int:
+    """Overwrite ref["decision"] where a label names the pair (either order); returns how many."""
+    hits = 0
+    for i, (a, b) in enumerate(zip(ref["path_a"], ref["path_b"])):
+        label = labels.get((a, b), labels.get((b, a)))
+        if label is not None:
+            ref["decision"][i] = label
+            hits += 1
+    if hits < len(labels):
+        logger.warning("%d labelled pairs have no reference metrics and are ignored", len(labels) - hits)
+    return hits
+
+
+# ─── evaluation / search ──────────────────────────────────────────────────────
+def evaluate(hd: np.ndarray, clip: np.ndarray, dup: np.ndarray,
+             pdq_reject: float, clip_high: float, clip_low: float) -> Dict[str, int]:
+    """Stage 1 / 2 exits and their disagreements with the reference under one setting."""
+    s1 = hd >= pdq_reject
+    high = ~s1 & (clip >= clip_high)
+    low = ~s1 & ~high & (clip < clip_low)
+    return {"pairs": int(len(hd)), "duplicates": int(dup.sum()),
+            "stage1_exits": int(s1.sum()), "stage2_accepts": int(high.sum()), "stage2_rejects": int(low.sum()),
+            "disagreements": int((s1 & dup).sum() + (high & ~dup).sum() + (low & dup).sum())}
+
+
+def _cut(values: np.ndarray, k: int, top: float) -> float:
+    """Threshold separating sorted unique values[:k] from values[k:] (midpoint)."""
+    if k >= len(values):
+        return top
+    if k == 0:
+        return float(values[0])
+    return float((values[k - 1] + values[k]) / 2.0)
+
+
+def search(hd: np.ndarray, clip: np.ndarray, dup: np.ndarray, budget: int) -> Optional[Dict[str, float]]:
+    """
+    Thresholds maximising stage 1–2 exits with at most `budget` disagreements
+    (None if even "no early exits" is over budget, which cannot happen).
+    """
+    best: Optional[Tuple[Tuple[int, int, int], Dict[str, float]]] = None
+    for p in np.append(np.unique(hd), NO_REJECT_HD):
+        s1 = hd >= p
+        e1 = int((s1 & dup).sum())
+        if e1 > budget:
+            continue
+        c, y = clip[~s1], dup[~s1]
+        m = len(c)
+        vals = np.unique(c)                                   # candidate cuts: vals[k] or +inf
+        below = np.searchsorted(np.sort(c), np.append(vals, np.inf), "left")
+        order = np.argsort(c, kind="stable")
+        dup_cum = np.concatenate([[0], np.cumsum(y[order])])
+        nondup_cum = np.concatenate([[0], np.cumsum(~y[order])])
+        dup_below = dup_cum[below]                            # rejected-but-duplicate if low = cut
+        nondup_above = nondup_cum[-1] - nondup_cum[below]     # accepted-but-not if high = cut
+        allowed = budget - e1 - dup_below
+        # nondup_above is non-increasing: first high index that fits the remaining budget
+        hi = np.maximum(np.searchsorted(-nondup_above, -allowed, "left"), np.arange(len(below)))
+        hi = np.minimum(hi, len(below) - 1)
+        ok = (allowed >= 0) & (nondup_above[hi] <= allowed)
+        if not ok.any():
+            continue
+        exits = np.where(ok, below + (m - below[hi]), -1)
+        lo = int(np.argmax(exits))
+        errors = e1 + int(dup_below[lo]) + int(nondup_above[hi[lo]])
+        key = (int(s1.sum()) + int(exits[lo]), -errors, int(p))
+        if best is None or key > best[0]:
+            best = (key, {"pdq_reject": int(p), "clip_low": _cut(vals, lo, NO_ACCEPT_CLIP),
+                          "clip_high": _cut(vals, int(hi[lo]), NO_ACCEPT_CLIP)})
+    return None if best is None else best[1]
+
+
+def calibrate(ref: Dict[str, np.ndarray], current: Dict[str, Dict[str, float]],
+              max_disagreements: int = 0, max_disagreement_rate: float = 0.0,
+              min_pairs: int = DEFAULT_MIN_PAIRS) -> Dict[str, Any]:
+    """Per-class thresholds, stats and baseline; `current` is {class: thresholds} of the engine."""
+    out: Dict[str, Any] = {}
+    for cls, mask in (("regular", ~ref["aerial"]), ("aerial", ref["aerial"])):
+        hd = ref["pdq_hd"][mask].astype(np.int64)
+        clip = ref["clip"][mask].astype(np.float64)
+        dup = ref["decision"][mask].astype(bool)
+        budget = max(int(max_disagreements), int(np.floor(max_disagreement_rate * len(hd))))
+        base = evaluate(hd, clip, dup, **current[cls])
+        found = search(hd, clip, dup, budget) if len(hd) >= min_pairs else None
+        thresholds = found or dict(current[cls])
+        stats = evaluate(hd, clip, dup, **thresholds)
+        for s in (base, stats):
+            s["early_exit_rate"] = round((s["stage1_exits"] + s["stage2_accepts"] + s["stage2_rejects"])
+                                         / max(1, s["pairs"]), 4)
+        out[cls] = {"thresholds": thresholds, "budget": budget, "calibrated": found is not None,
+                    "stats": stats, "baseline": {"thresholds": dict(current[cls]), **base}}
+        if found is None:
+            logger.warning("%s: %d reference pairs (< %d), keeping the current thresholds", cls, len(hd), min_pairs)
+    return out
+
+
+def current_thresholds(engine: Any) -> Dict[str, Dict[str, float]]:
+    return {"regular": {"pdq_reject": engine.PDQ_REJECT_HD, "clip_high": engine.CLIP_HIGH_THRESHOLD,
+                        "clip_low": engine.CLIP_LOW_THRESHOLD},
+            "aerial": {"pdq_reject": engine.AERIAL_PDQ_REJECT_HD, "clip_high": engine.AERIAL_CLIP_HIGH_THRESHOLD,
+                       "clip_low": engine.AERIAL_CLIP_LOW_THRESHOLD}}
+
+
+def build_config(classes: Dict[str, Any], ref: Dict[str, np.ndarray], source: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = {"version": CONFIG_VERSION, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "source": {**source, "runs": sorted(set(ref["run_id"].tolist())),
+                      "engines": sorted(set(ref["engine"].tolist())), "pairs": int(len(ref["path_a"]))},
+           **classes}
+    cfg["config_hash"] = config_hash({k: classes[k]["thresholds"] for k in classes})
+    return cfg
+
+
+def format_report(cfg: Dict[str, Any]) -> str:
+    lines = ["| Class | Pairs | Setting | PDQ reject | CLIP low | CLIP high | Stage 1 | Stage 2 ✓ | Stage 2 ✗ "
+             "| Early exits | Disagreements |",
+             "|-------|-------|---------|------------|----------|-----------|---------|-----------|-----------"
+             "|-------------|---------------|"]
+    for cls in ("regular", "aerial"):
+        c = cfg[cls]
+        for name, s, t in (("current", c["baseline"], c["baseline"]["thresholds"]),
+                           ("calibrated", c["stats"], c["thresholds"])):
+            lines.append(f"| {cls} | {s['pairs']} | {name} | {t['pdq_reject']} | {t['clip_low']:.2f} | "
+                         f"{t['clip_high']:.2f} | {s['stage1_exits']} | {s['stage2_accepts']} | "
+                         f"{s['stage2_rejects']} | {s['early_exit_rate']*100:.1f}% | {s['disagreements']} |")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    import argparse
+    import importlib
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Calibrate the cascade's stage 1/2 thresholds from reference pairs")
+    parser.add_argument("root", help="Result store written by a full (non-cascading) engine run")
+    parser.add_argument("--engine", default=None, help=f"Reference engine ({' | '.join(REPLAYABLE_ENGINES)}; default: both)")
+    parser.add_argument("--run-id", default=None)
+    parser.add_argument("--labels", default=None, help="JSON lines / CSV of path_a, path_b, label")
+    parser.add_argument("--max-disagreements", type=int, default=0, help="Per class (default: 0)")
+    parser.add_argument("--max-disagreement-rate", type=float, default=0.0,
+                        help="Per class, as a fraction of its pairs (the larger budget wins)")
+    parser.add_argument("--min-pairs", type=int, default=DEFAULT_MIN_PAIRS)
+    parser.add_argument("--out", default="cascade_thresholds.json")
+    args = parser.parse_args()
+
+    ref = load_reference(args.root, args.engine, args.run_id)
+    if not len(ref["path_a"]):
+        parser.error(f"No reference pair rows under {args.root}")
+    labelled = apply_labels(ref, load_labels(args.labels)) if args.labels else 0
+    cascade = importlib.import_module("deduplication_cascading")
+    classes = calibrate(ref, current_thresholds(cascade), args.max_disagreements,
+                        args.max_disagreement_rate, args.min_pairs)
+    cfg = build_config(classes, ref, {"root": str(Path(args.root).resolve()), "labels": args.labels,
+                                      "labelled_pairs": labelled})
+    Path(args.out).write_text(json.dumps(cfg, indent=2), encoding="utf-8")
+    print(format_report(cfg))
+    print(f"\nWrote {args.out} (version {CONFIG_VERSION}, {cfg['config_hash']})")
+
+
+if __name__ == "__main__":
+    main()
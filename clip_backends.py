@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+clip_backends.py – pluggable CPU inference backends for the CLIP embedding
+
+`deduplication._safe_clip_embed` runs ViT-B-32 through open_clip/torch, which
+costs ~200–500 ms per image on CPU.  This module provides drop-in backends
+selected with `deduplication.CLIP_BACKEND` (or the DEDUP_CLIP_BACKEND env var):
+
+    torch       reference open_clip model (the existing code path)
+    torch-int8  torch dynamic int8 quantization of the Linear layers
+    onnx        visual tower exported to ONNX, run under ONNX Runtime
+    onnx-int8   same, with ONNX Runtime dynamic int8 weight quantization
+
+All backends return L2-normalised float32 embeddings, so `_cosine` and every
+CLIP threshold keep their meaning.  The ONNX backends do their own PIL/numpy
+preprocessing (identical to open_clip's: bicubic resize of the short side to
+224, centre crop, CLIP mean/std), so torch is only needed once, to export.
+
+Intra-op threads are sized so that the Phase 1 thread pool (MAX_WORKERS
+concurrent embeddings) does not oversubscribe the CPU:
+    threads = max(1, cpu_count // pool_workers)
+Override with CLIP_INTRA_OP_THREADS.
+
+The parity tool checks a backend against the reference on a folder before it
+is trusted:
+
+    python clip_backends.py export --out clip_vitb32_visual.onnx
+    python clip_backends.py parity <folder> --backend onnx-int8
+
+It reports per-image cosine drift and, for image pairs, the CLIP % delta and
+any decision flips at CLIP_HIGH_THRESHOLD / CLIP_LOW_THRESHOLD and the 85 %
+(and drift-fix 92 %) SIFT+CLIP override.
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install open_clip_torch torch   # reference, torch-int8, export
+    pip install onnx onnxruntime        # onnx, onnx-int8
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from lazy_imports import lazy_module
+
+torch = lazy_module("torch")
+open_clip = lazy_module("open_clip")
+ort = lazy_module("onnxruntime")
+
+logger = logging.getLogger(__name__)
+
+CLIP_MODEL_NAME, CLIP_PRETRAINED = "ViT-B-32", "openai"
+CLIP_INPUT_SIZE = 224
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], np.float32)
+DEFAULT_ONNX_PATH = "clip_vitb32_visual.onnx"
+
+# Thresholds whose behaviour the parity tool checks (CLIP %)
+PARITY_THRESHOLDS = {"CLIP_LOW_THRESHOLD": 70.0, "CLIP_HIGH_THRESHOLD / override": 85.0,
+                     "drift-fix override": 92.0}
+
+
+def recommended_intra_op_threads(pool_workers: int) -> int:
+    """Threads per inference so that pool_workers concurrent calls fit the CPU."""
+    env = os.environ.get("CLIP_INTRA_OP_THREADS")
+    if env:
+        return max(1, int(env))
+    return max(1, (os.cpu_count() or 1) // max(1, pool_workers))
+
+
+def _load_open_clip_cpu():
+    model, _, preprocess = open_clip.create_model_and_transforms(
+        CLIP_MODEL_NAME, pretrained=CLIP_PRETRAINED, device="cpu")
+    model.eval()
+    return model, preprocess
+
+
+def preprocess_numpy(img) -> np.ndarray:
+    """open_clip ViT-B-32 preprocessing without torch → (3, 224, 224) float32."""
+    from PIL import Image
+    img = img.convert("RGB")
+    w, h = img.size
+    scale = CLIP_INPUT_SIZE / min(w, h)
+    img = img.resize((max(CLIP_INPUT_SIZE, round(w * scale)), max(CLIP_INPUT_SIZE, round(h * scale))),
+                     Image.BICUBIC)
+    w, h = img.size
+    left, top = int(round((w - CLIP_INPUT_SIZE) / 2.0)), int(round((h - CLIP_INPUT_SIZE) / 2.0))
+    img = img.crop((left, top, left + CLIP_INPUT_SIZE, top + CLIP_INPUT_SIZE))
+    arr = (np.asarray(img, np.float32) / 255.0 - CLIP_MEAN) / CLIP_STD
+    return arr.transpose(2, 0, 1).copy()
+
+
+def _normalise(emb: np.ndarray) -> np.ndarray:
+    emb = emb.astype(np.float32)
+    return emb / (np.linalg.norm(emb, axis=-1, keepdims=True) + 1e-8)
+
+
+# ─── backends ─────────────────────────────────────────────────────────────────
+class ClipBackend:
+    """Base class: subclasses implement load() and _encode(batch (N,3,224,224))."""
+
+    name = "base"
+
+    def __init__(self, pool_workers: int = 1):
+        self.threads = recommended_intra_op_threads(pool_workers)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+                logger.info(f"CLIP backend '{self.name}' ready ({self.threads} intra-op threads)")
+
+    def _load(self) -> None:
+        raise NotImplementedError
+
+    def _preprocess(self, img) -> np.ndarray:
+        return preprocess_numpy(img)
+
+    def _encode(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_images(self, imgs: Sequence[Any]) -> np.ndarray:
+        """PIL images → (N, 512) L2-normalised float32."""
+        self.load()
+        batch = np.stack([self._preprocess(im) for im in imgs])
+        emb = self._encode(batch)
+        if not np.isfinite(emb).all():
+            raise ValueError(f"CLIP backend '{self.name}' produced non-finite embeddings")
+        return _normalise(emb)
+
+    def embed_path(self, path: str) -> np.ndarray:
+        from PIL import Image
+        with Image.open(path) as img:
+            return self.embed_images([img])[0]
+
+    def embed_paths(self, paths: Sequence[str]) -> np.ndarray:
+        from PIL import Image
+        imgs = []
+        for p in paths:
+            with Image.open(p) as img:
+                imgs.append(img.convert("RGB"))
+        return self.embed_images(imgs)
+
+
+class TorchClipBackend(ClipBackend):
+    """Reference fp32 open_clip model on CPU (uses open_clip's own preprocessing)."""
+
+    name = "torch"
+
+    def _load(self) -> None:
+        torch.set_num_threads(self.threads)
+        self.model, self.preprocess = _load_open_clip_cpu()
+
+    def _preprocess(self, img) -> np.ndarray:
+        return self.preprocess(img.convert("RGB")).numpy()
+
+    def _encode(self, batch: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            return self.model.encode_image(torch.from_numpy(batch)).cpu().numpy()
+
+
+class QuantizedTorchClipBackend(TorchClipBackend):
+    """Torch dynamic int8 quantization of every nn.Linear (attention + MLP)."""
+
+    name = "torch-int8"
+
+    def _load(self) -> None:
+        super()._load()
+        quant = getattr(torch, "ao", torch).quantization
+        self.model = quant.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxClipBackend(ClipBackend):
+    """Visual tower exported to ONNX and run with ONNX Runtime on CPU."""
+
+    name = "onnx"
+    quantize = False
+
+    def __init__(self, pool_workers: int = 1, model_path: Optional[str] = None):
+        super().__init__(pool_workers)
+        self.model_path = Path(model_path or os.environ.get("CLIP_ONNX_PATH", DEFAULT_ONNX_PATH))
+
+    def _load(self) -> None:
+        path = self.model_path
+        if self.quantize:
+            path = path.with_name(path.stem + "_int8" + path.suffix)
+            if not path.exists():
+                quantize_onnx(export_onnx(self.model_path), path)
+        elif not path.exists():
+            export_onnx(path)
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = self.threads
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(path), sess_options=opts,
+                                            providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _encode(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch.astype(np.float32)})[0]
+
+
+class QuantizedOnnxClipBackend(OnnxClipBackend):
+    name = "onnx-int8"
+    quantize = True
+
+
+BACKENDS = {b.name: b for b in (TorchClipBackend, QuantizedTorchClipBackend,
+                                OnnxClipBackend, QuantizedOnnxClipBackend)}
+
+_instances: Dict[str, ClipBackend] = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name: str, pool_workers: int = 1) -> ClipBackend:
+    """Process-wide singleton per backend name."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown CLIP backend '{name}' (choose from {', '.join(BACKENDS)})")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name](pool_workers)
+        return _instances[name]
+
+
+# ─── export / quantize ────────────────────────────────────────────────────────
+def export_onnx(out_path: Path = Path(DEFAULT_ONNX_PATH), opset: int = 17) -> Path:
+    """Export the ViT-B-32 visual tower (image → unnormalised embedding)."""
+    out_path = Path(out_path)
+    if out_path.exists():
+        return out_path
+    model, _ = _load_open_clip_cpu()
+
+    class _Visual(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, x):
+            return self.m.encode_image(x)
+
+    dummy = torch.randn(1, 3, CLIP_INPUT_SIZE, CLIP_INPUT_SIZE)
+    torch.onnx.export(_Visual(model).eval(), dummy, str(out_path),
+                      input_names=["pixels"], output_names=["embedding"],
+                      dynamic_axes={"pixels": {0: "batch"}, "embedding": {0: "batch"}},
+                      opset_version=opset)
+    logger.info(f"Exported CLIP visual tower to {out_path}")
+    return out_path
+
+
+def quantize_onnx(src: Path, dst: Path) -> Path:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(str(src), str(dst), weight_type=QuantType.QInt8)
+    logger.info(f"Wrote int8 ONNX model to {dst}")
+    return dst
+
+
+# ─── parity check ─────────────────────────────────────────────────────────────
+def parity_report(paths: List[str], backend: str, reference: str = "torch",
+                  all_pairs: bool = False) -> Dict[str, Any]:
+    """Compare `backend` against `reference` embeddings on the given images."""
+    ref = get_backend(reference).embed_paths(paths)
+    cand = get_backend(backend).embed_paths(paths)
+    cos = np.sum(ref * cand, axis=1)
+    drift = 1.0 - cos
+
+    idx = ([(i, j) for i in range(len(paths) - 1) for j in range(i + 1, len(paths))]
+           if all_pairs else [(i, i + 1) for i in range(len(paths) - 1)])
+    pair_rows = []
+    flips = {k: 0 for k in PARITY_THRESHOLDS}
+    for i, j in idx:
+        r = 100.0 * float(ref[i] @ ref[j])
+        c = 100.0 * float(cand[i] @ cand[j])
+        row = {"a": Path(paths[i]).name, "b": Path(paths[j]).name, "ref": r, "cand": c, "flips": []}
+        for label, t in PARITY_THRESHOLDS.items():
+            if (r >= t) != (c >= t):
+                flips[label] += 1
+                row["flips"].append(label)
+        pair_rows.append(row)
+
+    deltas = np.array([abs(p["ref"] - p["cand"]) for p in pair_rows]) if pair_rows else np.zeros(1)
+    return {
+        "backend": backend, "reference": reference, "images": len(paths),
+        "cos_mean": float(cos.mean()), "cos_min": float(cos.min()),
+        "drift_mean": float(drift.mean()), "drift_max": float(drift.max()),
+        "pairs": len(pair_rows), "clip_pct_delta_mean": float(deltas.mean()),
+        "clip_pct_delta_max": float(deltas.max()), "threshold_flips": flips,
+        "pair_rows": pair_rows,
+    }
+
+
+def format_parity_markdown(rep: Dict[str, Any]) -> str:
+    lines = [f"# CLIP backend parity: {rep['backend']} vs {rep['reference']}", "",
+             "| Metric | Value |", "|--------|-------|",
+             f"| Images | {rep['images']} |",
+             f"| Mean cosine (ref·cand) | {rep['cos_mean']:.6f} |",
+             f"| Min cosine | {rep['cos_min']:.6f} |",
+             f"| Max drift (1 − cos) | {rep['drift_max']:.6f} |",
+             f"| Pairs compared | {rep['pairs']} |",
+             f"| Mean abs Δ CLIP % | {rep['clip_pct_delta_mean']:.3f} |",
+             f"| Max abs Δ CLIP % | {rep['clip_pct_delta_max']:.3f} |", "",
+             "| Threshold | Decision flips |", "|-----------|----------------|"]
+    for label, n in rep["threshold_flips"].items():
+        lines.append(f"| {label} ({PARITY_THRESHOLDS[label]:.0f}%) | {n} |")
+    flipped = [p for p in rep["pair_rows"] if p["flips"]]
+    if flipped:
+        lines += ["", "| Image A | Image B | Ref CLIP % | Cand CLIP % | Flipped at |",
+                  "|---------|---------|------------|-------------|------------|"]
+        for p in flipped:
+            lines.append(f"| {p['a']} | {p['b']} | {p['ref']:.2f} | {p['cand']:.2f} | {', '.join(p['flips'])} |")
+    return "\n".join(lines) + "\n"
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="CLIP CPU backends: export and parity check")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_exp = sub.add_parser("export", help="Export the visual tower to ONNX")
+    p_exp.add_argument("--out", type=str, default=DEFAULT_ONNX_PATH)
+    p_exp.add_argument("--int8", action="store_true", help="Also write a dynamic int8 model")
+
+    p_par = sub.add_parser("parity", help="Report cosine drift vs the reference backend")
+    p_par.add_argument("folder", type=str, help="Folder of images (uses processed/ if present)")
+    p_par.add_argument("--backend", type=str, default="onnx", choices=sorted(BACKENDS))
+    p_par.add_argument("--reference", type=str, default="torch", choices=sorted(BACKENDS))
+    p_par.add_argument("--all-pairs", action="store_true", help="Compare all pairs, not just adjacent")
+    p_par.add_argument("--output", type=str, default=None, help="Write the report as markdown")
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        out = export_onnx(Path(args.out))
+        if args.int8:
+            quantize_onnx(out, out.with_name(out.stem + "_int8" + out.suffix))
+        return
+
+    folder = Path(args.folder)
+    src = folder / "processed" if (folder / "processed").exists() else folder
+    paths = [str(p) for p in sorted(src.glob("*.jpg"))]
+    if not paths:
+        raise SystemExit(f"No images found in {src}")
+    md = format_parity_markdown(parity_report(paths, args.backend, args.reference, args.all_pairs))
+    print(md)
+    if args.output:
+        Path(args.output).write_text(md, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
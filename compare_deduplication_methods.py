@@ -9,13 +9,16 @@ import os
 from pathlib import Path
 from datetime import datetime
 from dataclasses import dataclass, field
-from typing import List, Dict, Set, Tuple, Any
+from typing import List, Dict, Set, Tuple, Any, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import cv2
 import numpy as np
 
 # Import from existing modules
+import deduplication
+from bounded_cache import engine_caches, release_paths
+from feature_shards import ensure_shard
 from deduplication import (
     _metric_worker, _pair_sim, _metric_store,
     WEIGHT_MTB, WEIGHT_SSIM, WEIGHT_CLIP, WEIGHT_PDQ, WEIGHT_SIFT,
@@ -101,9 +104,10 @@ def _get_image_quality_score(img_path: str) -> Tuple[int, int]:
 class DedupComparison:
     """Compares MTB and CNN deduplication methods"""
 
-    def __init__(self, images_base_dir: str, output_md_file: str):
+    def __init__(self, images_base_dir: str, output_md_file: str, shard_root: Optional[str] = None):
         self.images_base_dir = images_base_dir
         self.output_md_file = output_md_file
+        self.shard_root = shard_root            # memory-mapped feature shards, if set
 
     def discover_folders(self) -> List[Dict[str, Any]]:
         """
@@ -157,11 +161,15 @@ class DedupComparison:
 
         logger.info(f"[MTB] Processing {folder_name}: {len(images)} images")
 
-        # Compute metrics for all images
-        with ThreadPoolExecutor(max_workers=16) as pool:
-            for fut in as_completed(pool.submit(_metric_worker, img) for img in images):
-                m = fut.result()
-                _metric_store[m["path"]] = m
+        # Compute metrics for all images (or map this folder's shard)
+        pair_sim = _pair_sim
+        if self.shard_root:
+            pair_sim = ensure_shard(deduplication, images, self.shard_root, listing=folder_name).pair_sim
+        else:
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                for fut in as_completed(pool.submit(_metric_worker, img) for img in images):
+                    m = fut.result()
+                    _metric_store[m["path"]] = m
 
         # Compare all pairs (full scan within folder)
         comparisons = []
@@ -171,7 +179,7 @@ class DedupComparison:
             for j in range(i + 1, len(images)):
                 img_a, img_b = images[i], images[j]
 
-                mtb, edge, hd, ssim, clip, sift_matches = _pair_sim(img_a, img_b)
+                mtb, edge, hd, ssim, clip, sift_matches = pair_sim(img_a, img_b)
 
                 if hd == 999:  # Invalid comparison
                     continue
@@ -216,9 +224,8 @@ class DedupComparison:
                     drop_reason=drop_reason
                 ))
 
-        # Clear metric store to free memory
-        for img in images:
-            _metric_store.pop(img, None)
+        # Free this folder's images, features and pair metrics
+        release_paths(images, *engine_caches(deduplication))
 
         return MTBResults(
             folder_name=folder_name,
@@ -495,6 +502,8 @@ def main():
                         help="Output markdown file")
     parser.add_argument("--limit", type=int, default=None,
                         help="Limit processing to first N folders (for testing)")
+    parser.add_argument("--shards", type=str, default=None,
+                        help="Reuse/build memory-mapped feature shards in this directory")
 
     args = parser.parse_args()
 
@@ -505,7 +514,8 @@ def main():
     # Create comparison runner
     comparison = DedupComparison(
         images_base_dir=args.images_dir,
-        output_md_file=args.output
+        output_md_file=args.output,
+        shard_root=args.shards
     )
 
     # Discover folders
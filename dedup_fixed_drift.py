@@ -18,7 +18,6 @@ This prevents the bug where:
 Dependencies
 ------------------------------------------------------------
     pip install opencv-python-headless numpy pillow
-    pip install scikit-image           # <-- for SSIM
     pip install pdqhash-lite           # <-- optional PDQ
     pip install open_clip_torch torch  # <-- only if you enable CLIP
 """
@@ -30,25 +29,24 @@ import os
 import io
 import sys
 import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Tuple, Dict, Any, Optional
+from typing import Callable, List, Tuple, Dict, Any, Optional
 
 import cv2
 import numpy as np
 
+from bounded_cache import BoundedCache, memoize
+from lazy_imports import lazy_module
+from profiling import profile_phase
+from fast_ssim import ssim_from_stats, ssim_pair, ssim_stats
+from telemetry import PAIRS, PAIR_SECONDS, feature_timers, pair_timers, queue_depth
+
 # ─── optional deps ────────────────────────────────────────────────────────────
-try:
-    import pdqhash
-except ImportError:
-    pdqhash = None
+pdqhash = lazy_module("pdqhash")
 
-try:
-    from skimage.metrics import structural_similarity as _ssim
-except ImportError:
-    _ssim = None
 
 try:
     from PIL import Image
@@ -58,11 +56,12 @@ except ImportError:
 
 USE_CLIP = True
 if USE_CLIP:
-    try:
-        import torch, open_clip
+    # installed-check only; torch/open_clip are imported on the first embedding
+    torch, open_clip = lazy_module("torch"), lazy_module("open_clip")
+    if torch and open_clip:
         _clip_model = _clip_pre = _clip_device = None
         _clip_lock = threading.Lock()
-    except ImportError:
+    else:
         USE_CLIP = False
 
 # ─── logging ──────────────────────────────────────────────────────────────────
@@ -82,6 +81,8 @@ class ExperimentLogger:
         self.comparison_results: List[Dict[str, Any]] = []
         self.input_count = 0
         self.output_count = 0
+        self.result_store = None   # optional result_store.ResultStore (pair rows)
+        self.listing = ""
 
     def start_capture(self) -> None:
         self.handler = logging.StreamHandler(self.log_capture)
@@ -95,7 +96,15 @@ class ExperimentLogger:
 
     def add_comparison(self, img_a: str, img_b: str, mtb: float, edge: float,
                        ssim: float, clip: float, pdq_hd: int, sift_matches: int,
-                       score: float, dropped: bool, drop_reason: str) -> None:
+                       score: float, dropped: bool, drop_reason: str,
+                       aerial: bool = False, timing_ms: Optional[float] = None,
+                       dropped_path: Optional[str] = None) -> None:
+        if self.result_store is not None:
+            self.result_store.add_pair(
+                listing=self.listing, path_a=img_a, path_b=img_b, mtb=mtb, edge=edge,
+                ssim=ssim, clip=clip, pdq_hd=pdq_hd, sift=sift_matches, score=score,
+                aerial=aerial, timing_ms=timing_ms, decision=dropped,
+                drop_reason=drop_reason, dropped_path=dropped_path)
         self.comparison_results.append({
             "img_a": Path(img_a).stem,
             "img_b": Path(img_b).stem,
@@ -110,6 +119,13 @@ class ExperimentLogger:
             "drop_reason": drop_reason
         })
 
+    def results(self) -> List[Dict[str, Any]]:
+        """Rows for the markdown table, read back from the result store when one is attached."""
+        if self.result_store is not None:
+            from result_store import stored_comparisons
+            return stored_comparisons(self.result_store, self.listing)
+        return self.comparison_results
+
     def write_experiment_log(self, experiment_name: str, terminal_output: str, log_file: str) -> None:
         log_path = Path(log_file)
 
@@ -139,7 +155,7 @@ class ExperimentLogger:
 | Image A | Image B | MTB % | Edge % | SSIM % | CLIP % | PDQ HD | SIFT | SCORE | Dropped? |
 |---------|---------|-------|--------|--------|--------|--------|------|-------|----------|
 """
-        for r in self.comparison_results:
+        for r in self.results():
             dropped_str = f"Yes ({r['drop_reason']})" if r["dropped"] else "No"
             if not r["dropped"] and r["drop_reason"]:
                 dropped_str = f"No ({r['drop_reason']})"
@@ -165,6 +181,7 @@ class ExperimentLogger:
         logger.info(f"Experiment logged to {log_path}")
 
 _experiment_logger: Optional[ExperimentLogger] = None
+_profiler: Optional[Any] = None        # profiling.ListingProfiler (--profile CLI run)
 
 # ─── tuning knobs ─────────────────────────────────────────────────────────────
 MTB_SIZE, EDGE_SIZE, SSIM_SIZE = 640, 640, 320
@@ -197,10 +214,15 @@ AERIAL_WEIGHT_SIFT = 0.10
 AERIAL_COMPOSITE_DUP_THRESHOLD = 0.38
 AERIAL_SIFT_MIN_MATCHES = 100
 
+# SIFT override: strong SIFT alone, or moderate SIFT with high CLIP, lifts the
+# MTB floor and PDQ ceiling
+SIFT_OVERRIDE_MULT = 3.0
+SIFT_OVERRIDE_CLIP = 92.0
+
 MAX_WORKERS = 16
 
 # ─── helpers: I/O / resize / CLAHE / metadata ─────────────────────────────────
-@lru_cache(maxsize=512)
+@memoize(BoundedCache.from_env("gray"))
 def _load_gray(path: str) -> np.ndarray:
     img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
     if img is None:
@@ -275,17 +297,12 @@ def overlap_percent(a: np.ndarray, b: np.ndarray) -> float:
     return 100.0 * np.logical_and(a, b).sum() / min(a.sum(), b.sum())
 
 def _compute_ssim(gA: np.ndarray, gB: np.ndarray) -> float:
-    """Return SSIM in 0–100 (%). 0 if skimage unavailable."""
-    if _ssim is None:
-        return 0.0
-    H, W = max(gA.shape[0], gB.shape[0]), max(gA.shape[1], gB.shape[1])
-    padA = np.pad(gA, ((0, H-gA.shape[0]), (0, W-gA.shape[1])), constant_values=0)
-    padB = np.pad(gB, ((0, H-gB.shape[0]), (0, W-gB.shape[1])), constant_values=0)
-    return 100.0 * float(_ssim(padA, padB, data_range=255))
+    """Return SSIM in 0–100 (%) (thumbnails zero-padded to a common shape)."""
+    return 100.0 * ssim_pair(gA, gB)
 
 # ─── PDQ helpers ──────────────────────────────────────────────────────────────
 def _pdq_bits(path: str) -> Optional[np.ndarray]:
-    if pdqhash is None:
+    if not pdqhash:
         return None
     try:
         from PIL import Image
@@ -401,27 +418,47 @@ def _compute_sift_matches(path_a: str, path_b: str, min_matches: int = 50) -> in
         return 0
 
 # ─── metric worker & cache ────────────────────────────────────────────────────
-def _metric_worker(path: str) -> Dict[str, Any]:
-    gray = _load_gray(path)
-    if USE_CLAHE:
-        gray = _apply_clahe(gray)
-
-    return dict(
-        path=path,
-        filename=Path(path).name,
-        mtb=_compute_mtb(_resize_to_exact_size(gray, MTB_SIZE)),
-        edges=_compute_edges(_resize_to_exact_size(gray, EDGE_SIZE)),
-        gray_ssim=_resize_keep_aspect(gray, SSIM_SIZE),
-        pdq=_pdq_bits(path),
-        clip=_safe_clip_embed(path)
-    )
-
-_metric_store: Dict[str, Dict[str, Any]] = {}
+def _decode_gray(path: str, data: bytes) -> np.ndarray:
+    """Decode encoded image bytes and cache them as _load_gray(path)."""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise IOError(f"Failed to decode {path}")
+    _load_gray.cache[(path,)] = img
+    return img
 
-@lru_cache(maxsize=4096)
-def _pair_sim(path_a: str, path_b: str) -> Tuple[float, float, int, float, float, int]:
-    """Return (mtb %, edge %, PDQ-HD, SSIM %, CLIP %, SIFT matches)"""
-    mA, mB = _metric_store[path_a], _metric_store[path_b]
+# Telemetry (no-ops unless telemetry is enabled)
+_feature_timers = feature_timers("dedup_fixed_drift")
+_pair_timers = pair_timers("dedup_fixed_drift")
+_pair_seconds = PAIR_SECONDS.labels(engine="dedup_fixed_drift", part="total")
+_pair_outcomes = {r: PAIRS.labels(engine="dedup_fixed_drift", result=r) for r in ("duplicate", "kept", "unusable")}
+_phase1_depth = queue_depth("phase1")
+
+def _metric_worker(path: str, data: Optional[bytes] = None) -> Dict[str, Any]:
+    """Phase 1 record; with `data` (encoded bytes) nothing is read from `path`."""
+    t = _feature_timers
+    with t["decode"]:
+        gray = _load_gray(path) if data is None else _decode_gray(path, data)
+    if USE_CLAHE:
+        with t["clahe"]:
+            gray = _apply_clahe(gray)
+    with t["mtb"]:
+        mtb = _compute_mtb(_resize_to_exact_size(gray, MTB_SIZE))
+    with t["edges"]:
+        edges = _compute_edges(_resize_to_exact_size(gray, EDGE_SIZE))
+    with t["ssim"]:
+        stats = ssim_stats(_resize_keep_aspect(gray, SSIM_SIZE))
+    with t["pdq"]:
+        pdq = _pdq_bits(path if data is None else io.BytesIO(data))
+    with t["clip"]:
+        clip = _safe_clip_embed(path if data is None else io.BytesIO(data))
+
+    return dict(path=path, filename=Path(path).name, mtb=mtb, edges=edges,
+                ssim_stats=stats, pdq=pdq, clip=clip)
+
+_metric_store = BoundedCache.from_env("metrics")     # path → _metric_worker record
+
+def _pair_metrics(mA: Dict[str, Any], mB: Dict[str, Any]) -> Tuple[float, float, int, float, float, int]:
+    """(mtb %, edge %, PDQ-HD, SSIM %, CLIP %, SIFT matches) of two _metric_worker records"""
 
     if mA["mtb"].shape != mB["mtb"].shape:
         logger.warning("MTB shape mismatch: %s vs %s", mA["mtb"].shape, mB["mtb"].shape)
@@ -433,28 +470,142 @@ def _pair_sim(path_a: str, path_b: str) -> Tuple[float, float, int, float, float
     mtb  = overlap_percent(mA["mtb"],   mB["mtb"])
     edge = overlap_percent(mA["edges"], mB["edges"])
     hd   = _pdq_hd(mA["pdq"],           mB["pdq"])
-    ssim = _compute_ssim(mA["gray_ssim"], mB["gray_ssim"])
+    ssim = 100.0 * ssim_from_stats(mA["ssim_stats"], mB["ssim_stats"])
     clip = 100.0 * _cosine(mA["clip"],     mB["clip"])
-    sift_matches = _compute_sift_matches(path_a, path_b, SIFT_MIN_MATCHES)
+    with _pair_timers["sift"]:
+        sift_matches = _compute_sift_matches(mA["path"], mB["path"], SIFT_MIN_MATCHES)
     return mtb, edge, hd, ssim, clip, sift_matches
 
+@memoize(BoundedCache.from_env("pairs"))
+def _pair_sim(path_a: str, path_b: str) -> Tuple[float, float, int, float, float, int]:
+    """Return (mtb %, edge %, PDQ-HD, SSIM %, CLIP %, SIFT matches)"""
+    return _pair_metrics(_metric_store.get_or_compute(path_a, _metric_worker),
+                         _metric_store.get_or_compute(path_b, _metric_worker))
+
+# ─── decision rule ────────────────────────────────────────────────────────────
+def _policy(is_aerial_pair: bool) -> Dict[str, Any]:
+    """Weights and gates for a regular or aerial pair (read at call time)."""
+    if is_aerial_pair:
+        return {
+            "weights": (AERIAL_WEIGHT_MTB, AERIAL_WEIGHT_SSIM, AERIAL_WEIGHT_CLIP, AERIAL_WEIGHT_PDQ, AERIAL_WEIGHT_SIFT),
+            "threshold": AERIAL_COMPOSITE_DUP_THRESHOLD,
+            "mtb_floor": AERIAL_MTB_HARD_FLOOR,
+            "pdq_ceil": AERIAL_PDQ_HD_CEIL,
+            "sift_min": AERIAL_SIFT_MIN_MATCHES,
+            "sift_override_mult": SIFT_OVERRIDE_MULT,
+            "sift_override_clip": SIFT_OVERRIDE_CLIP,
+        }
+    return {
+        "weights": (WEIGHT_MTB, WEIGHT_SSIM, WEIGHT_CLIP, WEIGHT_PDQ, WEIGHT_SIFT),
+        "threshold": COMPOSITE_DUP_THRESHOLD,
+        "mtb_floor": MTB_HARD_FLOOR,
+        "pdq_ceil": PDQ_HD_CEIL,
+        "sift_min": SIFT_MIN_MATCHES,
+        "sift_override_mult": SIFT_OVERRIDE_MULT,
+        "sift_override_clip": SIFT_OVERRIDE_CLIP,
+    }
+
+def _decide_pair(mtb: float, hd: int, ssim: float, clip: float, sift_matches: int,
+                 policy: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Composite score and duplicate decision for one compared pair.
+
+    Returns {score, dup, drop_reason, trigger_metrics}; drop_reason is what the
+    experiment log records ("duplicate", "MTB < x", "PDQ >= x", "SCORE < x").
+    Shared with replay_decisions so a replay applies exactly this rule.
+    """
+    w_mtb, w_ssim, w_clip, w_pdq, w_sift = policy["weights"]
+    dup_threshold = policy["threshold"]
+    mtb_floor = policy["mtb_floor"]
+    pdq_ceil = policy["pdq_ceil"]
+    sift_min = policy["sift_min"]
+    override_mult = policy["sift_override_mult"]
+    override_clip = policy["sift_override_clip"]
+
+    # Normalize SIFT matches to 0-1 scale (cap at 100 matches = 1.0)
+    sift_score = min(sift_matches / 100.0, 1.0) if sift_matches > 0 else 0.0
+
+    # composite score with selected weights
+    score = (
+        w_mtb  * (mtb  / 100.0) +
+        w_ssim * (ssim / 100.0) +
+        w_clip * (clip / 100.0) +
+        w_pdq  * (0.0 if hd >= pdq_ceil else 1.0 - hd / pdq_ceil) +
+        w_sift * sift_score
+    )
+
+    trigger_metrics = []
+    if score >= dup_threshold:
+        trigger_metrics.append(f"SCORE({score:.2f}≥{dup_threshold})")
+
+    # SIFT override: If SIFT matches are high OR (SIFT moderate AND CLIP high), allow override of MTB floor AND PDQ ceiling
+    sift_override = ((sift_matches >= sift_min * override_mult) or
+                     ((sift_matches >= sift_min) and (clip >= override_clip)))
+
+    if mtb < mtb_floor and not sift_override:
+        trigger_metrics.append(f"MTB_FLOOR_FAIL({mtb:.1f}<{mtb_floor})")
+        return {"score": score, "dup": False, "drop_reason": f"MTB < {mtb_floor}",
+                "trigger_metrics": trigger_metrics}
+    if hd >= pdq_ceil and not sift_override:
+        trigger_metrics.append(f"PDQ_HD({hd:.0f}≥{pdq_ceil})")
+        return {"score": score, "dup": False, "drop_reason": f"PDQ >= {pdq_ceil}",
+                "trigger_metrics": trigger_metrics}
+
+    # Allow duplicate if: (score high AND (MTB floor passed OR SIFT override)) AND (PDQ ceiling passed OR SIFT override)
+    dup = (score >= dup_threshold) and ((mtb >= mtb_floor) or sift_override) and ((hd < pdq_ceil) or sift_override)
+
+    if sift_override:
+        if sift_matches >= sift_min * override_mult:
+            trigger_metrics.append(f"SIFT_OVERRIDE(HIGH: {sift_matches}≥{sift_min * override_mult:.0f})")
+        else:
+            trigger_metrics.append(f"SIFT_OVERRIDE(COMBO: SIFT={sift_matches}≥{sift_min}, CLIP={clip:.1f}≥{override_clip:.1f})")
+
+    if dup:
+        drop_reason = "duplicate"
+    else:
+        drop_reason = f"SCORE < {dup_threshold}" if score < dup_threshold else ""
+    return {"score": score, "dup": dup, "drop_reason": drop_reason, "trigger_metrics": trigger_metrics}
+
 # ─── main deduper with DRIFT FIX ──────────────────────────────────────────────
 def remove_near_duplicates(
     groups: List[List[str]],
     deduplication_flag: int = 0,
     metadata_dict: Dict[str, Dict[str, Any]] = None,
     threshold: float = 0.0,
-    full_scan: bool = False
+    full_scan: bool = False,
+    pair_metrics: Optional[Callable[[str, str], Tuple[float, float, int, float, float, int]]] = None,
+    policy: Optional[Callable[[bool], Dict[str, Any]]] = None,
+    pair_aerial: Optional[Callable[[str, str], Optional[bool]]] = None,
+    experiment_logger: Any = None,
+    profiler: Any = None
 ) -> List[List[str]]:
+    # pair_metrics: optional (path_a, path_b) → _pair_sim-style tuple.  When
+    # given, Phase 1 features are not computed here (see replay_decisions.py).
+    # policy: is_aerial_pair → _policy()-style dict (default: module constants).
+    # pair_aerial: optional (path_a, path_b) → recorded aerial flag of the pair;
+    # None (or no hook) falls back to _is_aerial on metadata_dict.
+    # experiment_logger: None → module-level _experiment_logger, False → none.
+    # profiler: profiling.ListingProfiler for this call; None → module-level
+    # _profiler, False → none.
+    # Together they let deduplicator.Deduplicator run without touching globals.
     if deduplication_flag != 1 or len(groups) < 2:
         return groups
 
     mids = [g[len(g)//2] for g in groups]
-    logger.info("[STEP] Pre-computing metrics for %d middles…", len(mids))
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
-        for fut in as_completed(pool.submit(_metric_worker, p) for p in mids):
-            m = fut.result()
-            _metric_store[m["path"]] = m
+    pair_sim = pair_metrics or _pair_sim
+    policy_for = policy or _policy
+    exp_log = _experiment_logger if experiment_logger is None else experiment_logger
+    prof = _profiler if profiler is None else profiler
+    todo = [] if pair_metrics else [p for p in dict.fromkeys(mids) if p not in _metric_store]
+    logger.info("[STEP] Pre-computing metrics for %d middles (%d cached)…",
+                len(mids), len(mids) - len(todo))
+    if todo:
+        with profile_phase(prof, "phase1"), ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            _phase1_depth.set(len(todo))
+            for fut in as_completed(pool.submit(_metric_worker, p) for p in todo):
+                m = fut.result()
+                _metric_store[m["path"]] = m
+                _phase1_depth.dec()
 
     if metadata_dict is None:
         logger.warning("No metadata_dict provided, using empty dict for aerial detection")
@@ -520,200 +671,100 @@ def remove_near_duplicates(
         # Instead of pre-generating all pairs, we'll process on-the-fly
         logger.info("[DRIFT-FIX] Sequential mode: comparing each frame vs last KEPT")
 
-    # Process comparisons
-    if full_scan:
-        # Standard full-scan processing
-        for i, j in idx_pairs:
-            if not keep[i] or not keep[j]:
-                continue
-
-            if mids[i] == mids[j]:
-                logger.debug("Skipping self-comparison: %s", mids[i])
-                continue
-
-            mtb, edge, hd, ssim, clip, sift_matches = _pair_sim(mids[i], mids[j])
-            if hd == 999:
-                continue
-
-            is_aerial_i = _is_aerial(mids[i], metadata_dict)
-            is_aerial_j = _is_aerial(mids[j], metadata_dict)
-            is_aerial_pair = is_aerial_i or is_aerial_j
-
-            if is_aerial_pair:
-                w_mtb, w_ssim, w_clip, w_pdq, w_sift = AERIAL_WEIGHT_MTB, AERIAL_WEIGHT_SSIM, AERIAL_WEIGHT_CLIP, AERIAL_WEIGHT_PDQ, AERIAL_WEIGHT_SIFT
-                dup_threshold = AERIAL_COMPOSITE_DUP_THRESHOLD
-                mtb_floor = AERIAL_MTB_HARD_FLOOR
-                pdq_ceil = AERIAL_PDQ_HD_CEIL
-                sift_min = AERIAL_SIFT_MIN_MATCHES
-            else:
-                w_mtb, w_ssim, w_clip, w_pdq, w_sift = WEIGHT_MTB, WEIGHT_SSIM, WEIGHT_CLIP, WEIGHT_PDQ, WEIGHT_SIFT
-                dup_threshold = COMPOSITE_DUP_THRESHOLD
-                mtb_floor = MTB_HARD_FLOOR
-                pdq_ceil = PDQ_HD_CEIL
-                sift_min = SIFT_MIN_MATCHES
-
-            sift_score = min(sift_matches / 100.0, 1.0) if sift_matches > 0 else 0.0
-
-            score = (
-                w_mtb  * (mtb  / 100.0) +
-                w_ssim * (ssim / 100.0) +
-                w_clip * (clip / 100.0) +
-                w_pdq  * (0.0 if hd >= pdq_ceil else 1.0 - hd / pdq_ceil) +
-                w_sift * sift_score
-            )
-
-            for k, v in zip(("mtb", "edge", "hd", "ssim", "clip", "sift", "score"),
-                            (mtb, edge, hd, ssim, clip, sift_matches, score)):
-                stats[k].append(v)
-            _log_pair(i, j, mtb, edge, hd, ssim, clip, sift_matches, score, is_aerial_pair)
-
-            trigger_metrics = []
-            drop_reason = ""
-            if score >= dup_threshold:
-                trigger_metrics.append(f"SCORE({score:.2f}≥{dup_threshold})")
-
-            sift_override = (sift_matches >= sift_min * 3.0) or ((sift_matches >= sift_min) and (clip >= 92.0))
-
-            if mtb < mtb_floor and not sift_override:
-                trigger_metrics.append(f"MTB_FLOOR_FAIL({mtb:.1f}<{mtb_floor})")
-                drop_reason = f"MTB < {mtb_floor}"
-                if _experiment_logger:
-                    _experiment_logger.add_comparison(
-                        mids[i], mids[j], mtb, edge, ssim, clip, hd, sift_matches, score,
-                        dropped=False, drop_reason=drop_reason
-                    )
-                continue
-            if hd >= pdq_ceil and not sift_override:
-                trigger_metrics.append(f"PDQ_HD({hd:.0f}≥{pdq_ceil})")
-                drop_reason = f"PDQ >= {pdq_ceil}"
-                if _experiment_logger:
-                    _experiment_logger.add_comparison(
-                        mids[i], mids[j], mtb, edge, ssim, clip, hd, sift_matches, score,
-                        dropped=False, drop_reason=drop_reason
-                    )
-                continue
-
-            dup = (score >= dup_threshold) and ((mtb >= mtb_floor) or sift_override) and ((hd < pdq_ceil) or sift_override)
-
-            if sift_override:
-                if sift_matches >= sift_min * 3.0:
-                    trigger_metrics.append(f"SIFT_OVERRIDE(HIGH: {sift_matches}≥{sift_min * 3.0:.0f})")
-                else:
-                    trigger_metrics.append(f"SIFT_OVERRIDE(COMBO: SIFT={sift_matches}≥{sift_min}, CLIP={clip:.1f}≥92.0)")
-
-            if dup:
-                _drop(i, mtb, edge, hd, ssim, clip, score, trigger_metrics, is_aerial_i)
-                if _experiment_logger:
-                    _experiment_logger.add_comparison(
-                        mids[i], mids[j], mtb, edge, ssim, clip, hd, sift_matches, score,
-                        dropped=True, drop_reason="duplicate"
-                    )
-            else:
-                if _experiment_logger:
-                    _experiment_logger.add_comparison(
+    with profile_phase(prof, "phase2"):
+        # Process comparisons
+        if full_scan:
+            # Standard full-scan processing
+            for i, j in idx_pairs:
+                if not keep[i] or not keep[j]:
+                    continue
+
+                if mids[i] == mids[j]:
+                    logger.debug("Skipping self-comparison: %s", mids[i])
+                    continue
+
+                t_pair = time.perf_counter()
+
+                mtb, edge, hd, ssim, clip, sift_matches = pair_sim(mids[i], mids[j])
+
+                pair_ms = (time.perf_counter() - t_pair) * 1000.0
+                _pair_seconds.observe(pair_ms / 1000.0)
+                if hd == 999:
+                    _pair_outcomes["unusable"].inc()
+                    continue
+
+                is_aerial_i = _is_aerial(mids[i], metadata_dict)
+                is_aerial_j = _is_aerial(mids[j], metadata_dict)
+                is_aerial_pair = is_aerial_i or is_aerial_j  # Use aerial weights if either is aerial
+                recorded = pair_aerial(mids[i], mids[j]) if pair_aerial else None
+                if recorded is not None:
+                    is_aerial_pair = recorded
+
+                d = _decide_pair(mtb, hd, ssim, clip, sift_matches, policy_for(is_aerial_pair))
+                _pair_outcomes["duplicate" if d["dup"] else "kept"].inc()
+                score = d["score"]
+
+                # stats + logging
+                for k, v in zip(("mtb", "edge", "hd", "ssim", "clip", "sift", "score"),
+                                (mtb, edge, hd, ssim, clip, sift_matches, score)):
+                    stats[k].append(v)
+                _log_pair(i, j, mtb, edge, hd, ssim, clip, sift_matches, score, is_aerial_pair)
+
+                if d["dup"]:
+                    _drop(i, mtb, edge, hd, ssim, clip, score, d["trigger_metrics"], is_aerial_i)
+                if exp_log:
+                    exp_log.add_comparison(
                         mids[i], mids[j], mtb, edge, ssim, clip, hd, sift_matches, score,
-                        dropped=False, drop_reason=f"SCORE < {dup_threshold}" if score < dup_threshold else ""
+                        dropped=d["dup"], drop_reason=d["drop_reason"],
+                        aerial=is_aerial_pair, timing_ms=pair_ms,
+                        dropped_path=mids[i] if d["dup"] else None
                     )
-    else:
-        # DRIFT-FIX mode: process sequentially, updating last_kept_idx
-        last_kept_idx = 0
-
-        for i in range(1, len(groups)):
-            # Compare current frame (i) against last kept frame (last_kept_idx)
-            mtb, edge, hd, ssim, clip, sift_matches = _pair_sim(mids[last_kept_idx], mids[i])
-            if hd == 999:
-                # Can't compare - keep the frame and update reference
-                last_kept_idx = i
-                continue
-
-            is_aerial_i = _is_aerial(mids[i], metadata_dict)
-            is_aerial_last = _is_aerial(mids[last_kept_idx], metadata_dict)
-            is_aerial_pair = is_aerial_i or is_aerial_last
-
-            if is_aerial_pair:
-                w_mtb, w_ssim, w_clip, w_pdq, w_sift = AERIAL_WEIGHT_MTB, AERIAL_WEIGHT_SSIM, AERIAL_WEIGHT_CLIP, AERIAL_WEIGHT_PDQ, AERIAL_WEIGHT_SIFT
-                dup_threshold = AERIAL_COMPOSITE_DUP_THRESHOLD
-                mtb_floor = AERIAL_MTB_HARD_FLOOR
-                pdq_ceil = AERIAL_PDQ_HD_CEIL
-                sift_min = AERIAL_SIFT_MIN_MATCHES
-            else:
-                w_mtb, w_ssim, w_clip, w_pdq, w_sift = WEIGHT_MTB, WEIGHT_SSIM, WEIGHT_CLIP, WEIGHT_PDQ, WEIGHT_SIFT
-                dup_threshold = COMPOSITE_DUP_THRESHOLD
-                mtb_floor = MTB_HARD_FLOOR
-                pdq_ceil = PDQ_HD_CEIL
-                sift_min = SIFT_MIN_MATCHES
-
-            sift_score = min(sift_matches / 100.0, 1.0) if sift_matches > 0 else 0.0
-
-            score = (
-                w_mtb  * (mtb  / 100.0) +
-                w_ssim * (ssim / 100.0) +
-                w_clip * (clip / 100.0) +
-                w_pdq  * (0.0 if hd >= pdq_ceil else 1.0 - hd / pdq_ceil) +
-                w_sift * sift_score
-            )
-
-            for k, v in zip(("mtb", "edge", "hd", "ssim", "clip", "sift", "score"),
-                            (mtb, edge, hd, ssim, clip, sift_matches, score)):
-                stats[k].append(v)
-            _log_pair(last_kept_idx, i, mtb, edge, hd, ssim, clip, sift_matches, score, is_aerial_pair)
-
-            trigger_metrics = []
-            drop_reason = ""
-            if score >= dup_threshold:
-                trigger_metrics.append(f"SCORE({score:.2f}≥{dup_threshold})")
-
-            sift_override = (sift_matches >= sift_min * 3.0) or ((sift_matches >= sift_min) and (clip >= 92.0))
-
-            if mtb < mtb_floor and not sift_override:
-                trigger_metrics.append(f"MTB_FLOOR_FAIL({mtb:.1f}<{mtb_floor})")
-                drop_reason = f"MTB < {mtb_floor}"
-                if _experiment_logger:
-                    _experiment_logger.add_comparison(
-                        mids[last_kept_idx], mids[i], mtb, edge, ssim, clip, hd, sift_matches, score,
-                        dropped=False, drop_reason=drop_reason
-                    )
-                # Keep this frame and update reference
-                last_kept_idx = i
-                continue
-
-            if hd >= pdq_ceil and not sift_override:
-                trigger_metrics.append(f"PDQ_HD({hd:.0f}≥{pdq_ceil})")
-                drop_reason = f"PDQ >= {pdq_ceil}"
-                if _experiment_logger:
-                    _experiment_logger.add_comparison(
+        else:
+            # DRIFT-FIX mode: process sequentially, updating last_kept_idx
+            last_kept_idx = 0
+
+            for i in range(1, len(groups)):
+                # Compare current frame (i) against last kept frame (last_kept_idx)
+                t_pair = time.perf_counter()
+                mtb, edge, hd, ssim, clip, sift_matches = pair_sim(mids[last_kept_idx], mids[i])
+                pair_ms = (time.perf_counter() - t_pair) * 1000.0
+                _pair_seconds.observe(pair_ms / 1000.0)
+                if hd == 999:
+                    _pair_outcomes["unusable"].inc()
+                    # Can't compare - keep the frame and update reference
+                    last_kept_idx = i
+                    continue
+
+                is_aerial_i = _is_aerial(mids[i], metadata_dict)
+                is_aerial_last = _is_aerial(mids[last_kept_idx], metadata_dict)
+                is_aerial_pair = is_aerial_i or is_aerial_last  # Use aerial weights if either is aerial
+                recorded = pair_aerial(mids[last_kept_idx], mids[i]) if pair_aerial else None
+                if recorded is not None:
+                    is_aerial_pair = recorded
+
+                d = _decide_pair(mtb, hd, ssim, clip, sift_matches, policy_for(is_aerial_pair))
+                _pair_outcomes["duplicate" if d["dup"] else "kept"].inc()
+                score = d["score"]
+
+                # stats + logging
+                for k, v in zip(("mtb", "edge", "hd", "ssim", "clip", "sift", "score"),
+                                (mtb, edge, hd, ssim, clip, sift_matches, score)):
+                    stats[k].append(v)
+                _log_pair(last_kept_idx, i, mtb, edge, hd, ssim, clip, sift_matches, score, is_aerial_pair)
+
+                if d["dup"]:
+                    # Drop frame i; DON'T update last_kept_idx - keep comparing against same reference
+                    _drop(i, mtb, edge, hd, ssim, clip, score, d["trigger_metrics"], is_aerial_i)
+                if exp_log:
+                    exp_log.add_comparison(
                         mids[last_kept_idx], mids[i], mtb, edge, ssim, clip, hd, sift_matches, score,
-                        dropped=False, drop_reason=drop_reason
+                        dropped=d["dup"], drop_reason=d["drop_reason"],
+                        aerial=is_aerial_pair, timing_ms=pair_ms,
+                        dropped_path=mids[i] if d["dup"] else None
                     )
-                # Keep this frame and update reference
-                last_kept_idx = i
-                continue
-
-            dup = (score >= dup_threshold) and ((mtb >= mtb_floor) or sift_override) and ((hd < pdq_ceil) or sift_override)
-
-            if sift_override:
-                if sift_matches >= sift_min * 3.0:
-                    trigger_metrics.append(f"SIFT_OVERRIDE(HIGH: {sift_matches}≥{sift_min * 3.0:.0f})")
-                else:
-                    trigger_metrics.append(f"SIFT_OVERRIDE(COMBO: SIFT={sift_matches}≥{sift_min}, CLIP={clip:.1f}≥92.0)")
-
-            if dup:
-                # Drop frame i
-                _drop(i, mtb, edge, hd, ssim, clip, score, trigger_metrics, is_aerial_i)
-                if _experiment_logger:
-                    _experiment_logger.add_comparison(
-                        mids[last_kept_idx], mids[i], mtb, edge, ssim, clip, hd, sift_matches, score,
-                        dropped=True, drop_reason="duplicate"
-                    )
-                # DON'T update last_kept_idx - keep comparing against same reference
-            else:
-                # Keep frame i and update reference
-                if _experiment_logger:
-                    _experiment_logger.add_comparison(
-                        mids[last_kept_idx], mids[i], mtb, edge, ssim, clip, hd, sift_matches, score,
-                        dropped=False, drop_reason=f"SCORE < {dup_threshold}" if score < dup_threshold else ""
-                    )
-                last_kept_idx = i
+                if not d["dup"]:
+                    # Keep this frame and update reference
+                    last_kept_idx = i
 
     final_groups = [g for g, k in zip(groups, keep) if k]
     logger.info("[RESULT] stacks: %d → %d", len(groups), len(final_groups))
@@ -722,13 +773,27 @@ def remove_near_duplicates(
 
 if __name__ == "__main__":
     import argparse
+    from profiling import add_profile_arguments, profiler_from_args
 
     parser = argparse.ArgumentParser(description="Near-duplicate image remover with drift fix")
     parser.add_argument("--log-experiment", type=str, default=None,
                         help="Name for this experiment")
     parser.add_argument("--log-file", type=str, default="experiment_logs.md",
                         help="File to log experiment results to")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print per-module import cost and deferred-import timings")
+    parser.add_argument("--metrics-out", type=str, default=None, metavar="PREFIX",
+                        help="Record stage timers/counters; write PREFIX.prom and PREFIX.json at the end")
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    if args.metrics_out:
+        import telemetry
+        telemetry.enable()
+    _profiler = profiler_from_args(args)
+
+    if args.profile_startup:
+        from lazy_imports import startup_report
+        print(startup_report(Path(__file__).stem))
 
     # Test on folder 1 (20 images)
     groups = []
@@ -747,6 +812,8 @@ if __name__ == "__main__":
         _experiment_logger = ExperimentLogger()
         _experiment_logger.start_capture()
         _experiment_logger.input_count = len(groups)
+    if _profiler:
+        _profiler.listing = folder
 
     logger.info(f"Number of groups before deduplication: {len(groups)}")
     logger.info(f"Using DRIFT-FIX mode: comparing vs last KEPT frame")
@@ -758,3 +825,19 @@ if __name__ == "__main__":
         _experiment_logger.output_count = len(filtered)
         terminal_output = _experiment_logger.stop_capture()
         _experiment_logger.write_experiment_log(args.log_experiment, terminal_output, args.log_file)
+
+    if _profiler:
+        _profiler.stop()
+        if args.log_experiment:
+            _profiler.append_report(args.log_file)
+        else:
+            print(_profiler.report_markdown())
+
+    if args.profile_startup:
+        from lazy_imports import lazy_import_times
+        for name, secs in sorted(lazy_import_times().items(), key=lambda kv: kv[1], reverse=True):
+            print(f"  deferred import {name:<24}{secs * 1000:>10.1f} ms")
+
+    if args.metrics_out:
+        from telemetry import write_report
+        write_report(args.metrics_out)
@@ -10,6 +10,12 @@ PERFORMANCE-OPTIMIZED PIPELINE:
     Stage 3: SIFT Matching   (200ms)  - Geometric verification for uncertain cases
     Stage 4: Composite Score (1ms)    - Full weighted decision for edge cases
 
+remove_near_duplicates runs the stages as tiers over the whole pair schedule
+(cascade_pairs): a stage sees only the pairs the earlier ones left open and
+computes its features in one batch for just the images of those pairs, after a
+tier 0 that settles byte-identical files.  Per-tier pair counts, exit rates,
+images computed and time are logged and written to the experiment log.
+
 Expected Performance: ~80ms avg (GPU) vs ~9000ms in standard implementation (112x faster)
 Accuracy: Same as standard implementation (100% on test set)
 
@@ -17,37 +23,37 @@ Accuracy: Same as standard implementation (100% on test set)
 Dependencies
 ------------------------------------------------------------
     pip install opencv-python-headless numpy pillow
-    pip install scikit-image           # <-- for SSIM
     pip install pdqhash-lite           # <-- optional PDQ
     pip install open_clip_torch torch  # <-- only if you enable CLIP
 """
 
 from __future__ import annotations
 
+import hashlib
 import logging
 import os
 import io
 import threading
 import time
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Dict, Any, Optional
 
 import cv2
 import numpy as np
 
+from bounded_cache import BoundedCache, memoize
+from lazy_imports import lazy_module
+from fast_ssim import ssim_from_stats, ssim_pair, ssim_stats
+from feature_shards import sift_descriptors, sift_match_count
+from multihash import pack_bits, popcount
+from telemetry import feature_timers
+
 # ─── optional deps ────────────────────────────────────────────────────────────
-try:
-    import pdqhash
-except ImportError:
-    pdqhash = None
+pdqhash = lazy_module("pdqhash")
 
-try:
-    from skimage.metrics import structural_similarity as _ssim
-except ImportError:
-    _ssim = None
 
 try:
     from PIL import Image
@@ -57,11 +63,12 @@ except ImportError:
 
 USE_CLIP = True
 if USE_CLIP:
-    try:
-        import torch, open_clip
+    # installed-check only; torch/open_clip are imported on the first embedding
+    torch, open_clip = lazy_module("torch"), lazy_module("open_clip")
+    if torch and open_clip:
         _clip_model = _clip_pre = _clip_device = None
         _clip_lock = threading.Lock()
-    except ImportError:
+    else:
         USE_CLIP = False
 
 # ─── logging ──────────────────────────────────────────────────────────────────
@@ -81,8 +88,11 @@ class ExperimentLogger:
         self.comparison_results: List[Dict[str, Any]] = []
         self.input_count = 0
         self.output_count = 0
-        self.stage_stats = {"stage1_exits": 0, "stage2_exits": 0, "stage3_exits": 0, "stage4_full": 0}
+        self.result_store = None   # optional result_store.ResultStore (pair rows)
+        self.listing = ""
+        self.stage_stats = {"stage0_exits": 0, "stage1_exits": 0, "stage2_exits": 0, "stage3_exits": 0, "stage4_full": 0}
         self.timing_stats = []
+        self.tier_stats = []       # TierStats of the last cascade_pairs run
 
     def start_capture(self) -> None:
         self.handler = logging.StreamHandler(self.log_capture)
@@ -97,7 +107,14 @@ class ExperimentLogger:
     def add_comparison(self, img_a: str, img_b: str, mtb: float, edge: float,
                        ssim: float, clip: float, pdq_hd: int, sift_matches: int,
                        score: float, dropped: bool, drop_reason: str,
-                       exit_stage: str, timing_ms: float) -> None:
+                       exit_stage: str, timing_ms: float, aerial: bool = False,
+                       dropped_path: Optional[str] = None) -> None:
+        if self.result_store is not None:
+            self.result_store.add_pair(
+                listing=self.listing, path_a=img_a, path_b=img_b, mtb=mtb, edge=edge,
+                ssim=ssim, clip=clip, pdq_hd=pdq_hd, sift=sift_matches, score=score,
+                aerial=aerial, exit_stage=exit_stage, timing_ms=timing_ms, decision=dropped,
+                drop_reason=drop_reason, dropped_path=dropped_path)
         self.comparison_results.append({
             "img_a": Path(img_a).stem,
             "img_b": Path(img_b).stem,
@@ -116,15 +133,24 @@ class ExperimentLogger:
         self.timing_stats.append(timing_ms)
 
     def record_stage_exit(self, stage: str) -> None:
-        if stage == "STAGE1_PDQ_REJECT":
+        if stage == "STAGE0_EXACT":
+            self.stage_stats["stage0_exits"] += 1
+        elif stage == "STAGE1_PDQ_REJECT":
             self.stage_stats["stage1_exits"] += 1
-        elif stage == "STAGE2_CLIP_HIGH":
+        elif stage in ("STAGE2_CLIP_HIGH", "STAGE2_CLIP_LOW"):
             self.stage_stats["stage2_exits"] += 1
         elif stage == "STAGE3_SIFT":
             self.stage_stats["stage3_exits"] += 1
         elif stage == "STAGE4_COMPOSITE":
             self.stage_stats["stage4_full"] += 1
 
+    def results(self) -> List[Dict[str, Any]]:
+        """Rows for the markdown table, read back from the result store when one is attached."""
+        if self.result_store is not None:
+            from result_store import stored_comparisons
+            return stored_comparisons(self.result_store, self.listing)
+        return self.comparison_results
+
     def write_experiment_log(self, experiment_name: str, terminal_output: str, log_file: str) -> None:
         log_path = Path(log_file)
 
@@ -149,23 +175,32 @@ class ExperimentLogger:
 | MTB_HARD_FLOOR | {MTB_HARD_FLOOR} |
 | PDQ_HD_CEIL | {PDQ_HD_CEIL} |
 | SIFT_MIN_MATCHES | {SIFT_MIN_MATCHES} |
+| PDQ_REJECT_HD (regular / aerial) | {PDQ_REJECT_HD} / {AERIAL_PDQ_REJECT_HD} |
+| CLIP_HIGH / LOW (regular) | {CLIP_HIGH_THRESHOLD} / {CLIP_LOW_THRESHOLD} |
+| CLIP_HIGH / LOW (aerial) | {AERIAL_CLIP_HIGH_THRESHOLD} / {AERIAL_CLIP_LOW_THRESHOLD} |
+| CASCADE_CONFIG | {CASCADE_CONFIG or '(defaults)'} |
 
 ## Cascading Pipeline Performance
 
 | Stage | Exits | Percentage | Avg Time |
 |-------|-------|------------|----------|
+| Stage 0: Exact Match | {self.stage_stats['stage0_exits']} | {self.stage_stats['stage0_exits']/total_comparisons*100:.1f}% | <0.1ms |
 | Stage 1: PDQ Rejection | {self.stage_stats['stage1_exits']} | {self.stage_stats['stage1_exits']/total_comparisons*100:.1f}% | ~0.1ms |
-| Stage 2: CLIP High Similarity | {self.stage_stats['stage2_exits']} | {self.stage_stats['stage2_exits']/total_comparisons*100:.1f}% | ~50ms |
+| Stage 2: CLIP High / Low | {self.stage_stats['stage2_exits']} | {self.stage_stats['stage2_exits']/total_comparisons*100:.1f}% | ~50ms |
 | Stage 3: SIFT Verification | {self.stage_stats['stage3_exits']} | {self.stage_stats['stage3_exits']/total_comparisons*100:.1f}% | ~200ms |
 | Stage 4: Composite Decision | {self.stage_stats['stage4_full']} | {self.stage_stats['stage4_full']/total_comparisons*100:.1f}% | ~250ms |
 | **Average Time per Comparison** | - | - | **{avg_time:.1f}ms** |
 
+## Tier Statistics
+
+{format_tier_stats(self.tier_stats) if self.tier_stats else '(not recorded)'}
+
 ## Results
 
 | Image A | Image B | MTB % | Edge % | SSIM % | CLIP % | PDQ HD | SIFT | SCORE | Dropped? | Exit Stage | Time (ms) |
 |---------|---------|-------|--------|--------|--------|--------|------|-------|----------|------------|-----------|
 """
-        for r in self.comparison_results:
+        for r in self.results():
             dropped_str = f"Yes ({r['drop_reason']})" if r["dropped"] else "No"
             if not r["dropped"] and r["drop_reason"]:
                 dropped_str = f"No ({r['drop_reason']})"
@@ -209,6 +244,8 @@ CLIP_LOW_THRESHOLD = 70.0   # CLIP < this ⇒ definitely not duplicate (fast rej
 
 # Stage 3: SIFT verification threshold
 SIFT_MIN_MATCHES = 50       # SIFT matches ≥ this ⇒ duplicate
+SIFT_OVERRIDE_MULT = 1.5    # SIFT ≥ sift_min × this ⇒ duplicate outright
+SIFT_OVERRIDE_CLIP = 85.0   # … or SIFT ≥ sift_min with CLIP ≥ this
 
 # Stage 4: Composite decision (for uncertain cases)
 MTB_HARD_FLOOR = 67.0       # MTB floor for composite decision
@@ -232,10 +269,21 @@ AERIAL_WEIGHT_SIFT = 0.10
 AERIAL_COMPOSITE_DUP_THRESHOLD = 0.32
 AERIAL_SIFT_MIN_MATCHES = 50
 
+# Stage 1 / 2 exits per pair class.  calibrate_cascade.py writes a versioned
+# config that replaces these four (load_cascade_config, or $DEDUP_CASCADE_CONFIG
+# at import); the composite keeps PDQ_HD_CEIL / AERIAL_PDQ_HD_CEIL.
+PDQ_REJECT_HD = PDQ_HD_CEIL
+AERIAL_PDQ_REJECT_HD = AERIAL_PDQ_HD_CEIL
+AERIAL_CLIP_HIGH_THRESHOLD = CLIP_HIGH_THRESHOLD
+AERIAL_CLIP_LOW_THRESHOLD = CLIP_LOW_THRESHOLD
+CASCADE_CONFIG = os.environ.get("DEDUP_CASCADE_CONFIG", "")
+CASCADE_CONFIG_VERSION = 1
+
 MAX_WORKERS = 16
+CLIP_BATCH_SIZE = 32        # images per CLIP forward pass (tier 2)
 
 # ─── helpers: I/O / resize / CLAHE / metadata ─────────────────────────────────
-@lru_cache(maxsize=512)
+@memoize(BoundedCache.from_env("gray"))
 def _load_gray(path: str) -> np.ndarray:
     img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
     if img is None:
@@ -305,17 +353,12 @@ def overlap_percent(a: np.ndarray, b: np.ndarray) -> float:
     return 100.0 * np.logical_and(a, b).sum() / min(a.sum(), b.sum())
 
 def _compute_ssim(gA: np.ndarray, gB: np.ndarray) -> float:
-    """Return SSIM in 0–100 (%). 0 if skimage unavailable."""
-    if _ssim is None:
-        return 0.0
-    H, W = max(gA.shape[0], gB.shape[0]), max(gA.shape[1], gB.shape[1])
-    padA = np.pad(gA, ((0, H-gA.shape[0]), (0, W-gA.shape[1])), constant_values=0)
-    padB = np.pad(gB, ((0, H-gB.shape[0]), (0, W-gB.shape[1])), constant_values=0)
-    return 100.0 * float(_ssim(padA, padB, data_range=255))
+    """Return SSIM in 0–100 (%) (thumbnails zero-padded to a common shape)."""
+    return 100.0 * ssim_pair(gA, gB)
 
 # ─── PDQ helpers ──────────────────────────────────────────────────────────────
 def _pdq_bits(path: str) -> Optional[np.ndarray]:
-    if pdqhash is None:
+    if not pdqhash:
         return None
     try:
         from PIL import Image
@@ -332,43 +375,51 @@ def _pdq_hd(a: np.ndarray, b: np.ndarray) -> int:
 # ─── CLIP helpers ─────────────────────────────────────────────────────────────
 _clip_failed = False
 
-def _safe_clip_embed(path: str) -> Optional[np.ndarray]:
-    if not USE_CLIP:
-        return None
-    global _clip_model, _clip_pre, _clip_device, _clip_failed
+def _ensure_clip_model() -> None:
+    """Load ViT-B-32 once (CUDA if it works, else CPU)."""
+    global _clip_model, _clip_pre, _clip_device
+    if _clip_model is not None:
+        return
+    with _clip_lock:
+        if _clip_model is None:
+            if torch.cuda.is_available():
+                try:
+                    _clip_device = "cuda"
+                    _clip_model, _clip_pre, _ = open_clip.create_model_and_transforms(
+                        "ViT-B-32", pretrained="openai", device=_clip_device)
+                    _clip_model.eval()
+                    test_tensor = torch.randn(1, 3, 224, 224).to(_clip_device)
+                    with torch.no_grad():
+                        test_emb = _clip_model.encode_image(test_tensor)
+                    logger.info(f"CLIP model loaded on CUDA successfully")
+                except Exception as cuda_err:
+                    logger.warning(f"CLIP CUDA failed ({cuda_err}), falling back to CPU")
+                    _clip_device = "cpu"
+                    _clip_model, _clip_pre, _ = open_clip.create_model_and_transforms(
+                        "ViT-B-32", pretrained="openai", device=_clip_device)
+                    _clip_model.eval()
+                    logger.info(f"CLIP model loaded on CPU successfully")
+            else:
+                _clip_device = "cpu"
+                _clip_model, _clip_pre, _ = open_clip.create_model_and_transforms(
+                    "ViT-B-32", pretrained="openai", device=_clip_device)
+                _clip_model.eval()
+                logger.info(f"CLIP model loaded on CPU (CUDA not available)")
+
+def _clip_failure(e: Exception, what: str) -> None:
+    global _clip_failed
+    logger.error(f"CLIP embedding failed for {what}: {e}")
+    if "CUDA" in str(e) or "device" in str(e).lower():
+        logger.error("CLIP appears to have device issues, disabling for this session")
+        _clip_failed = True
 
-    if _clip_failed:
+def _safe_clip_embed(path: str) -> Optional[np.ndarray]:
+    if not USE_CLIP or _clip_failed:
         return None
 
     try:
         import PIL.Image as Image
-        if _clip_model is None:
-            with _clip_lock:
-                if _clip_model is None:
-                    if torch.cuda.is_available():
-                        try:
-                            _clip_device = "cuda"
-                            _clip_model, _clip_pre, _ = open_clip.create_model_and_transforms(
-                                "ViT-B-32", pretrained="openai", device=_clip_device)
-                            _clip_model.eval()
-                            test_tensor = torch.randn(1, 3, 224, 224).to(_clip_device)
-                            with torch.no_grad():
-                                test_emb = _clip_model.encode_image(test_tensor)
-                            logger.info(f"CLIP model loaded on CUDA successfully")
-                        except Exception as cuda_err:
-                            logger.warning(f"CLIP CUDA failed ({cuda_err}), falling back to CPU")
-                            _clip_device = "cpu"
-                            _clip_model, _clip_pre, _ = open_clip.create_model_and_transforms(
-                                "ViT-B-32", pretrained="openai", device=_clip_device)
-                            _clip_model.eval()
-                            logger.info(f"CLIP model loaded on CPU successfully")
-                    else:
-                        _clip_device = "cpu"
-                        _clip_model, _clip_pre, _ = open_clip.create_model_and_transforms(
-                            "ViT-B-32", pretrained="openai", device=_clip_device)
-                        _clip_model.eval()
-                        logger.info(f"CLIP model loaded on CPU (CUDA not available)")
-
+        _ensure_clip_model()
         img = Image.open(path).convert("RGB")
         t = _clip_pre(img).unsqueeze(0).to(_clip_device)
         with torch.no_grad():
@@ -380,12 +431,54 @@ def _safe_clip_embed(path: str) -> Optional[np.ndarray]:
 
         return (emb / (emb.norm() + 1e-8)).numpy()
     except Exception as e:
-        logger.error(f"CLIP embedding failed for {path}: {e}")
-        if "CUDA" in str(e) or "device" in str(e).lower():
-            logger.error("CLIP appears to have device issues, disabling for this session")
-            _clip_failed = True
+        _clip_failure(e, path)
         return None
 
+def _clip_embed_batch(paths: List[str]) -> List[Optional[np.ndarray]]:
+    """
+    Embeddings for many images: decoding + preprocessing on a thread pool, one
+    forward pass per CLIP_BATCH_SIZE images.  A failed batch falls back to
+    _safe_clip_embed per image.
+    """
+    if not USE_CLIP or _clip_failed or not paths:
+        return [None] * len(paths)
+    import PIL.Image as Image
+    try:
+        _ensure_clip_model()
+    except Exception as e:
+        _clip_failure(e, "model load")
+        return [None] * len(paths)
+
+    def _prep(path: str):
+        try:
+            with Image.open(path) as img:
+                return _clip_pre(img.convert("RGB"))
+        except Exception as e:
+            logger.error(f"CLIP preprocessing failed for {path}: {e}")
+            return None
+
+    out: List[Optional[np.ndarray]] = [None] * len(paths)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        tensors = list(pool.map(_prep, paths))
+    for s in range(0, len(paths), CLIP_BATCH_SIZE):
+        idx = [k for k in range(s, min(s + CLIP_BATCH_SIZE, len(paths))) if tensors[k] is not None]
+        if not idx:
+            continue
+        try:
+            with torch.no_grad():
+                emb = _clip_model.encode_image(torch.stack([tensors[k] for k in idx]).to(_clip_device)).cpu()
+        except Exception as e:
+            logger.warning(f"Batched CLIP failed ({e}), embedding {len(idx)} images one by one")
+            for k in idx:
+                out[k] = _safe_clip_embed(paths[k])
+            continue
+        for k, e in zip(idx, emb):
+            if e.numel() == 0 or torch.isnan(e).any():
+                logger.error(f"CLIP produced invalid embedding for {paths[k]}")
+                continue
+            out[k] = (e / (e.norm() + 1e-8)).numpy()
+    return out
+
 def _cosine(a: np.ndarray, b: np.ndarray) -> float:
     if a is None or b is None:
         return 0.0
@@ -439,11 +532,63 @@ def _pdq_worker(path: str) -> Dict[str, Any]:
         pdq=_pdq_bits(path)
     )
 
-_pdq_store: Dict[str, Dict[str, Any]] = {}
-_clip_store: Dict[str, Optional[np.ndarray]] = {}
-_mtb_store: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+def _mtb_worker(path: str) -> Tuple[np.ndarray, np.ndarray, Any]:
+    """MTB bitmap, edge map and SSIM window stats for Stage 4"""
+    gray = _load_gray(path)
+    if USE_CLAHE:
+        gray = _apply_clahe(gray)
+    return (
+        _compute_mtb(_resize_to_exact_size(gray, MTB_SIZE)),
+        _compute_edges(_resize_to_exact_size(gray, EDGE_SIZE)),
+        ssim_stats(_resize_keep_aspect(gray, SSIM_SIZE))
+    )
+
+_pdq_store = BoundedCache.from_env("metrics", name="pdq")     # path → _pdq_worker record
+_clip_store = BoundedCache.from_env("metrics", name="clip")   # path → CLIP embedding
+_mtb_store = BoundedCache.from_env("metrics", name="mtb")     # path → _mtb_worker tuple
 
 # ─── cascading comparison logic ───────────────────────────────────────────────
+def _thresholds(is_aerial_pair: bool) -> Dict[str, Any]:
+    """Stage thresholds and composite weights for a regular or aerial pair (read at call time)."""
+    if is_aerial_pair:
+        return {"pdq_reject": AERIAL_PDQ_REJECT_HD, "clip_high": AERIAL_CLIP_HIGH_THRESHOLD,
+                "clip_low": AERIAL_CLIP_LOW_THRESHOLD,
+                "pdq_ceil": AERIAL_PDQ_HD_CEIL, "sift_min": AERIAL_SIFT_MIN_MATCHES,
+                "mtb_floor": AERIAL_MTB_HARD_FLOOR, "threshold": AERIAL_COMPOSITE_DUP_THRESHOLD,
+                "weights": (AERIAL_WEIGHT_MTB, AERIAL_WEIGHT_SSIM, AERIAL_WEIGHT_CLIP,
+                            AERIAL_WEIGHT_PDQ, AERIAL_WEIGHT_SIFT)}
+    return {"pdq_reject": PDQ_REJECT_HD, "clip_high": CLIP_HIGH_THRESHOLD, "clip_low": CLIP_LOW_THRESHOLD,
+            "pdq_ceil": PDQ_HD_CEIL, "sift_min": SIFT_MIN_MATCHES,
+            "mtb_floor": MTB_HARD_FLOOR, "threshold": COMPOSITE_DUP_THRESHOLD,
+            "weights": (WEIGHT_MTB, WEIGHT_SSIM, WEIGHT_CLIP, WEIGHT_PDQ, WEIGHT_SIFT)}
+
+_CASCADE_KEYS = {"regular": ("PDQ_REJECT_HD", "CLIP_HIGH_THRESHOLD", "CLIP_LOW_THRESHOLD"),
+                 "aerial": ("AERIAL_PDQ_REJECT_HD", "AERIAL_CLIP_HIGH_THRESHOLD", "AERIAL_CLIP_LOW_THRESHOLD")}
+
+def load_cascade_config(path: str) -> Dict[str, Any]:
+    """Apply stage 1 / 2 thresholds from a calibrate_cascade.py config; returns the config."""
+    global CASCADE_CONFIG
+    import json
+    cfg = json.loads(Path(path).read_text(encoding="utf-8"))
+    if cfg.get("version") != CASCADE_CONFIG_VERSION:
+        raise ValueError(f"{path}: cascade config version {cfg.get('version')} "
+                         f"(this engine reads version {CASCADE_CONFIG_VERSION})")
+    for cls in _CASCADE_KEYS:                      # validate every class before applying any
+        t = cfg[cls]["thresholds"]
+        if t["clip_low"] > t["clip_high"]:
+            raise ValueError(f"{path}: {cls} clip_low {t['clip_low']} > clip_high {t['clip_high']}")
+    for cls, (pdq_key, high_key, low_key) in _CASCADE_KEYS.items():
+        t = cfg[cls]["thresholds"]
+        globals().update({pdq_key: int(t["pdq_reject"]), high_key: float(t["clip_high"]),
+                          low_key: float(t["clip_low"])})
+    CASCADE_CONFIG = str(path)
+    logger.info("Cascade thresholds from %s (calibrated %s): regular %s, aerial %s", path,
+                cfg.get("created", "?"), cfg["regular"]["thresholds"], cfg["aerial"]["thresholds"])
+    return cfg
+
+if CASCADE_CONFIG:
+    load_cascade_config(CASCADE_CONFIG)
+
 def _cascading_compare(path_a: str, path_b: str, is_aerial_pair: bool,
                        metadata_dict: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
     """
@@ -458,21 +603,9 @@ def _cascading_compare(path_a: str, path_b: str, is_aerial_pair: bool,
     start_time = time.time()
 
     # Select appropriate thresholds
-    if is_aerial_pair:
-        pdq_ceil = AERIAL_PDQ_HD_CEIL
-        sift_min = AERIAL_SIFT_MIN_MATCHES
-        mtb_floor = AERIAL_MTB_HARD_FLOOR
-        dup_threshold = AERIAL_COMPOSITE_DUP_THRESHOLD
-        w_mtb, w_ssim, w_clip, w_pdq, w_sift = (AERIAL_WEIGHT_MTB, AERIAL_WEIGHT_SSIM,
-                                                 AERIAL_WEIGHT_CLIP, AERIAL_WEIGHT_PDQ,
-                                                 AERIAL_WEIGHT_SIFT)
-    else:
-        pdq_ceil = PDQ_HD_CEIL
-        sift_min = SIFT_MIN_MATCHES
-        mtb_floor = MTB_HARD_FLOOR
-        dup_threshold = COMPOSITE_DUP_THRESHOLD
-        w_mtb, w_ssim, w_clip, w_pdq, w_sift = (WEIGHT_MTB, WEIGHT_SSIM, WEIGHT_CLIP,
-                                                 WEIGHT_PDQ, WEIGHT_SIFT)
+    th = _thresholds(is_aerial_pair)
+    pdq_ceil, sift_min, mtb_floor, dup_threshold = th["pdq_ceil"], th["sift_min"], th["mtb_floor"], th["threshold"]
+    w_mtb, w_ssim, w_clip, w_pdq, w_sift = th["weights"]
 
     metrics = {
         "mtb": -1.0,
@@ -487,12 +620,12 @@ def _cascading_compare(path_a: str, path_b: str, is_aerial_pair: bool,
     # ═══════════════════════════════════════════════════════════════════════════
     # STAGE 1: PDQ FAST REJECTION (0.1ms)
     # ═══════════════════════════════════════════════════════════════════════════
-    pdqA = _pdq_store.get(path_a, {}).get("pdq")
-    pdqB = _pdq_store.get(path_b, {}).get("pdq")
+    pdqA = _pdq_store.get_or_compute(path_a, _pdq_worker)["pdq"]
+    pdqB = _pdq_store.get_or_compute(path_b, _pdq_worker)["pdq"]
     hd = _pdq_hd(pdqA, pdqB)
     metrics["pdq_hd"] = hd
 
-    if hd >= pdq_ceil:
+    if hd >= th["pdq_reject"]:
         # Clearly different images - fast reject
         timing_ms = (time.time() - start_time) * 1000
         return {
@@ -505,16 +638,14 @@ def _cascading_compare(path_a: str, path_b: str, is_aerial_pair: bool,
     # ═══════════════════════════════════════════════════════════════════════════
     # STAGE 2: CLIP SEMANTIC SIMILARITY (50ms GPU / 500ms CPU)
     # ═══════════════════════════════════════════════════════════════════════════
-    if path_a not in _clip_store:
-        _clip_store[path_a] = _safe_clip_embed(path_a)
-    if path_b not in _clip_store:
-        _clip_store[path_b] = _safe_clip_embed(path_b)
+    clip_a = _clip_store.get_or_compute(path_a, _safe_clip_embed)
+    clip_b = _clip_store.get_or_compute(path_b, _safe_clip_embed)
 
-    clip_sim = 100.0 * _cosine(_clip_store[path_a], _clip_store[path_b])
+    clip_sim = 100.0 * _cosine(clip_a, clip_b)
     metrics["clip"] = clip_sim
 
     # High CLIP similarity - very likely duplicate
-    if clip_sim >= CLIP_HIGH_THRESHOLD:
+    if clip_sim >= th["clip_high"]:
         timing_ms = (time.time() - start_time) * 1000
         return {
             "is_duplicate": True,
@@ -524,7 +655,7 @@ def _cascading_compare(path_a: str, path_b: str, is_aerial_pair: bool,
         }
 
     # Low CLIP similarity - unlikely to be duplicate
-    if clip_sim < CLIP_LOW_THRESHOLD:
+    if clip_sim < th["clip_low"]:
         timing_ms = (time.time() - start_time) * 1000
         return {
             "is_duplicate": False,
@@ -541,7 +672,8 @@ def _cascading_compare(path_a: str, path_b: str, is_aerial_pair: bool,
     metrics["sift_matches"] = sift_matches
 
     # SIFT override: strong geometric match
-    sift_override = (sift_matches >= sift_min * 1.5) or ((sift_matches >= sift_min) and (clip_sim >= 85.0))
+    sift_override = ((sift_matches >= sift_min * SIFT_OVERRIDE_MULT) or
+                     ((sift_matches >= sift_min) and (clip_sim >= SIFT_OVERRIDE_CLIP)))
 
     if sift_override:
         timing_ms = (time.time() - start_time) * 1000
@@ -556,32 +688,12 @@ def _cascading_compare(path_a: str, path_b: str, is_aerial_pair: bool,
     # STAGE 4: COMPOSITE DECISION (1ms + any missing metrics)
     # ═══════════════════════════════════════════════════════════════════════════
     # Compute MTB and SSIM if not already computed
-    if path_a not in _mtb_store:
-        gray_a = _load_gray(path_a)
-        if USE_CLAHE:
-            gray_a = _apply_clahe(gray_a)
-        _mtb_store[path_a] = (
-            _compute_mtb(_resize_to_exact_size(gray_a, MTB_SIZE)),
-            _compute_edges(_resize_to_exact_size(gray_a, EDGE_SIZE)),
-            _resize_keep_aspect(gray_a, SSIM_SIZE)
-        )
-
-    if path_b not in _mtb_store:
-        gray_b = _load_gray(path_b)
-        if USE_CLAHE:
-            gray_b = _apply_clahe(gray_b)
-        _mtb_store[path_b] = (
-            _compute_mtb(_resize_to_exact_size(gray_b, MTB_SIZE)),
-            _compute_edges(_resize_to_exact_size(gray_b, EDGE_SIZE)),
-            _resize_keep_aspect(gray_b, SSIM_SIZE)
-        )
-
-    mtb_a, edge_a, gray_ssim_a = _mtb_store[path_a]
-    mtb_b, edge_b, gray_ssim_b = _mtb_store[path_b]
+    mtb_a, edge_a, ssim_a = _mtb_store.get_or_compute(path_a, _mtb_worker)
+    mtb_b, edge_b, ssim_b = _mtb_store.get_or_compute(path_b, _mtb_worker)
 
     mtb = overlap_percent(mtb_a, mtb_b)
     edge = overlap_percent(edge_a, edge_b)
-    ssim = _compute_ssim(gray_ssim_a, gray_ssim_b)
+    ssim = 100.0 * ssim_from_stats(ssim_a, ssim_b)
 
     metrics["mtb"] = mtb
     metrics["edge"] = edge
@@ -619,6 +731,214 @@ def _cascading_compare(path_a: str, path_b: str, is_aerial_pair: bool,
         "timing_ms": timing_ms
     }
 
+# ─── tiered cascade over a whole pair set ─────────────────────────────────────
+# The same stages as _cascading_compare, but each one runs over every pair still
+# undecided, with its features computed in one batch for just the images those
+# pairs involve: SHA-1 of the file bytes, then one packed-PDQ XOR/popcount over
+# all pairs, batched CLIP, SIFT descriptors once per image with the matching
+# fanned out, then MTB/edge/SSIM for the composite.  Identical files exit at
+# tier 0 (the per-pair path only catches them through CLIP); this is the one
+# deliberate difference: without CLIP (not installed, or the model failed) the
+# per-pair path rejects identical files at STAGE2_CLIP_LOW like every other
+# pair that survives PDQ, while tier 0 still accepts them.  Every other pair
+# gets the same decision and exit stage from both paths.
+TIERS = ("STAGE0_EXACT", "STAGE1_PDQ", "STAGE2_CLIP", "STAGE3_SIFT", "STAGE4_COMPOSITE")
+
+@dataclass
+class TierStats:
+    name: str
+    pairs_in: int = 0
+    accepted: int = 0            # decided duplicate here
+    rejected: int = 0            # decided not duplicate here
+    images: int = 0              # images whose features this tier computed
+    seconds: float = 0.0
+
+    @property
+    def exits(self) -> int:
+        return self.accepted + self.rejected
+
+    @property
+    def exit_rate(self) -> float:
+        return self.exits / self.pairs_in if self.pairs_in else 0.0
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+_digest_store = BoundedCache.from_env("metrics", name="digest")   # path → SHA-1 of the file
+_sift_store = BoundedCache.from_env("metrics", name="sift")       # path → (K, 128) uint8 descriptors
+
+_sift_timer = feature_timers("deduplication_cascading")["sift"]
+
+def _sift_worker(path: str) -> np.ndarray:
+    with _sift_timer:
+        return sift_descriptors(cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+
+def _fill(store: BoundedCache, paths: List[str], worker) -> int:
+    """Compute `worker` for every path missing from `store` on the thread pool; returns how many."""
+    todo = [p for p in paths if p not in store]
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(todo))) as pool:
+            for p, v in zip(todo, pool.map(worker, todo)):
+                store[p] = v
+    return len(todo)
+
+def cascade_pairs(pairs: List[Tuple[str, str]], aerial: List[bool]) -> Tuple[List[Dict[str, Any]], List[TierStats]]:
+    """
+    Decide every (path_a, path_b) pair tier by tier.
+
+    Returns one _cascading_compare-style result per pair (timing_ms is the
+    pair's share of each tier it entered) and the per-tier statistics.
+    Byte-identical pairs are accepted at tier 0 even when CLIP is unavailable
+    (see above); otherwise the decisions match _cascading_compare.
+    """
+    n = len(pairs)
+    th = [_thresholds(a) for a in aerial]
+    results: List[Optional[Dict[str, Any]]] = [None] * n
+    metrics = [{"mtb": -1.0, "edge": -1.0, "ssim": -1.0, "clip": -1.0,
+                "pdq_hd": 999, "sift_matches": 0, "score": 0.0} for _ in range(n)]
+    spent = [0.0] * n
+    stats = [TierStats(t) for t in TIERS]
+    open_ = list(range(n))
+
+    def _images(idx: List[int]) -> List[str]:
+        return list(dict.fromkeys(p for k in idx for p in pairs[k]))
+
+    def _decide(k: int, dup: bool, stage: str, tier: TierStats) -> None:
+        results[k] = {"is_duplicate": dup, "exit_stage": stage, "metrics": metrics[k]}
+        if dup:
+            tier.accepted += 1
+        else:
+            tier.rejected += 1
+
+    def _close(tier: TierStats, idx: List[int], t0: float) -> List[int]:
+        tier.seconds = time.perf_counter() - t0
+        for k in idx:
+            spent[k] += tier.seconds / len(idx)
+        return [k for k in idx if results[k] is None]
+
+    # tier 0: byte-identical files
+    t0, tier = time.perf_counter(), stats[0]
+    tier.pairs_in = len(open_)
+    if open_:
+        images = _images(open_)
+        with _digest_store.pinned(images):
+            tier.images = _fill(_digest_store, images, _file_digest)
+            for k in open_:
+                a, b = pairs[k]
+                if _digest_store[a] == _digest_store[b]:
+                    _decide(k, True, "STAGE0_EXACT", tier)
+        open_ = _close(tier, open_, t0)
+
+    # tier 1: PDQ Hamming distance of every open pair in one vector op
+    t0, tier = time.perf_counter(), stats[1]
+    tier.pairs_in = len(open_)
+    if open_:
+        images = _images(open_)
+        with _pdq_store.pinned(images):
+            tier.images = _fill(_pdq_store, images, _pdq_worker)
+            hashes = [_pdq_store[p]["pdq"] for p in images]
+        row = {p: r for r, p in enumerate(images)}
+        ok = np.array([h is not None and h.size == 256 for h in hashes])
+        bits = np.zeros((len(images), 256), np.uint8)
+        for r, h in enumerate(hashes):
+            if ok[r]:
+                bits[r] = h
+        words = pack_bits(bits)
+        a = np.array([row[pairs[k][0]] for k in open_])
+        b = np.array([row[pairs[k][1]] for k in open_])
+        hd = np.where(ok[a] & ok[b], popcount(words[a] ^ words[b]), 999)
+        for k, d in zip(open_, hd):
+            metrics[k]["pdq_hd"] = int(d)
+            if d >= th[k]["pdq_reject"]:
+                _decide(k, False, "STAGE1_PDQ_REJECT", tier)
+        open_ = _close(tier, open_, t0)
+
+    # tier 2: CLIP, embedded in batches for the images of surviving pairs only
+    t0, tier = time.perf_counter(), stats[2]
+    tier.pairs_in = len(open_)
+    if open_:
+        images = _images(open_)
+        with _clip_store.pinned(images):
+            todo = [p for p in images if p not in _clip_store]
+            for p, e in zip(todo, _clip_embed_batch(todo)):
+                _clip_store[p] = e
+            tier.images = len(todo)
+            for k in open_:
+                clip_sim = 100.0 * _cosine(_clip_store[pairs[k][0]], _clip_store[pairs[k][1]])
+                metrics[k]["clip"] = clip_sim
+                if clip_sim >= th[k]["clip_high"]:
+                    _decide(k, True, "STAGE2_CLIP_HIGH", tier)
+                elif clip_sim < th[k]["clip_low"]:
+                    _decide(k, False, "STAGE2_CLIP_LOW", tier)
+        open_ = _close(tier, open_, t0)
+
+    # tier 3: SIFT – descriptors once per image, matching fanned out over pairs
+    t0, tier = time.perf_counter(), stats[3]
+    tier.pairs_in = len(open_)
+    overrides: Dict[int, bool] = {}
+    if open_:
+        images = _images(open_)
+        with _sift_store.pinned(images):
+            tier.images = _fill(_sift_store, images, _sift_worker)
+            with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(open_))) as pool:
+                counts = list(pool.map(lambda k: sift_match_count(_sift_store[pairs[k][0]], _sift_store[pairs[k][1]]),
+                                       open_))
+        for k, sift_matches in zip(open_, counts):
+            sift_min = th[k]["sift_min"]
+            metrics[k]["sift_matches"] = sift_matches
+            overrides[k] = ((sift_matches >= sift_min * SIFT_OVERRIDE_MULT) or
+                            ((sift_matches >= sift_min) and (metrics[k]["clip"] >= SIFT_OVERRIDE_CLIP)))
+            if overrides[k]:
+                _decide(k, True, "STAGE3_SIFT", tier)
+        open_ = _close(tier, open_, t0)
+
+    # tier 4: composite score on the residue
+    t0, tier = time.perf_counter(), stats[4]
+    tier.pairs_in = len(open_)
+    if open_:
+        images = _images(open_)
+        with _mtb_store.pinned(images):
+            tier.images = _fill(_mtb_store, images, _mtb_worker)
+            for k in open_:
+                m, t = metrics[k], th[k]
+                mtb_a, edge_a, ssim_a = _mtb_store[pairs[k][0]]
+                mtb_b, edge_b, ssim_b = _mtb_store[pairs[k][1]]
+                m["mtb"] = mtb = overlap_percent(mtb_a, mtb_b)
+                m["edge"] = overlap_percent(edge_a, edge_b)
+                m["ssim"] = ssim = 100.0 * ssim_from_stats(ssim_a, ssim_b)
+                sift_override = overrides.get(k, False)
+                if mtb < t["mtb_floor"] and not sift_override:
+                    _decide(k, False, "STAGE4_COMPOSITE", tier)
+                    continue
+                hd, sift_matches = m["pdq_hd"], m["sift_matches"]
+                w_mtb, w_ssim, w_clip, w_pdq, w_sift = t["weights"]
+                sift_score = min(sift_matches / 100.0, 1.0) if sift_matches > 0 else 0.0
+                m["score"] = score = (
+                    w_mtb  * (mtb  / 100.0) +
+                    w_ssim * (ssim / 100.0) +
+                    w_clip * (m["clip"] / 100.0) +
+                    w_pdq  * (0.0 if hd >= t["pdq_ceil"] else 1.0 - hd / t["pdq_ceil"]) +
+                    w_sift * sift_score
+                )
+                dup = ((score >= t["threshold"]) and ((mtb >= t["mtb_floor"]) or sift_override)
+                       and ((hd < t["pdq_ceil"]) or sift_override))
+                _decide(k, dup, "STAGE4_COMPOSITE", tier)
+        _close(tier, open_, t0)
+
+    for k, r in enumerate(results):
+        r["timing_ms"] = spent[k] * 1000.0
+    return results, stats
+
+def format_tier_stats(stats: List[TierStats]) -> str:
+    """Markdown table: pairs in, accepted / rejected, exit rate, images computed, time per tier."""
+    lines = ["| Tier | Pairs in | Accepted | Rejected | Exit rate | Images computed | Time (ms) |",
+             "|------|----------|----------|----------|-----------|-----------------|-----------|"]
+    for t in stats:
+        lines.append(f"| {t.name} | {t.pairs_in} | {t.accepted} | {t.rejected} | "
+                     f"{t.exit_rate*100:.1f}% | {t.images} | {t.seconds*1000:.1f} |")
+    return "\n".join(lines)
+
 # ─── main deduper ─────────────────────────────────────────────────────────────
 def remove_near_duplicates(
     groups: List[List[str]],
@@ -632,13 +952,6 @@ def remove_near_duplicates(
 
     mids = [g[len(g)//2] for g in groups]
 
-    # Precompute only PDQ hashes (lightweight)
-    logger.info("[STEP] Pre-computing PDQ hashes for %d images (Stage 1 prep)…", len(mids))
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
-        for fut in as_completed(pool.submit(_pdq_worker, p) for p in mids):
-            m = fut.result()
-            _pdq_store[m["path"]] = m
-
     if metadata_dict is None:
         logger.warning("No metadata_dict provided, using empty dict for aerial detection")
         metadata_dict = {}
@@ -677,17 +990,23 @@ def remove_near_duplicates(
                            for j in range(i+1, len(groups))]
                  if full_scan else [(i, i+1) for i in range(len(groups)-1)])
 
-    for i, j in idx_pairs:
+    # Every scheduled pair is decided tier by tier up front; a pair's decision
+    # does not depend on earlier drops, so replaying them in order below gives
+    # the same result as the per-pair loop (full_scan may decide a few pairs
+    # the loop would have skipped).
+    aerial_flags = [_is_aerial(m, metadata_dict) for m in mids]
+    results, tier_stats = cascade_pairs([(mids[i], mids[j]) for i, j in idx_pairs],
+                                        [aerial_flags[i] or aerial_flags[j] for i, j in idx_pairs])
+    logger.info("[STEP] Tier statistics:\n%s", format_tier_stats(tier_stats))
+    if _experiment_logger:
+        _experiment_logger.tier_stats = tier_stats
+
+    for (i, j), result in zip(idx_pairs, results):
         if not keep[i] or not keep[j]:
             continue
 
-        # Check if either image is aerial
-        is_aerial_i = _is_aerial(mids[i], metadata_dict)
-        is_aerial_j = _is_aerial(mids[j], metadata_dict)
-        is_aerial_pair = is_aerial_i or is_aerial_j
-
-        # Cascading comparison
-        result = _cascading_compare(mids[i], mids[j], is_aerial_pair, metadata_dict)
+        is_aerial_i = aerial_flags[i]
+        is_aerial_pair = is_aerial_i or aerial_flags[j]
         metrics = result["metrics"]
 
         # Update stats
@@ -707,7 +1026,9 @@ def remove_near_duplicates(
                 result["is_duplicate"],
                 result["exit_stage"] if result["is_duplicate"] else "not duplicate",
                 result["exit_stage"],
-                result["timing_ms"]
+                result["timing_ms"],
+                aerial=is_aerial_pair,
+                dropped_path=mids[i] if result["is_duplicate"] else None
             )
 
         if result["is_duplicate"]:
@@ -726,7 +1047,11 @@ if __name__ == "__main__":
                         help="Name for this experiment")
     parser.add_argument("--log-file", type=str, default="experiment_logs_cascading.md",
                         help="File to log experiment results to")
+    parser.add_argument("--cascade-config", type=str, default=None,
+                        help="Stage 1/2 thresholds from calibrate_cascade.py (default: $DEDUP_CASCADE_CONFIG)")
     args = parser.parse_args()
+    if args.cascade_config:
+        load_cascade_config(args.cascade_config)
 
     # Load test images
     folders = [
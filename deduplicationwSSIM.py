@@ -18,7 +18,6 @@ combinations can still count as duplicates.
 Dependencies
 ------------------------------------------------------------
     pip install opencv-python-headless numpy pillow
-    pip install scikit-image           # <-- for SSIM
     pip install pdqhash-lite           # <-- optional PDQ
     pip install open_clip_torch torch  # <-- only if you enable CLIP
 """
@@ -31,23 +30,19 @@ import io
 import sys
 from datetime import datetime
 from pathlib import Path
-from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Tuple, Dict, Any, Optional
 
 import cv2
 import numpy as np
 
+from bounded_cache import BoundedCache, memoize
+from lazy_imports import lazy_module
+from fast_ssim import ssim_pair
+
 # ─── optional deps ────────────────────────────────────────────────────────────
-try:
-    import pdqhash
-except ImportError:           # PDQ is optional
-    pdqhash = None
+pdqhash = lazy_module("pdqhash")        # PDQ is optional
 
-try:
-    from skimage.metrics import structural_similarity as _ssim
-except ImportError:
-    _ssim = None              # SSIM gate disabled if missing
 
 try:
     from PIL import Image
@@ -57,10 +52,11 @@ except ImportError:
 
 USE_CLIP = True               # flip to True if you have open_clip-torch installed
 if USE_CLIP:
-    try:
-        import torch, open_clip
+    # installed-check only; torch/open_clip are imported on the first embedding
+    torch, open_clip = lazy_module("torch"), lazy_module("open_clip")
+    if torch and open_clip:
         _clip_model = _clip_pre = _clip_device = None
-    except ImportError:
+    else:
         USE_CLIP = False
 
 # ─── logging ──────────────────────────────────────────────────────────────────
@@ -200,7 +196,7 @@ AERIAL_SIFT_MIN_MATCHES = 50              # Minimum SIFT matches for aerial phot
 MAX_WORKERS = 16
 
 # ─── helpers: I/O / resize / CLAHE / metadata ─────────────────────────────────
-@lru_cache(maxsize=512)
+@memoize(BoundedCache.from_env("gray"))
 def _load_gray(path: str) -> np.ndarray:
     img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
     if img is None:
@@ -275,17 +271,12 @@ def overlap_percent(a: np.ndarray, b: np.ndarray) -> float:
     return 100.0 * np.logical_and(a, b).sum() / min(a.sum(), b.sum())
 
 def _compute_ssim(gA: np.ndarray, gB: np.ndarray) -> float:
-    """Return SSIM in 0–100 (%). 0 if skimage unavailable."""
-    if _ssim is None:
-        return 0.0
-    H, W = max(gA.shape[0], gB.shape[0]), max(gA.shape[1], gB.shape[1])
-    padA = np.pad(gA, ((0, H-gA.shape[0]), (0, W-gA.shape[1])), constant_values=0)
-    padB = np.pad(gB, ((0, H-gB.shape[0]), (0, W-gB.shape[1])), constant_values=0)
-    return 100.0 * float(_ssim(padA, padB, data_range=255))
+    """Return SSIM in 0–100 (%) (thumbnails zero-padded to a common shape)."""
+    return 100.0 * ssim_pair(gA, gB)
 
 # ─── PDQ helpers ──────────────────────────────────────────────────────────────
 def _pdq_bits(path: str) -> Optional[np.ndarray]:
-    if pdqhash is None:
+    if not pdqhash:
         return None
     try:
         from PIL import Image
@@ -385,12 +376,13 @@ def _metric_worker(path: str) -> Dict[str, Any]:
         clip=_safe_clip_embed(path)
     )
 
-_metric_store: Dict[str, Dict[str, Any]] = {}
+_metric_store = BoundedCache.from_env("metrics")     # path → _metric_worker record
 
-@lru_cache(maxsize=4096)
+@memoize(BoundedCache.from_env("pairs"))
 def _pair_sim(path_a: str, path_b: str) -> Tuple[float, float, int, float, float, int]:
     """Return (mtb %, edge %, PDQ-HD, SSIM %, CLIP %, SIFT matches)"""
-    mA, mB = _metric_store[path_a], _metric_store[path_b]
+    mA = _metric_store.get_or_compute(path_a, _metric_worker)
+    mB = _metric_store.get_or_compute(path_b, _metric_worker)
 
     # Shapes should now be consistent due to _resize_to_exact_size
     # But keep the safety check just in case
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+deduplicator.py – instance-scoped dedup configuration for concurrent listings
+
+The engines keep weights, thresholds, the feature store and the experiment
+logger in module globals, and `set_weights` rewrites them in place, so two
+listings with different policies (say aerial-heavy vs interior) cannot run in
+one process at the same time.  Here:
+
+    DedupConfig    frozen snapshot of every decision constant (regular and
+                   aerial weights, threshold, MTB floor, PDQ ceiling, SIFT
+                   minimum and override); derive variants with replace() /
+                   with_weights(), never mutate
+    FeatureStore   Phase 1 records and pair metrics, computed at most once per
+                   key under striped locks and then only read; one per process,
+                   shared by every Deduplicator (wraps engine._metric_store by
+                   default so a warmed store is reused)
+    Deduplicator   config + store + engine + optional experiment logger; runs
+                   the engine's own remove_near_duplicates loop with its policy
+                   passed in, so it is safe from many threads or asyncio tasks
+
+Pair metrics do not depend on the decision constants, so every config shares
+the same cached metrics; only the (cheap) decision differs.
+
+Usage:
+    import deduplication as dedupe
+    store = FeatureStore(dedupe)
+    interior = Deduplicator.from_engine(dedupe, store)
+    aerial = interior.with_config(aerial_threshold=0.30, aerial_mtb_floor=58.0)
+    with ThreadPoolExecutor(8) as pool:
+        kept = list(pool.map(interior.dedupe, listings))
+    kept = await aerial.dedupe_async(groups)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import importlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bounded_cache import BoundedCache
+from profiling import profile_phase
+
+logger = logging.getLogger(__name__)
+
+ENGINES = {"standard": "deduplication", "drift_fix": "dedup_fixed_drift"}
+_WEIGHT_NAMES = ("mtb", "ssim", "clip", "pdq", "sift")
+_LOCK_STRIPES = 64
+
+
+# ─── configuration ────────────────────────────────────────────────────────────
+@dataclass(frozen=True)
+class DedupConfig:
+    """Every constant _decide_pair reads, for regular and aerial pairs."""
+    weights: Tuple[float, float, float, float, float]            # mtb, ssim, clip, pdq, sift
+    threshold: float
+    mtb_floor: float
+    pdq_ceil: float
+    sift_min: float
+    aerial_weights: Tuple[float, float, float, float, float]
+    aerial_threshold: float
+    aerial_mtb_floor: float
+    aerial_pdq_ceil: float
+    aerial_sift_min: float
+    sift_override_mult: float = 1.5
+    sift_override_clip: float = 85.0
+    full_scan: bool = False
+
+    @classmethod
+    def from_engine(cls, engine: Any, **changes: Any) -> "DedupConfig":
+        """Snapshot of an engine module's current constants."""
+        cfg = cls(
+            weights=tuple(getattr(engine, f"WEIGHT_{k.upper()}") for k in _WEIGHT_NAMES),
+            threshold=engine.COMPOSITE_DUP_THRESHOLD,
+            mtb_floor=engine.MTB_HARD_FLOOR,
+            pdq_ceil=engine.PDQ_HD_CEIL,
+            sift_min=engine.SIFT_MIN_MATCHES,
+            aerial_weights=tuple(getattr(engine, f"AERIAL_WEIGHT_{k.upper()}") for k in _WEIGHT_NAMES),
+            aerial_threshold=engine.AERIAL_COMPOSITE_DUP_THRESHOLD,
+            aerial_mtb_floor=engine.AERIAL_MTB_HARD_FLOOR,
+            aerial_pdq_ceil=engine.AERIAL_PDQ_HD_CEIL,
+            aerial_sift_min=engine.AERIAL_SIFT_MIN_MATCHES,
+            sift_override_mult=engine.SIFT_OVERRIDE_MULT,
+            sift_override_clip=engine.SIFT_OVERRIDE_CLIP,
+        )
+        return cfg.replace(**changes) if changes else cfg
+
+    def replace(self, **changes: Any) -> "DedupConfig":
+        for key in ("weights", "aerial_weights"):
+            if key in changes:
+                changes[key] = tuple(float(w) for w in changes[key])
+                if len(changes[key]) != len(_WEIGHT_NAMES):
+                    raise ValueError(f"{key} needs {len(_WEIGHT_NAMES)} values ({', '.join(_WEIGHT_NAMES)})")
+        return dataclasses.replace(self, **changes)
+
+    def with_weights(self, **weights: Optional[float]) -> "DedupConfig":
+        """set_weights() without the globals: mtb=…, aerial_clip=…, etc."""
+        regular, aerial = list(self.weights), list(self.aerial_weights)
+        for key, value in weights.items():
+            if value is None:
+                continue
+            target, name = (aerial, key[len("aerial_"):]) if key.startswith("aerial_") else (regular, key)
+            if name not in _WEIGHT_NAMES:
+                raise ValueError(f"Unknown weight '{key}'")
+            target[_WEIGHT_NAMES.index(name)] = float(value)
+        return self.replace(weights=regular, aerial_weights=aerial)
+
+    def policy(self, is_aerial_pair: bool) -> Dict[str, Any]:
+        """Same shape as engine._policy()."""
+        if is_aerial_pair:
+            return {"weights": self.aerial_weights, "threshold": self.aerial_threshold,
+                    "mtb_floor": self.aerial_mtb_floor, "pdq_ceil": self.aerial_pdq_ceil,
+                    "sift_min": self.aerial_sift_min,
+                    "sift_override_mult": self.sift_override_mult,
+                    "sift_override_clip": self.sift_override_clip}
+        return {"weights": self.weights, "threshold": self.threshold,
+                "mtb_floor": self.mtb_floor, "pdq_ceil": self.pdq_ceil,
+                "sift_min": self.sift_min,
+                "sift_override_mult": self.sift_override_mult,
+                "sift_override_clip": self.sift_override_clip}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+# ─── shared feature store ─────────────────────────────────────────────────────
+class FeatureStore:
+    """
+    Compute-once Phase 1 records and pair metrics.  Values are never replaced
+    once written (bounded caches may evict them; they are then recomputed on
+    demand), so readers need no lock; writers serialise per key on one of a
+    fixed set of lock stripes.
+    """
+
+    def __init__(self, engine: Any, records: Optional[Dict[str, Dict[str, Any]]] = None,
+                 max_workers: Optional[int] = None):
+        self.engine = engine
+        self.records = engine._metric_store if records is None else records
+        self.pairs = BoundedCache.from_env("pairs", name="feature_store_pairs")
+        self.max_workers = max_workers or getattr(engine, "MAX_WORKERS", 8)
+        self._stripes = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+    def _lock(self, key: Any) -> threading.Lock:
+        return self._stripes[hash(key) % _LOCK_STRIPES]
+
+    def record(self, path: str) -> Dict[str, Any]:
+        r = self.records.get(path)
+        if r is None:
+            with self._lock(path):
+                r = self.records.get(path)
+                if r is None:
+                    r = self.engine._metric_worker(path)
+                    self.records[path] = r
+        return r
+
+    def warm(self, paths: Sequence[str]) -> None:
+        """Phase 1 for every uncached path, fanned out over a thread pool."""
+        todo = [p for p in dict.fromkeys(paths) if p not in self.records]
+        if not todo:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(todo))) as pool:
+            list(pool.map(self.record, todo))
+
+    def pair(self, path_a: str, path_b: str) -> Tuple[float, float, int, float, float, int]:
+        """engine._pair_sim semantics without the module-level store."""
+        key = (path_a, path_b)
+        m = self.pairs.get(key)
+        if m is None:
+            with self._lock(key):
+                m = self.pairs.get(key)
+                if m is None:
+                    m = self.engine._pair_metrics(self.record(path_a), self.record(path_b))
+                    self.pairs[key] = m
+        return m
+
+
+# ─── deduplicator ─────────────────────────────────────────────────────────────
+class Deduplicator:
+    """One dedup policy bound to a shared FeatureStore; holds no mutable state of its own."""
+
+    def __init__(self, config: DedupConfig, store: FeatureStore,
+                 experiment_logger: Any = None, name: str = ""):
+        self.config = config
+        self.store = store
+        self.engine = store.engine
+        self.experiment_logger = experiment_logger
+        self.name = name
+
+    @classmethod
+    def from_engine(cls, engine: Any = "standard", store: Optional[FeatureStore] = None,
+                    **changes: Any) -> "Deduplicator":
+        """engine: module or ENGINES key; changes: DedupConfig fields to override."""
+        if isinstance(engine, str):
+            engine = importlib.import_module(ENGINES.get(engine, engine))
+        store = store or FeatureStore(engine)
+        return cls(DedupConfig.from_engine(engine, **changes), store)
+
+    def with_config(self, **changes: Any) -> "Deduplicator":
+        """Sibling with some constants changed, sharing this store."""
+        return Deduplicator(self.config.replace(**changes), self.store,
+                            self.experiment_logger, self.name)
+
+    def dedupe(self, groups: List[List[str]], metadata_dict: Optional[Dict[str, Dict[str, Any]]] = None,
+               full_scan: Optional[bool] = None, experiment_logger: Any = None,
+               profiler: Any = None) -> List[List[str]]:
+        """
+        remove_near_duplicates under this config; returns the kept groups.
+        profiler: a profiling.ListingProfiler owned by this call (never the
+        engine's module-level one, which concurrent callers would share).
+        """
+        if len(groups) < 2:
+            return groups
+        with profile_phase(profiler, "phase1"):
+            self.store.warm([g[len(g) // 2] for g in groups])
+        return self.engine.remove_near_duplicates(
+            groups,
+            deduplication_flag=1,
+            metadata_dict=metadata_dict or {},
+            full_scan=self.config.full_scan if full_scan is None else full_scan,
+            pair_metrics=self.store.pair,
+            policy=self.config.policy,
+            experiment_logger=experiment_logger or self.experiment_logger or False,
+            profiler=profiler or False,
+        )
+
+    async def dedupe_async(self, groups: List[List[str]], **kwargs: Any) -> List[List[str]]:
+        return await asyncio.to_thread(self.dedupe, groups, **kwargs)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+    from pathlib import Path
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Run several listings concurrently under two configs")
+    parser.add_argument("folders", nargs="+", help="Listing folders (processed/ used if present)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="standard")
+    parser.add_argument("--set", dest="overrides", default="{}",
+                        help='JSON DedupConfig overrides for the second config, e.g. \'{"threshold": 0.4}\'')
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    base = Deduplicator.from_engine(args.engine)
+    variant = base.with_config(**json.loads(args.overrides))
+    listings = []
+    for f in args.folders:
+        src = Path(f) / "processed" if (Path(f) / "processed").exists() else Path(f)
+        listings.append([[str(p)] for p in sorted(src.glob("*.jpg"))])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        base_runs = pool.map(base.dedupe, listings)
+        variant_runs = pool.map(variant.dedupe, listings)
+        for f, groups, a, b in zip(args.folders, listings, base_runs, variant_runs):
+            print(f"{Path(f).name}: {len(groups)} → base {len(a)}, variant {len(b)}")
+    print(f"{time.perf_counter() - t0:.1f} s, {len(base.store.pairs)} pair metrics shared")
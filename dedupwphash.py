@@ -18,10 +18,8 @@ different from PDQ's algorithm. This adds diversity to duplicate detection.
 Dependencies
 ------------------------------------------------------------
     pip install opencv-python-headless numpy pillow
-    pip install scikit-image           # <-- for SSIM
     pip install pdqhash-lite           # <-- for PDQ
     pip install open_clip_torch torch  # <-- for CLIP
-    pip install imagehash              # <-- for pHash ✨ NEW
 """
 
 from __future__ import annotations
@@ -33,23 +31,19 @@ import sys
 import threading
 from datetime import datetime
 from pathlib import Path
-from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Tuple, Dict, Any, Optional
 
 import cv2
 import numpy as np
 
+from bounded_cache import BoundedCache, memoize
+from lazy_imports import lazy_module
+from fast_ssim import ssim_pair
+from multihash import fingerprint_path, hamming
+
 # ─── optional deps ────────────────────────────────────────────────────────────
-try:
-    import pdqhash
-except ImportError:
-    pdqhash = None
 
-try:
-    from skimage.metrics import structural_similarity as _ssim
-except ImportError:
-    _ssim = None
 
 try:
     from PIL import Image
@@ -57,20 +51,18 @@ try:
 except ImportError:
     _pil_available = False
 
-try:
-    import imagehash
-    _phash_available = True
-except ImportError:
-    _phash_available = False
-    logging.warning("imagehash not available - pHash will be disabled. Install with: pip install imagehash")
+_phash_available = _pil_available      # pHash is computed by multihash (numpy DCT)
+if not _phash_available:
+    logging.warning("PIL not available - pHash will be disabled. Install with: pip install pillow")
 
 USE_CLIP = True
 if USE_CLIP:
-    try:
-        import torch, open_clip
+    # installed-check only; torch/open_clip are imported on the first embedding
+    torch, open_clip = lazy_module("torch"), lazy_module("open_clip")
+    if torch and open_clip:
         _clip_model = _clip_pre = _clip_device = None
         _clip_lock = threading.Lock()
-    except ImportError:
+    else:
         USE_CLIP = False
 
 # ─── logging ──────────────────────────────────────────────────────────────────
@@ -286,7 +278,7 @@ def get_weights():
     }
 
 # ─── helpers: I/O / resize / CLAHE / metadata ─────────────────────────────────
-@lru_cache(maxsize=512)
+@memoize(BoundedCache.from_env("gray"))
 def _load_gray(path: str) -> np.ndarray:
     img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
     if img is None:
@@ -361,52 +353,31 @@ def overlap_percent(a: np.ndarray, b: np.ndarray) -> float:
     return 100.0 * np.logical_and(a, b).sum() / min(a.sum(), b.sum())
 
 def _compute_ssim(gA: np.ndarray, gB: np.ndarray) -> float:
-    """Return SSIM in 0–100 (%). 0 if skimage unavailable."""
-    if _ssim is None:
-        return 0.0
-    H, W = max(gA.shape[0], gB.shape[0]), max(gA.shape[1], gB.shape[1])
-    padA = np.pad(gA, ((0, H-gA.shape[0]), (0, W-gA.shape[1])), constant_values=0)
-    padB = np.pad(gB, ((0, H-gB.shape[0]), (0, W-gB.shape[1])), constant_values=0)
-    return 100.0 * float(_ssim(padA, padB, data_range=255))
-
-# ─── PDQ helpers ──────────────────────────────────────────────────────────────
-def _pdq_bits(path: str) -> Optional[np.ndarray]:
-    if pdqhash is None:
-        return None
-    try:
-        from PIL import Image
-        bits, _ = pdqhash.compute(np.asarray(Image.open(path).convert("RGB")))
-        return np.array(bits, np.uint8)
-    except Exception:
-        return None
-
-def _pdq_hd(a: np.ndarray, b: np.ndarray) -> int:
-    if a is None or b is None or a.shape != b.shape:
-        return 999
-    return int(np.count_nonzero(a ^ b))
+    """Return SSIM in 0–100 (%) (thumbnails zero-padded to a common shape)."""
+    return 100.0 * ssim_pair(gA, gB)
 
-# ─── pHash helpers ✨ NEW ─────────────────────────────────────────────────────
-def _phash_hash(path: str) -> Optional[imagehash.ImageHash]:
-    """Compute pHash (Perceptual Hash) using DCT-based algorithm"""
+# ─── hash helpers ─────────────────────────────────────────────────────────────
+# PDQ and pHash both come from multihash.fingerprint_path (one decode per image)
+# and are stored as packed uint64 words.
+def _hashes(path: str) -> Dict[str, Optional[np.ndarray]]:
     if not _phash_available:
-        return None
+        return {"pdq": None, "phash": None}
     try:
-        from PIL import Image
-        img = Image.open(path)
-        # Using hash_size=8 gives 64-bit hash (8x8 DCT)
-        return imagehash.phash(img, hash_size=8)
+        return fingerprint_path(path)
     except Exception as e:
-        logger.debug(f"pHash computation failed for {path}: {e}")
-        return None
+        logger.debug(f"Hashing failed for {path}: {e}")
+        return {"pdq": None, "phash": None}
 
-def _phash_hd(a: Optional[imagehash.ImageHash], b: Optional[imagehash.ImageHash]) -> int:
-    """Calculate Hamming distance between two pHash hashes"""
-    if a is None or b is None:
+def _pdq_hd(a: Optional[np.ndarray], b: Optional[np.ndarray]) -> int:
+    if a is None or b is None or a.shape != b.shape:
         return 999
-    try:
-        return int(a - b)  # imagehash overloads '-' operator for Hamming distance
-    except Exception:
+    return hamming(a, b)
+
+def _phash_hd(a: Optional[np.ndarray], b: Optional[np.ndarray]) -> int:
+    """Hamming distance between two packed pHash words"""
+    if a is None or b is None:
         return 999
+    return hamming(a, b)
 
 # ─── CLIP helpers ─────────────────────────────────────────────────────────────
 _clip_failed = False
@@ -518,23 +489,25 @@ def _metric_worker(path: str) -> Dict[str, Any]:
     if USE_CLAHE:
         gray = _apply_clahe(gray)
 
+    hashes = _hashes(path)
     return dict(
         path=path,
         filename=Path(path).name,
         mtb=_compute_mtb(_resize_to_exact_size(gray, MTB_SIZE)),
         edges=_compute_edges(_resize_to_exact_size(gray, EDGE_SIZE)),
         gray_ssim=_resize_keep_aspect(gray, SSIM_SIZE),
-        pdq=_pdq_bits(path),
-        phash=_phash_hash(path),  # ✨ NEW
+        pdq=hashes["pdq"],
+        phash=hashes["phash"],  # ✨ NEW
         clip=_safe_clip_embed(path)
     )
 
-_metric_store: Dict[str, Dict[str, Any]] = {}
+_metric_store = BoundedCache.from_env("metrics")     # path → _metric_worker record
 
-@lru_cache(maxsize=4096)
+@memoize(BoundedCache.from_env("pairs"))
 def _pair_sim(path_a: str, path_b: str) -> Tuple[float, float, int, float, float, int, int]:
     """Return (mtb %, edge %, PDQ-HD, SSIM %, CLIP %, pHash-HD, SIFT matches)"""
-    mA, mB = _metric_store[path_a], _metric_store[path_b]
+    mA = _metric_store.get_or_compute(path_a, _metric_worker)
+    mB = _metric_store.get_or_compute(path_b, _metric_worker)
 
     if mA["mtb"].shape != mB["mtb"].shape:
         logger.warning("MTB shape mismatch: %s vs %s - this shouldn't happen anymore",
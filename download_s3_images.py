@@ -5,15 +5,41 @@ download_s3_images.py
 
 Downloads processed images from AWS S3 bucket to local directory structure.
 Each folder in S3 bucket is downloaded to images/{id}/processed/
+
+Default transfer ("client"): one pooled S3 client (s3_store.S3Store) lists
+folders concurrently and downloads objects from a shared worker pool, each
+object retried with exponential backoff and written via a .part file.  A
+JSON-lines manifest records the ETag and size of every finished object, so a
+rerun skips unchanged objects and re-fetches changed or partial ones.  The
+source may also be a local directory laid out like the bucket (the test
+stand-in), or an S3-compatible endpoint such as moto via --endpoint-url.
+
+`--header-first` fetches only the first 64 KB of every object (ranged GETs,
+in parallel), builds each listing's metadata_dict and an EXIF-thumbnail
+prefilter from those bytes (s3_headers.py), writes images/{id}/header_plan.json
+and then downloads only the frames that survive the prefilter.
+
+`--transfer cli` keeps the old serial `aws s3 cp --recursive` per folder.
+
+Usage:
+    python download_s3_images.py --limit 500 --workers 64
+    python download_s3_images.py --limit 500 --header-first --max-gap-s 2 --max-hash-distance 4
+    python download_s3_images.py --bucket ./fake_bucket --output-dir images
 """
 
+import os
 import subprocess
 import sys
 import shutil
 import platform
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
+
+from s3_headers import fetch_headers, plan_listing
+from s3_store import ObjectInfo, open_store, with_retry
 
 
 def find_aws_cli() -> str:
@@ -331,6 +357,177 @@ def download_all_images(
     print("=" * 60)
 
 
+# ─── pooled, resumable transfers ──────────────────────────────────────────────
+class Manifest:
+    """
+    Append-only JSON-lines record of finished objects (key → ETag, size).
+    The last line for a key wins; the file is compacted on load when stale
+    lines outnumber live ones.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict[str, object]] = {}
+        lines = 0
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue                      # torn final line after a crash
+                    self.entries[entry["key"]] = entry
+                    lines += 1
+        if lines > 2 * len(self.entries) + 100:
+            self._compact()
+        self._lock = threading.Lock()
+        self._fh = open(self.path, "a", encoding="utf-8")
+        if self._fh.tell():
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._fh.write("\n")             # don't glue the next entry onto a torn line
+
+    def _compact(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+        tmp.replace(self.path)
+
+    def is_current(self, obj: ObjectInfo, dest: Path) -> bool:
+        """Already downloaded with the same ETag and size, and still on disk."""
+        entry = self.entries.get(obj.key)
+        return (entry is not None and entry["etag"] == obj.etag and entry["size"] == obj.size
+                and dest.exists() and dest.stat().st_size == obj.size)
+
+    def record(self, obj: ObjectInfo) -> None:
+        entry = {"key": obj.key, "etag": obj.etag, "size": obj.size}
+        with self._lock:
+            self.entries[obj.key] = entry
+            self._fh.write(json.dumps(entry) + "\n")
+            self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def list_folder_objects(store, prefix: str, folder_ids: List[str],
+                        folder_workers: int) -> Dict[str, List[ObjectInfo]]:
+    """Objects under {prefix}{id}/processed/ for every folder, listed concurrently."""
+    def _list(folder_id: str) -> List[ObjectInfo]:
+        return with_retry(store.list_objects, f"{prefix}{folder_id}/processed/")
+
+    with ThreadPoolExecutor(max_workers=max(1, folder_workers)) as pool:
+        return dict(zip(folder_ids, pool.map(_list, folder_ids)))
+
+
+def sync_folders(
+    source: str,
+    local_base_dir: str,
+    folder_ids: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    manifest_file: str = "download_manifest.jsonl",
+    workers: int = 32,
+    folder_workers: int = 8,
+    endpoint_url: Optional[str] = None,
+    header_first: bool = False,
+    max_gap_s: float = 2.0,
+    max_hash_distance: int = 4
+) -> Dict[str, int]:
+    """
+    Download processed images with a pooled client and an object manifest.
+
+    Args:
+        source: s3://bucket/prefix/ URL or a local directory standing in for it
+        local_base_dir: Local base directory (e.g., "images")
+        folder_ids: Optional list of folder IDs; listed from the source if None
+        limit: Optional limit on number of folders
+        manifest_file: JSON-lines manifest of finished objects (for resuming)
+        workers: Concurrent object transfers (also the connection-pool size)
+        folder_workers: Concurrent folder listings
+        endpoint_url: S3-compatible endpoint (moto, MinIO, ...)
+        header_first: Plan each listing from 64 KB ranged GETs and download
+                      only the frames that survive the thumbnail prefilter
+        max_gap_s: Prefilter capture-time window (seconds)
+        max_hash_distance: Prefilter thumbnail dHash distance (bits)
+
+    Returns:
+        Counts: folders, objects, downloaded, skipped, prefiltered, failed,
+        bytes, header_bytes
+    """
+    local_path = Path(local_base_dir)
+    local_path.mkdir(parents=True, exist_ok=True)
+    store, prefix = open_store(source, pool_size=workers, endpoint_url=endpoint_url)
+
+    if folder_ids is None:
+        print("Listing folders...")
+        folder_ids = with_retry(store.list_prefixes, prefix)
+        print(f"Found {len(folder_ids)} folders")
+    if limit is not None:
+        folder_ids = folder_ids[:limit]
+
+    listing = list_folder_objects(store, prefix, folder_ids, folder_workers)
+    stats = {"folders": len(folder_ids), "objects": 0, "downloaded": 0, "skipped": 0,
+             "prefiltered": 0, "failed": 0, "bytes": 0, "header_bytes": 0}
+    if header_first:
+        headers = fetch_headers(store, [o for objs in listing.values() for o in objs], workers)
+        for folder_id, objects in listing.items():
+            plan = plan_listing(objects, headers, max_gap_s, max_hash_distance)
+            plan.save(local_path / folder_id)
+            stats["prefiltered"] += len(plan.skipped)
+            stats["header_bytes"] += plan.header_bytes
+            keep = set(plan.keep)
+            listing[folder_id] = [o for o in objects if o.key in keep]
+        print(f"Header pass: {stats['header_bytes'] / 1e6:.1f} MB read, "
+              f"{stats['prefiltered']} frames prefiltered")
+
+    manifest = Manifest(Path(manifest_file))
+    todo: List[Tuple[str, ObjectInfo, Path]] = []
+    for folder_id, objects in listing.items():
+        base = f"{prefix}{folder_id}/processed/"
+        for obj in objects:
+            dest = local_path / folder_id / "processed" / obj.key[len(base):]
+            stats["objects"] += 1
+            if manifest.is_current(obj, dest):
+                stats["skipped"] += 1
+            else:
+                todo.append((folder_id, obj, dest))
+    print(f"{stats['objects']} objects in {len(folder_ids)} folders; "
+          f"{stats['skipped']} unchanged, {len(todo)} to download")
+
+    def _fetch(obj: ObjectInfo, dest: Path) -> int:
+        n = with_retry(store.download, obj.key, dest)
+        manifest.record(obj)
+        return n
+
+    failed_folders: Set[str] = set()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(_fetch, obj, dest): (folder_id, obj) for folder_id, obj, dest in todo}
+            for fut in as_completed(futures):
+                folder_id, obj = futures[fut]
+                try:
+                    stats["bytes"] += fut.result()
+                    stats["downloaded"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    failed_folders.add(folder_id)
+                    print(f"  ERROR: {obj.key}: {e}", file=sys.stderr)
+    finally:
+        manifest.close()
+
+    print("=" * 60)
+    print("Download complete:")
+    print(f"  Objects downloaded: {stats['downloaded']} ({stats['bytes'] / 1e6:.1f} MB)")
+    print(f"  Objects unchanged: {stats['skipped']}")
+    if header_first:
+        print(f"  Objects prefiltered from headers: {stats['prefiltered']}")
+    print(f"  Objects failed: {stats['failed']} (in {len(failed_folders)} folders)")
+    print("=" * 60)
+    return stats
+
+
 def main() -> None:
     """Main entry point."""
     import argparse
@@ -370,10 +567,74 @@ def main() -> None:
         default="download_progress.json",
         help="Path to progress file for resuming downloads (default: download_progress.json)"
     )
+    parser.add_argument(
+        "--transfer",
+        choices=["client", "cli"],
+        default="client",
+        help="client: pooled concurrent S3 client (default); cli: serial 'aws s3 cp' per folder"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default="download_manifest.jsonl",
+        help="Object manifest (ETag/size) for resuming client transfers (default: download_manifest.jsonl)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=32,
+        help="Concurrent object transfers / connection-pool size (default: 32)"
+    )
+    parser.add_argument(
+        "--folder-workers",
+        type=int,
+        default=8,
+        help="Concurrent folder listings (default: 8)"
+    )
+    parser.add_argument(
+        "--endpoint-url",
+        type=str,
+        default=None,
+        help="S3-compatible endpoint, e.g. a local moto server"
+    )
+    parser.add_argument(
+        "--header-first",
+        action="store_true",
+        help="Plan from 64 KB ranged GETs (EXIF metadata + thumbnail prefilter) before full downloads"
+    )
+    parser.add_argument(
+        "--max-gap-s",
+        type=float,
+        default=2.0,
+        help="Header prefilter: max capture-time gap to the last kept frame (default: 2.0)"
+    )
+    parser.add_argument(
+        "--max-hash-distance",
+        type=int,
+        default=4,
+        help="Header prefilter: max thumbnail dHash distance in bits (default: 4)"
+    )
     
     args = parser.parse_args()
     
     try:
+        if args.transfer == "client":
+            stats = sync_folders(
+                source=args.bucket,
+                local_base_dir=args.output_dir,
+                folder_ids=args.folder_ids,
+                limit=args.limit,
+                manifest_file=args.manifest,
+                workers=args.workers,
+                folder_workers=args.folder_workers,
+                endpoint_url=args.endpoint_url,
+                header_first=args.header_first,
+                max_gap_s=args.max_gap_s,
+                max_hash_distance=args.max_hash_distance
+            )
+            if stats["failed"]:
+                sys.exit(1)
+            return
         download_all_images(
             bucket_path=args.bucket,
             local_base_dir=args.output_dir,
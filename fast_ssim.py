@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fast_ssim.py – SSIM from precomputed per-image statistics
+
+`skimage.metrics.structural_similarity` (defaults: 7×7 uniform window,
+sample covariance, K1=0.01, K2=0.03) recomputes five filtered images for every
+pair.  Four of them depend on one image only:
+
+    Σx, Σx²  over every 7×7 window of A        → cached once per image
+    Σy, Σy²  over every 7×7 window of B        → cached once per image
+    Σxy                                        → the only per-pair work
+
+skimage averages the SSIM map after cropping (win−1)/2 pixels from every
+border, so only "valid" windows contribute and the border mode is irrelevant.
+Window sums are taken with cv2.boxFilter (normalize=False) on uint8-valued
+float32 data: every sum is an integer < 2²⁴, so they are exact and the result
+agrees with skimage to within 1e-6 (1e-4 on the 0–100 % scale used by the
+engines; `python fast_ssim.py --verify <folder>` checks this on real data).
+
+Thumbnails of different shape are zero-padded to the common shape first, as
+the engines always did; that pair then recomputes its own statistics.
+
+`ssim_one_vs_many()` evaluates one thumbnail against a stack of same-shape
+thumbnails in a single multi-channel box filter.
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install opencv-python numpy
+    pip install scikit-image            # only for --verify
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import List, Sequence
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SSIM_WIN = 7
+K1, K2, DATA_RANGE = 0.01, 0.03, 255.0
+C1, C2 = (K1 * DATA_RANGE) ** 2, (K2 * DATA_RANGE) ** 2
+_NP = SSIM_WIN * SSIM_WIN
+_COV_NORM = _NP / (_NP - 1.0)        # skimage use_sample_covariance=True
+_R = (SSIM_WIN - 1) // 2
+_MAX_CHANNELS = 512                  # cv2 CV_CN_MAX
+
+
+def _box_sum_valid(a: np.ndarray) -> np.ndarray:
+    """7×7 window sums over valid windows of a (H, W) or (H, W, C) float32 array."""
+    s = cv2.boxFilter(a, -1, (SSIM_WIN, SSIM_WIN), normalize=False,
+                      borderType=cv2.BORDER_REFLECT)
+    return s[_R:-_R, _R:-_R]
+
+
+class SSIMStats:
+    """Per-thumbnail window sums; build with ssim_stats()."""
+
+    __slots__ = ("gray", "s1", "s2")
+
+    def __init__(self, gray: np.ndarray, s1: np.ndarray, s2: np.ndarray):
+        self.gray, self.s1, self.s2 = gray, s1, s2
+
+    @property
+    def shape(self):
+        return self.gray.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.gray.nbytes + self.s1.nbytes + self.s2.nbytes
+
+
+def ssim_stats(gray: np.ndarray) -> SSIMStats:
+    """Precompute Σx and Σx² window sums for one uint8 thumbnail."""
+    if min(gray.shape[:2]) < SSIM_WIN:
+        raise ValueError(f"SSIM needs images of at least {SSIM_WIN}px per side, got {gray.shape}")
+    g = np.ascontiguousarray(gray, dtype=np.uint8)
+    x = g.astype(np.float32)
+    return SSIMStats(g, _box_sum_valid(x), _box_sum_valid(x * x))
+
+
+def _ssim_map_mean(s1a, s2a, s1b, s2b, sab) -> np.ndarray:
+    """Mean SSIM over the trailing two axes, from window sums (float64 arithmetic)."""
+    ux, uy = s1a.astype(np.float64) / _NP, s1b.astype(np.float64) / _NP
+    vx = _COV_NORM * (s2a.astype(np.float64) / _NP - ux * ux)
+    vy = _COV_NORM * (s2b.astype(np.float64) / _NP - uy * uy)
+    vxy = _COV_NORM * (sab.astype(np.float64) / _NP - ux * uy)
+    s = ((2 * ux * uy + C1) * (2 * vxy + C2)) / ((ux * ux + uy * uy + C1) * (vx + vy + C2))
+    return s.mean(axis=(-2, -1))
+
+
+def _pad_to(gray: np.ndarray, H: int, W: int) -> np.ndarray:
+    return np.pad(gray, ((0, H - gray.shape[0]), (0, W - gray.shape[1])), constant_values=0)
+
+
+def ssim_from_stats(a: SSIMStats, b: SSIMStats) -> float:
+    """SSIM in 0–1; only the cross term is computed for same-shape thumbnails."""
+    if a.shape != b.shape:
+        H, W = max(a.shape[0], b.shape[0]), max(a.shape[1], b.shape[1])
+        a, b = ssim_stats(_pad_to(a.gray, H, W)), ssim_stats(_pad_to(b.gray, H, W))
+    sab = _box_sum_valid(a.gray.astype(np.float32) * b.gray.astype(np.float32))
+    return float(_ssim_map_mean(a.s1, a.s2, b.s1, b.s2, sab))
+
+
+def ssim_pair(gA: np.ndarray, gB: np.ndarray) -> float:
+    """Drop-in for the engines' padded skimage call (no cached stats)."""
+    return ssim_from_stats(ssim_stats(gA), ssim_stats(gB))
+
+
+class SSIMStack:
+    """Same-shape thumbnails stacked as (N, H, W) with their window sums."""
+
+    def __init__(self, stats: Sequence[SSIMStats]):
+        shapes = {s.shape for s in stats}
+        if len(shapes) != 1:
+            raise ValueError(f"SSIMStack needs a single thumbnail shape, got {sorted(shapes)}")
+        self.shape = shapes.pop()
+        self.gray = np.stack([s.gray for s in stats])
+        self.s1 = np.stack([s.s1 for s in stats])
+        self.s2 = np.stack([s.s2 for s in stats])
+
+    def __len__(self) -> int:
+        return self.gray.shape[0]
+
+    def ssim(self, query: SSIMStats) -> np.ndarray:
+        """SSIM (0–1) of `query` against every thumbnail in the stack."""
+        if query.shape != self.shape:
+            return np.array([ssim_from_stats(query, SSIMStats(g, s1, s2))
+                             for g, s1, s2 in zip(self.gray, self.s1, self.s2)])
+        q = query.gray.astype(np.float32)
+        out = np.empty(len(self), np.float64)
+        for lo in range(0, len(self), _MAX_CHANNELS):
+            hi = min(lo + _MAX_CHANNELS, len(self))
+            prod = np.ascontiguousarray((self.gray[lo:hi].astype(np.float32) * q).transpose(1, 2, 0))
+            sab = _box_sum_valid(prod)
+            if sab.ndim == 2:                     # cv2 drops a single channel axis
+                sab = sab[..., None]
+            out[lo:hi] = _ssim_map_mean(query.s1, query.s2, self.s1[lo:hi], self.s2[lo:hi],
+                                        sab.transpose(2, 0, 1))
+        return out
+
+
+def ssim_one_vs_many(query: SSIMStats, candidates: Sequence[SSIMStats]) -> np.ndarray:
+    """SSIM of `query` against each candidate; same-shape candidates are batched."""
+    out = np.empty(len(candidates), np.float64)
+    same = [i for i, c in enumerate(candidates) if c.shape == query.shape]
+    if same:
+        out[same] = SSIMStack([candidates[i] for i in same]).ssim(query)
+    for i, c in enumerate(candidates):
+        if c.shape != query.shape:
+            out[i] = ssim_from_stats(query, c)
+    return out
+
+
+# ─── verification against skimage ─────────────────────────────────────────────
+def verify_against_skimage(grays: List[np.ndarray], tol: float = 1e-6) -> dict:
+    """Max |fast − skimage| over all pairs of the given thumbnails."""
+    from skimage.metrics import structural_similarity
+
+    stats = [ssim_stats(g) for g in grays]
+    worst = 0.0
+    for i in range(len(grays)):
+        batch = ssim_one_vs_many(stats[i], stats[i + 1:]) if i + 1 < len(grays) else []
+        for k, j in enumerate(range(i + 1, len(grays))):
+            H = max(grays[i].shape[0], grays[j].shape[0])
+            W = max(grays[i].shape[1], grays[j].shape[1])
+            ref = structural_similarity(_pad_to(grays[i], H, W), _pad_to(grays[j], H, W),
+                                        data_range=DATA_RANGE)
+            worst = max(worst, abs(ref - ssim_from_stats(stats[i], stats[j])), abs(ref - batch[k]))
+    return {"images": len(grays), "max_abs_diff": worst, "tolerance": tol, "ok": worst <= tol}
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Check fast SSIM against skimage")
+    parser.add_argument("--verify", type=str, required=True,
+                        help="Folder of images (uses processed/ if present)")
+    parser.add_argument("--size", type=int, default=320, help="Thumbnail long side (SSIM_SIZE)")
+    parser.add_argument("--limit", type=int, default=20, help="Max images to compare")
+    args = parser.parse_args()
+
+    folder = Path(args.verify)
+    src = folder / "processed" if (folder / "processed").exists() else folder
+    grays = []
+    for p in sorted(src.glob("*.jpg"))[:args.limit]:
+        g = cv2.imread(str(p), cv2.IMREAD_GRAYSCALE)
+        if g is None:
+            continue
+        h, w = g.shape
+        scale = args.size / max(h, w)
+        grays.append(cv2.resize(g, (max(1, int(w * scale)), max(1, int(h * scale))),
+                                interpolation=cv2.INTER_AREA))
+    rep = verify_against_skimage(grays)
+    logger.info("fast SSIM vs skimage over %d images: max |Δ| = %.2e (tolerance %.0e) → %s",
+                rep["images"], rep["max_abs_diff"], rep["tolerance"], "OK" if rep["ok"] else "FAIL")
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+feature_shards.py – memory-mapped per-listing Phase 1 features
+
+Batch scripts (run_test_eval.py, compare_deduplication_methods.py) recompute
+Phase 1 in every process and keep the records in Python dicts; SIFT is worse,
+re-reading and re-detecting both images for every compared pair.  A shard is a
+directory written once per listing with a fixed layout:
+
+    meta.json        version, engine, feature settings, paths, shapes
+    mtb.npy          (N, ⌈MTB_SIZE²/8⌉)  uint8   packed MTB bitmaps
+    mtb_count.npy    (N,)                int64   set bits per bitmap
+    edges.npy        (N, ⌈EDGE_SIZE²/8⌉) uint8   packed Canny bitmaps
+    edge_count.npy   (N,)                int64
+    pdq.npy          (N, 4)              uint64  256-bit PDQ hashes
+    pdq_ok.npy       (N,)                bool    PDQ available
+    clip.npy         (N, D)              float16 normalised CLIP embeddings
+    clip_ok.npy      (N,)                bool
+    ssim.npy         (N, H, W)           uint8   SSIM thumbnails, zero-padded
+    ssim_shape.npy   (N, 2)              int32   true thumbnail shape
+    sift.npy         (K, 128)            uint8   SIFT descriptors of all images
+    sift_offsets.npy (N + 1,)            int64   image i owns rows [o[i], o[i+1])
+
+Every array is opened with `np.load(mmap_mode="r")`, so parallel workers and
+reruns share the OS page cache instead of recomputing or pickling features.
+`FeatureShard.pair_sim(path_a, path_b)` returns the engines' 6-tuple straight
+from the mapped arrays (bit overlaps by popcount on packed bytes, PDQ by XOR of
+uint64 words, SSIM from the thumbnail, SIFT by FLANN on stored descriptors) and
+plugs into `remove_near_duplicates(..., pair_metrics=shard.pair_sim)`.
+
+Equivalence: MTB, edge, PDQ and SSIM are exact.  CLIP is stored as float16,
+which moves cosine similarity by ~1e-3 percentage points.  SIFT descriptors
+are stored losslessly (OpenCV's are integer-valued), but the match count is
+not bit-for-bit the engine's: FLANN builds randomised KD-trees, so the
+engines' _compute_sift_matches drifts by a few matches from run to run.
+sift_match_count seeds OpenCV's RNG before every match, which makes shard
+counts reproducible; they still differ from any single engine run by that
+same few-match jitter, which matters near SIFT_MIN_MATCHES.
+
+A shard is keyed by listing name, feature settings and the (size, mtime) of
+each image; `ensure_shard()` reuses a matching shard or builds one in a temp
+directory and renames it into place, so concurrent builders never expose a
+partial shard.
+
+Usage:
+    import dedup_fixed_drift as dedupe
+    shard = ensure_shard(dedupe, paths, "shards", listing="1")
+    kept = dedupe.remove_near_duplicates(groups, 1, {}, False, pair_metrics=shard.pair_sim)
+
+    python feature_shards.py build 1 2 3 --root shards --engine dedup_fixed_drift
+    python feature_shards.py info shards/1-3f2a9c0d1e4b
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install opencv-python numpy
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from fast_ssim import SSIMStats, ssim_from_stats, ssim_stats
+
+logger = logging.getLogger(__name__)
+
+SHARD_VERSION = 1
+FEATURE_KEYS = ("MTB_SIZE", "EDGE_SIZE", "SSIM_SIZE", "BLUR_SIZE", "CANNY1", "CANNY2",
+                "USE_AUTO_CANNY", "SIGMA", "USE_CLAHE", "USE_CLIP", "CLIP_BACKEND")
+_ARRAYS = ("mtb", "mtb_count", "edges", "edge_count", "pdq", "pdq_ok", "clip", "clip_ok",
+           "ssim", "ssim_shape", "sift", "sift_offsets")
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+_SIFT_RATIO = 0.7                      # Lowe's ratio, as _compute_sift_matches
+_FLANN_SEED = 0                        # fixed KD-tree seed: reproducible SIFT counts
+
+
+def _popcount(packed: np.ndarray) -> int:
+    return int(_POPCOUNT8[packed].sum(dtype=np.int64))
+
+
+def feature_settings(engine: Any) -> Dict[str, Any]:
+    """Engine constants that change Phase 1 output (shards are invalid across them)."""
+    return {k: getattr(engine, k) for k in FEATURE_KEYS if hasattr(engine, k)}
+
+
+def shard_key(engine: Any, paths: Sequence[str]) -> str:
+    h = hashlib.sha1(json.dumps(feature_settings(engine), sort_keys=True, default=str).encode())
+    for p in paths:
+        st = os.stat(p)
+        h.update(f"{p}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:12]
+
+
+# ─── SIFT ─────────────────────────────────────────────────────────────────────
+def sift_descriptors(gray: np.ndarray) -> np.ndarray:
+    """(K, 128) uint8 SIFT descriptors of a full-resolution grayscale frame."""
+    _, des = cv2.SIFT_create().detectAndCompute(gray, None)
+    if des is None:
+        return np.zeros((0, 128), np.uint8)
+    return np.clip(np.rint(des), 0, 255).astype(np.uint8)
+
+
+def sift_match_count(des_a: np.ndarray, des_b: np.ndarray) -> int:
+    """
+    Good FLANN matches after Lowe's ratio test (same matcher as the engines).
+    OpenCV's RNG (per thread) is seeded first so the KD-trees, and hence the
+    count, are the same on every call.
+    """
+    if len(des_a) < 2 or len(des_b) < 2:
+        return 0
+    try:
+        cv2.setRNGSeed(_FLANN_SEED)
+        flann = cv2.FlannBasedMatcher(dict(algorithm=1, trees=5), dict(checks=50))
+        matches = flann.knnMatch(np.asarray(des_a, np.float32), np.asarray(des_b, np.float32), k=2)
+    except cv2.error as e:
+        logger.debug("FLANN matching failed: %s", e)
+        return 0
+    return sum(1 for pair in matches if len(pair) == 2 and pair[0].distance < _SIFT_RATIO * pair[1].distance)
+
+
+# ─── writer ───────────────────────────────────────────────────────────────────
+def _image_features(engine: Any, path: str, records: Optional[Mapping] = None) -> Tuple[Dict[str, Any], np.ndarray]:
+    m = records.get(path) if records is not None else None
+    if m is None:
+        m = engine._metric_worker(path)
+    return m, sift_descriptors(engine._load_gray(path))
+
+
+def pack_features(feats: Sequence[Tuple[Dict[str, Any], np.ndarray]], listing: str = "") -> Dict[str, np.ndarray]:
+    """Shard arrays from (_metric_worker record, SIFT descriptors) per image."""
+    n = len(feats)
+    mtb = np.stack([np.packbits(m["mtb"].ravel()) for m, _ in feats]) if n else np.zeros((0, 0), np.uint8)
+    edges = np.stack([np.packbits(m["edges"].ravel()) for m, _ in feats]) if n else np.zeros((0, 0), np.uint8)
+
+    pdq = np.zeros((n, 4), np.uint64)
+    pdq_ok = np.zeros(n, bool)
+    for i, (m, _) in enumerate(feats):
+        if m["pdq"] is not None and m["pdq"].size == 256:
+            pdq[i] = np.packbits(m["pdq"].astype(np.uint8)).view(np.uint64)
+            pdq_ok[i] = True
+
+    dims = {m["clip"].shape[0] for m, _ in feats if m["clip"] is not None}
+    dim = next(iter(dims)) if len(dims) == 1 else 0
+    if len(dims) > 1:
+        logger.warning("Mixed CLIP dimensions in %s; storing no CLIP embeddings", listing)
+    clip = np.zeros((n, dim), np.float16)
+    clip_ok = np.zeros(n, bool)
+    for i, (m, _) in enumerate(feats):
+        if dim and m["clip"] is not None:
+            clip[i] = m["clip"]
+            clip_ok[i] = True
+
+    shapes = np.array([m["ssim_stats"].shape for m, _ in feats], np.int32).reshape(n, 2)
+    H, W = (shapes.max(axis=0) if n else (0, 0))
+    ssim = np.zeros((n, H, W), np.uint8)
+    for i, (m, _) in enumerate(feats):
+        h, w = shapes[i]
+        ssim[i, :h, :w] = m["ssim_stats"].gray
+
+    sift_offsets = np.zeros(n + 1, np.int64)
+    sift_offsets[1:] = np.cumsum([len(d) for _, d in feats])
+    sift = np.concatenate([d for _, d in feats]) if n else np.zeros((0, 128), np.uint8)
+
+    return {
+        "mtb": mtb, "mtb_count": np.array([m["mtb"].sum() for m, _ in feats], np.int64),
+        "edges": edges, "edge_count": np.array([m["edges"].sum() for m, _ in feats], np.int64),
+        "pdq": pdq, "pdq_ok": pdq_ok, "clip": clip, "clip_ok": clip_ok,
+        "ssim": ssim, "ssim_shape": shapes, "sift": sift, "sift_offsets": sift_offsets,
+    }
+
+
+def shard_meta(engine: Any, paths: Sequence[str], feats: Sequence[Tuple[Dict[str, Any], np.ndarray]],
+               listing: str = "") -> Dict[str, Any]:
+    return {
+        "version": SHARD_VERSION,
+        "engine": engine.__name__,
+        "listing": listing,
+        "settings": feature_settings(engine),
+        "paths": list(paths),
+        "mtb_shape": list(feats[0][0]["mtb"].shape) if feats else [0, 0],
+        "edge_shape": list(feats[0][0]["edges"].shape) if feats else [0, 0],
+    }
+
+
+def save_shard(arrays: Dict[str, np.ndarray], meta: Dict[str, Any], out_dir: str) -> Path:
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(out / f"{name}.npy", np.ascontiguousarray(arr))
+    (out / "meta.json").write_text(json.dumps(meta, indent=1, default=str), encoding="utf-8")
+    logger.info("Wrote shard %s: %d images, %.1f MB (%d SIFT descriptors)", out, len(meta["paths"]),
+                sum(a.nbytes for a in arrays.values()) / 1e6, len(arrays["sift"]))
+    return out
+
+
+def write_shard(engine: Any, paths: Sequence[str], out_dir: str, listing: str = "",
+                records: Optional[Mapping] = None, max_workers: Optional[int] = None) -> Path:
+    """
+    Run Phase 1 (plus SIFT detection) for `paths` and write a shard to
+    `out_dir`.  `records` may hold already-computed _metric_worker records.
+    """
+    paths = list(paths)
+    workers = max_workers or getattr(engine, "MAX_WORKERS", 8)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        feats = list(pool.map(lambda p: _image_features(engine, p, records), paths))
+    return save_shard(pack_features(feats, listing), shard_meta(engine, paths, feats, listing), out_dir)
+
+
+def ensure_shard(engine: Any, paths: Sequence[str], root: str, listing: str = "",
+                 records: Optional[Mapping] = None) -> "FeatureShard":
+    """Open the shard for these paths and settings, building it if it is missing."""
+    paths = list(paths)
+    listing = listing or (Path(paths[0]).parent.name if paths else "empty")
+    final = Path(root) / f"{listing}-{shard_key(engine, paths)}"
+    if not (final / "meta.json").exists():
+        tmp = Path(root) / f".{final.name}.{uuid.uuid4().hex[:8]}.tmp"
+        write_shard(engine, paths, str(tmp), listing=listing, records=records)
+        try:
+            os.rename(tmp, final)
+        except OSError:                          # another worker finished first
+            shutil.rmtree(tmp, ignore_errors=True)
+    return FeatureShard(str(final))
+
+
+# ─── reader ───────────────────────────────────────────────────────────────────
+class FeatureShard(Mapping):
+    """
+    Read-only view of one shard.  As a Mapping it yields _metric_worker-shaped
+    records (unpacked on access); pair_sim() works on the packed arrays.
+    """
+
+    def __init__(self, path: str):
+        root = Path(path)
+        meta = json.loads((root / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("version") != SHARD_VERSION:
+            raise ValueError(f"{path}: shard version {meta.get('version')} != {SHARD_VERSION}")
+        self._bind({name: np.load(root / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}, meta, root)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> "FeatureShard":
+        """In-memory shard (same layout, nothing on disk)."""
+        shard = cls.__new__(cls)
+        shard._bind(arrays, meta, None)
+        return shard
+
+    def _bind(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any], path: Optional[Path]) -> None:
+        self.path = path
+        self.meta = meta
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.paths: List[str] = self.meta["paths"]
+        self.index = {p: i for i, p in enumerate(self.paths)}
+        self._ssim: Dict[int, SSIMStats] = {}
+        self._lock = threading.Lock()
+
+    def check(self, engine: Any) -> bool:
+        """True if the engine's feature settings still match the shard's."""
+        return json.loads(json.dumps(feature_settings(engine), default=str)) == self.meta["settings"]
+
+    # ── per-image views ───────────────────────────────────────────────────────
+    def ssim_stats(self, i: int) -> SSIMStats:
+        st = self._ssim.get(i)
+        if st is None:
+            h, w = self.ssim_shape[i]
+            st = ssim_stats(np.asarray(self.ssim[i, :h, :w]))
+            with self._lock:
+                self._ssim[i] = st
+        return st
+
+    def descriptors(self, i: int) -> np.ndarray:
+        return self.sift[self.sift_offsets[i]:self.sift_offsets[i + 1]]
+
+    def _bits(self, packed: np.ndarray, shape: Sequence[int]) -> np.ndarray:
+        return np.unpackbits(packed, count=int(np.prod(shape))).reshape(shape).astype(bool)
+
+    # ── Mapping protocol (path → record) ──────────────────────────────────────
+    def __getitem__(self, path: str) -> Dict[str, Any]:
+        i = self.index[path]
+        pdq = np.unpackbits(np.asarray(self.pdq[i]).view(np.uint8)) if self.pdq_ok[i] else None
+        clip = np.asarray(self.clip[i], np.float32) if self.clip_ok[i] else None
+        return dict(path=path, filename=Path(path).name,
+                    mtb=self._bits(self.mtb[i], self.meta["mtb_shape"]),
+                    edges=self._bits(self.edges[i], self.meta["edge_shape"]),
+                    ssim_stats=self.ssim_stats(i), pdq=pdq, clip=clip)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, path: object) -> bool:
+        return path in self.index
+
+    # ── pair evaluation ───────────────────────────────────────────────────────
+    def _overlap(self, packed: np.ndarray, counts: np.ndarray, i: int, j: int) -> float:
+        if counts[i] == 0 or counts[j] == 0:
+            return 0.0
+        return 100.0 * _popcount(np.bitwise_and(packed[i], packed[j])) / min(counts[i], counts[j])
+
+    def pair_metrics_at(self, i: int, j: int) -> Tuple[float, float, int, float, float, int]:
+        """(mtb %, edge %, PDQ-HD, SSIM %, CLIP %, SIFT matches) of images i and j."""
+        mtb = self._overlap(self.mtb, self.mtb_count, i, j)
+        edge = self._overlap(self.edges, self.edge_count, i, j)
+        hd = (_popcount(np.bitwise_xor(self.pdq[i], self.pdq[j]).view(np.uint8))
+              if self.pdq_ok[i] and self.pdq_ok[j] else 999)
+        ssim = 100.0 * ssim_from_stats(self.ssim_stats(i), self.ssim_stats(j))
+        clip = (100.0 * float(np.dot(self.clip[i].astype(np.float32), self.clip[j].astype(np.float32)))
+                if self.clip_ok[i] and self.clip_ok[j] else 0.0)
+        sift = sift_match_count(self.descriptors(i), self.descriptors(j))
+        return mtb, edge, hd, ssim, clip, sift
+
+    def pair_sim(self, path_a: str, path_b: str) -> Tuple[float, float, int, float, float, int]:
+        """engine._pair_sim from the shard (a pair_metrics callable)."""
+        return self.pair_metrics_at(self.index[path_a], self.index[path_b])
+
+    def info(self) -> Dict[str, Any]:
+        return {"path": str(self.path or ""), "engine": self.meta["engine"], "listing": self.meta["listing"],
+                "images": len(self), "sift_descriptors": int(self.sift_offsets[-1]),
+                "mb": sum(getattr(self, n).nbytes for n in _ARRAYS) / 1e6,
+                "settings": self.meta["settings"]}
+
+
+def main() -> None:
+    import argparse
+    import importlib
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Build or inspect memory-mapped feature shards")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Build shards for listing folders (processed/ used if present)")
+    b.add_argument("folders", nargs="+")
+    b.add_argument("--root", default="shards")
+    b.add_argument("--engine", default="dedup_fixed_drift")
+    i = sub.add_parser("info", help="Print a shard's summary")
+    i.add_argument("shard")
+    args = parser.parse_args()
+
+    if args.cmd == "info":
+        print(json.dumps(FeatureShard(args.shard).info(), indent=2, default=str))
+        return
+    engine = importlib.import_module(args.engine)
+    for f in args.folders:
+        src = Path(f) / "processed" if (Path(f) / "processed").exists() else Path(f)
+        paths = [str(p.resolve()) for p in sorted(src.glob("*.jpg"))]
+        if not paths:
+            logger.warning("No images in %s", src)
+            continue
+        shard = ensure_shard(engine, paths, args.root, listing=Path(f).name)
+        logger.info("%s → %s (%.1f MB)", f, shard.path, shard.info()["mb"])
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,21 @@
 generate_weight_combinations.py
 
 Generates all valid weight combinations for 5 metrics (MTB, SSIM, CLIP, PDQ, SIFT)
-with 10% increments where weights sum to 1.0.
+with 10% increments (or 1/steps) where weights sum to 1.0.
 
-Total combinations: 1,001 (using stars and bars: C(14, 4))
+Total combinations: 1,001 (using stars and bars: C(14, 4)); 10,626 at 5% steps
 """
 
-def generate_weights():
+def generate_weights(steps=10):
     """
     Generate all weight combinations using nested loops.
 
+    Args:
+        steps: Grid resolution; weights are multiples of 1/steps
+               (10 → 10% increments, 1,001 combos; 20 → 5%, 10,626 combos)
+
     Returns:
-        List[dict]: List of 1,001 weight dictionaries with keys:
+        List[dict]: List of C(steps + 4, 4) weight dictionaries with keys:
                     'mtb', 'ssim', 'clip', 'pdq', 'sift'
 
     Example:
@@ -25,25 +29,28 @@ def generate_weights():
         {'mtb': 0.0, 'ssim': 0.0, 'clip': 0.0, 'pdq': 0.0, 'sift': 1.0}
         >>> weights[-1]
         {'mtb': 1.0, 'ssim': 0.0, 'clip': 0.0, 'pdq': 0.0, 'sift': 0.0}
+        >>> len(generate_weights(steps=20))
+        10626
     """
     combinations = []
+    n = steps
 
     # Generate all combinations where:
     # w_mtb + w_ssim + w_clip + w_pdq + w_sift = 1.0
-    # Each weight in {0.0, 0.1, 0.2, ..., 1.0}
+    # Each weight in {0, 1/steps, 2/steps, ..., 1.0}
 
-    for w_mtb in range(0, 11):      # 0.0 to 1.0 in 0.1 steps
-        for w_ssim in range(0, 11 - w_mtb):
-            for w_clip in range(0, 11 - w_mtb - w_ssim):
-                for w_pdq in range(0, 11 - w_mtb - w_ssim - w_clip):
-                    w_sift = 10 - w_mtb - w_ssim - w_clip - w_pdq
+    for w_mtb in range(0, n + 1):
+        for w_ssim in range(0, n + 1 - w_mtb):
+            for w_clip in range(0, n + 1 - w_mtb - w_ssim):
+                for w_pdq in range(0, n + 1 - w_mtb - w_ssim - w_clip):
+                    w_sift = n - w_mtb - w_ssim - w_clip - w_pdq
                     if w_sift >= 0:  # Valid combination
                         combinations.append({
-                            'mtb': w_mtb / 10.0,
-                            'ssim': w_ssim / 10.0,
-                            'clip': w_clip / 10.0,
-                            'pdq': w_pdq / 10.0,
-                            'sift': w_sift / 10.0
+                            'mtb': w_mtb / n,
+                            'ssim': w_ssim / n,
+                            'clip': w_clip / n,
+                            'pdq': w_pdq / n,
+                            'sift': w_sift / n
                         })
 
     return combinations
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+global_index.py – persistent cross-listing near-duplicate index
+
+imagededup_cross_directory.py copies every image of every directory into
+temp_all_images/ and re-encodes all of them with the imagededup CNN on each
+run.  Stock photos and images reused between agents need that check across the
+whole archive, so this index keeps two compact signatures per image on disk
+and only ever computes features for the listing being added:
+
+    PDQ    256-bit hash as 4 × uint64, searched with a multi-index Hamming
+           table: the hash is split into 16 chunks of 16 bits and each chunk
+           has its own sorted table.  Two hashes within `pdq_radius` bits agree
+           on at least one chunk to within ⌊radius / 16⌋ bits (pigeonhole), so
+           probing every chunk at that radius finds *all* of them; candidates
+           are then checked exactly by popcount
+    CLIP   normalised embedding quantised to int8 (×127); cosine ≈ int dot
+           product / 127².  Searched with an inverted file (spherical k-means
+           centroids, `nprobe` nearest lists) once the base has IVF_MIN_ROWS
+           rows, brute force below that
+
+Layout of an index directory:
+
+    meta.json                 engine, CLIP width, listings, replaced listings
+    base/*.npy                compacted rows (memory-mapped): paths, listings,
+                              pdq, pdq_ok, clip, clip_ok, the 16 chunk tables
+                              (mih_keys, mih_rows) and the IVF lists
+    delta/<listing>.npz       one file per listing added since the last compact;
+                              scanned exactly, folded into base by compact()
+
+Adding a listing writes one delta file (re-adding replaces it, and hides its
+old base rows), so updates are incremental and never rewrite the base.
+`query(listing)` collects PDQ and CLIP candidates from other listings and
+verifies each with the engine's own multi-metric decision (`_pair_metrics`
+through the Deduplicator's FeatureStore, then `_decide_pair` under its
+policy), reading the candidate images in place.  Fragments written by
+sharded_runner.py (index_fragments.npz) can be ingested directly.
+
+One writer at a time; any number of readers.
+
+Usage:
+    index = GlobalIndex("global_index", engine="drift_fix")
+    index.add_listing("1", paths)
+    for m in index.query("1"):
+        if m.dup:
+            print(m.query, "≈", m.match, f"({m.listing})")
+
+    python global_index.py add images/1 images/2 --root global_index --query
+    python global_index.py ingest nightly/index_fragments.npz --root global_index
+    python global_index.py query 1 --root global_index --out matches.jsonl
+    python global_index.py compact --root global_index
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install opencv-python numpy
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bounded_cache import engine_caches, release_paths
+from deduplicator import ENGINES, Deduplicator
+from multihash import popcount
+from sharded_runner import index_fragment, load_fragments
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+PDQ_CHUNKS = 16                        # 16 chunks × 16 bits
+DEFAULT_PDQ_RADIUS = 31                # bits; probes each chunk at radius 1
+DEFAULT_CLIP_MIN = 0.92                # cosine for a CLIP candidate
+DEFAULT_CLIP_K = 10                    # CLIP candidates per image (before the cosine cut)
+CLIP_SCALE = 127.0
+IVF_MIN_ROWS = 20000                   # below this the base CLIP scan is brute force
+IVF_NPROBE = 8
+SCAN_CHUNK = 65536                     # rows per block in brute-force scans
+_ROW_KEYS = ("paths", "listings", "pdq", "pdq_ok", "clip", "clip_ok")
+
+
+@dataclass
+class Match:
+    query: str
+    match: str
+    listing: str
+    index_hd: Optional[int] = None               # PDQ distance that made it a candidate
+    index_clip: Optional[float] = None           # quantised CLIP cosine
+    metrics: Dict[str, float] = field(default_factory=dict)   # mtb, edge, hd, ssim, clip, sift
+    score: float = 0.0
+    dup: bool = False
+    reason: str = ""
+
+
+# ─── signatures ───────────────────────────────────────────────────────────────
+def quantize_clip(clip: np.ndarray) -> np.ndarray:
+    """(N, D) float embeddings → (N, D) int8, row-normalised and scaled by 127."""
+    x = np.asarray(clip, np.float32)
+    norm = np.linalg.norm(x, axis=1, keepdims=True)
+    x = x / np.where(norm > 0, norm, 1.0)
+    return np.clip(np.rint(x * CLIP_SCALE), -127, 127).astype(np.int8)
+
+
+def pdq_chunks(pdq: np.ndarray) -> np.ndarray:
+    """(N, 4) uint64 hashes → (N, 16) uint16 chunks."""
+    pdq = np.ascontiguousarray(pdq, dtype=np.uint64)
+    return pdq.view(np.uint16).reshape(len(pdq), PDQ_CHUNKS)
+
+
+def _probe_masks(radius: int) -> np.ndarray:
+    """Every 16-bit XOR mask with at most `radius` bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        masks.extend(sum(1 << b for b in bits) for bits in combinations(range(16), r))
+    return np.array(masks, np.uint16)
+
+
+def _empty_rows(dim: int) -> Dict[str, np.ndarray]:
+    return {"paths": np.zeros(0, str), "listings": np.zeros(0, str),
+            "pdq": np.zeros((0, 4), np.uint64), "pdq_ok": np.zeros(0, bool),
+            "clip": np.zeros((0, dim), np.int8), "clip_ok": np.zeros(0, bool)}
+
+
+def _concat_rows(parts: Sequence[Dict[str, np.ndarray]], dim: int) -> Dict[str, np.ndarray]:
+    parts = [p for p in parts if len(p["paths"])]
+    if not parts:
+        return _empty_rows(dim)
+    return {k: np.concatenate([np.asarray(p[k]) for p in parts]) for k in _ROW_KEYS}
+
+
+def _take(rows: Dict[str, np.ndarray], idx: np.ndarray) -> Dict[str, np.ndarray]:
+    return {k: np.asarray(rows[k][idx]) for k in _ROW_KEYS}
+
+
+def _slug(listing: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", listing)
+
+
+# ─── base tables ──────────────────────────────────────────────────────────────
+def build_mih(pdq: np.ndarray, pdq_ok: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(16, M) sorted chunk values and (16, M) row ids over the rows with a PDQ."""
+    rows = np.flatnonzero(pdq_ok).astype(np.int64)
+    chunks = pdq_chunks(pdq[rows]) if len(rows) else np.zeros((0, PDQ_CHUNKS), np.uint16)
+    order = np.argsort(chunks, axis=0, kind="stable")
+    keys = np.take_along_axis(chunks, order, axis=0).T.copy()
+    return keys, rows[order].T.copy()
+
+
+def train_ivf(clip: np.ndarray, clip_ok: np.ndarray, iters: int = 10,
+              seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Spherical k-means over int8 rows → (centroids, row order by list, list offsets)."""
+    rows = np.flatnonzero(clip_ok)
+    nlist = int(min(4096, max(1, 4 * np.sqrt(len(rows)))))
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(rows, size=min(len(rows), 256 * nlist), replace=False)
+    x = clip[np.sort(sample)].astype(np.float32) / CLIP_SCALE
+    cent = x[rng.choice(len(x), size=nlist, replace=False)]
+    for _ in range(iters):
+        assign = np.argmax(x @ cent.T, axis=1)
+        for c in range(nlist):
+            members = x[assign == c]
+            if len(members):
+                v = members.sum(0)
+                cent[c] = v / max(np.linalg.norm(v), 1e-12)
+
+    assign = np.empty(len(rows), np.int64)
+    for s in range(0, len(rows), SCAN_CHUNK):
+        block = clip[rows[s:s + SCAN_CHUNK]].astype(np.float32)
+        assign[s:s + SCAN_CHUNK] = np.argmax(block @ cent.T, axis=1)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+    return cent.astype(np.float32), rows[order].astype(np.int64), offsets.astype(np.int64)
+
+
+# ─── index ────────────────────────────────────────────────────────────────────
+class GlobalIndex:
+    """PDQ multi-index + quantised CLIP index over every listing added so far."""
+
+    def __init__(self, root: str, engine: Any = "drift_fix", dedup: Optional[Deduplicator] = None,
+                 pair_metrics: Optional[Callable[[str, str], Tuple[float, float, int, float, float, int]]] = None):
+        self.root = Path(root)
+        self.dedup = dedup or Deduplicator.from_engine(engine)
+        self.engine = self.dedup.engine
+        self.pair_metrics = pair_metrics or self.dedup.store.pair
+        (self.root / "delta").mkdir(parents=True, exist_ok=True)
+        meta_path = self.root / "meta.json"
+        self.meta: Dict[str, Any] = (json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists()
+                                     else {"version": INDEX_VERSION, "engine": self.engine.__name__,
+                                           "clip_dim": 0, "listings": {}, "replaced": []})
+        if self.meta["engine"] != self.engine.__name__:
+            logger.warning("Index %s was built with %s, querying with %s",
+                           root, self.meta["engine"], self.engine.__name__)
+        self._load_base()
+        self._delta: Dict[str, Dict[str, np.ndarray]] = {}
+        for name, entry in self.meta["listings"].items():
+            if entry["where"] == "delta":
+                with np.load(self.root / "delta" / entry["file"]) as z:
+                    self._delta[name] = {k: z[k] for k in _ROW_KEYS}
+        self._delta_rows: Optional[Dict[str, np.ndarray]] = None
+
+    # ── persistence ───────────────────────────────────────────────────────────
+    def _load_base(self) -> None:
+        base = self.root / "base"
+        self.base = {k: np.load(base / f"{k}.npy", mmap_mode="r") for k in _ROW_KEYS} \
+            if (base / "paths.npy").exists() else _empty_rows(self.clip_dim)
+        self.mih = ((np.load(base / "mih_keys.npy", mmap_mode="r"), np.load(base / "mih_rows.npy", mmap_mode="r"))
+                    if (base / "mih_keys.npy").exists() else None)
+        self.ivf = ((np.load(base / "ivf_centroids.npy"), np.load(base / "ivf_rows.npy", mmap_mode="r"),
+                     np.load(base / "ivf_offsets.npy")) if (base / "ivf_centroids.npy").exists() else None)
+        replaced = set(self.meta["replaced"])
+        self._base_dead = (np.isin(np.asarray(self.base["listings"]), list(replaced))
+                           if replaced else np.zeros(len(self.base["paths"]), bool))
+
+    def _save_meta(self) -> None:
+        tmp = self.root / f"meta.json.{uuid.uuid4().hex[:8]}.tmp"
+        tmp.write_text(json.dumps(self.meta, indent=1), encoding="utf-8")
+        os.replace(tmp, self.root / "meta.json")
+
+    @property
+    def clip_dim(self) -> int:
+        return int(self.meta["clip_dim"])
+
+    def __len__(self) -> int:
+        return int((~self._base_dead).sum()) + sum(len(d["paths"]) for d in self._delta.values())
+
+    def info(self) -> Dict[str, Any]:
+        where = [e["where"] for e in self.meta["listings"].values()]
+        return {"root": str(self.root), "engine": self.meta["engine"], "images": len(self),
+                "listings": len(where), "base_listings": where.count("base"),
+                "delta_listings": where.count("delta"), "base_rows": len(self.base["paths"]),
+                "hidden_base_rows": int(self._base_dead.sum()), "clip_dim": self.clip_dim,
+                "ivf_lists": 0 if self.ivf is None else len(self.ivf[0])}
+
+    # ── updates ───────────────────────────────────────────────────────────────
+    def add_listing(self, listing: str, paths: Sequence[str]) -> int:
+        """Compute Phase 1 for this listing only and add (or replace) its rows."""
+        store = self.dedup.store
+        store.warm(paths)
+        return self.add_fragment(index_fragment(listing, [store.record(p) for p in paths]))
+
+    def add_fragment(self, frag: Dict[str, np.ndarray]) -> int:
+        """Add every listing of an index fragment (sharded_runner format); returns rows added."""
+        width = frag["clip"].shape[1]
+        if width and not self.clip_dim:
+            self.meta["clip_dim"] = width
+            if not len(self.base["paths"]):
+                self.base = _empty_rows(width)
+        if width and width != self.clip_dim:
+            raise ValueError(f"CLIP width {width} does not match the index ({self.clip_dim})")
+        added = 0
+        for listing in np.unique(frag["listings"]):
+            sel = frag["listings"] == listing
+            n = int(sel.sum())
+            clip = quantize_clip(frag["clip"][sel]) if width else np.zeros((n, self.clip_dim), np.int8)
+            rows = {"paths": frag["paths"][sel], "listings": frag["listings"][sel],
+                    "pdq": frag["pdq"][sel], "pdq_ok": frag["pdq_ok"][sel],
+                    "clip": clip, "clip_ok": frag["clip_ok"][sel] & bool(width)}
+            self._write_delta(str(listing), rows)
+            added += n
+        self._save_meta()
+        return added
+
+    def _write_delta(self, listing: str, rows: Dict[str, np.ndarray]) -> None:
+        entry = self.meta["listings"].get(listing)
+        if entry and entry["where"] == "base" and listing not in self.meta["replaced"]:
+            self.meta["replaced"].append(listing)
+            self._base_dead |= np.asarray(self.base["listings"]) == listing
+        name = f"{_slug(listing)}.npz"
+        tmp = self.root / "delta" / f".{name}.{uuid.uuid4().hex[:8]}.tmp.npz"
+        np.savez(tmp, **rows)
+        os.replace(tmp, self.root / "delta" / name)
+        self.meta["listings"][listing] = {"where": "delta", "file": name, "images": len(rows["paths"])}
+        self._delta[listing] = rows
+        self._delta_rows = None
+
+    def ingest(self, fragment_file: str) -> int:
+        return self.add_fragment(load_fragments(fragment_file))
+
+    def needs_compact(self, fraction: float = 0.25, min_rows: int = 10000) -> bool:
+        pending = sum(len(d["paths"]) for d in self._delta.values())
+        return pending >= max(min_rows, fraction * len(self.base["paths"])) or \
+            int(self._base_dead.sum()) >= max(min_rows, fraction * len(self.base["paths"]))
+
+    def compact(self) -> None:
+        """Fold delta listings into the base and rebuild the PDQ and CLIP tables."""
+        live = _take(self.base, np.flatnonzero(~self._base_dead))
+        rows = _concat_rows([live] + list(self._delta.values()), self.clip_dim)
+        tmp = self.root / f".base.{uuid.uuid4().hex[:8]}.tmp"
+        tmp.mkdir()
+        for k in _ROW_KEYS:
+            np.save(tmp / f"{k}.npy", rows[k])
+        keys, mih_rows = build_mih(rows["pdq"], rows["pdq_ok"])
+        np.save(tmp / "mih_keys.npy", keys)
+        np.save(tmp / "mih_rows.npy", mih_rows)
+        if int(rows["clip_ok"].sum()) >= IVF_MIN_ROWS:
+            cent, ivf_rows, offsets = train_ivf(rows["clip"], rows["clip_ok"])
+            np.save(tmp / "ivf_centroids.npy", cent)
+            np.save(tmp / "ivf_rows.npy", ivf_rows)
+            np.save(tmp / "ivf_offsets.npy", offsets)
+
+        old = self.root / f".base.{uuid.uuid4().hex[:8]}.old"
+        if (self.root / "base").exists():
+            os.rename(self.root / "base", old)
+        os.rename(tmp, self.root / "base")
+        for listing, entry in self.meta["listings"].items():
+            if entry["where"] == "delta":
+                (self.root / "delta" / entry["file"]).unlink(missing_ok=True)
+            self.meta["listings"][listing] = {"where": "base", "images": entry["images"]}
+        self.meta["replaced"] = []
+        self._save_meta()
+        shutil.rmtree(old, ignore_errors=True)
+        self._delta, self._delta_rows = {}, None
+        self._load_base()
+        logger.info("Compacted %s: %d rows", self.root, len(rows["paths"]))
+
+    # ── search ────────────────────────────────────────────────────────────────
+    def _rows_of(self, listing: str) -> Dict[str, np.ndarray]:
+        if listing in self._delta:
+            return self._delta[listing]
+        if listing not in self.meta["listings"]:
+            raise KeyError(f"Listing {listing!r} is not in the index")
+        return _take(self.base, np.flatnonzero(np.asarray(self.base["listings"]) == listing))
+
+    def _delta_all(self) -> Dict[str, np.ndarray]:
+        if self._delta_rows is None:
+            self._delta_rows = _concat_rows(list(self._delta.values()), self.clip_dim)
+        return self._delta_rows
+
+    def _pdq_base(self, q: np.ndarray, radius: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, distances) of base hashes within `radius` of q, via the chunk tables."""
+        if self.mih is None or not self.mih[0].shape[1]:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        keys, rows = self.mih
+        masks = _probe_masks(radius // PDQ_CHUNKS)
+        qc = pdq_chunks(q[None])[0]
+        found = []
+        for c in range(PDQ_CHUNKS):
+            probes = np.unique(qc[c] ^ masks)
+            lo = np.searchsorted(keys[c], probes, "left")
+            hi = np.searchsorted(keys[c], probes, "right")
+            found.extend(np.asarray(rows[c, a:b]) for a, b in zip(lo, hi) if b > a)
+        if not found:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        cand = np.unique(np.concatenate(found))
+        hd = popcount(np.asarray(self.base["pdq"][cand]) ^ q)
+        keep = hd <= radius
+        return cand[keep], hd[keep]
+
+    def _clip_base(self, Q: np.ndarray, nprobe: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Per query row: (base rows, int dot products) over the probed IVF lists or every row."""
+        Qi = Q.astype(np.int32)
+        if self.ivf is not None:
+            cent, ivf_rows, offsets = self.ivf
+            near = np.argsort(-(Q.astype(np.float32) @ cent.T), axis=1)[:, :nprobe]
+            out = []
+            for i, lists in enumerate(near):
+                cand = np.concatenate([np.asarray(ivf_rows[offsets[c]:offsets[c + 1]]) for c in lists])
+                out.append((cand, np.asarray(self.base["clip"][cand], np.int32) @ Qi[i]))
+            return out
+        n = len(self.base["paths"])
+        dots = np.empty((len(Q), n), np.int32)
+        for s in range(0, n, SCAN_CHUNK):
+            dots[:, s:s + SCAN_CHUNK] = Qi @ np.asarray(self.base["clip"][s:s + SCAN_CHUNK], np.int32).T
+        rows = np.arange(n)
+        return [(rows, d) for d in dots]
+
+    def candidates(self, listing: str, pdq_radius: int = DEFAULT_PDQ_RADIUS,
+                   clip_min: float = DEFAULT_CLIP_MIN, clip_k: int = DEFAULT_CLIP_K,
+                   nprobe: int = IVF_NPROBE) -> Dict[Tuple[str, str], Match]:
+        """(query path, other path) → unverified Match for every index hit outside `listing`."""
+        q = self._rows_of(listing)
+        delta = self._delta_all()
+        base_ok = ~self._base_dead & (np.asarray(self.base["listings"]) != listing)
+        delta_ok = delta["listings"] != listing
+        found: Dict[Tuple[str, str], Match] = {}
+
+        def _hit(i: int, paths: np.ndarray, listings: np.ndarray, r: int) -> Match:
+            key = (str(q["paths"][i]), str(paths[r]))
+            if key not in found:
+                found[key] = Match(query=key[0], match=key[1], listing=str(listings[r]))
+            return found[key]
+
+        for i in np.flatnonzero(q["pdq_ok"]):
+            rows, hd = self._pdq_base(q["pdq"][i], pdq_radius)
+            for r, d in zip(rows, hd):
+                if base_ok[r]:
+                    _hit(i, self.base["paths"], self.base["listings"], r).index_hd = int(d)
+            if len(delta["paths"]):
+                hd = popcount(delta["pdq"] ^ q["pdq"][i])
+                for r in np.flatnonzero((hd <= pdq_radius) & delta["pdq_ok"] & delta_ok):
+                    _hit(i, delta["paths"], delta["listings"], r).index_hd = int(hd[r])
+
+        qi = np.flatnonzero(q["clip_ok"])
+        if len(qi) and self.clip_dim:
+            cut = clip_min * CLIP_SCALE * CLIP_SCALE
+            sources = []
+            if len(self.base["paths"]):
+                sources.append((self.base, base_ok & np.asarray(self.base["clip_ok"]),
+                                self._clip_base(q["clip"][qi], nprobe)))
+            if len(delta["paths"]):
+                dots = q["clip"][qi].astype(np.int32) @ delta["clip"].astype(np.int32).T
+                rows = np.arange(len(delta["paths"]))
+                sources.append((delta, delta_ok & delta["clip_ok"], [(rows, d) for d in dots]))
+            for src, ok, per_query in sources:
+                for i, (rows, dots) in zip(qi, per_query):
+                    sel = ok[rows] & (dots >= cut)
+                    rows, dots = rows[sel], dots[sel]
+                    for j in np.argsort(-dots, kind="stable")[:clip_k]:
+                        _hit(i, src["paths"], src["listings"], rows[j]).index_clip = \
+                            float(dots[j]) / (CLIP_SCALE * CLIP_SCALE)
+        return found
+
+    def _verify(self, m: Match, metadata_dict: Dict[str, Dict[str, Any]]) -> Optional[Match]:
+        try:
+            mtb, edge, hd, ssim, clip, sift = self.pair_metrics(m.query, m.match)
+        except Exception as e:
+            logger.warning("Cannot verify %s vs %s: %s", m.query, m.match, e)
+            return None
+        if hd == 999:
+            return None
+        aerial = self.engine._is_aerial(m.query, metadata_dict) or self.engine._is_aerial(m.match, metadata_dict)
+        d = self.engine._decide_pair(mtb, hd, ssim, clip, sift, self.dedup.config.policy(aerial))
+        m.metrics = {"mtb": mtb, "edge": edge, "hd": hd, "ssim": ssim, "clip": clip, "sift": sift}
+        m.score, m.dup, m.reason = d["score"], d["dup"], d["drop_reason"]
+        return m
+
+    def query(self, listing: str, verify: bool = True, metadata_dict: Optional[Dict[str, Dict[str, Any]]] = None,
+              workers: int = 8, **search: Any) -> List[Match]:
+        """
+        Cross-listing matches for every image of `listing`.  With verify (the
+        default) each candidate pair is scored by the engine's decision rule and
+        `dup` says whether it is a near duplicate; without, index hits only.
+        """
+        found = list(self.candidates(listing, **search).values())
+        if verify and found:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(found)))) as pool:
+                found = [m for m in pool.map(lambda m: self._verify(m, metadata_dict or {}), found) if m]
+        return sorted(found, key=lambda m: (m.query, -m.score, m.match))
+
+
+# ─── CLI ──────────────────────────────────────────────────────────────────────
+def _listing_paths(folder: str) -> List[str]:
+    src = Path(folder) / "processed" if (Path(folder) / "processed").exists() else Path(folder)
+    return [str(p.resolve()) for p in sorted(src.glob("*.jpg"))]
+
+
+def _report(index: GlobalIndex, listing: str, out: Any, all_pairs: bool, **search: Any) -> int:
+    matches = index.query(listing, **search)
+    dups = [m for m in matches if m.dup]
+    print(f"{listing}: {len(matches)} candidate pairs, {len(dups)} cross-listing duplicates")
+    for m in dups:
+        print(f"   {Path(m.query).name} ≈ {m.listing}/{Path(m.match).name} (score {m.score:.2f})")
+    if out:
+        for m in (matches if all_pairs else dups):
+            out.write(json.dumps({"listing": listing, **asdict(m)}) + "\n")
+    return len(dups)
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Persistent cross-listing near-duplicate index")
+    parser.add_argument("--root", default="global_index", help="Index directory")
+    parser.add_argument("--engine", default="drift_fix", help=f"{' | '.join(ENGINES)} (default: drift_fix)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("add", help="Add (or replace) listing folders (processed/ used if present)")
+    a.add_argument("folders", nargs="+")
+    a.add_argument("--query", action="store_true", help="Report each listing's cross-listing matches")
+    g = sub.add_parser("ingest", help="Add index fragments written by sharded_runner.py")
+    g.add_argument("fragments", nargs="+")
+    q = sub.add_parser("query", help="Cross-listing matches of listings already in the index")
+    q.add_argument("listings", nargs="+")
+    q.add_argument("--no-verify", action="store_true", help="Index hits only, no decision rule")
+    for p in (a, q):
+        p.add_argument("--pdq-radius", type=int, default=DEFAULT_PDQ_RADIUS)
+        p.add_argument("--clip-min", type=float, default=DEFAULT_CLIP_MIN)
+        p.add_argument("--clip-k", type=int, default=DEFAULT_CLIP_K)
+        p.add_argument("--out", type=str, default=None, help="Append matches as JSON lines")
+        p.add_argument("--all-pairs", action="store_true", help="With --out, also write non-duplicates")
+    sub.add_parser("compact", help="Fold delta listings into the base tables")
+    sub.add_parser("info", help="Print the index summary")
+    args = parser.parse_args()
+
+    index = GlobalIndex(args.root, engine=args.engine)
+    if args.cmd == "info":
+        print(json.dumps(index.info(), indent=2))
+        return
+    if args.cmd == "compact":
+        index.compact()
+        print(json.dumps(index.info(), indent=2))
+        return
+    if args.cmd == "ingest":
+        for f in args.fragments:
+            logger.info("%s: %d rows", f, index.ingest(f))
+        if index.needs_compact():
+            index.compact()
+        return
+
+    search = {"pdq_radius": args.pdq_radius, "clip_min": args.clip_min, "clip_k": args.clip_k}
+    out = open(args.out, "a", encoding="utf-8") if args.out else None
+    try:
+        if args.cmd == "query":
+            for listing in args.listings:
+                _report(index, listing, out, args.all_pairs, verify=not args.no_verify, **search)
+            return
+        for folder in args.folders:
+            paths = _listing_paths(folder)
+            if not paths:
+                logger.warning("No images in %s", folder)
+                continue
+            listing = Path(folder).name
+            try:
+                logger.info("%s: %d images added", listing, index.add_listing(listing, paths))
+                if args.query:
+                    _report(index, listing, out, args.all_pairs, **search)
+            finally:
+                release_paths(paths, index.dedup.store.pairs, *engine_caches(index.engine))
+        if index.needs_compact():
+            index.compact()
+    finally:
+        if out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+lazy_imports.py – on-demand loading of optional heavy dependencies
+
+The dedup engines used to `import torch, open_clip`, `skimage`, `pdqhash` and
+`imagehash` at module import.  Scripts that import an engine only for its
+helpers (reports, cached-feature runs, batch sweeps) paid several seconds of
+torch import for nothing.  `lazy_module` returns a proxy that:
+
+    • is truthy/falsy according to whether the package is *installed*
+      (checked with importlib.util.find_spec, nothing is imported), so the
+      existing `if pdqhash is None`-style availability checks become
+      `if not pdqhash`;
+    • imports the real module on first attribute access and records how long
+      that took, so the first metric that needs it pays the cost.
+
+`startup_report()` runs a fresh interpreter with `-X importtime` and prints the
+per-module import cost of an entry point plus the lazy loads that happened in
+the current process (`--profile-startup` in the CLIs).
+"""
+
+from __future__ import annotations
+
+import importlib
+import importlib.util
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+_IMPORT_TIMES: Dict[str, float] = {}   # module -> seconds spent in first import
+_lock = threading.Lock()
+
+
+def module_available(name: str) -> bool:
+    """True if the top-level package is installed (does not import it)."""
+    try:
+        return importlib.util.find_spec(name.split(".")[0]) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule:
+    """Proxy that imports `name` on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Any = None
+        self._available: Optional[bool] = None
+
+    def _load(self) -> Any:
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    t0 = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    _IMPORT_TIMES[self._name] = time.perf_counter() - t0
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __bool__(self) -> bool:
+        if self._available is None:
+            self._available = module_available(self._name)
+        return self._available
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "deferred"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+class LazyAttr:
+    """Callable proxy for `from <module> import <attr>` style imports."""
+
+    def __init__(self, module: str, attr: str):
+        self._mod = LazyModule(module)
+        self._attr = attr
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return getattr(self._mod, self._attr)(*args, **kwargs)
+
+    def __bool__(self) -> bool:
+        return bool(self._mod)
+
+    def __repr__(self) -> str:
+        return f"<LazyAttr {self._mod._name}.{self._attr}>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def lazy_attr(module: str, attr: str) -> LazyAttr:
+    return LazyAttr(module, attr)
+
+
+def is_loaded(proxy: Any) -> bool:
+    """True once a lazy proxy has actually imported its module."""
+    if isinstance(proxy, LazyAttr):
+        proxy = proxy._mod
+    return isinstance(proxy, LazyModule) and proxy._module is not None
+
+
+def lazy_import_times() -> Dict[str, float]:
+    return dict(_IMPORT_TIMES)
+
+
+# ─── startup profiling ────────────────────────────────────────────────────────
+def profile_module_import(module: str, cwd: Optional[str] = None) -> List[Tuple[str, float, float]]:
+    """
+    Import `module` in a fresh interpreter with `-X importtime`.
+
+    Returns [(top_level_package, self_ms, cumulative_ms)] sorted by cumulative
+    cost.  Self time is summed over all submodules of a package; cumulative is
+    the largest cumulative figure seen for the package (its outermost import).
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=cwd, capture_output=True, text=True)
+    self_us: Dict[str, int] = defaultdict(int)
+    cum_us: Dict[str, int] = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            s, c = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue   # header line
+        top = parts[2].strip().split(".")[0]
+        self_us[top] += s
+        cum_us[top] = max(cum_us[top], c)
+    rows = [(name, self_us[name] / 1000, cum_us[name] / 1000) for name in self_us]
+    return sorted(rows, key=lambda r: r[2], reverse=True)
+
+
+def startup_report(module: str, top: int = 15) -> str:
+    """Human-readable per-module import cost for `import <module>`."""
+    rows = profile_module_import(module)
+    total = next((c for name, _, c in rows if name == module), 0.0)
+    lines = [f"Startup import profile for `{module}` (total {total:.0f} ms)",
+             f"{'module':<28}{'self ms':>10}{'cumul ms':>10}"]
+    for name, s, c in rows[:top]:
+        lines.append(f"{name:<28}{s:>10.1f}{c:>10.1f}")
+    lazy = lazy_import_times()
+    if lazy:
+        lines.append("Deferred imports loaded during this run:")
+        for name, secs in sorted(lazy.items(), key=lambda kv: kv[1], reverse=True):
+            lines.append(f"  {name:<26}{secs * 1000:>10.1f} ms")
+    else:
+        lines.append("Deferred imports loaded during this run: none")
+    return "\n".join(lines)
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+metric_registry.py – metric plugins + lazy, cost-ordered pair evaluation
+
+The dedup engines (deduplication, deduplicationwnew, deduplicationwSSIM,
+deduplication_sift150, dedup_fixed_drift, dedupwphash, deduplication_asift)
+differ mostly in which metrics feed the composite, yet every one of them
+computes every metric for every pair – including Edge overlap, which no
+composite uses, and SIFT, which costs more than everything else combined.
+
+Here each metric is a plugin:
+
+    FeatureSpec   per-image feature (gray, MTB bitmap, SSIM window sums, PDQ
+                  bits, CLIP embedding, SIFT descriptors …) with its cost and
+                  the features it is built from
+    MetricSpec    pair function over features, its cost, and how its raw value
+                  becomes a score term (range known up front)
+
+`DecisionPolicy` is the engines' rule (_decide_pair) in three-valued form:
+
+    dup = score ≥ threshold  ∧  ((mtb ≥ floor ∧ hd < ceil) ∨ override)
+
+With only some metrics known, the score is an interval and each clause is
+True / False / unknown.  `LazyPairEvaluator` repeatedly asks the policy which
+unknown metrics can still change the outcome and computes the cheapest one
+(pair cost + cost of the features it still needs), stopping as soon as the
+decision is fixed.  Metrics with no weight and no gate/override role are
+never computed; a clear non-duplicate or a clear duplicate never pays for
+SIFT.  A pair whose PDQ is unusable (hd == 999) is skipped as the engines do,
+so PDQ is always known before a pair is declared a duplicate.
+
+Adding a metric is a registration, not a fork: the "phash" (multihash) and
+"asift" (deduplication_asift) plugins ship here, and a policy built from an
+engine picks up any {AERIAL_}WEIGHT_<NAME> it defines.
+
+Usage:
+    import deduplication as dedupe
+    reg = build_registry(dedupe, plugins=("phash",))
+    ev = LazyPairEvaluator(reg)
+    r = ev.evaluate(a, b, DecisionPolicy.from_engine(dedupe))
+    r.dup, r.metrics, r.computed            # decision, known values, what ran
+    kept = dedupe_groups(groups, dedupe)    # same greedy loop, lazily evaluated
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bounded_cache import BoundedCache
+
+logger = logging.getLogger(__name__)
+
+UNUSABLE_HD = 999                     # _pdq_hd / _phash_hd when a hash is missing
+_MISSING = object()
+
+
+# ─── specs ────────────────────────────────────────────────────────────────────
+@dataclass(frozen=True)
+class FeatureSpec:
+    """Per-image feature; compute(path, deps) gets the features named in `deps`."""
+    name: str
+    compute: Callable[[str, Dict[str, Any]], Any]
+    cost: float                               # relative cost per image
+    deps: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    """
+    Pair metric.  pair(fa, fb) receives the two images' `features` dicts;
+    term(value, policy) maps the raw value to its score term, which always lies
+    in `term_range`.  unusable(value) marks a comparison the engines skip.
+    """
+    name: str
+    features: Tuple[str, ...]
+    pair: Callable[[Dict[str, Any], Dict[str, Any]], float]
+    cost: float                               # relative cost per pair
+    term: Optional[Callable[[float, "DecisionPolicy"], float]] = None
+    term_range: Tuple[float, float] = (0.0, 1.0)
+    unusable: Optional[Callable[[float], bool]] = None
+
+
+def percent_term(value: float, policy: "DecisionPolicy") -> float:
+    return value / 100.0
+
+
+def count_term(value: float, policy: "DecisionPolicy") -> float:
+    return min(value / 100.0, 1.0) if value > 0 else 0.0
+
+
+def hamming_term(name: str) -> Callable[[float, "DecisionPolicy"], float]:
+    def term(value: float, policy: "DecisionPolicy") -> float:
+        ceil = policy.ceilings[name]
+        return 0.0 if value >= ceil else 1.0 - value / ceil
+    return term
+
+
+class MetricRegistry:
+    """Feature and metric plugins plus the per-image feature cache ((path, feature) → value)."""
+
+    def __init__(self, cache: Optional[BoundedCache] = None):
+        self.features: Dict[str, FeatureSpec] = {}
+        self.metrics: Dict[str, MetricSpec] = {}
+        self._cache = cache if cache is not None else BoundedCache.from_env("metrics", name="metric_registry")
+        self.register_feature(FeatureSpec("path", lambda path, deps: path, 0.0))
+
+    def register_feature(self, spec: FeatureSpec) -> FeatureSpec:
+        missing = [d for d in spec.deps if d not in self.features]
+        if missing:
+            raise ValueError(f"Feature '{spec.name}' depends on unknown features: {', '.join(missing)}")
+        self.features[spec.name] = spec
+        return spec
+
+    def register_metric(self, spec: MetricSpec) -> MetricSpec:
+        missing = [f for f in spec.features if f not in self.features]
+        if missing:
+            raise ValueError(f"Metric '{spec.name}' needs unknown features: {', '.join(missing)}")
+        self.metrics[spec.name] = spec
+        return spec
+
+    # ── feature cache ─────────────────────────────────────────────────────────
+    def has(self, path: str, name: str) -> bool:
+        return (path, name) in self._cache
+
+    def feature(self, path: str, name: str) -> Any:
+        value = self._cache.get((path, name), _MISSING)
+        if value is not _MISSING:
+            return value
+        spec = self.features[name]
+        value = spec.compute(path, {d: self.feature(path, d) for d in spec.deps})
+        self._cache[(path, name)] = value
+        return value
+
+    def missing_cost(self, path: str, name: str, seen: Optional[set] = None) -> float:
+        """Cost of computing `name` for `path` given what is already cached."""
+        seen = set() if seen is None else seen
+        if name in seen or self.has(path, name):
+            return 0.0
+        seen.add(name)
+        spec = self.features[name]
+        return spec.cost + sum(self.missing_cost(path, d, seen) for d in spec.deps)
+
+    def prefetch(self, paths: Sequence[str], names: Iterable[str], max_workers: int = 8) -> None:
+        """Compute features for many images in parallel (e.g. the ones every pair needs)."""
+        names = list(names)
+
+        def _one(p):
+            for n in names:
+                self.feature(p, n)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(_one, paths))
+
+    def evict(self, path: str) -> None:
+        self._cache.release_where(lambda key: key[0] == path)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+# ─── decision policy ──────────────────────────────────────────────────────────
+# Values are True / False / None (unknown).  Truth is tested by value, not
+# identity, so numpy booleans from the metric functions count as decided.
+def _and3(*vals: Optional[bool]) -> Optional[bool]:
+    if any(v is not None and not v for v in vals):
+        return False
+    return True if all(v is not None and v for v in vals) else None
+
+
+def _or3(*vals: Optional[bool]) -> Optional[bool]:
+    if any(v is not None and v for v in vals):
+        return True
+    return False if all(v is not None and not v for v in vals) else None
+
+
+def _ge(known: Dict[str, float], name: str, bound: float) -> Optional[bool]:
+    return None if name not in known else bool(known[name] >= bound)
+
+
+@dataclass
+class DecisionPolicy:
+    """_decide_pair's rule; `override_min` lists the match-count metrics that can override."""
+    weights: Dict[str, float]
+    threshold: float
+    mtb_floor: float
+    ceilings: Dict[str, float]                        # {"pdq": PDQ_HD_CEIL, "phash": …}
+    override_min: Dict[str, float]                    # {"sift": SIFT_MIN_MATCHES, "asift": …}
+    override_mult: float = 1.5
+    override_clip: float = 85.0
+    gate_metric: str = "pdq"
+
+    @classmethod
+    def from_engine(cls, engine: Any, aerial: bool = False) -> "DecisionPolicy":
+        p = "AERIAL_" if aerial else ""
+        weights = {k[len(p) + len("WEIGHT_"):].lower(): float(v) for k, v in vars(engine).items()
+                   if k.startswith(f"{p}WEIGHT_") and isinstance(v, (int, float))}
+        ceilings = {"pdq": getattr(engine, f"{p}PDQ_HD_CEIL")}
+        if hasattr(engine, f"{p}PHASH_HD_CEIL"):
+            ceilings["phash"] = getattr(engine, f"{p}PHASH_HD_CEIL")
+        override_min = {"sift": getattr(engine, f"{p}SIFT_MIN_MATCHES")}
+        if hasattr(engine, f"{p}ASIFT_MIN_MATCHES"):
+            override_min["asift"] = getattr(engine, f"{p}ASIFT_MIN_MATCHES")
+        return cls(weights=weights,
+                   threshold=getattr(engine, f"{p}COMPOSITE_DUP_THRESHOLD"),
+                   mtb_floor=getattr(engine, f"{p}MTB_HARD_FLOOR"),
+                   ceilings=ceilings, override_min=override_min,
+                   override_mult=getattr(engine, "SIFT_OVERRIDE_MULT", 1.5),
+                   override_clip=getattr(engine, "SIFT_OVERRIDE_CLIP", 85.0))
+
+    def score_bounds(self, known: Dict[str, float], registry: MetricRegistry) -> Tuple[float, float]:
+        lo = hi = 0.0
+        for name, w in self.weights.items():
+            if w == 0.0:
+                continue
+            if name in known:
+                t = w * registry.metrics[name].term(known[name], self)
+                lo, hi = lo + t, hi + t
+            else:
+                a, b = (w * r for r in registry.metrics[name].term_range)
+                lo, hi = lo + min(a, b), hi + max(a, b)
+        return lo, hi
+
+    def resolve(self, known: Dict[str, float],
+                registry: MetricRegistry) -> Tuple[Optional[bool], List[str]]:
+        """(decision or None, unknown metrics that can still change it)."""
+        lo, hi = self.score_bounds(known, registry)
+        score_ok = True if lo >= self.threshold else False if hi < self.threshold else None
+
+        gate_ceil = self.ceilings[self.gate_metric]
+        gate_hd = None if self.gate_metric not in known else bool(known[self.gate_metric] < gate_ceil)
+        gates = _and3(_ge(known, "mtb", self.mtb_floor), gate_hd)
+        override = _or3(*(
+            _or3(_ge(known, m, mn * self.override_mult),
+                 _and3(_ge(known, m, mn), _ge(known, "clip", self.override_clip)))
+            for m, mn in self.override_min.items()))
+        dup = _and3(score_ok, _or3(gates, override))
+
+        need: List[str] = []
+        if dup is None:
+            if score_ok is None:
+                need += [m for m, w in self.weights.items() if w != 0.0 and m not in known]
+            if gates is None and override is not True:
+                need += [m for m in ("mtb", self.gate_metric) if m not in known]
+            if override is None and gates is not True:
+                need += [m for m in (*self.override_min, "clip") if m not in known]
+        elif dup:
+            # the engines skip unusable comparisons before deciding anything
+            need = [m for m, s in registry.metrics.items()
+                    if s.unusable is not None and m in self.relevant() and m not in known]
+            if need:
+                dup = None
+        return dup, list(dict.fromkeys(need))
+
+    def relevant(self) -> set:
+        """Every metric this policy reads."""
+        return ({m for m, w in self.weights.items() if w != 0.0} | {"mtb", self.gate_metric, "clip"}
+                | set(self.override_min))
+
+
+# ─── lazy evaluation ──────────────────────────────────────────────────────────
+@dataclass
+class PairEvaluation:
+    dup: bool
+    skipped: bool                                 # unusable comparison (hd == 999)
+    metrics: Dict[str, float]
+    computed: List[str]                           # metric names, in evaluation order
+    score_bounds: Tuple[float, float]
+    score: Optional[float] = None                 # exact once every weighted metric is known
+    cost: float = 0.0
+
+
+@dataclass
+class EvaluatorStats:
+    pairs: int = 0
+    computed: Dict[str, int] = field(default_factory=dict)
+    cost: float = 0.0
+
+    def summary(self) -> str:
+        per = ", ".join(f"{k}={v}" for k, v in sorted(self.computed.items(), key=lambda kv: -kv[1]))
+        return f"{self.pairs} pairs, est. cost {self.cost:.0f} ({per or 'nothing computed'})"
+
+
+class LazyPairEvaluator:
+    """Computes only the metrics that can still change a pair's decision, cheapest first."""
+
+    def __init__(self, registry: MetricRegistry):
+        self.registry = registry
+        self.stats = EvaluatorStats()
+        self._lock = threading.Lock()
+
+    def _effective_cost(self, name: str, path_a: str, path_b: str) -> float:
+        spec = self.registry.metrics[name]
+        return spec.cost + sum(self.registry.missing_cost(p, f) for p in (path_a, path_b)
+                               for f in spec.features)
+
+    def metric(self, name: str, path_a: str, path_b: str) -> float:
+        spec = self.registry.metrics[name]
+        fa = {f: self.registry.feature(path_a, f) for f in spec.features}
+        fb = {f: self.registry.feature(path_b, f) for f in spec.features}
+        return spec.pair(fa, fb)
+
+    def evaluate(self, path_a: str, path_b: str, policy: DecisionPolicy,
+                 known: Optional[Dict[str, float]] = None) -> PairEvaluation:
+        known = dict(known or {})
+        computed: List[str] = []
+        cost = 0.0
+        skipped = False
+        missing = policy.relevant() - set(self.registry.metrics)
+        if missing:
+            raise KeyError(f"Policy uses unregistered metrics: {', '.join(sorted(missing))}")
+        while True:
+            dup, need = policy.resolve(known, self.registry)
+            if dup is not None:
+                break
+            if not need:
+                raise RuntimeError("Policy left the decision open with nothing left to compute")
+            name = min(need, key=lambda m: self._effective_cost(m, path_a, path_b))
+            cost += self._effective_cost(name, path_a, path_b)
+            known[name] = self.metric(name, path_a, path_b)
+            computed.append(name)
+            unusable = self.registry.metrics[name].unusable
+            if unusable is not None and unusable(known[name]):
+                dup, skipped = False, True
+                break
+
+        lo, hi = policy.score_bounds(known, self.registry)
+        with self._lock:
+            self.stats.pairs += 1
+            self.stats.cost += cost
+            for name in computed:
+                self.stats.computed[name] = self.stats.computed.get(name, 0) + 1
+        return PairEvaluation(dup=bool(dup), skipped=skipped, metrics=known, computed=computed,
+                              score_bounds=(lo, hi), score=lo if lo == hi else None, cost=cost)
+
+
+# ─── built-in metrics (bound to an engine module's helpers and sizes) ─────────
+def build_registry(engine: Any = None, plugins: Sequence[str] = ()) -> MetricRegistry:
+    """
+    Registry with the metrics every engine shares (mtb, edge, ssim, pdq, clip,
+    sift), computed with `engine`'s helpers and constants, plus named plugins.
+    """
+    if engine is None:
+        engine = importlib.import_module("deduplication")
+    from fast_ssim import ssim_from_stats, ssim_stats
+
+    reg = MetricRegistry()
+
+    def _gray_eq(path, d):
+        return engine._apply_clahe(d["gray"]) if engine.USE_CLAHE else d["gray"]
+
+    reg.register_feature(FeatureSpec("gray", lambda p, d: engine._load_gray(p), 5.0))
+    reg.register_feature(FeatureSpec("gray_eq", _gray_eq, 2.0, ("gray",)))
+    reg.register_feature(FeatureSpec(
+        "mtb", lambda p, d: engine._compute_mtb(engine._resize_to_exact_size(d["gray_eq"], engine.MTB_SIZE)),
+        2.0, ("gray_eq",)))
+    reg.register_feature(FeatureSpec(
+        "edges", lambda p, d: engine._compute_edges(engine._resize_to_exact_size(d["gray_eq"], engine.EDGE_SIZE)),
+        3.0, ("gray_eq",)))
+    reg.register_feature(FeatureSpec(
+        "ssim_stats", lambda p, d: ssim_stats(engine._resize_keep_aspect(d["gray_eq"], engine.SSIM_SIZE)),
+        2.0, ("gray_eq",)))
+    reg.register_feature(FeatureSpec("pdq", lambda p, d: engine._pdq_bits(p), 15.0))
+    reg.register_feature(FeatureSpec("clip", lambda p, d: engine._safe_clip_embed(p), 60.0))
+    reg.register_feature(FeatureSpec("sift_desc", lambda p, d: _sift_descriptors(d["gray"]), 150.0, ("gray",)))
+
+    reg.register_metric(MetricSpec("mtb", ("mtb",), lambda a, b: engine.overlap_percent(a["mtb"], b["mtb"]),
+                                   0.2, percent_term))
+    reg.register_metric(MetricSpec("edge", ("edges",), lambda a, b: engine.overlap_percent(a["edges"], b["edges"]),
+                                   0.2, percent_term))
+    reg.register_metric(MetricSpec("ssim", ("ssim_stats",),
+                                   lambda a, b: 100.0 * ssim_from_stats(a["ssim_stats"], b["ssim_stats"]),
+                                   0.5, percent_term, (-1.0, 1.0)))
+    reg.register_metric(MetricSpec("pdq", ("pdq",), lambda a, b: engine._pdq_hd(a["pdq"], b["pdq"]),
+                                   0.01, hamming_term("pdq"), unusable=lambda v: v == UNUSABLE_HD))
+    reg.register_metric(MetricSpec("clip", ("clip",), lambda a, b: 100.0 * engine._cosine(a["clip"], b["clip"]),
+                                   0.01, percent_term, (-1.0, 1.0)))
+    reg.register_metric(MetricSpec("sift", ("sift_desc",), lambda a, b: _sift_match_count(a["sift_desc"], b["sift_desc"]),
+                                   20.0, count_term))
+    for name in plugins:
+        PLUGINS[name](reg, engine)
+    return reg
+
+
+def _sift_descriptors(gray: np.ndarray) -> Optional[np.ndarray]:
+    import cv2
+
+    _, des = cv2.SIFT_create().detectAndCompute(gray, None)
+    return des
+
+
+def _sift_match_count(des1: Optional[np.ndarray], des2: Optional[np.ndarray]) -> int:
+    """Lowe-ratio FLANN matches, as engine._compute_sift_matches (descriptors cached per image)."""
+    import cv2
+
+    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+        return 0
+    try:
+        flann = cv2.FlannBasedMatcher(dict(algorithm=1, trees=5), dict(checks=50))
+        matches = flann.knnMatch(des1, des2, k=2)
+    except Exception as e:
+        logger.debug(f"SIFT matching failed: {e}")
+        return 0
+    return sum(1 for mp in matches if len(mp) == 2 and mp[0].distance < 0.7 * mp[1].distance)
+
+
+# ─── plugins ──────────────────────────────────────────────────────────────────
+def _register_phash(reg: MetricRegistry, engine: Any) -> None:
+    from multihash import fingerprint_path, hamming
+
+    def _phash_hd(a, b):
+        ha, hb = a["hashes"]["phash"], b["hashes"]["phash"]
+        return UNUSABLE_HD if ha is None or hb is None else hamming(ha, hb)
+
+    reg.register_feature(FeatureSpec("hashes", lambda p, d: fingerprint_path(p), 10.0))
+    reg.register_metric(MetricSpec("phash", ("hashes",), _phash_hd, 0.01, hamming_term("phash")))
+
+
+def _register_asift(reg: MetricRegistry, engine: Any) -> None:
+    asift_engine = engine if hasattr(engine, "_compute_asift_matches") else \
+        importlib.import_module("deduplication_asift")
+    reg.register_metric(MetricSpec(
+        "asift", ("path",),
+        lambda a, b: asift_engine._compute_asift_matches(a["path"], b["path"], asift_engine.ASIFT_MIN_MATCHES),
+        2000.0, count_term))
+
+
+PLUGINS: Dict[str, Callable[[MetricRegistry, Any], None]] = {
+    "phash": _register_phash,
+    "asift": _register_asift,
+}
+
+
+# ─── greedy dedup on top of the lazy evaluator ────────────────────────────────
+def dedupe_groups(groups: List[List[str]], engine: Any = None,
+                  metadata_dict: Optional[Dict[str, Dict[str, Any]]] = None,
+                  full_scan: bool = False, drift: bool = False,
+                  registry: Optional[MetricRegistry] = None,
+                  evaluator: Optional[LazyPairEvaluator] = None) -> List[List[str]]:
+    """
+    remove_near_duplicates' schedule (adjacent or all pairs, drop the earlier
+    stack; `drift` compares against the last kept stack as dedup_fixed_drift
+    does) with every pair decided by the lazy evaluator.
+    """
+    if engine is None:
+        engine = importlib.import_module("deduplication")
+    if len(groups) < 2:
+        return groups
+    evaluator = evaluator or LazyPairEvaluator(registry or build_registry(engine, _engine_plugins(engine)))
+    metadata_dict = metadata_dict or {}
+    policies = {False: DecisionPolicy.from_engine(engine), True: DecisionPolicy.from_engine(engine, aerial=True)}
+    mids = [g[len(g) // 2] for g in groups]
+    aerial = [engine._is_aerial(p, metadata_dict) for p in mids]
+
+    # every comparison starts with the cheapest gate metrics
+    evaluator.registry.prefetch(list(dict.fromkeys(mids)), ("pdq", "mtb"),
+                                max_workers=getattr(engine, "MAX_WORKERS", 8))
+    keep = [True] * len(groups)
+
+    def _decide(i: int, j: int) -> PairEvaluation:
+        r = evaluator.evaluate(mids[i], mids[j], policies[aerial[i] or aerial[j]])
+        logger.debug("  • %s ↔ %s : %s (computed %s)", Path(mids[i]).stem, Path(mids[j]).stem,
+                     "DUP" if r.dup else "skip" if r.skipped else "keep", ", ".join(r.computed))
+        return r
+
+    if drift and not full_scan:
+        last = 0
+        for i in range(1, len(groups)):
+            r = _decide(last, i)
+            if r.dup:
+                keep[i] = False
+            else:
+                last = i
+    else:
+        pairs = ([(i, j) for i in range(len(groups) - 1) for j in range(i + 1, len(groups))]
+                 if full_scan else [(i, i + 1) for i in range(len(groups) - 1)])
+        for i, j in pairs:
+            if not keep[i] or not keep[j] or mids[i] == mids[j]:
+                continue
+            if _decide(i, j).dup:
+                keep[i] = False
+
+    logger.info("[RESULT] stacks: %d → %d  (%s)", len(groups), sum(keep), evaluator.stats.summary())
+    return [g for g, k in zip(groups, keep) if k]
+
+
+def _engine_plugins(engine: Any) -> Tuple[str, ...]:
+    """Plugins an engine's weights call for (e.g. WEIGHT_PHASH → "phash")."""
+    return tuple(name for name in PLUGINS if hasattr(engine, f"WEIGHT_{name.upper()}"))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Lazy, cost-ordered dedup over registered metric plugins")
+    parser.add_argument("folder", type=str, help="Folder of images (uses processed/ if present)")
+    parser.add_argument("--engine", type=str, default="deduplication",
+                        help="Engine module whose weights/thresholds/helpers to use")
+    parser.add_argument("--plugins", nargs="*", default=None, choices=sorted(PLUGINS),
+                        help="Extra metric plugins (default: whatever the engine weights)")
+    parser.add_argument("--full-scan", action="store_true")
+    parser.add_argument("--drift", action="store_true", help="Compare against the last kept stack")
+    args = parser.parse_args()
+
+    eng = importlib.import_module(args.engine)
+    folder = Path(args.folder)
+    src = folder / "processed" if (folder / "processed").exists() else folder
+    groups = [[str(p)] for p in sorted(src.glob("*.jpg"))]
+    plugins = tuple(args.plugins) if args.plugins is not None else _engine_plugins(eng)
+    ev = LazyPairEvaluator(build_registry(eng, plugins))
+    t0 = time.perf_counter()
+    kept = dedupe_groups(groups, eng, full_scan=args.full_scan, drift=args.drift, evaluator=ev)
+    print(f"{len(groups)} → {len(kept)} stacks in {time.perf_counter() - t0:.1f} s")
+    print(ev.stats.summary())
+    for g in groups:
+        if g not in kept:
+            print(f"  dropped {Path(g[0]).name}")
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+micro_benchmarks.py – per-kernel timings and allocations of the metric hot paths
+
+benchmark_suite.py measures whole listings, which is too coarse to tell
+whether a change to one kernel paid off.  This harness times each kernel the
+engines call per image or per pair on inputs of realistic size, in the forms
+the engines use it:
+
+    kernel                   input                          forms
+    overlap_percent          640² MTB / edge bitmaps        single, loop, vectorised
+    _pdq_hd                  256-bit PDQ hashes             single, loop, vectorised (packed popcount)
+    _compute_ssim            320 px thumbnails              single, loop, precomputed (ssim_from_stats)
+    _cosine                  512-d CLIP embeddings          single, loop, vectorised
+    _compute_sift_matches    1600×1067 JPEG files           single, loop, precomputed (descriptors once)
+    _compute_asift_matches   800×533 JPEG files             single, loop
+    _resize_to_exact_size    24 MP grayscale decode → 640²  single, loop
+    _apply_clahe             24 MP grayscale decode         single, loop
+    _compute_edges           640² grayscale                 single, loop
+
+    single       one call on one pair / image
+    loop         the same kernel over `batch` distinct inputs (cache-cold data)
+    vectorised   one numpy call over the whole batch (what a batched port of
+                 the kernel would cost; multihash / matrix product)
+    precomputed  per-image work hoisted out, per-pair cost only (fast_ssim
+                 stats, feature_shards SIFT descriptors)
+
+Per kernel and form: ops/s and µs/op (best and median of `repeats` runs, each
+at least `min_time` long), then one extra call under tracemalloc for the peak
+transient bytes allocated per op and the blocks / bytes still held afterwards.
+tracemalloc sees numpy and Python allocations (cv2 results are numpy arrays);
+OpenCV's internal C++ scratch buffers are not visible to it.
+
+Inputs are procedural scenes (benchmark_suite._procedural_scene) from a fixed
+seed, so runs are comparable.  --quick shrinks the large inputs (6 MP, 800 px
+SIFT) for CI.  Results can be stored and compared against a baseline like
+benchmark_suite.py; an ops/s drop beyond tolerance exits 1.
+
+Usage:
+    python micro_benchmarks.py                                   # all kernels, dedup_fixed_drift
+    python micro_benchmarks.py --kernels _pdq_hd _cosine --engine deduplication
+    python micro_benchmarks.py --quick --out micro.json --baseline micro_baseline.json
+    python micro_benchmarks.py --update-baseline --baseline micro_baseline.json
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install opencv-python numpy
+"""
+
+from __future__ import annotations
+
+import importlib
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from benchmark_suite import _procedural_scene, host_info
+from fast_ssim import ssim_from_stats, ssim_stats
+from feature_shards import sift_descriptors, sift_match_count
+from multihash import pack_bits, popcount
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = "dedup_fixed_drift"
+ASIFT_ENGINE = "deduplication_asift"
+DEFAULT_MIN_TIME = 0.2          # seconds per timed run
+DEFAULT_REPEATS = 5
+SPEED_TOLERANCE = 0.15
+
+# input sizes: (realistic, quick)
+SIZES = {
+    "bitmap": (640, 640),
+    "decode": ((6000, 4000), (3000, 2000)),
+    "sift": ((1600, 1067), (800, 533)),
+    "asift": ((800, 533), (400, 267)),
+}
+CLIP_DIM = 512
+PDQ_BITS = 256
+# pairs / images per loop, vectorised or precomputed call
+BATCH = {"overlap_percent": 64, "_pdq_hd": 1024, "_compute_ssim": 32, "_cosine": 1024,
+         "_compute_sift_matches": 4, "_compute_asift_matches": 2, "_resize_to_exact_size": 4,
+         "_apply_clahe": 4, "_compute_edges": 16}
+
+
+@dataclass
+class KernelResult:
+    kernel: str
+    form: str
+    input: str
+    ops_per_call: int
+    calls: int
+    best_us_per_op: float
+    median_us_per_op: float
+    ops_per_s: float
+    peak_alloc_bytes_per_op: float
+    retained_blocks: int
+    retained_bytes: int
+
+
+# ─── measurement ──────────────────────────────────────────────────────────────
+def _time_calls(fn: Callable[[], Any], number: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return time.perf_counter() - t0
+
+
+def measure(kernel: str, form: str, label: str, fn: Callable[[], Any], ops_per_call: int = 1,
+            min_time: float = DEFAULT_MIN_TIME, repeats: int = DEFAULT_REPEATS) -> KernelResult:
+    """Time `fn` (one call = `ops_per_call` ops) and trace one call's allocations."""
+    fn()                                                   # warm-up (lazy imports, caches, JIT'd paths)
+    number = 1
+    while True:
+        t = _time_calls(fn, number)
+        if t >= min_time or number >= 1 << 20:
+            break
+        number = max(number * 2, int(number * min_time / max(t, 1e-9) * 1.1))
+    runs = [t] + [_time_calls(fn, number) for _ in range(repeats - 1)]
+    per_op = [r / (number * ops_per_call) for r in runs]
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        del result
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    best = min(per_op)
+    return KernelResult(
+        kernel=kernel, form=form, input=label, ops_per_call=ops_per_call, calls=number * repeats,
+        best_us_per_op=best * 1e6, median_us_per_op=statistics.median(per_op) * 1e6,
+        ops_per_s=1.0 / best if best else 0.0,
+        peak_alloc_bytes_per_op=(peak - base) / ops_per_call,
+        retained_blocks=sum(d.count_diff for d in diff), retained_bytes=current - base)
+
+
+# ─── inputs ───────────────────────────────────────────────────────────────────
+class Inputs:
+    """Deterministic inputs; images and files are built on first use."""
+
+    def __init__(self, quick: bool = False, seed: int = 0):
+        self.quick = quick
+        self.rng = np.random.default_rng(seed)
+        self._tmp = tempfile.TemporaryDirectory(prefix="micro_bench_")
+        self._files: Dict[Tuple[str, int], List[str]] = {}
+
+    def size(self, kind: str) -> Tuple[int, int]:
+        s = SIZES[kind]
+        return s if isinstance(s[0], int) else s[1 if self.quick else 0]
+
+    def gray(self, kind: str, n: int) -> List[np.ndarray]:
+        """n distinct grayscale scenes."""
+        w, h = self.size(kind)
+        return [cv2.cvtColor(_procedural_scene(self.rng, (w, h)), cv2.COLOR_BGR2GRAY) for _ in range(n)]
+
+    def pairs(self, kind: str, n: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(scene, slightly brighter + shifted copy) pairs, so matches are non-trivial."""
+        out = []
+        for g in self.gray(kind, n):
+            M = np.float32([[1, 0, 3], [0, 1, 2]])
+            twin = cv2.warpAffine(cv2.convertScaleAbs(g, alpha=1.1, beta=5), M, g.shape[::-1],
+                                  borderMode=cv2.BORDER_REFLECT)
+            out.append((g, twin))
+        return out
+
+    def files(self, kind: str, n: int) -> List[Tuple[str, str]]:
+        """n JPEG file pairs on disk (for the path-based SIFT kernels)."""
+        key = (kind, n)
+        if key not in self._files:
+            paths = []
+            for i, (a, b) in enumerate(self.pairs(kind, n)):
+                for tag, img in (("a", a), ("b", b)):
+                    p = str(Path(self._tmp.name) / f"{kind}_{n}_{i}{tag}.jpg")
+                    cv2.imwrite(p, img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+                    paths.append(p)
+            self._files[key] = paths
+        paths = self._files[key]
+        return list(zip(paths[0::2], paths[1::2]))
+
+    def close(self) -> None:
+        self._tmp.cleanup()
+
+
+def _label(size: Tuple[int, int], what: str) -> str:
+    w, h = size
+    mp = w * h / 1e6
+    return f"{w}×{h} {what}" + (f" ({mp:.0f} MP)" if mp >= 1 else "")
+
+
+# ─── kernels ──────────────────────────────────────────────────────────────────
+def _bench_overlap(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    pairs = [(e._compute_mtb(x), e._compute_mtb(y)) for x, y in inp.pairs("bitmap", b)]
+    A, B = np.stack([p[0] for p in pairs]), np.stack([p[1] for p in pairs])
+    label = _label(inp.size("bitmap"), "bitmap")
+
+    def vectorised() -> np.ndarray:
+        inter = np.logical_and(A, B).sum((1, 2))
+        return 100.0 * inter / np.maximum(np.minimum(A.sum((1, 2)), B.sum((1, 2))), 1)
+
+    return [measure("overlap_percent", "single", label, lambda: e.overlap_percent(*pairs[0]), **kw),
+            measure("overlap_percent", "loop", label, lambda: [e.overlap_percent(a, c) for a, c in pairs], b, **kw),
+            measure("overlap_percent", "vectorised", label, vectorised, b, **kw)]
+
+
+def _bench_pdq(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    A = inp.rng.integers(0, 2, (b, PDQ_BITS), dtype=np.uint8)
+    flips = inp.rng.random((b, PDQ_BITS)) < 0.1
+    B = (A ^ flips).astype(np.uint8)
+    PA, PB = pack_bits(A), pack_bits(B)                    # packed once, as shards / the index store them
+    label = f"{PDQ_BITS}-bit hash"
+    return [measure("_pdq_hd", "single", label, lambda: e._pdq_hd(A[0], B[0]), **kw),
+            measure("_pdq_hd", "loop", label, lambda: [e._pdq_hd(A[i], B[i]) for i in range(b)], b, **kw),
+            measure("_pdq_hd", "vectorised", label + " (packed)", lambda: popcount(PA ^ PB), b, **kw)]
+
+
+def _bench_ssim(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    pairs = [(e._resize_keep_aspect(x, 320), e._resize_keep_aspect(y, 320)) for x, y in inp.pairs("sift", b)]
+    stats = [(ssim_stats(x), ssim_stats(y)) for x, y in pairs]
+    label = f"{pairs[0][0].shape[1]}×{pairs[0][0].shape[0]} thumbnail"
+    return [measure("_compute_ssim", "single", label, lambda: e._compute_ssim(*pairs[0]), **kw),
+            measure("_compute_ssim", "loop", label, lambda: [e._compute_ssim(x, y) for x, y in pairs], b, **kw),
+            measure("_compute_ssim", "precomputed", label + " (stats)",
+                    lambda: [ssim_from_stats(x, y) for x, y in stats], b, **kw)]
+
+
+def _bench_cosine(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    A = inp.rng.normal(size=(b, CLIP_DIM)).astype(np.float32)
+    A /= np.linalg.norm(A, axis=1, keepdims=True)
+    B = A + inp.rng.normal(scale=0.1, size=A.shape).astype(np.float32)
+    B /= np.linalg.norm(B, axis=1, keepdims=True)
+    label = f"{CLIP_DIM}-d float32"
+    return [measure("_cosine", "single", label, lambda: e._cosine(A[0], B[0]), **kw),
+            measure("_cosine", "loop", label, lambda: [e._cosine(A[i], B[i]) for i in range(b)], b, **kw),
+            measure("_cosine", "vectorised", label, lambda: np.einsum("ij,ij->i", A, B), b, **kw)]
+
+
+def _bench_sift(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    files = inp.files("sift", b)
+    des = [(sift_descriptors(cv2.imread(x, cv2.IMREAD_GRAYSCALE)),
+            sift_descriptors(cv2.imread(y, cv2.IMREAD_GRAYSCALE))) for x, y in files]
+    label = _label(inp.size("sift"), "JPEG")
+    min_m = getattr(e, "SIFT_MIN_MATCHES", 50)
+    return [measure("_compute_sift_matches", "single", label,
+                    lambda: e._compute_sift_matches(*files[0], min_m), **kw),
+            measure("_compute_sift_matches", "loop", label,
+                    lambda: [e._compute_sift_matches(x, y, min_m) for x, y in files], b, **kw),
+            measure("_compute_sift_matches", "precomputed", label + " (descriptors)",
+                    lambda: [sift_match_count(x, y) for x, y in des], b, **kw)]
+
+
+def _bench_asift(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    asift = importlib.import_module(ASIFT_ENGINE)
+    files = inp.files("asift", b)
+    label = _label(inp.size("asift"), "JPEG")
+    return [measure("_compute_asift_matches", "single", label,
+                    lambda: asift._compute_asift_matches(*files[0]), **kw),
+            measure("_compute_asift_matches", "loop", label,
+                    lambda: [asift._compute_asift_matches(x, y) for x, y in files], b, **kw)]
+
+
+def _bench_resize(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    grays = inp.gray("decode", b)
+    label = _label(inp.size("decode"), "gray") + " → 640²"
+    return [measure("_resize_to_exact_size", "single", label, lambda: e._resize_to_exact_size(grays[0], 640), **kw),
+            measure("_resize_to_exact_size", "loop", label,
+                    lambda: [e._resize_to_exact_size(g, 640) for g in grays], b, **kw)]
+
+
+def _bench_clahe(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    grays = inp.gray("decode", b)
+    label = _label(inp.size("decode"), "gray")
+    return [measure("_apply_clahe", "single", label, lambda: e._apply_clahe(grays[0]), **kw),
+            measure("_apply_clahe", "loop", label, lambda: [e._apply_clahe(g) for g in grays], b, **kw)]
+
+
+def _bench_edges(e: Any, inp: Inputs, b: int, **kw: Any) -> List[KernelResult]:
+    grays = inp.gray("bitmap", b)
+    label = _label(inp.size("bitmap"), "gray")
+    return [measure("_compute_edges", "single", label, lambda: e._compute_edges(grays[0]), **kw),
+            measure("_compute_edges", "loop", label, lambda: [e._compute_edges(g) for g in grays], b, **kw)]
+
+
+KERNELS: Dict[str, Callable[..., List[KernelResult]]] = {
+    "overlap_percent": _bench_overlap,
+    "_pdq_hd": _bench_pdq,
+    "_compute_ssim": _bench_ssim,
+    "_cosine": _bench_cosine,
+    "_compute_sift_matches": _bench_sift,
+    "_compute_asift_matches": _bench_asift,
+    "_resize_to_exact_size": _bench_resize,
+    "_apply_clahe": _bench_clahe,
+    "_compute_edges": _bench_edges,
+}
+
+
+def run_kernels(kernels: Sequence[str], engine: str = DEFAULT_ENGINE, quick: bool = False,
+                min_time: float = DEFAULT_MIN_TIME, repeats: int = DEFAULT_REPEATS,
+                batch_scale: float = 1.0) -> Dict[str, Any]:
+    module = importlib.import_module(engine)
+    inp = Inputs(quick=quick)
+    results: List[KernelResult] = []
+    try:
+        for name in kernels:
+            if name != "_compute_asift_matches" and not hasattr(module, name):
+                logger.warning("%s has no %s; skipped", engine, name)
+                continue
+            b = max(1, int(BATCH[name] * batch_scale))
+            logger.info("Benchmarking %s (batch %d)…", name, b)
+            results += KERNELS[name](module, inp, b, min_time=min_time, repeats=repeats)
+    finally:
+        inp.close()
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": host_info(), "engine": engine,
+            "quick": quick, "results": [asdict(r) for r in results]}
+
+
+# ─── report / baseline ────────────────────────────────────────────────────────
+def format_results(report: Dict[str, Any]) -> str:
+    lines = [f"{'kernel':<24}{'form':<12}{'input':<34}{'ops/s':>12}{'best µs':>11}{'median µs':>11}"
+             f"{'peak B/op':>12}{'kept blk':>9}"]
+    for r in report["results"]:
+        lines.append(f"{r['kernel']:<24}{r['form']:<12}{r['input']:<34}{r['ops_per_s']:>12.1f}"
+                     f"{r['best_us_per_op']:>11.2f}{r['median_us_per_op']:>11.2f}"
+                     f"{r['peak_alloc_bytes_per_op']:>12.0f}{r['retained_blocks']:>9}")
+    return "\n".join(lines)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            tol: float = SPEED_TOLERANCE) -> Tuple[List[str], List[str]]:
+    """(regressions, notes): ops/s more than `tol` below the baseline, per kernel and form."""
+    notes: List[str] = []
+    if current.get("quick") != baseline.get("quick") or current.get("engine") != baseline.get("engine"):
+        notes.append("baseline used a different engine or --quick setting; comparing anyway")
+    if current.get("host", {}).get("node") != baseline.get("host", {}).get("node"):
+        notes.append(f"baseline recorded on {baseline.get('host', {}).get('node', '?')}: speed comparisons are indicative")
+    base = {(r["kernel"], r["form"]): r for r in baseline.get("results", [])}
+    regressions: List[str] = []
+    for r in current["results"]:
+        b = base.get((r["kernel"], r["form"]))
+        if b is None:
+            notes.append(f"{r['kernel']} {r['form']}: no baseline")
+        elif b["ops_per_s"] and r["ops_per_s"] < b["ops_per_s"] * (1.0 - tol):
+            regressions.append(f"{r['kernel']} {r['form']}: {r['ops_per_s']:.1f} ops/s < baseline "
+                               f"{b['ops_per_s']:.1f} (-{100 * (1 - r['ops_per_s'] / b['ops_per_s']):.0f}%)")
+    return regressions, notes
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the dedup metric kernels")
+    parser.add_argument("--kernels", nargs="+", choices=list(KERNELS), default=list(KERNELS))
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, help="Engine module the kernels come from")
+    parser.add_argument("--quick", action="store_true", help="Smaller large inputs (6 MP decodes, 800 px SIFT)")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME, help="Seconds per timed run")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--batch-scale", type=float, default=1.0, help="Multiply every batch size")
+    parser.add_argument("--out", default=None, help="Write results JSON")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare with")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as --baseline")
+    parser.add_argument("--tolerance", type=float, default=SPEED_TOLERANCE)
+    args = parser.parse_args()
+
+    report = run_kernels(args.kernels, args.engine, args.quick, args.min_time, args.repeats, args.batch_scale)
+    print(format_results(report))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Results written to {args.out}")
+    if not args.baseline:
+        return
+    if args.update_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline updated: {args.baseline}")
+        return
+    if not Path(args.baseline).exists():
+        print(f"No baseline at {args.baseline}; record one with --update-baseline")
+        return
+    regressions, notes = compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")),
+                                 args.tolerance)
+    for n in notes:
+        print(f"note: {n}")
+    if regressions:
+        print(f"\n{len(regressions)} REGRESSION(S) against {args.baseline}:")
+        for r in regressions:
+            print(f"  ✗ {r}")
+        sys.exit(1)
+    print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+multihash.py – aHash / dHash / pHash / wHash / PDQ from a single decode
+
+`dedupwphash.py` opened every image three times for hashing (cv2 for the
+bitmaps, PIL for PDQ, PIL again inside imagehash.phash).  Here each image is
+decoded once to RGB; PDQ is computed from that array and everything else from
+one 32×32 LANCZOS grayscale buffer (the buffer imagehash.phash builds):
+
+    aHash  8×8 area average of the buffer, bit = pixel > mean
+    dHash  9×8 area resample, bit = right neighbour brighter
+    pHash  8×8 low-frequency block of the 2-D DCT-II, bit = coeff > median
+           (bit-identical to imagehash.phash(hash_size=8))
+    wHash  8×8 Haar LL band, bit = coeff > median  (imagehash.whash's rule;
+           LL at level 2 is the 4×4 block mean, and removing the global DC
+           term does not move the median split.  It is taken from the 32×32
+           buffer, so bits can differ from imagehash.whash's larger resample)
+    PDQ    pdqhash.compute on the decoded RGB array (optional dependency)
+
+Resampling and the DCT are matrix products, so a batch of N buffers stacked as
+(N, 32, 32) is hashed with a handful of einsum calls.  Every hash is stored as
+packed big-endian uint64 words (64-bit hashes → 1 word, PDQ → 4 words) and all
+distances go through one popcount kernel (np.bitwise_count when available,
+otherwise a byte lookup table).
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install numpy pillow
+    pip install pdqhash-lite            # <-- optional PDQ
+"""
+
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from lazy_imports import lazy_module
+
+pdqhash = lazy_module("pdqhash")
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+BUFFER_SIZE = 32                    # hash_size × imagehash's highfreq_factor (4)
+HASH_NAMES = ("ahash", "dhash", "phash", "whash", "pdq")
+HASH_BITS = {"ahash": 64, "dhash": 64, "phash": 64, "whash": 64, "pdq": 256}
+
+
+# ─── packing & popcount ───────────────────────────────────────────────────────
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """(..., nbits) bool/0-1 → (..., nbits // 64) uint64, MSB first."""
+    bits = np.asarray(bits, dtype=bool)
+    if bits.shape[-1] % 64:
+        raise ValueError(f"bit count must be a multiple of 64, got {bits.shape[-1]}")
+    packed = np.packbits(bits, axis=-1)
+    return np.ascontiguousarray(packed).view(">u8").astype(np.uint64)
+
+
+def unpack_bits(words: np.ndarray) -> np.ndarray:
+    """Inverse of pack_bits → (..., 64 * words) uint8 0/1."""
+    words = np.ascontiguousarray(np.asarray(words, dtype=np.uint64).astype(">u8"))
+    return np.unpackbits(words.view(np.uint8), axis=-1)
+
+
+if hasattr(np, "bitwise_count"):                          # numpy ≥ 2.0
+    def _popcount_words(x: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(x)
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+
+    def _popcount_words(x: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(x, dtype=np.uint64)
+        return _POP8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(-1, dtype=np.uint32)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits summed over the last (word) axis."""
+    return _popcount_words(np.asarray(words, dtype=np.uint64)).sum(-1, dtype=np.int64)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> int:
+    """Hamming distance between two packed hashes of equal width."""
+    return int(popcount(np.bitwise_xor(a, b)))
+
+
+def hamming_matrix(A: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """(N, w) × (M, w) packed hashes → (N, M) Hamming distances."""
+    A, B = np.asarray(A, np.uint64), np.asarray(B, np.uint64)
+    return popcount(A[:, None, :] ^ B[None, :, :])
+
+
+# ─── transforms on the 32×32 buffer ───────────────────────────────────────────
+def _area_matrix(n_out: int, n_in: int) -> np.ndarray:
+    """Row-stochastic (n_out, n_in) matrix of INTER_AREA-style coverage weights."""
+    m = np.zeros((n_out, n_in), np.float64)
+    scale = n_in / n_out
+    for i in range(n_out):
+        lo, hi = i * scale, (i + 1) * scale
+        for j in range(int(np.floor(lo)), int(np.ceil(hi))):
+            m[i, j] = min(hi, j + 1) - max(lo, j)
+    return m / m.sum(axis=1, keepdims=True)
+
+
+def _dct_matrix(n_out: int, n_in: int) -> np.ndarray:
+    """First n_out rows of the (unnormalised) DCT-II basis of length n_in."""
+    k = np.arange(n_out)[:, None]
+    n = np.arange(n_in)[None, :]
+    return 2.0 * np.cos(np.pi * k * (2 * n + 1) / (2 * n_in))
+
+
+_AREA8 = _area_matrix(HASH_SIZE, BUFFER_SIZE)
+_AREA9 = _area_matrix(HASH_SIZE + 1, BUFFER_SIZE)
+_DCT8 = _dct_matrix(HASH_SIZE, BUFFER_SIZE)
+
+
+def hash_stack(buffers: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    (N, 32, 32) grayscale buffers → {"ahash"|"dhash"|"phash"|"whash": (N, 1) uint64}.
+    """
+    X = np.asarray(buffers, np.float64)
+    if X.ndim == 2:
+        X = X[None]
+    n = X.shape[0]
+
+    small = np.einsum("ih,nhw,jw->nij", _AREA8, X, _AREA8)           # (N, 8, 8)
+    ahash = small > small.mean(axis=(1, 2), keepdims=True)
+
+    wide = np.einsum("ih,nhw,jw->nij", _AREA8, X, _AREA9)            # (N, 8, 9)
+    dhash = wide[:, :, 1:] > wide[:, :, :-1]
+
+    dct = np.einsum("ih,nhw,jw->nij", _DCT8, X, _DCT8)               # (N, 8, 8)
+    phash = dct > np.median(dct.reshape(n, -1), axis=1)[:, None, None]
+
+    # Haar LL at level log2(32/8) = 4×4 block means (same as `small`; the
+    # orthonormal scale factor does not change a median split)
+    whash = small > np.median(small.reshape(n, -1), axis=1)[:, None, None]
+
+    return {name: pack_bits(bits.reshape(n, -1))
+            for name, bits in (("ahash", ahash), ("dhash", dhash),
+                               ("phash", phash), ("whash", whash))}
+
+
+# ─── decoding ─────────────────────────────────────────────────────────────────
+def _decode(path: str):
+    """One decode → (32×32 float buffer, PDQ bits or None)."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        rgb = img.convert("RGB")
+    buf = np.asarray(rgb.convert("L").resize((BUFFER_SIZE, BUFFER_SIZE), Image.LANCZOS),
+                     np.float64)
+    pdq = None
+    if pdqhash:
+        try:
+            bits, _ = pdqhash.compute(np.asarray(rgb))
+            pdq = np.asarray(bits, np.uint8)
+        except Exception as e:
+            logger.debug(f"PDQ failed for {path}: {e}")
+    return buf, pdq
+
+
+class HashBatch:
+    """Packed hashes for a list of paths: hashes[name] is (N, words) uint64."""
+
+    def __init__(self, paths: Sequence[str], hashes: Dict[str, np.ndarray],
+                 ok: np.ndarray, pdq_ok: np.ndarray):
+        self.paths = list(paths)
+        self.hashes = hashes
+        self.ok = ok            # image decoded
+        self.pdq_ok = pdq_ok    # PDQ available for this row
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def row(self, i: int) -> Dict[str, Optional[np.ndarray]]:
+        """Hashes of image i (None where the hash could not be computed)."""
+        out: Dict[str, Optional[np.ndarray]] = {}
+        for name, arr in self.hashes.items():
+            good = self.pdq_ok[i] if name == "pdq" else self.ok[i]
+            out[name] = arr[i].copy() if good else None
+        return out
+
+    def distance_matrix(self, name: str) -> np.ndarray:
+        """All-pairs Hamming distances for one hash (-1 where unavailable)."""
+        d = hamming_matrix(self.hashes[name], self.hashes[name])
+        good = self.pdq_ok if name == "pdq" else self.ok
+        d[~good, :] = -1
+        d[:, ~good] = -1
+        return d
+
+
+def fingerprint_paths(paths: Sequence[str], max_workers: int = 8) -> HashBatch:
+    """Decode each path once (threaded) and hash the whole batch in one pass."""
+    def _safe(p):
+        try:
+            return _decode(p)
+        except Exception as e:
+            logger.debug(f"Hash decode failed for {p}: {e}")
+            return None, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        decoded = list(ex.map(_safe, paths))
+
+    n = len(paths)
+    ok = np.array([b is not None for b, _ in decoded], bool)
+    pdq_ok = np.array([q is not None for _, q in decoded], bool)
+    buffers = np.zeros((n, BUFFER_SIZE, BUFFER_SIZE), np.float64)
+    pdq_bits = np.zeros((n, HASH_BITS["pdq"]), np.uint8)
+    for i, (b, q) in enumerate(decoded):
+        if b is not None:
+            buffers[i] = b
+        if q is not None:
+            pdq_bits[i] = q
+    hashes = hash_stack(buffers) if n else {k: np.zeros((0, 1), np.uint64) for k in HASH_NAMES[:-1]}
+    hashes["pdq"] = pack_bits(pdq_bits)
+    return HashBatch(paths, hashes, ok, pdq_ok)
+
+
+def fingerprint_path(path: str) -> Dict[str, Optional[np.ndarray]]:
+    """All hashes of one image from a single decode."""
+    return fingerprint_paths([path], max_workers=1).row(0)
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Adjacent-pair Hamming distances for every hash")
+    parser.add_argument("folder", type=str, help="Folder of images (uses processed/ if present)")
+    args = parser.parse_args()
+
+    folder = Path(args.folder)
+    src = folder / "processed" if (folder / "processed").exists() else folder
+    files: List[str] = [str(p) for p in sorted(src.glob("*.jpg"))]
+    batch = fingerprint_paths(files)
+    print("| Image A | Image B | " + " | ".join(HASH_NAMES) + " |")
+    print("|" + "---|" * (len(HASH_NAMES) + 2))
+    for i in range(len(files) - 1):
+        a, b = batch.row(i), batch.row(i + 1)
+        cells = [str(hamming(a[k], b[k])) if a[k] is not None and b[k] is not None else "–"
+                 for k in HASH_NAMES]
+        print(f"| {Path(files[i]).name} | {Path(files[i + 1]).name} | " + " | ".join(cells) + " |")
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pair_metric_matrix.py – columnar pair metrics for vectorized weight sweeps
+
+Once Phase 1 features and the per-pair metrics are known, the composite
+decision of every engine is linear in the weights:
+
+    score = w · [mtb/100, ssim/100, clip/100, pdq_term, sift_term]
+    dup   = score ≥ threshold  ∧  (mtb ≥ floor ∨ override)  ∧  (hd < ceil ∨ override)
+
+`PairMetricMatrix` caches the raw metrics of P pairs as a (P × 5) array plus
+per-pair aerial flags and ground-truth labels.  `evaluate()` scores C weight
+combinations at once, (C × 5) @ (5 × P), and applies the MTB floor, PDQ
+ceiling and (optional) SIFT override as boolean masks, so sweeping the 10,626
+combinations of a 5 % grid takes milliseconds.  Matrices from several datasets
+can be concatenated and saved to .npz so a sweep never recomputes metrics.
+
+Usage:
+    m = PairMetricMatrix.from_engine(dedupe, mids, labels=[1, 0, 1])
+    res = m.evaluate(weights_to_matrix(generate_weights(steps=20)),
+                     policy_from_engine(dedupe), sift_override=False)
+    res["recall"], res["dropped"], res["decisions"]   # (C,), (C,), (C, P)
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METRIC_COLUMNS = ("mtb", "ssim", "clip", "pdq_hd", "sift")
+WEIGHT_KEYS = ("mtb", "ssim", "clip", "pdq", "sift")
+UNUSABLE_HD = 999                       # engines skip pairs with no PDQ
+
+# SIFT override defaults (deduplication.py) for policy dicts that don't carry their own
+SIFT_OVERRIDE_MULT = 1.5
+SIFT_OVERRIDE_CLIP = 85.0
+
+
+def weights_to_matrix(weights_list: Sequence[Dict[str, float]]) -> np.ndarray:
+    """List of {'mtb','ssim','clip','pdq','sift'} dicts → (C, 5) float64."""
+    return np.array([[w[k] for k in WEIGHT_KEYS] for w in weights_list], np.float64).reshape(-1, 5)
+
+
+def policy_from_engine(engine: Any, aerial: bool = False) -> Dict[str, Any]:
+    """Current weights and gates of a dedup engine module (regular or aerial)."""
+    p = "AERIAL_" if aerial else ""
+    return {
+        "weights": np.array([getattr(engine, f"{p}WEIGHT_{k.upper()}") for k in WEIGHT_KEYS], np.float64),
+        "threshold": getattr(engine, f"{p}COMPOSITE_DUP_THRESHOLD"),
+        "mtb_floor": getattr(engine, f"{p}MTB_HARD_FLOOR"),
+        "pdq_ceil": getattr(engine, f"{p}PDQ_HD_CEIL"),
+        "sift_min": getattr(engine, f"{p}SIFT_MIN_MATCHES"),
+        "sift_override_mult": getattr(engine, "SIFT_OVERRIDE_MULT", SIFT_OVERRIDE_MULT),
+        "sift_override_clip": getattr(engine, "SIFT_OVERRIDE_CLIP", SIFT_OVERRIDE_CLIP),
+    }
+
+
+class PairMetricMatrix:
+    """(P × 5) raw pair metrics with aerial flags and labels (1 dup, 0 not, -1 unknown)."""
+
+    def __init__(self, metrics: np.ndarray, aerial: Optional[np.ndarray] = None,
+                 labels: Optional[np.ndarray] = None,
+                 pairs: Optional[List[Tuple[str, str]]] = None):
+        self.metrics = np.asarray(metrics, np.float64).reshape(-1, len(METRIC_COLUMNS))
+        n = len(self.metrics)
+        self.aerial = np.zeros(n, bool) if aerial is None else np.asarray(aerial, bool)
+        self.labels = np.full(n, -1, np.int8) if labels is None else np.asarray(labels, np.int8)
+        self.pairs = list(pairs) if pairs is not None else [("", "")] * n
+        if not (len(self.aerial) == len(self.labels) == len(self.pairs) == n):
+            raise ValueError("metrics, aerial, labels and pairs must have the same length")
+
+    def __len__(self) -> int:
+        return len(self.metrics)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.metrics[:, METRIC_COLUMNS.index(name)]
+
+    # ── construction ──────────────────────────────────────────────────────────
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "PairMetricMatrix":
+        """Rows with mtb/ssim/clip/pdq_hd/sift and optional aerial/label/img_a/img_b."""
+        rows = list(rows)
+        return cls(np.array([[r[c] for c in METRIC_COLUMNS] for r in rows], np.float64),
+                   np.array([bool(r.get("aerial", False)) for r in rows], bool),
+                   np.array([r.get("label", -1) for r in rows], np.int8),
+                   [(r.get("img_a", ""), r.get("img_b", "")) for r in rows])
+
+    @classmethod
+    def from_engine(cls, engine: Any, mids: Sequence[str],
+                    pairs: Optional[Sequence[Tuple[int, int]]] = None,
+                    metadata_dict: Optional[Dict[str, Dict[str, Any]]] = None,
+                    labels: Optional[Sequence[int]] = None) -> "PairMetricMatrix":
+        """
+        Pull metrics through engine._pair_sim (features must already be in
+        engine._metric_store).  Default pairs are the adjacent ones.
+        """
+        pairs = list(pairs) if pairs is not None else [(i, i + 1) for i in range(len(mids) - 1)]
+        metadata_dict = metadata_dict or {}
+        rows, aerial = [], []
+        for i, j in pairs:
+            mtb, _edge, hd, ssim, clip, sift = engine._pair_sim(mids[i], mids[j])
+            rows.append((mtb, ssim, clip, hd, sift))
+            aerial.append(engine._is_aerial(mids[i], metadata_dict) or
+                          engine._is_aerial(mids[j], metadata_dict))
+        return cls(np.array(rows, np.float64), np.array(aerial, bool),
+                   None if labels is None else np.asarray(labels, np.int8),
+                   [(mids[i], mids[j]) for i, j in pairs])
+
+    @classmethod
+    def concat(cls, parts: Sequence["PairMetricMatrix"]) -> "PairMetricMatrix":
+        return cls(np.concatenate([p.metrics for p in parts]),
+                   np.concatenate([p.aerial for p in parts]),
+                   np.concatenate([p.labels for p in parts]),
+                   [pr for p in parts for pr in p.pairs])
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, metrics=self.metrics, aerial=self.aerial, labels=self.labels,
+                            pairs=np.array(self.pairs, dtype=str).reshape(-1, 2))
+
+    @classmethod
+    def load(cls, path: str) -> "PairMetricMatrix":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["metrics"], z["aerial"], z["labels"], [tuple(p) for p in z["pairs"]])
+
+    # ── vectorized scoring ────────────────────────────────────────────────────
+    def _per_pair(self, regular: Dict[str, Any], aerial: Dict[str, Any], key: str,
+                  default: Any = None) -> np.ndarray:
+        if default is not None:
+            return np.where(self.aerial, aerial.get(key, default), regular.get(key, default)).astype(np.float64)
+        return np.where(self.aerial, aerial[key], regular[key]).astype(np.float64)
+
+    def features(self, pdq_ceil: np.ndarray) -> np.ndarray:
+        """(P, 5) normalised score terms, using each pair's PDQ ceiling."""
+        mtb, ssim, clip, hd, sift = self.metrics.T
+        pdq_term = np.where(hd >= pdq_ceil, 0.0, 1.0 - hd / pdq_ceil)
+        sift_term = np.clip(sift / 100.0, 0.0, 1.0)
+        return np.stack([mtb / 100.0, ssim / 100.0, clip / 100.0, pdq_term, sift_term], axis=1)
+
+    def evaluate(self, W: np.ndarray, regular: Dict[str, Any],
+                 aerial: Optional[Dict[str, Any]] = None, W_aerial: Optional[np.ndarray] = None,
+                 sift_override: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Score C weight rows against every pair.
+
+        W        (C, 5) regular-photo weights
+        regular  policy dict (threshold, mtb_floor, pdq_ceil, sift_min and optionally
+                 sift_override_mult / sift_override_clip; weights unused)
+        aerial   aerial policy; None scores aerial pairs exactly like regular ones
+        W_aerial (C, 5) aerial weights; defaults to aerial["weights"] for every row,
+                 i.e. the sweep varies the regular weights only, like set_weights()
+
+        Returns scores (C, P), decisions (C, P) and per-combo dropped / correct /
+        recall / accuracy (labels: 1 dup, 0 not dup; -1 ignored).
+        """
+        same_policy = aerial is None
+        aerial = aerial or regular
+        W = np.atleast_2d(np.asarray(W, np.float64))
+        thr = self._per_pair(regular, aerial, "threshold")
+        floor = self._per_pair(regular, aerial, "mtb_floor")
+        ceil = self._per_pair(regular, aerial, "pdq_ceil")
+        sift_min = self._per_pair(regular, aerial, "sift_min")
+
+        F = self.features(ceil)                                   # (P, 5)
+        scores = W @ F.T                                          # (C, P)
+        if self.aerial.any() and not same_policy:
+            Wa = (np.broadcast_to(np.asarray(aerial["weights"], np.float64), W.shape)
+                  if W_aerial is None else np.atleast_2d(np.asarray(W_aerial, np.float64)))
+            scores = np.where(self.aerial[None, :], Wa @ F.T, scores)
+
+        mtb, clip, hd, sift = self.column("mtb"), self.column("clip"), self.column("pdq_hd"), self.column("sift")
+        if sift_override:
+            mult = self._per_pair(regular, aerial, "sift_override_mult", SIFT_OVERRIDE_MULT)
+            clip_min = self._per_pair(regular, aerial, "sift_override_clip", SIFT_OVERRIDE_CLIP)
+            ovr = (sift >= sift_min * mult) | ((sift >= sift_min) & (clip >= clip_min))
+        else:
+            ovr = np.zeros(len(self), bool)
+        gate = ((mtb >= floor) | ovr) & ((hd < ceil) | ovr) & (hd != UNUSABLE_HD)   # (P,)
+        decisions = (scores >= thr[None, :]) & gate[None, :]
+
+        dup, notdup = self.labels == 1, self.labels == 0
+        correct_drops = decisions[:, dup].sum(axis=1)
+        correct_keeps = (~decisions[:, notdup]).sum(axis=1)
+        n_lab = dup.sum() + notdup.sum()
+        return {
+            "scores": scores,
+            "decisions": decisions,
+            "dropped": decisions.sum(axis=1),
+            "correct_drops": correct_drops,
+            "recall": correct_drops / dup.sum() if dup.any() else np.zeros(len(W)),
+            "accuracy": (correct_drops + correct_keeps) / n_lab if n_lab else np.zeros(len(W)),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from generate_weight_combinations import generate_weights
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Sweep weight grids over cached pair metrics")
+    parser.add_argument("matrices", nargs="+", help=".npz files written by PairMetricMatrix.save")
+    parser.add_argument("--steps", type=int, default=20, help="Grid steps per unit (10 → 10%%, 20 → 5%%)")
+    parser.add_argument("--no-sift-override", action="store_true")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    import deduplication as dedupe
+
+    m = PairMetricMatrix.concat([PairMetricMatrix.load(p) for p in args.matrices])
+    weights = generate_weights(steps=args.steps)
+    t0 = time.perf_counter()
+    res = m.evaluate(weights_to_matrix(weights), policy_from_engine(dedupe),
+                     policy_from_engine(dedupe, aerial=True), sift_override=not args.no_sift_override)
+    logger.info("Scored %d combos × %d pairs in %.1f ms", len(weights), len(m),
+                (time.perf_counter() - t0) * 1000)
+    for k in np.argsort(-res["accuracy"], kind="stable")[:args.top]:
+        w = weights[k]
+        print(f"acc={res['accuracy'][k]:.3f} recall={res['recall'][k]:.3f} dropped={res['dropped'][k]}  "
+              + " ".join(f"{key}={w[key]:.2f}" for key in WEIGHT_KEYS))
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+profiling.py – per-listing Phase 1 / Phase 2 profiles (sampled stacks + cProfile)
+
+When one listing takes twenty minutes the experiment log says nothing about
+why: SIFT on a large drone image, threads queueing for CLIP, and SSIM all look
+the same from the outside.  `--profile` on deduplication.py,
+dedup_fixed_drift.py and run_test_eval.py passes a ListingProfiler to
+remove_near_duplicates (`profiler=`), which brackets Phase 1 (feature
+extraction) and Phase 2 (pair comparisons) of every listing with two profilers:
+
+    sample    a stdlib sampling profiler: a daemon thread reads
+              sys._current_frames() every `interval` seconds and counts the
+              stack of *every* thread (thread-pool workers included, labelled
+              by pool name).  Time spent blocked (lock/condition waits, idle
+              pool workers, as_completed) stays visible as wait share per
+              thread group, which is what separates CPU cost from contention.
+              Written as collapsed stacks ("thread;mod:func;mod:func N"), the
+              input format of flamegraph.pl, speedscope and inferno.
+    cprofile  deterministic cProfile of the calling thread (the Phase 2 pair
+              loop runs there; Phase 1 work happens in pool threads, which
+              only the sampler sees).  Written as a .pstats file.
+
+A ListingProfiler profiles one listing at a time: give concurrent dedup calls
+their own profiler (or none).  The sampler sees every thread of the process,
+so anything else running alongside is part of the profile.
+
+Files land in <out_dir>/<listing>/<phase>.collapsed and .pstats, and a top-N
+hot-function summary (self and inclusive share of busy samples, plus the
+cProfile top by own time) is appended to the experiment report.
+
+Usage:
+    python dedup_fixed_drift.py --profile --log-experiment run1
+    python run_test_eval.py --folders 3 --profile profiles/eval --profile-interval 0.002
+    python profiling.py profiles/eval/3/phase2.collapsed --top 25    # summarise a file
+
+    flamegraph.pl profiles/eval/3/phase1.collapsed > phase1.svg
+    python -m pstats profiles/eval/3/phase2.pstats
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    standard library only
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import logging
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODES = ("both", "sample", "cprofile")
+DEFAULT_OUT_DIR = "profiles"
+DEFAULT_INTERVAL_S = 0.005
+DEFAULT_TOP_N = 15
+
+# Leaf frames of a thread that is blocked rather than running Python or a
+# GIL-releasing C call (cv2, numpy, torch show up as the Python frame calling them)
+IDLE_LEAVES = frozenset({
+    "threading:Condition.wait", "threading:Event.wait", "threading:Thread.join",
+    "threading:Thread._wait_for_tstate_lock", "threading:Semaphore.acquire",
+    "queue:Queue.get", "queue:Queue.put", "thread:_worker", "_base:as_completed",
+    "_base:Future.result", "_base:_AcquireFutures.__enter__", "selectors:EpollSelector.select",
+    "selectors:PollSelector.select", "selectors:SelectSelector.select", "socketserver:BaseServer.serve_forever",
+    "connection:wait", "popen_fork:Popen.wait", "base_events:BaseEventLoop._run_once",
+})
+
+Stack = Tuple[str, ...]
+
+
+# ─── sampling profiler ────────────────────────────────────────────────────────
+def _thread_group(name: str) -> str:
+    """'ThreadPoolExecutor-0_3' → 'ThreadPoolExecutor-0', 'features_2' → 'features'."""
+    return re.sub(r"[_-]\d+$", "", name) or name
+
+
+class SamplingProfiler:
+    """Counts the Python stack of every thread every `interval` seconds."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL_S):
+        self.interval = interval
+        self.stacks: "Counter[Stack]" = Counter()
+        self.ticks = 0
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _label(self, code: Any) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{Path(code.co_filename).stem}:{name}".replace(";", ":").replace(" ", "_")
+        return label
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(_thread_group(names.get(tid, str(tid))))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.ticks += 1
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+def write_collapsed(stacks: "Counter[Stack]", path: Path) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, n in sorted(stacks.items(), key=lambda kv: -kv[1]):
+            f.write(f"{';'.join(stack)} {n}\n")
+
+
+def read_collapsed(path: str) -> "Counter[Stack]":
+    stacks: "Counter[Stack]" = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                frames, _, n = line.rpartition(" ")
+                stacks[tuple(frames.split(";"))] += int(n)
+    return stacks
+
+
+def is_idle(stack: Stack) -> bool:
+    return len(stack) < 2 or stack[-1] in IDLE_LEAVES
+
+
+def hot_functions(stacks: "Counter[Stack]", n: int = DEFAULT_TOP_N) -> List[Tuple[str, float, float]]:
+    """[(function, self %, inclusive %)] over busy samples, by self share."""
+    busy = {s: c for s, c in stacks.items() if not is_idle(s)}
+    total = sum(busy.values())
+    if not total:
+        return []
+    own: "Counter[str]" = Counter()
+    incl: "Counter[str]" = Counter()
+    for stack, c in busy.items():
+        own[stack[-1]] += c
+        for fn in set(stack[1:]):                    # [0] is the thread group
+            incl[fn] += c
+    return [(fn, 100.0 * c / total, 100.0 * incl[fn] / total) for fn, c in own.most_common(n)]
+
+
+def thread_shares(stacks: "Counter[Stack]") -> List[Tuple[str, int, float]]:
+    """[(thread group, samples, wait %)] – how much of each group's time was spent blocked."""
+    seen: "Counter[str]" = Counter()
+    idle: "Counter[str]" = Counter()
+    for stack, c in stacks.items():
+        seen[stack[0]] += c
+        if is_idle(stack):
+            idle[stack[0]] += c
+    return [(g, c, 100.0 * idle[g] / c) for g, c in seen.most_common()]
+
+
+def pstats_top(prof: cProfile.Profile, n: int = DEFAULT_TOP_N) -> List[Tuple[str, int, float, float]]:
+    """[(function, calls, own s, cumulative s)] of a cProfile run, by own time."""
+    stats = pstats.Stats(prof, stream=io.StringIO()).stats       # {(file, line, fn): (cc, nc, tt, ct, callers)}
+    rows = sorted(stats.items(), key=lambda kv: -kv[1][2])[:n]
+    return [(f"{Path(file).stem}:{fn}" if file != "~" else fn, nc, tt, ct)
+            for (file, _, fn), (_, nc, tt, ct, _) in rows]
+
+
+# ─── per-listing phases ───────────────────────────────────────────────────────
+@dataclass
+class PhaseProfile:
+    listing: str
+    phase: str
+    seconds: float
+    samples: int = 0
+    hot: List[Tuple[str, float, float]] = field(default_factory=list)
+    threads: List[Tuple[str, int, float]] = field(default_factory=list)
+    cprofile_top: List[Tuple[str, int, float, float]] = field(default_factory=list)
+    collapsed: str = ""
+    pstats: str = ""
+
+
+class ListingProfiler:
+    """
+    Profiles named phases of the current listing; the engine runs each phase
+    inside `with profiler.phase("phase1"):`.  Each phase's files are written
+    when it ends; `results` keeps only the summaries.
+    """
+
+    def __init__(self, out_dir: str = DEFAULT_OUT_DIR, mode: str = "both",
+                 interval: float = DEFAULT_INTERVAL_S, top_n: int = DEFAULT_TOP_N):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode '{mode}' (choose from {', '.join(MODES)})")
+        self.out_dir = Path(out_dir)
+        self.mode = mode
+        self.interval = interval
+        self.top_n = top_n
+        self.listing = "run"
+        self.results: List[PhaseProfile] = []
+        self._phase: Optional[str] = None
+        self._owner: Optional[int] = None
+        self._t0 = 0.0
+        self._sampler: Optional[SamplingProfiler] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+
+    def enter(self, phase: str) -> None:
+        """End the running phase (if any) and start profiling `phase`."""
+        if self._phase is not None and self._owner != threading.get_ident():
+            raise RuntimeError(f"ListingProfiler is already profiling {self.listing} {self._phase} "
+                               f"in another thread; use one profiler per concurrent listing")
+        self.stop()
+        self._phase, self._owner, self._t0 = phase, threading.get_ident(), time.perf_counter()
+        if self.mode in ("both", "sample"):
+            self._sampler = SamplingProfiler(self.interval)
+            self._sampler.start()
+        if self.mode in ("both", "cprofile"):
+            self._cprofile = cProfile.Profile()
+            try:
+                self._cprofile.enable()
+            except ValueError as e:                 # another profiler already owns this thread
+                logger.warning("cProfile unavailable (%s); sampling only", e)
+                self._cprofile = None
+
+    def stop(self) -> Optional[PhaseProfile]:
+        """End the running phase and write its files (no-op when none is running)."""
+        if self._phase is None:
+            return None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        res = PhaseProfile(self.listing, self._phase, time.perf_counter() - self._t0)
+        out = self.out_dir / (re.sub(r"[^\w.-]+", "_", self.listing).strip("_") or "run")
+        out.mkdir(parents=True, exist_ok=True)
+        if self._sampler is not None:
+            res.samples = self._sampler.ticks
+            res.hot = hot_functions(self._sampler.stacks, self.top_n)
+            res.threads = thread_shares(self._sampler.stacks)
+            res.collapsed = str(out / f"{self._phase}.collapsed")
+            write_collapsed(self._sampler.stacks, Path(res.collapsed))
+        if self._cprofile is not None:
+            res.cprofile_top = pstats_top(self._cprofile, self.top_n)
+            res.pstats = str(out / f"{self._phase}.pstats")
+            self._cprofile.dump_stats(res.pstats)
+        self._phase, self._owner, self._sampler, self._cprofile = None, None, None, None
+        self.results.append(res)
+        logger.info("[PROFILE] %s %s: %.2f s, %d samples → %s", res.listing, res.phase, res.seconds,
+                    res.samples, out)
+        return res
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        """Profile the block as `phase`; the phase ends even if the block raises."""
+        self.enter(phase)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    # ── report ────────────────────────────────────────────────────────────────
+    def report_markdown(self) -> str:
+        lines = [f"## Profile (top {self.top_n} hot functions)", "",
+                 f"Mode `{self.mode}`, sampling every {self.interval * 1000:.1f} ms; "
+                 f"files under `{self.out_dir}/<listing>/`.  Self/inclusive shares are of busy "
+                 f"samples (blocked threads excluded and reported as wait %).", ""]
+        for r in self.results:
+            lines += [f"### {r.listing} – {r.phase} ({r.seconds:.2f} s, {r.samples} samples)", ""]
+            if r.threads:
+                lines.append("Threads: " + ", ".join(f"{g} {n} samples ({w:.0f}% waiting)"
+                                                     for g, n, w in r.threads))
+                lines.append("")
+            if r.hot:
+                lines += ["| Function | Self % | Inclusive % |", "|----------|--------|-------------|"]
+                lines += [f"| `{fn}` | {own:.1f} | {incl:.1f} |" for fn, own, incl in r.hot]
+                lines.append("")
+            if r.cprofile_top:
+                lines += ["| cProfile (calling thread) | Calls | Own s | Cumulative s |",
+                          "|---------------------------|-------|-------|--------------|"]
+                lines += [f"| `{fn}` | {nc} | {tt:.3f} | {ct:.3f} |" for fn, nc, tt, ct in r.cprofile_top]
+                lines.append("")
+        return "\n".join(lines)
+
+    def append_report(self, path: str) -> None:
+        """Append report_markdown() to an existing experiment / eval report."""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n" + self.report_markdown() + "\n")
+        logger.info("Profile summary appended to %s", path)
+
+
+def profile_phase(profiler: Optional[ListingProfiler], phase: str) -> ContextManager[None]:
+    """profiler.phase(phase), or a no-op block when profiling is off."""
+    return profiler.phase(phase) if profiler else nullcontext()
+
+
+# ─── CLI glue ─────────────────────────────────────────────────────────────────
+def add_profile_arguments(parser: Any) -> None:
+    """--profile [DIR], --profile-mode, --profile-interval, --profile-top."""
+    parser.add_argument("--profile", nargs="?", const=DEFAULT_OUT_DIR, default=None, metavar="DIR",
+                        help=f"Profile Phase 1/2 of each listing into DIR (default: {DEFAULT_OUT_DIR})")
+    parser.add_argument("--profile-mode", choices=MODES, default="both",
+                        help="Sampling profiler (all threads), cProfile (calling thread) or both")
+    parser.add_argument("--profile-interval", type=float, default=DEFAULT_INTERVAL_S,
+                        help="Sampling interval in seconds")
+    parser.add_argument("--profile-top", type=int, default=DEFAULT_TOP_N,
+                        help="Hot functions listed per phase in the report")
+
+
+def profiler_from_args(args: Any) -> Optional[ListingProfiler]:
+    if not getattr(args, "profile", None):
+        return None
+    return ListingProfiler(args.profile, args.profile_mode, args.profile_interval, args.profile_top)
+
+
+def _summarise(paths: Iterable[str], top: int) -> None:
+    for path in paths:
+        stacks = read_collapsed(path)
+        print(f"{path}: {sum(stacks.values())} samples")
+        for g, n, w in thread_shares(stacks):
+            print(f"  thread {g:<32}{n:>8} samples {w:>6.1f}% waiting")
+        print(f"  {'function':<60}{'self %':>8}{'incl %':>8}")
+        for fn, own, incl in hot_functions(stacks, top):
+            print(f"  {fn:<60}{own:>8.1f}{incl:>8.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarise collapsed-stack profiles")
+    parser.add_argument("files", nargs="+", help=".collapsed files written by --profile")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_N)
+    args = parser.parse_args()
+    _summarise(args.files, args.top)
@@ -2,6 +2,9 @@
 """
 Re-analyze existing markdown reports with SIFT >= 150 threshold
 Uses existing comparison data instead of re-running expensive CLIP/SIFT computations
+
+With --store DIR the comparison rows come from a result store (see
+result_store.py) instead of being parsed back out of markdown.
 """
 import sys
 import re
@@ -206,9 +209,65 @@ def reanalyze_folder(folder_path):
 
     return new_md_path
 
+def comparisons_from_store(store_root, run_id=None):
+    """Duplicate pairs per listing from a result store → {listing: (comparisons, total_images)}"""
+    from result_store import read_table
+
+    pairs = read_table(store_root, "pairs")
+    images = read_table(store_root, "images", ["run_id", "listing", "path"])
+    if run_id is None and len(pairs["run_id"]):
+        run_id = sorted(set(pairs["run_id"]))[-1]
+
+    out = {}
+    sel = (pairs["run_id"] == run_id) & pairs["decision"]
+    for listing in sorted(set(pairs["listing"][pairs["run_id"] == run_id])):
+        m = sel & (pairs["listing"] == listing)
+        comparisons = [{
+            'kept': Path(b if d == a else a).name,
+            'duplicate': Path(d or b).name,
+            'score': float(sc), 'mtb': float(mt), 'edge': float(ed), 'ssim': float(ss),
+            'clip': float(cl), 'pdq_hd': int(hd), 'sift': int(sf)
+        } for a, b, d, sc, mt, ed, ss, cl, hd, sf in zip(
+            pairs["path_a"][m], pairs["path_b"][m], pairs["dropped_path"][m], pairs["score"][m],
+            pairs["mtb"][m], pairs["edge"][m], pairs["ssim"][m], pairs["clip"][m],
+            pairs["pdq_hd"][m], pairs["sift"][m])]
+        img_m = (images["run_id"] == run_id) & (images["listing"] == listing)
+        total = int(img_m.sum())
+        if total == 0:
+            lm = (pairs["run_id"] == run_id) & (pairs["listing"] == listing)
+            total = len(set(pairs["path_a"][lm]) | set(pairs["path_b"][lm]))
+        out[listing] = (comparisons, total)
+    return out
+
+def reanalyze_store(store_root, run_id=None):
+    """Re-analyze every listing of a result-store run; reports go next to each listing"""
+    for listing, (comparisons, total_images) in comparisons_from_store(store_root, run_id).items():
+        folder = Path(listing)
+        out_dir = folder if folder.exists() else Path(store_root) / "reanalysis"
+        out_dir.mkdir(parents=True, exist_ok=True)
+        print(f"{folder.name}: {len(comparisons)} duplicate pairs, {total_images} images (from store)")
+        new_md_path = out_dir / f"{folder.name}_greatersift.md"
+        with open(new_md_path, 'w', encoding='utf-8') as f:
+            f.write(generate_markdown(folder.name, comparisons, total_images))
+        print(f"Saved re-analyzed results to {new_md_path}")
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        folders = sys.argv[1:]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-analyze duplicate reports with SIFT >= 150")
+    parser.add_argument("folders", nargs="*", help="Folders with <name>.md reports")
+    parser.add_argument("--store", type=str, default=None,
+                        help="Read comparisons from a result store instead of markdown")
+    parser.add_argument("--run-id", type=str, default=None,
+                        help="Store run to analyze (default: latest)")
+    args = parser.parse_args()
+
+    if args.store:
+        reanalyze_store(args.store, args.run_id)
+        sys.exit(0)
+
+    if args.folders:
+        folders = args.folders
     else:
         folders = [
             r"000fc774-cb56-4052-a33a-9974c58a00d6",
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+replay_decisions.py – re-decide stored runs under new thresholds
+
+A run written to a result store (result_store.py) already holds every pair
+metric the engine computed.  Trying a new threshold used to mean re-running
+Phase 1 on every listing; here the engine's own remove_near_duplicates loop
+is replayed instead (same _decide_pair rule, aerial/regular split and greedy
+order) with the stored metrics served through its `pair_metrics` hook.
+
+Only pairs the new schedule needs but the old run never compared are
+computed – e.g. once the drift-fix engine drops a different frame it compares
+against a different "last kept" reference.  For those, Phase 1 features of the
+two images are built on demand and the pair goes through engine._pair_sim.
+
+Only decision constants (weights, thresholds, MTB floor, PDQ ceiling, SIFT
+minimum and override) may be overridden; anything that changes the features
+themselves would make the stored metrics stale.  The baseline is the stored
+run's own config, so a replay without overrides reproduces the stored
+decisions exactly (a cheap consistency check).
+
+Usage:
+    python replay_decisions.py results --set SIFT_MIN_MATCHES=120 --set COMPOSITE_DUP_THRESHOLD=0.5
+    python replay_decisions.py results --run-id 20250101-120000-ab12cd --out-store results
+
+    from replay_decisions import replay_store
+    report = replay_store("results", overrides={"PDQ_HD_CEIL": 120})
+    report["totals"]["newly_dropped"]
+"""
+
+from __future__ import annotations
+
+import ast
+import importlib
+import json
+import logging
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from result_store import ResultStore, engine_config, read_table
+
+logger = logging.getLogger(__name__)
+
+REPLAYABLE_ENGINES = ("deduplication", "dedup_fixed_drift")
+_DECISION_KEYS = {"COMPOSITE_DUP_THRESHOLD", "MTB_HARD_FLOOR", "PDQ_HD_CEIL",
+                  "SIFT_MIN_MATCHES", "SIFT_OVERRIDE_MULT", "SIFT_OVERRIDE_CLIP"}
+
+PairMetrics = Tuple[float, float, int, float, float, int]   # _pair_sim order
+
+
+def is_decision_key(name: str) -> bool:
+    """True for constants that only enter _decide_pair (safe to replay)."""
+    base = name[len("AERIAL_"):] if name.startswith("AERIAL_") else name
+    return base.startswith("WEIGHT_") or base in _DECISION_KEYS
+
+
+def load_engine(name: str) -> Any:
+    if name not in REPLAYABLE_ENGINES:
+        raise ValueError(f"Engine '{name}' cannot be replayed (choose from {', '.join(REPLAYABLE_ENGINES)})")
+    return importlib.import_module(name)
+
+
+@contextmanager
+def engine_overrides(engine: Any, values: Dict[str, Any]) -> Iterator[None]:
+    """Temporarily set decision constants on an engine module."""
+    bad = [k for k in values if not is_decision_key(k) or not hasattr(engine, k)]
+    if bad:
+        raise ValueError(f"Not a decision constant of {engine.__name__}: {', '.join(bad)}")
+    saved = {k: getattr(engine, k) for k in values}
+    try:
+        for k, v in values.items():
+            setattr(engine, k, v)
+        yield
+    finally:
+        for k, v in saved.items():
+            setattr(engine, k, v)
+
+
+# ─── stored metrics ───────────────────────────────────────────────────────────
+class PairMetricSource:
+    """
+    `pair_metrics` provider for remove_near_duplicates: stored metrics first,
+    then Phase 1 features + engine._pair_sim for pairs never compared.
+
+    `aerial_of` is the matching `pair_aerial` hook: stored pairs keep the aerial
+    flag they were decided with (the original run may have had EXIF make/model
+    that a replay does not); new pairs fall back to the engine's _is_aerial.
+    """
+
+    def __init__(self, engine: Any, stored: Dict[Tuple[str, str], PairMetrics],
+                 aerial: Optional[Dict[Tuple[str, str], bool]] = None):
+        self.engine = engine
+        self.stored = stored
+        self.aerial = aerial or {}
+        self.computed: Dict[Tuple[str, str], PairMetrics] = {}
+        self.hits = 0
+
+    @classmethod
+    def from_store(cls, engine: Any, root: str, run_id: str) -> "PairMetricSource":
+        cols = read_table(root, "pairs", columns=["path_a", "path_b", "mtb", "edge", "pdq_hd",
+                                                  "ssim", "clip", "sift", "aerial"], run_id=run_id)
+        stored = {
+            (a, b): (float(mtb), float(edge), int(hd), float(ssim), float(clip), int(sift))
+            for a, b, mtb, edge, hd, ssim, clip, sift in zip(
+                cols["path_a"], cols["path_b"], cols["mtb"], cols["edge"], cols["pdq_hd"],
+                cols["ssim"], cols["clip"], cols["sift"])
+        }
+        aerial = {(a, b): bool(f) for a, b, f in zip(cols["path_a"], cols["path_b"], cols["aerial"])}
+        return cls(engine, stored, aerial)
+
+    def __call__(self, path_a: str, path_b: str) -> PairMetrics:
+        key = (path_a, path_b)
+        if key in self.stored:
+            self.hits += 1
+            return self.stored[key]
+        if key not in self.computed:
+            for p in key:
+                if p not in self.engine._metric_store:
+                    self.engine._metric_store[p] = self.engine._metric_worker(p)
+            self.computed[key] = self.engine._pair_sim(path_a, path_b)
+        return self.computed[key]
+
+    def aerial_of(self, path_a: str, path_b: str) -> Optional[bool]:
+        return self.aerial.get((path_a, path_b))
+
+
+class _PairRecorder:
+    """Stands in for the engine's _experiment_logger during a replay."""
+
+    def __init__(self, store: Optional[ResultStore], listing: str):
+        self.store = store
+        self.listing = listing
+        self.rows: List[Dict[str, Any]] = []
+
+    def add_comparison(self, img_a: str, img_b: str, mtb: float, edge: float,
+                       ssim: float, clip: float, pdq_hd: int, sift_matches: int,
+                       score: float, dropped: bool, drop_reason: str,
+                       aerial: bool = False, timing_ms: Optional[float] = None,
+                       dropped_path: Optional[str] = None) -> None:
+        self.rows.append({"path_a": img_a, "path_b": img_b, "decision": dropped,
+                          "drop_reason": drop_reason, "score": score})
+        if self.store is not None:
+            self.store.add_pair(
+                listing=self.listing, path_a=img_a, path_b=img_b, mtb=mtb, edge=edge,
+                ssim=ssim, clip=clip, pdq_hd=pdq_hd, sift=sift_matches, score=score,
+                aerial=aerial, timing_ms=timing_ms, decision=dropped,
+                drop_reason=drop_reason, dropped_path=dropped_path)
+
+
+# ─── run / listing layout ─────────────────────────────────────────────────────
+def latest_run(root: str, engine: Optional[str] = None) -> str:
+    runs = []
+    for p in (Path(root) / "runs").glob("*.json"):
+        meta = json.loads(p.read_text(encoding="utf-8"))
+        if meta.get("engine") in REPLAYABLE_ENGINES and (engine is None or meta.get("engine") == engine):
+            runs.append((meta.get("started", 0.0), meta["run_id"]))
+    if not runs:
+        raise FileNotFoundError(f"No replayable runs under {root}/runs")
+    return max(runs)[1]
+
+
+def run_meta(root: str, run_id: str) -> Dict[str, Any]:
+    return json.loads((Path(root) / "runs" / f"{run_id}.json").read_text(encoding="utf-8"))
+
+
+def listing_paths(root: str, run_id: str) -> Dict[str, List[str]]:
+    """
+    Image order of every listing in a run.  The images table is authoritative;
+    listings without image rows fall back to first appearance in the pair rows
+    (which misses images whose only comparison was unusable, hd == 999).
+    """
+    out: Dict[str, List[str]] = {}
+    img = read_table(root, "images", columns=["listing", "position", "path"], run_id=run_id)
+    for listing in dict.fromkeys(img["listing"]):
+        sel = img["listing"] == listing
+        order = np.argsort(img["position"][sel], kind="stable")
+        out[listing] = list(img["path"][sel][order])
+    with_images = set(out)
+    pairs = read_table(root, "pairs", columns=["listing", "path_a", "path_b"], run_id=run_id)
+    seen: Dict[str, Dict[str, None]] = {}
+    for listing, a, b in zip(pairs["listing"], pairs["path_a"], pairs["path_b"]):
+        if listing not in with_images:
+            seen.setdefault(listing, {}).update(dict.fromkeys((a, b)))
+    out.update({listing: list(order) for listing, order in seen.items()})
+    return out
+
+
+def stored_drops(root: str, run_id: str) -> Dict[str, set]:
+    cols = read_table(root, "pairs", columns=["listing", "decision", "dropped_path"], run_id=run_id)
+    out: Dict[str, set] = {}
+    for listing, dec, p in zip(cols["listing"], cols["decision"], cols["dropped_path"]):
+        if dec and p:
+            out.setdefault(listing, set()).add(p)
+    return out
+
+
+# ─── replay ───────────────────────────────────────────────────────────────────
+def replay_listing(engine: Any, paths: Sequence[str], source: PairMetricSource,
+                   metadata_dict: Optional[Dict[str, Dict[str, Any]]] = None,
+                   full_scan: bool = False, store: Optional[ResultStore] = None,
+                   listing: str = "") -> Tuple[List[str], List[Dict[str, Any]]]:
+    """One listing through engine.remove_near_duplicates → (kept paths, pair rows)."""
+    recorder = _PairRecorder(store, listing)
+    prev = engine._experiment_logger
+    engine._experiment_logger = recorder
+    try:
+        kept = engine.remove_near_duplicates([[p] for p in paths], deduplication_flag=1,
+                                             metadata_dict=metadata_dict or {},
+                                             full_scan=full_scan, pair_metrics=source,
+                                             pair_aerial=source.aerial_of)
+    finally:
+        engine._experiment_logger = prev
+    return [g[0] for g in kept], recorder.rows
+
+
+def replay_store(root: str, run_id: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None,
+                 full_scan: bool = False, metadata_dict: Optional[Dict[str, Dict[str, Any]]] = None,
+                 out_store: Optional[str] = None, quiet: bool = True) -> Dict[str, Any]:
+    """
+    Replay every listing of a stored run with `overrides` applied on top of the
+    run's own decision constants.  Returns per-listing flips and totals.
+    """
+    run_id = run_id or latest_run(root)
+    meta = run_meta(root, run_id)
+    engine = load_engine(meta["engine"])
+    stored_cfg = meta.get("config", {})
+    baseline = {k: v for k, v in stored_cfg.items() if is_decision_key(k) and hasattr(engine, k)}
+    stale = sorted(k for k, v in stored_cfg.items()
+                   if not is_decision_key(k) and hasattr(engine, k) and getattr(engine, k) != v)
+    if stale:
+        logger.warning("Feature settings differ from run %s (%s) – newly computed pairs "
+                       "will not match stored ones", run_id, ", ".join(stale))
+
+    source = PairMetricSource.from_store(engine, root, run_id)
+    layout = listing_paths(root, run_id)
+    before = stored_drops(root, run_id)
+    settings = {**baseline, **(overrides or {})}
+    logger.info("Replaying run %s (%s): %d listings, %d stored pairs, overrides=%s",
+                run_id, meta["engine"], len(layout), len(source.stored), overrides or {})
+
+    engine_log = logging.getLogger(engine.__name__)
+    level = engine_log.level
+    if quiet:
+        engine_log.setLevel(logging.WARNING)
+    store = None
+    listings: List[Dict[str, Any]] = []
+    t0 = time.perf_counter()
+    try:
+        with engine_overrides(engine, settings):
+            if out_store:
+                store = ResultStore(out_store, engine=meta["engine"], config=engine_config(engine))
+            for listing, paths in layout.items():
+                computed0 = len(source.computed)
+                kept, rows = replay_listing(engine, paths, source, metadata_dict,
+                                            full_scan, store, listing)
+                dropped = set(paths) - set(kept)
+                old = before.get(listing, set())
+                listings.append({
+                    "listing": listing,
+                    "images": len(paths),
+                    "kept_before": len(paths) - len(old),
+                    "kept_after": len(kept),
+                    "newly_dropped": sorted(dropped - old),
+                    "newly_kept": sorted(old - dropped),
+                    "comparisons": len(rows),
+                    "computed_pairs": len(source.computed) - computed0,
+                })
+    finally:
+        engine_log.setLevel(level)
+        if store is not None:
+            store.close()
+
+    totals = {
+        "listings": len(listings),
+        "images": sum(r["images"] for r in listings),
+        "changed_listings": sum(1 for r in listings if r["newly_dropped"] or r["newly_kept"]),
+        "newly_dropped": sum(len(r["newly_dropped"]) for r in listings),
+        "newly_kept": sum(len(r["newly_kept"]) for r in listings),
+        "stored_pairs_used": source.hits,
+        "computed_pairs": len(source.computed),
+        "seconds": time.perf_counter() - t0,
+    }
+    return {"run_id": run_id, "engine": meta["engine"], "overrides": overrides or {},
+            "listings": listings, "totals": totals,
+            "out_run_id": store.run_id if store is not None else None}
+
+
+def format_report(report: Dict[str, Any], changed_only: bool = True) -> str:
+    t = report["totals"]
+    md = [f"# Replay of {report['run_id']} ({report['engine']})", "",
+          "**Overrides:** " + (", ".join(f"{k}={v}" for k, v in report["overrides"].items()) or "none"), "",
+          f"- **Listings:** {t['listings']} ({t['changed_listings']} changed)",
+          f"- **Images:** {t['images']}",
+          f"- **Newly dropped:** {t['newly_dropped']}",
+          f"- **Newly kept:** {t['newly_kept']}",
+          f"- **Pairs:** {t['stored_pairs_used']} from store, {t['computed_pairs']} computed",
+          f"- **Time:** {t['seconds']:.2f} s", ""]
+    if report.get("out_run_id"):
+        md += [f"Replayed decisions written as run `{report['out_run_id']}`.", ""]
+    md += ["| Listing | Images | Kept before | Kept after | Newly dropped | Newly kept | Computed pairs |",
+           "|---------|--------|-------------|------------|---------------|------------|----------------|"]
+    for r in report["listings"]:
+        if changed_only and not (r["newly_dropped"] or r["newly_kept"]):
+            continue
+        md.append(f"| {Path(r['listing']).name} | {r['images']} | {r['kept_before']} | {r['kept_after']} | "
+                  f"{', '.join(Path(p).stem for p in r['newly_dropped']) or '–'} | "
+                  f"{', '.join(Path(p).stem for p in r['newly_kept']) or '–'} | {r['computed_pairs']} |")
+    return "\n".join(md) + "\n"
+
+
+def _parse_overrides(items: Sequence[str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected KEY=VALUE, got '{item}'")
+        out[key.strip()] = ast.literal_eval(value.strip())
+    return out
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Replay stored dedup runs under new decision constants")
+    parser.add_argument("store", type=str, help="Result store root")
+    parser.add_argument("--run-id", type=str, default=None, help="Run to replay (default: latest)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Decision constant override, e.g. SIFT_MIN_MATCHES=120 (repeatable)")
+    parser.add_argument("--full-scan", action="store_true", help="Replay with the all-pairs schedule")
+    parser.add_argument("--metadata", type=str, default=None,
+                        help="JSON {path: {make, model}} for aerial detection of pairs the stored "
+                             "run never compared (default: filenames only)")
+    parser.add_argument("--out-store", type=str, default=None,
+                        help="Write the replayed decisions as a new run in this store")
+    parser.add_argument("--all", action="store_true", help="List unchanged listings too")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Write the report here")
+    args = parser.parse_args()
+
+    metadata = json.loads(Path(args.metadata).read_text(encoding="utf-8")) if args.metadata else None
+    report = replay_store(args.store, args.run_id, _parse_overrides(args.overrides),
+                          full_scan=args.full_scan, metadata_dict=metadata, out_store=args.out_store)
+    md = format_report(report, changed_only=not args.all)
+    if args.output:
+        Path(args.output).write_text(md, encoding="utf-8")
+        logger.info("Report written to %s", args.output)
+    else:
+        print(md)
+
+
+if __name__ == "__main__":
+    main()
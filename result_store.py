@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+result_store.py – columnar, streaming store for dedup runs
+
+Markdown reports used to be the only record of a run, and scripts such as
+reanalyze_with_sift150.py parsed the tables back with regex to try a new
+rule.  A ResultStore streams two tables instead:
+
+    pairs   one row per comparison: run/engine/config hash, listing, both
+            paths, every metric, aerial flag, exit stage, per-pair timing,
+            decision, drop reason, dropped path
+    images  one row per Phase 1 feature record: listing, position, path and a
+            small feature summary (MTB fill, edge density, which optional
+            features were available, SSIM thumbnail shape)
+
+Rows are buffered and flushed in batches; every flush writes one complete
+part file, so an open (or crashed) run is readable up to its last flush.
+Formats:
+    parquet   Parquet (default)
+    arrow     Arrow IPC stream
+    jsonl     JSON lines; used automatically when pyarrow is not installed
+
+Layout:  <root>/<table>/<run_id>.<part>.<ext>
+
+Reads filtered by run_id only open that run's parts, and ResultStore.pairs()
+only the parts that hold the requested listing, so reading back one listing
+costs the same at the first listing of an archive as at the ten-thousandth.
+
+`read_table()` returns a dict of numpy columns (all runs, or filtered by
+run/engine/config/listing), so re-evaluating a rule across thousands of
+listings is a vectorized expression over columns; `render_markdown()` turns a
+listing back into the familiar comparison table.  The engines' ExperimentLogger
+markdown reads its rows back the same way (`stored_comparisons()`) when a
+store is attached, so the report and the store cannot disagree.
+
+Usage:
+    with ResultStore("results", engine="dedup_fixed_drift", config=engine_config(dedupe)) as store:
+        dedupe._experiment_logger.result_store = store
+        ...
+    cols = read_table("results", "pairs", engine="dedup_fixed_drift")
+    flips = (cols["sift"] >= 150) & (cols["clip"] >= 85) & ~cols["decision"]
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install pyarrow                # <-- optional; falls back to JSON lines
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from lazy_imports import lazy_module
+
+pa = lazy_module("pyarrow")
+pq = lazy_module("pyarrow.parquet")
+ipc = lazy_module("pyarrow.ipc")
+
+logger = logging.getLogger(__name__)
+
+# (column, type) – types: str, float, int, bool
+PAIR_COLUMNS = [
+    ("run_id", "str"), ("engine", "str"), ("config_hash", "str"), ("ts", "float"),
+    ("listing", "str"), ("path_a", "str"), ("path_b", "str"),
+    ("mtb", "float"), ("edge", "float"), ("ssim", "float"), ("clip", "float"),
+    ("pdq_hd", "int"), ("sift", "int"), ("score", "float"),
+    ("aerial", "bool"), ("exit_stage", "str"), ("timing_ms", "float"),
+    ("decision", "bool"), ("drop_reason", "str"), ("dropped_path", "str"),
+]
+IMAGE_COLUMNS = [
+    ("run_id", "str"), ("engine", "str"), ("config_hash", "str"), ("ts", "float"),
+    ("listing", "str"), ("position", "int"), ("path", "str"),
+    ("mtb_fill", "float"), ("edge_density", "float"),
+    ("has_pdq", "bool"), ("has_clip", "bool"), ("ssim_h", "int"), ("ssim_w", "int"),
+]
+TABLES = {"pairs": PAIR_COLUMNS, "images": IMAGE_COLUMNS}
+_EXT = {"parquet": ".parquet", "arrow": ".arrows", "jsonl": ".jsonl"}
+_NP_TYPES = {"str": object, "float": np.float64, "int": np.int64, "bool": bool}
+_DEFAULTS = {"str": "", "float": float("nan"), "int": -1, "bool": False}
+
+
+def engine_config(engine: Any) -> Dict[str, Any]:
+    """UPPER_CASE scalar settings of an engine module (weights, thresholds, sizes…)."""
+    return {k: v for k, v in sorted(vars(engine).items())
+            if k.isupper() and isinstance(v, (int, float, str, bool))}
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def infer_exit_stage(drop_reason: str) -> str:
+    """Exit stage for engines without a cascade (which gate or rule decided)."""
+    if drop_reason.startswith("MTB"):
+        return "GATE_MTB_FLOOR"
+    if drop_reason.startswith("PDQ"):
+        return "GATE_PDQ_CEIL"
+    return "COMPOSITE"
+
+
+def image_summary(m: Dict[str, Any]) -> Dict[str, Any]:
+    """Feature summary of one _metric_worker record."""
+    ssim = m.get("ssim_stats")
+    shape = ssim.shape if ssim is not None else getattr(m.get("gray_ssim"), "shape", (-1, -1))
+    return {
+        "path": m.get("path", ""),
+        "mtb_fill": float(np.mean(m["mtb"])) if m.get("mtb") is not None else float("nan"),
+        "edge_density": float(np.mean(m["edges"])) if m.get("edges") is not None else float("nan"),
+        "has_pdq": m.get("pdq") is not None,
+        "has_clip": m.get("clip") is not None,
+        "ssim_h": int(shape[0]), "ssim_w": int(shape[1]),
+    }
+
+
+# ─── writers ──────────────────────────────────────────────────────────────────
+class _TableWriter:
+    """Writes each flushed batch of one table as the next part file of a run."""
+
+    def __init__(self, directory: Path, run_id: str, columns, fmt: str):
+        self.directory, self.run_id, self.columns, self.fmt = directory, run_id, columns, fmt
+        self.parts: List[Path] = []
+
+    def _arrow_schema(self):
+        types = {"str": pa.string(), "float": pa.float64(), "int": pa.int64(), "bool": pa.bool_()}
+        return pa.schema([(name, types[t]) for name, t in self.columns])
+
+    def write(self, rows: List[Dict[str, Any]]) -> Optional[Path]:
+        """Write `rows` as a new part; returns its path (None for an empty batch)."""
+        if not rows:
+            return None
+        path = self.directory / f"{self.run_id}.{len(self.parts):05d}{_EXT[self.fmt]}"
+        if self.fmt == "jsonl":
+            with open(path, "w", encoding="utf-8") as f:
+                for r in rows:
+                    f.write(json.dumps(r, default=float) + "\n")
+        else:
+            schema = self._arrow_schema()
+            batch = pa.record_batch([pa.array([r[name] for r in rows], type=schema.field(name).type)
+                                     for name, _ in self.columns], schema=schema)
+            if self.fmt == "parquet":
+                pq.write_table(pa.Table.from_batches([batch]), str(path))
+            else:
+                with pa.OSFile(str(path), "wb") as sink, ipc.new_stream(sink, schema) as writer:
+                    writer.write_batch(batch)
+        self.parts.append(path)
+        return path
+
+
+class ResultStore:
+    """Streams pair and image rows for one run; use as a context manager."""
+
+    def __init__(self, root: str, engine: str = "", config: Optional[Dict[str, Any]] = None,
+                 run_id: Optional[str] = None, fmt: Optional[str] = None, flush_every: int = 1000):
+        if fmt is None:
+            fmt = "parquet" if pa else "jsonl"
+        if fmt not in _EXT:
+            raise ValueError(f"Unknown store format '{fmt}' (choose from {', '.join(_EXT)})")
+        if fmt != "jsonl" and not pa:
+            logger.warning("pyarrow not installed – writing JSON lines instead of %s", fmt)
+            fmt = "jsonl"
+        self.root = Path(root)
+        self.fmt = fmt
+        self.engine = engine
+        self.config = config or {}
+        self.config_hash = config_hash(self.config)
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {t: [] for t in TABLES}
+        self._writers: Dict[str, _TableWriter] = {}
+        self._listing_parts: Dict[str, Dict[str, List[Path]]] = {t: {} for t in TABLES}
+        for table, cols in TABLES.items():
+            (self.root / table).mkdir(parents=True, exist_ok=True)
+            self._writers[table] = _TableWriter(self.root / table, self.run_id, cols, fmt)
+        (self.root / "runs").mkdir(parents=True, exist_ok=True)
+        (self.root / "runs" / f"{self.run_id}.json").write_text(json.dumps(
+            {"run_id": self.run_id, "engine": engine, "config_hash": self.config_hash,
+             "config": self.config, "format": fmt, "started": time.time()}, indent=2, default=str),
+            encoding="utf-8")
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _row(self, table: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        row = {"run_id": self.run_id, "engine": self.engine,
+               "config_hash": self.config_hash, "ts": time.time()}
+        for name, t in TABLES[table]:
+            if name in row:
+                continue
+            v = values.get(name)
+            if v is None:
+                v = _DEFAULTS[t]
+            row[name] = {"str": str, "float": float, "int": int, "bool": bool}[t](v)
+        return row
+
+    def _write(self, table: str) -> None:
+        """Under the lock: flush one table's buffer and index its part by listing."""
+        buf = self._buffers[table]
+        path = self._writers[table].write(buf)
+        if path is not None:
+            for listing in dict.fromkeys(r["listing"] for r in buf):
+                self._listing_parts[table].setdefault(listing, []).append(path)
+        self._buffers[table] = []
+
+    def _append(self, table: str, row: Dict[str, Any]) -> None:
+        with self._lock:
+            self._buffers[table].append(row)
+            if len(self._buffers[table]) >= self.flush_every:
+                self._write(table)
+
+    def add_pair(self, **values: Any) -> None:
+        if not values.get("exit_stage"):
+            values["exit_stage"] = infer_exit_stage(values.get("drop_reason") or "")
+        self._append("pairs", self._row("pairs", values))
+
+    def add_image(self, **values: Any) -> None:
+        self._append("images", self._row("images", values))
+
+    def add_listing_images(self, listing: str, paths: Sequence[str],
+                           metric_store: Dict[str, Dict[str, Any]]) -> None:
+        """Summaries for every path of a listing that has Phase 1 features."""
+        for pos, p in enumerate(paths):
+            if p in metric_store:
+                self.add_image(listing=listing, position=pos, **image_summary(metric_store[p]))
+
+    def flush(self) -> None:
+        with self._lock:
+            for table in self._buffers:
+                self._write(table)
+
+    def pairs(self, columns: Optional[List[str]] = None, **filters: Any) -> Dict[str, np.ndarray]:
+        """
+        This run's pair rows so far (flushes first); filters as in read_table.
+        With a `listing` filter only the parts holding that listing are read.
+        """
+        self.flush()
+        with self._lock:
+            if "listing" in filters:
+                paths = list(self._listing_parts["pairs"].get(filters["listing"], []))
+            else:
+                paths = list(self._writers["pairs"].parts)
+        return _read_columns(paths, "pairs", columns, dict(filters, run_id=self.run_id))
+
+    def close(self) -> None:
+        self.flush()
+
+
+# ─── readers ──────────────────────────────────────────────────────────────────
+def _read_file(path: Path, columns: List[str]) -> Dict[str, list]:
+    if path.suffix == ".jsonl":
+        out: Dict[str, list] = {c: [] for c in columns}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    r = json.loads(line)
+                    for c in columns:
+                        out[c].append(r.get(c))
+        return out
+    if path.suffix == ".parquet":
+        table = pq.read_table(str(path), columns=columns)
+    else:
+        with pa.OSFile(str(path), "rb") as src:
+            reader = ipc.open_stream(src)
+            batches = []
+            try:
+                for b in reader:
+                    batches.append(b)
+            except pa.ArrowInvalid:
+                pass          # truncated stream: keep the complete batches
+            table = pa.Table.from_batches(batches, schema=reader.schema).select(columns)
+    return {c: table.column(c).to_pylist() for c in columns}
+
+
+def read_table(root: str, table: str = "pairs", columns: Optional[List[str]] = None,
+               **filters: Any) -> Dict[str, np.ndarray]:
+    """
+    All rows of `table` under `root` as numpy columns.
+
+    Keyword filters are equality tests on string columns, e.g.
+    read_table(root, "pairs", engine="dedup_fixed_drift", run_id="…").
+    """
+    pattern = f"{filters['run_id']}.*" if "run_id" in filters else "*"
+    paths = [p for p in sorted((Path(root) / table).glob(pattern)) if p.suffix in _EXT.values()]
+    return _read_columns(paths, table, columns, filters)
+
+
+def _read_columns(paths: Sequence[Path], table: str, columns: Optional[List[str]],
+                  filters: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    spec = dict(TABLES[table])
+    columns = columns or list(spec)
+    need = list(dict.fromkeys(columns + list(filters)))
+    merged: Dict[str, list] = {c: [] for c in need}
+    for path in paths:
+        part = _read_file(path, need)
+        for c in need:
+            merged[c].extend(part[c])
+    cols = {c: np.array(merged[c], dtype=_NP_TYPES[spec[c]]) for c in need}
+    if filters:
+        mask = np.ones(len(next(iter(cols.values()))) if cols else 0, bool)
+        for k, v in filters.items():
+            mask &= cols[k] == v
+        cols = {c: a[mask] for c, a in cols.items()}
+    return {c: cols[c] for c in columns}
+
+
+def iter_rows(cols: Dict[str, np.ndarray]) -> Iterable[Dict[str, Any]]:
+    names = list(cols)
+    for i in range(len(cols[names[0]]) if names else 0):
+        yield {n: cols[n][i] for n in names}
+
+
+def stored_comparisons(store: ResultStore, listing: str) -> List[Dict[str, Any]]:
+    """ExperimentLogger.comparison_results-style rows of one listing, read back from `store`."""
+    return [{"img_a": Path(r["path_a"]).stem, "img_b": Path(r["path_b"]).stem,
+             "mtb": float(r["mtb"]), "edge": float(r["edge"]), "ssim": float(r["ssim"]),
+             "clip": float(r["clip"]), "pdq_hd": int(r["pdq_hd"]), "sift_matches": int(r["sift"]),
+             "score": float(r["score"]), "dropped": bool(r["decision"]), "drop_reason": r["drop_reason"],
+             "exit_stage": r["exit_stage"], "timing_ms": float(r["timing_ms"])}
+            for r in iter_rows(store.pairs(listing=listing))]
+
+
+def render_markdown(root: str, listing: str, run_id: Optional[str] = None) -> str:
+    """Comparison table of one listing (latest run unless run_id is given)."""
+    cols = read_table(root, "pairs", listing=listing)
+    if run_id is None and len(cols["run_id"]):
+        run_id = sorted(set(cols["run_id"]))[-1]
+    sel = cols["run_id"] == run_id
+    rows = list(iter_rows({c: a[sel] for c, a in cols.items()}))
+    engine = rows[0]["engine"] if rows else ""
+    cfg = rows[0]["config_hash"] if rows else ""
+    md = [f"# {Path(listing).name}", "",
+          f"**Run:** {run_id}  **Engine:** {engine}  **Config:** {cfg}", "",
+          f"- **Comparisons:** {len(rows)}",
+          f"- **Dropped:** {sum(1 for r in rows if r['decision'])}", "",
+          "| Image A | Image B | MTB % | Edge % | SSIM % | CLIP % | PDQ HD | SIFT | SCORE | Exit | ms | Dropped? |",
+          "|---------|---------|-------|--------|--------|--------|--------|------|-------|------|----|----------|"]
+    for r in rows:
+        dropped = "✅ Yes" if r["decision"] else f"❌ No ({r['drop_reason']})" if r["drop_reason"] else "❌ No"
+        md.append(f"| {Path(r['path_a']).stem} | {Path(r['path_b']).stem} | {r['mtb']:.1f} | {r['edge']:.1f} | "
+                  f"{r['ssim']:.1f} | {r['clip']:.1f} | {r['pdq_hd']} | {r['sift']} | {r['score']:.2f} | "
+                  f"{r['exit_stage']} | {r['timing_ms']:.1f} | {dropped} |")
+    return "\n".join(md) + "\n"
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Inspect a dedup result store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_sum = sub.add_parser("summary", help="Pairs / drops / exit stages per run")
+    p_sum.add_argument("root")
+    p_md = sub.add_parser("render", help="Render one listing as markdown")
+    p_md.add_argument("root")
+    p_md.add_argument("listing")
+    p_md.add_argument("--run-id", default=None)
+    p_md.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    if args.cmd == "render":
+        md = render_markdown(args.root, args.listing, args.run_id)
+        if args.output:
+            Path(args.output).write_text(md, encoding="utf-8")
+        print(md)
+        return
+
+    cols = read_table(args.root, "pairs", ["run_id", "engine", "config_hash", "listing",
+                                           "decision", "exit_stage", "timing_ms"])
+    print("| Run | Engine | Config | Listings | Pairs | Dropped | Mean ms/pair | Exit stages |")
+    print("|-----|--------|--------|----------|-------|---------|--------------|-------------|")
+    for run in sorted(set(cols["run_id"])):
+        m = cols["run_id"] == run
+        stages, counts = np.unique(cols["exit_stage"][m].astype(str), return_counts=True)
+        print(f"| {run} | {cols['engine'][m][0]} | {cols['config_hash'][m][0]} | "
+              f"{len(set(cols['listing'][m]))} | {int(m.sum())} | {int(cols['decision'][m].sum())} | "
+              f"{np.nanmean(cols['timing_ms'][m]):.1f} | "
+              + ", ".join(f"{s}:{c}" for s, c in zip(stages, counts)) + " |")
+
+
+if __name__ == "__main__":
+    main()
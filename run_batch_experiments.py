@@ -5,6 +5,10 @@ run_batch_experiments.py
 
 Batch runner for testing all weight combinations (1,001 total) with metric caching.
 Generates CSV summary + selective markdown files for analysis.
+
+Pair metrics are computed once into a PairMetricMatrix and every weight
+combination is scored in one matrix multiply, so finer grids (--steps 20 →
+10,626 combos at 5%) cost milliseconds; only the CSV/markdown I/O is per row.
 """
 
 import sys
@@ -17,18 +21,26 @@ from typing import List, Dict, Any
 # Import from deduplication module
 import deduplication as dedupe
 from generate_weight_combinations import generate_weights
+from pair_metric_matrix import PairMetricMatrix, policy_from_engine, weights_to_matrix
+
+# Pair 1 (Nancy Peppin) and Pair 3 (Scott Wall) are the known duplicates;
+# Pair 2 (cross-property) is not
+KNOWN_DUPLICATE_PAIRS = (0, 2)
+KNOWN_DISTINCT_PAIRS = (1,)
 
 
 class BatchExperimentRunner:
     """Run batch experiments with different weight combinations"""
 
-    def __init__(self, output_dir='batch_results', test_limit=None):
+    def __init__(self, output_dir='batch_results', test_limit=None, steps=10, metrics_cache=None):
         """
         Initialize batch runner.
 
         Args:
             output_dir: Directory for output files
             test_limit: If set, only run first N experiments (for testing)
+            steps: Weight grid resolution (10 → 10% steps, 20 → 5% steps)
+            metrics_cache: Optional .npz path to load/save the pair-metric matrix
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
@@ -37,12 +49,16 @@ class BatchExperimentRunner:
 
         self.csv_path = self.output_dir / 'weight_experiments_summary.csv'
         self.test_limit = test_limit
+        self.steps = steps
+        self.metrics_cache = Path(metrics_cache) if metrics_cache else None
 
         # Image paths (hardcoded from deduplication.py)
         self.image_groups = []
 
         # Cached metrics (computed once, reused for all experiments)
         self.cached_metrics = {}
+        self.matrix = None
+        self.total_experiments = 1001
 
         # CSV fieldnames
         self.csv_fieldnames = [
@@ -83,7 +99,12 @@ class BatchExperimentRunner:
         print(f"Loaded {len(self.image_groups)} image groups")
 
     def precompute_metrics(self):
-        """Precompute Phase 1 metrics (MTB, SSIM, CLIP, PDQ) for all images"""
+        """Precompute Phase 1 metrics (MTB, SSIM, CLIP, PDQ) and the pair-metric matrix"""
+        if self.metrics_cache and self.metrics_cache.exists():
+            self.matrix = PairMetricMatrix.load(str(self.metrics_cache))
+            print(f"\n[PRECOMPUTE] Loaded {len(self.matrix)} cached pairs from {self.metrics_cache}\n")
+            return
+
         print("\n[PRECOMPUTE] Computing metrics for all images...")
         mids = [g[len(g)//2] for g in self.image_groups]
 
@@ -98,95 +119,28 @@ class BatchExperimentRunner:
                 dedupe._metric_store[m["path"]] = m  # Also populate global store
                 print(f"  - Cached metrics for {Path(m['path']).name}")
 
-        print(f"[PRECOMPUTE] Cached metrics for {len(self.cached_metrics)} images\n")
-
-    def run_single_experiment(self, exp_id: int, weights: Dict[str, float]) -> Dict[str, Any]:
-        """
-        Run one experiment with given weights.
-
-        Args:
-            exp_id: Experiment ID (1-indexed)
-            weights: Dict with keys 'mtb', 'ssim', 'clip', 'pdq', 'sift'
-
-        Returns:
-            Dict with experiment results
-        """
-        # Set weights globally
-        dedupe.set_weights(
-            mtb=weights['mtb'],
-            ssim=weights['ssim'],
-            clip=weights['clip'],
-            pdq=weights['pdq'],
-            sift=weights['sift']
-        )
-
-        # Run deduplication (metrics already cached in _metric_store)
-        # Note: We're not using ExperimentLogger here to avoid overhead
-        # We'll manually collect results
-
-        mids = [g[len(g)//2] for g in self.image_groups]
-
-        # Compute pair similarities (SIFT is computed on-demand)
-        pairs_results = []
-
-        # Pairs: (0,1), (1,2), (2,3) - sequential pairs
-        pair_indices = [(i, i+1) for i in range(len(self.image_groups)-1)]
-
-        for i, j in pair_indices:
-            mtb, edge, hd, ssim, clip, sift_matches = dedupe._pair_sim(mids[i], mids[j])
-
-            # Compute score using current weights
-            w_mtb = dedupe.WEIGHT_MTB
-            w_ssim = dedupe.WEIGHT_SSIM
-            w_clip = dedupe.WEIGHT_CLIP
-            w_pdq = dedupe.WEIGHT_PDQ
-            w_sift = dedupe.WEIGHT_SIFT
-
-            mtb_floor = dedupe.MTB_HARD_FLOOR
-            pdq_ceil = dedupe.PDQ_HD_CEIL
-
-            sift_score = min(sift_matches / 100.0, 1.0) if sift_matches > 0 else 0.0
-
-            score = (
-                w_mtb  * (mtb  / 100.0) +
-                w_ssim * (ssim / 100.0) +
-                w_clip * (clip / 100.0) +
-                w_pdq  * (0.0 if hd >= pdq_ceil else 1.0 - hd / pdq_ceil) +
-                w_sift * sift_score
-            )
-
-            # Decision logic (no SIFT override since it's disabled)
-            dup_threshold = dedupe.COMPOSITE_DUP_THRESHOLD
-
-            dropped = False
-            if score >= dup_threshold and mtb >= mtb_floor and hd < pdq_ceil:
-                dropped = True
-
-            pairs_results.append({
-                'mtb': mtb,
-                'ssim': ssim,
-                'clip': clip,
-                'pdq': hd,  # Store Hamming distance
-                'sift': sift_matches,
-                'score': score,
-                'dropped': dropped
-            })
-
-        # Calculate summary stats
-        duplicates_removed = sum(1 for p in pairs_results if p['dropped'])
-
+        print(f"[PRECOMPUTE] Cached metrics for {len(self.cached_metrics)} images")
+
+        # Pair metrics (incl. SIFT) once; no metadata, so no aerial policy, as before
+        n_pairs = len(mids) - 1
+        labels = [1 if i in KNOWN_DUPLICATE_PAIRS else 0 if i in KNOWN_DISTINCT_PAIRS else -1
+                  for i in range(n_pairs)]
+        self.matrix = PairMetricMatrix.from_engine(dedupe, mids, labels=labels)
+        self.matrix.aerial[:] = False
+        if self.metrics_cache:
+            self.matrix.save(str(self.metrics_cache))
+        print(f"[PRECOMPUTE] Pair-metric matrix: {len(self.matrix)} pairs\n")
+
+    def evaluate(self, weights_list: List[Dict[str, float]]) -> Dict[str, Any]:
+        """Score every weight combination at once (no SIFT override, as before)"""
+        return self.matrix.evaluate(weights_to_matrix(weights_list), policy_from_engine(dedupe),
+                                    sift_override=False)
+
+    def _result_row(self, exp_id: int, weights: Dict[str, float],
+                    res: Dict[str, Any], k: int) -> Dict[str, Any]:
+        """Build the CSV/markdown row for combination k of an evaluate() result"""
         # Accuracy: We know pairs 0 and 2 are duplicates (2 total)
         # 100% = 2/2, 50% = 1/2, 0% = 0/2
-        # Pair 0 (index 0,1) and Pair 2 (index 2,3) should be dropped
-        correct_drops = 0
-        if len(pairs_results) >= 1 and pairs_results[0]['dropped']:  # Pair 1 (Nancy Peppin)
-            correct_drops += 1
-        if len(pairs_results) >= 3 and pairs_results[2]['dropped']:  # Pair 3 (Scott Wall)
-            correct_drops += 1
-
-        accuracy_pct = (correct_drops / 2.0) * 100.0
-
-        # Build result dict
         result = {
             'exp_id': exp_id,
             'w_mtb': weights['mtb'],
@@ -194,23 +148,37 @@ class BatchExperimentRunner:
             'w_clip': weights['clip'],
             'w_pdq': weights['pdq'],
             'w_sift': weights['sift'],
-            'duplicates_removed': duplicates_removed,
-            'accuracy_pct': accuracy_pct
+            'duplicates_removed': int(res['dropped'][k]),
+            'accuracy_pct': int(res['correct_drops'][k]) / len(KNOWN_DUPLICATE_PAIRS) * 100.0
         }
 
-        # Add pair-specific results
-        for i, p in enumerate(pairs_results, 1):
-            result[f'pair{i}_mtb'] = p['mtb']
-            result[f'pair{i}_ssim'] = p['ssim']
-            result[f'pair{i}_clip'] = p['clip']
-            result[f'pair{i}_pdq'] = p['pdq']  # Store as pdq for CSV
-            result[f'pair{i}_pdq_hd'] = p['pdq']  # Also store with _hd suffix
-            result[f'pair{i}_sift'] = p['sift']
-            result[f'pair{i}_score'] = p['score']
-            result[f'pair{i}_dropped'] = p['dropped']
+        m = self.matrix
+        for i in range(len(m)):
+            hd = int(m.column('pdq_hd')[i])
+            result[f'pair{i+1}_mtb'] = m.column('mtb')[i]
+            result[f'pair{i+1}_ssim'] = m.column('ssim')[i]
+            result[f'pair{i+1}_clip'] = m.column('clip')[i]
+            result[f'pair{i+1}_pdq'] = hd  # Store as pdq for CSV
+            result[f'pair{i+1}_pdq_hd'] = hd  # Also store with _hd suffix
+            result[f'pair{i+1}_sift'] = int(m.column('sift')[i])
+            result[f'pair{i+1}_score'] = float(res['scores'][k, i])
+            result[f'pair{i+1}_dropped'] = bool(res['decisions'][k, i])
 
         return result
 
+    def run_single_experiment(self, exp_id: int, weights: Dict[str, float]) -> Dict[str, Any]:
+        """
+        Run one experiment with given weights.
+
+        Args:
+            exp_id: Experiment ID (1-indexed)
+            weights: Dict with keys 'mtb', 'ssim', 'clip', 'pdq', 'sift'
+
+        Returns:
+            Dict with experiment results
+        """
+        return self._result_row(exp_id, weights, self.evaluate([weights]), 0)
+
     def write_csv_header(self):
         """Initialize CSV file with header"""
         with open(self.csv_path, 'w', newline='', encoding='utf-8') as f:
@@ -231,7 +199,7 @@ class BatchExperimentRunner:
         # - Every 100th experiment
         # - Experiments with interesting accuracy (50% or 100%)
 
-        total_experiments = self.test_limit or 1001
+        total_experiments = self.test_limit or self.total_experiments
 
         if exp_id <= 10:
             return True
@@ -292,7 +260,8 @@ class BatchExperimentRunner:
 
     def run_all_experiments(self):
         """Main batch loop"""
-        weights_list = generate_weights()
+        weights_list = generate_weights(steps=self.steps)
+        self.total_experiments = len(weights_list)
 
         if self.test_limit:
             weights_list = weights_list[:self.test_limit]
@@ -307,39 +276,34 @@ class BatchExperimentRunner:
         # Track timing
         start_time = time.time()
 
-        # Main loop
-        for i, weights in enumerate(weights_list, 1):
-            exp_start = time.time()
-
-            print(f"\n[{i}/{total}] Experiment {i}")
-            print(f"  Weights: MTB={weights['mtb']:.1f}, SSIM={weights['ssim']:.1f}, "
-                  f"CLIP={weights['clip']:.1f}, PDQ={weights['pdq']:.1f}, SIFT={weights['sift']:.1f}")
-
-            # Run experiment
-            result = self.run_single_experiment(i, weights)
+        # Score all combinations in one pass
+        res = self.evaluate(weights_list)
+        score_elapsed = time.time() - start_time
+        print(f"[SCORE] {total} combinations x {len(self.matrix)} pairs scored in {score_elapsed*1000:.1f} ms")
 
-            # Write to CSV
-            self.append_to_csv(result)
-
-            # Optionally write markdown
-            if self.should_write_markdown(i, result):
-                self.write_markdown(i, weights, result)
-                print(f"  [MD] Written to exp_weights_{i:04d}.md")
+        # Write results
+        md_written = 0
+        with open(self.csv_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.csv_fieldnames)
+            for i, weights in enumerate(weights_list, 1):
+                result = self._result_row(i, weights, res, i - 1)
+                writer.writerow(result)
 
-            exp_elapsed = time.time() - exp_start
-            total_elapsed = time.time() - start_time
+                # Optionally write markdown
+                if self.should_write_markdown(i, result):
+                    self.write_markdown(i, weights, result)
+                    md_written += 1
 
-            # Progress update
-            avg_time = total_elapsed / i
-            remaining = (total - i) * avg_time
-            print(f"  Result: {result['duplicates_removed']} duplicates, "
-                  f"{result['accuracy_pct']:.0f}% accuracy")
-            print(f"  Time: {exp_elapsed:.1f}s (avg: {avg_time:.1f}s, est. remaining: {remaining/60:.1f}min)")
+                if i % 1000 == 0 or i == total:
+                    print(f"  [{i}/{total}] written ({md_written} markdown files)")
 
         # Final summary
         total_elapsed = time.time() - start_time
+        best = int(res['correct_drops'].max()) if total else 0
         print(f"\n{'='*60}")
-        print(f"[COMPLETE] All {total} experiments finished in {total_elapsed/60:.1f} minutes")
+        print(f"[COMPLETE] All {total} experiments finished in {total_elapsed:.1f} seconds")
+        print(f"[BEST] {best}/{len(KNOWN_DUPLICATE_PAIRS)} known duplicates caught by "
+              f"{int((res['correct_drops'] == best).sum())} combinations")
         print(f"[CSV] Results saved to: {self.csv_path}")
         print(f"[MD]  Markdown files in: {self.experiments_dir}/")
         print(f"{'='*60}\n")
@@ -354,6 +318,10 @@ def main():
                         help="Test mode: only run first N experiments (e.g., --test 10)")
     parser.add_argument("--output-dir", type=str, default="batch_results",
                         help="Output directory for results")
+    parser.add_argument("--steps", type=int, default=10,
+                        help="Weight grid steps (10 = 10%% increments/1,001 combos, 20 = 5%%/10,626)")
+    parser.add_argument("--metrics-cache", type=str, default=None,
+                        help="Load/save the pair-metric matrix (.npz) to skip recomputation")
 
     args = parser.parse_args()
 
@@ -362,7 +330,8 @@ def main():
     print("="*60)
 
     # Create runner
-    runner = BatchExperimentRunner(output_dir=args.output_dir, test_limit=args.test)
+    runner = BatchExperimentRunner(output_dir=args.output_dir, test_limit=args.test,
+                                   steps=args.steps, metrics_cache=args.metrics_cache)
 
     # Load images
     runner.load_images()
@@ -19,6 +19,10 @@ from collections import defaultdict
 
 import numpy as np
 
+from bounded_cache import engine_caches, release_paths
+from profiling import add_profile_arguments, profiler_from_args
+from s3_headers import load_header_metadata
+
 try:
     from PIL import Image, ImageDraw, ImageFont
     PIL_AVAILABLE = True
@@ -64,7 +68,8 @@ def find_images_in_folder(folder_path: Path) -> List[Path]:
     return sorted(images)
 
 
-def process_folder(folder_num: int, folder_path: Path, full_scan: bool = False) -> Dict[str, Any]:
+def process_folder(folder_num: int, folder_path: Path, full_scan: bool = False,
+                   store=None, shard_root: Optional[str] = None, profiler=None) -> Dict[str, Any]:
     """
     Process a single folder through deduplication.
     
@@ -72,6 +77,12 @@ def process_folder(folder_num: int, folder_path: Path, full_scan: bool = False)
         folder_num: Folder number (1-10)
         folder_path: Path to the folder
         full_scan: Whether to do full scan (all pairs) or just adjacent pairs
+        store: Optional result_store.ResultStore receiving pair and image rows;
+            the returned comparisons (and so every report) are then read back
+            from it
+        shard_root: Optional directory of memory-mapped feature shards; the
+            folder's shard is reused (or built once) instead of running Phase 1
+        profiler: Optional profiling.ListingProfiler for this folder's phases
         
     Returns:
         Dictionary with results and statistics
@@ -118,26 +129,42 @@ def process_folder(folder_num: int, folder_path: Path, full_scan: bool = False)
     exp_logger = ExperimentLogger()
     exp_logger.start_capture()
     exp_logger.input_count = len(groups)
+    exp_logger.result_store = store
+    exp_logger.listing = str(folder_path)
     
     # Set global experiment logger in deduplication module
     dedupe._experiment_logger = exp_logger
     
     # Run deduplication
     try:
+        shard = None
+        if shard_root:
+            from feature_shards import ensure_shard
+            shard = ensure_shard(dedupe, [g[0] for g in groups], shard_root, listing=str(folder_num))
         filtered_groups = remove_near_duplicates(
             groups,
             deduplication_flag=1,
-            metadata_dict={},
-            full_scan=full_scan
+            metadata_dict=load_header_metadata(folder_path),
+            full_scan=full_scan,
+            pair_metrics=shard.pair_sim if shard is not None else None,
+            profiler=profiler or False
         )
         
         exp_logger.output_count = len(filtered_groups)
         terminal_output = exp_logger.stop_capture()
+        if store is not None:
+            store.add_listing_images(str(folder_path), [g[0] for g in groups],
+                                     shard if shard is not None else dedupe._metric_store)
         
         # Extract results
         input_images = [img[0] for img in groups]
         output_images = [img[0] for img in filtered_groups]
         dropped_images = [img for img in input_images if img not in output_images]
+        if store is not None:
+            from result_store import stored_comparisons
+            comparisons = stored_comparisons(store, str(folder_path))
+        else:
+            comparisons = exp_logger.comparison_results
         
         return {
             'folder_num': folder_num,
@@ -145,7 +172,7 @@ def process_folder(folder_num: int, folder_path: Path, full_scan: bool = False)
             'input_count': len(groups),
             'output_count': len(filtered_groups),
             'duplicates_removed': len(dropped_images),
-            'comparisons': exp_logger.comparison_results,
+            'comparisons': comparisons,
             'dropped_images': dropped_images,
             'kept_images': output_images,
             'terminal_output': terminal_output,
@@ -166,6 +193,8 @@ def process_folder(folder_num: int, folder_path: Path, full_scan: bool = False)
         }
     finally:
         dedupe._experiment_logger = None
+        # listing finished: free its images, features and pair metrics
+        release_paths([g[0] for g in groups], *engine_caches(dedupe))
 
 
 def create_image_thumbnail(img_path: str, output_dir: Path, size: int = 200) -> Optional[str]:
@@ -638,15 +667,43 @@ def main():
                         help="Generate separate markdown file for each folder")
     parser.add_argument("--full-scan", action="store_true",
                         help="Use full scan mode (compare all pairs, not just adjacent)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print per-module import cost and deferred-import timings")
+    parser.add_argument("--store", type=str, default=None,
+                        help="Also stream pair/image rows to this result-store directory")
+    parser.add_argument("--store-format", type=str, default=None, choices=["parquet", "arrow", "jsonl"],
+                        help="Result-store format (default: parquet, or jsonl without pyarrow)")
+    parser.add_argument("--shards", type=str, default=None,
+                        help="Reuse/build memory-mapped feature shards in this directory")
+    parser.add_argument("--metrics-out", type=str, default=None, metavar="PREFIX",
+                        help="Record stage timers/counters; write PREFIX.prom and PREFIX.json at the end")
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    if args.metrics_out:
+        import telemetry
+        telemetry.enable()
+
+    if args.profile_startup:
+        from lazy_imports import startup_report
+        logger.info("\n" + startup_report("run_test_eval"))
     
     # Get current directory
     base_dir = Path.cwd()
     output_dir = Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
+    store = None
+    if args.store:
+        from result_store import ResultStore, engine_config
+        store = ResultStore(args.store, engine="dedup_fixed_drift", config=engine_config(dedupe),
+                            fmt=args.store_format)
+        logger.info(f"Streaming results to {args.store} (run {store.run_id}, config {store.config_hash})")
+
+    profiler = profiler_from_args(args)
+
     # Process each folder
     results = []
+    report_path = None
     for folder_num in args.folders:
         folder_path = base_dir / str(folder_num)
         
@@ -665,7 +722,10 @@ def main():
             })
             continue
         
-        result = process_folder(folder_num, folder_path, full_scan=args.full_scan)
+        if profiler:
+            profiler.listing = str(folder_num)
+        result = process_folder(folder_num, folder_path, full_scan=args.full_scan, store=store,
+                                shard_root=args.shards, profiler=profiler)
         results.append(result)
         
         # Generate and save per-folder report immediately if requested
@@ -673,9 +733,16 @@ def main():
             report_path = generate_folder_markdown(result, output_dir)
             logger.info(f"✅ Folder {folder_num} report saved immediately: {report_path}")
     
+    if store is not None:
+        store.close()
+
     # Generate aggregate report
     if not args.per_folder or len(results) > 1:
         generate_markdown_report(results, output_file=args.output)
+        if profiler:
+            profiler.append_report(args.output)
+    elif profiler and report_path:
+        profiler.append_report(report_path)
     
     logger.info(f"\n{'='*70}")
     logger.info("Test evaluation complete!")
@@ -684,6 +751,15 @@ def main():
     logger.info(f"Aggregate report saved to: {args.output}")
     logger.info(f"{'='*70}\n")
 
+    if args.profile_startup:
+        from lazy_imports import lazy_import_times
+        for name, secs in sorted(lazy_import_times().items(), key=lambda kv: kv[1], reverse=True):
+            logger.info(f"  deferred import {name:<24}{secs * 1000:>10.1f} ms")
+
+    if args.metrics_out:
+        from telemetry import write_report
+        write_report(args.metrics_out)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+s3_headers.py – header-first planning from ranged GETs
+
+A listing's `metadata_dict` (camera make/model for `_is_aerial`, capture time)
+and a rough look at every frame are all inside the first few KB of each JPEG:
+the APP1/EXIF segment holds IFD0 (Make, Model), the Exif IFD
+(DateTimeOriginal) and IFD1 (the embedded ~160×120 JPEG thumbnail), and APP1
+is capped at 64 KB.  This module
+
+    fetch_headers()   issues ranged GETs (`bytes=0-65535`) for every object in
+                      parallel through an s3_store client
+    parse_exif()      reads make / model / capture time / thumbnail from those
+                      bytes (pure Python; a truncated header yields what it has)
+    plan_listing()    builds the listing's metadata_dict and a conservative
+                      thumbnail prefilter: a frame is skipped only if it was
+                      captured within `max_gap_s` of the last kept frame AND
+                      its thumbnail dHash is within `max_hash_distance` bits
+                      (bracketed / burst repeats).  Frames without a
+                      timestamp or thumbnail always survive
+
+Only survivors are then fetched in full.  The plan (metadata keyed by file
+name, kept and skipped frames) is written next to the listing as
+header_plan.json; `load_header_metadata()` turns it back into a
+metadata_dict for the engines.
+
+Usage:
+    headers = fetch_headers(store, objects, workers=64)
+    plan = plan_listing(objects, headers)
+    survivors = [o for o in objects if o.key in plan.keep]
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from lazy_imports import lazy_module
+from s3_store import ObjectInfo, with_retry
+
+cv2 = lazy_module("cv2")
+np = lazy_module("numpy")
+
+logger = logging.getLogger(__name__)
+
+HEADER_BYTES = 64 * 1024
+PLAN_FILE = "header_plan.json"
+
+_TAG_MAKE, _TAG_MODEL, _TAG_DATETIME = 0x010F, 0x0110, 0x0132
+_TAG_EXIF_IFD, _TAG_DATETIME_ORIGINAL = 0x8769, 0x9003
+_TAG_THUMB_OFFSET, _TAG_THUMB_LENGTH = 0x0201, 0x0202
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+
+# ─── EXIF parsing ─────────────────────────────────────────────────────────────
+def _exif_tiff(data: bytes) -> Optional[bytes]:
+    """TIFF block of the APP1/Exif segment of a JPEG header, if present."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker in (0xD9, 0xDA):                    # EOI / start of scan
+            return None
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker == 0xE1 and data[pos + 4:pos + 10] == b"Exif\x00\x00":
+            return data[pos + 10:pos + 2 + length]    # may be truncated
+        pos += 2 + length
+    return None
+
+
+def _read_ifd(tiff: bytes, offset: int, endian: str) -> Tuple[Dict[int, Any], int]:
+    """({tag: value}, next IFD offset) for ASCII, SHORT and LONG tags."""
+    entries: Dict[int, Any] = {}
+    if offset <= 0 or offset + 2 > len(tiff):
+        return entries, 0
+    count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+    for k in range(count):
+        e = offset + 2 + 12 * k
+        if e + 12 > len(tiff):
+            return entries, 0
+        tag, typ, n = struct.unpack(endian + "HHI", tiff[e:e + 8])
+        size = _TYPE_SIZES.get(typ, 1) * n
+        raw = tiff[e + 8:e + 12] if size <= 4 else None
+        if raw is None:
+            ptr = struct.unpack(endian + "I", tiff[e + 8:e + 12])[0]
+            raw = tiff[ptr:ptr + size] if ptr + size <= len(tiff) else None
+        if raw is None:
+            continue
+        if typ == 2:
+            entries[tag] = raw[:size].split(b"\x00", 1)[0].decode("latin-1").strip()
+        elif typ == 3:
+            entries[tag] = struct.unpack(endian + "H", raw[:2])[0]
+        elif typ == 4:
+            entries[tag] = struct.unpack(endian + "I", raw[:4])[0]
+    end = offset + 2 + 12 * count
+    nxt = struct.unpack(endian + "I", tiff[end:end + 4])[0] if end + 4 <= len(tiff) else 0
+    return entries, nxt
+
+
+def parse_exif(data: bytes) -> Dict[str, Any]:
+    """make, model, datetime (ISO string or ""), thumbnail (JPEG bytes or None)."""
+    out: Dict[str, Any] = {"make": "", "model": "", "datetime": "", "thumbnail": None}
+    tiff = _exif_tiff(data)
+    if not tiff or len(tiff) < 8 or tiff[:2] not in (b"II", b"MM"):
+        return out
+    endian = "<" if tiff[:2] == b"II" else ">"
+    ifd0, ifd1_offset = _read_ifd(tiff, struct.unpack(endian + "I", tiff[4:8])[0], endian)
+    exif, _ = _read_ifd(tiff, ifd0.get(_TAG_EXIF_IFD, 0), endian)
+    ifd1, _ = _read_ifd(tiff, ifd1_offset, endian)
+
+    out["make"] = ifd0.get(_TAG_MAKE, "")
+    out["model"] = ifd0.get(_TAG_MODEL, "")
+    stamp = exif.get(_TAG_DATETIME_ORIGINAL) or ifd0.get(_TAG_DATETIME, "")
+    try:
+        out["datetime"] = datetime.strptime(stamp, "%Y:%m:%d %H:%M:%S").isoformat() if stamp else ""
+    except ValueError:
+        out["datetime"] = ""
+    off, length = ifd1.get(_TAG_THUMB_OFFSET), ifd1.get(_TAG_THUMB_LENGTH)
+    if off and length and off + length <= len(tiff):
+        out["thumbnail"] = tiff[off:off + length]
+    return out
+
+
+def thumbnail_dhash(jpeg: Optional[bytes]) -> Optional[int]:
+    """64-bit difference hash of an embedded thumbnail (None if undecodable)."""
+    if not jpeg:
+        return None
+    img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+# ─── fetch ────────────────────────────────────────────────────────────────────
+def fetch_headers(store: Any, objects: Sequence[ObjectInfo], workers: int = 32,
+                  nbytes: int = HEADER_BYTES) -> Dict[str, Dict[str, Any]]:
+    """key → parse_exif() result (+ header_bytes), from parallel ranged GETs."""
+    def _one(obj: ObjectInfo) -> Tuple[str, Dict[str, Any]]:
+        try:
+            data = with_retry(store.get_bytes, obj.key, 0, min(nbytes, obj.size) - 1)
+        except Exception as e:
+            logger.warning("Header fetch failed for %s: %s", obj.key, e)
+            return obj.key, {"make": "", "model": "", "datetime": "", "thumbnail": None, "header_bytes": 0}
+        info = parse_exif(data)
+        info["header_bytes"] = len(data)
+        return obj.key, info
+
+    if not objects:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(objects)))) as pool:
+        return dict(pool.map(_one, [o for o in objects if o.size > 0]))
+
+
+# ─── plan ─────────────────────────────────────────────────────────────────────
+@dataclass
+class ListingPlan:
+    metadata: Dict[str, Dict[str, Any]] = field(default_factory=dict)   # file name → make/model/datetime
+    keep: List[str] = field(default_factory=list)                       # keys to fetch in full
+    skipped: List[Dict[str, Any]] = field(default_factory=list)         # key, like, gap_s, distance
+    header_bytes: int = 0
+
+    def save(self, folder: Path) -> Path:
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / PLAN_FILE
+        path.write_text(json.dumps(asdict(self), indent=1), encoding="utf-8")
+        return path
+
+
+def plan_listing(objects: Sequence[ObjectInfo], headers: Dict[str, Dict[str, Any]],
+                 max_gap_s: float = 2.0, max_hash_distance: int = 4,
+                 prefilter: bool = True) -> ListingPlan:
+    """metadata_dict entries for every object and the frames worth fetching in full."""
+    plan = ListingPlan()
+    last: Optional[Tuple[str, Optional[datetime], Optional[int]]] = None
+    for obj in objects:
+        h = headers.get(obj.key, {})
+        name = obj.key.rsplit("/", 1)[-1]
+        plan.metadata[name] = {"make": h.get("make", ""), "model": h.get("model", ""),
+                               "datetime": h.get("datetime", "")}
+        plan.header_bytes += h.get("header_bytes", 0)
+        when = datetime.fromisoformat(h["datetime"]) if h.get("datetime") else None
+        dh = thumbnail_dhash(h.get("thumbnail")) if prefilter else None
+
+        if prefilter and last is not None and None not in (when, dh, last[1], last[2]):
+            gap = abs((when - last[1]).total_seconds())
+            dist = bin(dh ^ last[2]).count("1")
+            if gap <= max_gap_s and dist <= max_hash_distance:
+                plan.skipped.append({"key": obj.key, "like": last[0], "gap_s": gap, "distance": dist})
+                continue
+        plan.keep.append(obj.key)
+        last = (obj.key, when, dh)
+    return plan
+
+
+def load_header_metadata(folder: Path) -> Dict[str, Dict[str, Any]]:
+    """metadata_dict keyed by resolved processed/ paths, from a saved plan (or {})."""
+    path = Path(folder) / PLAN_FILE
+    if not path.exists():
+        return {}
+    plan = json.loads(path.read_text(encoding="utf-8"))
+    processed = Path(folder) / "processed"
+    return {str((processed / name).resolve()): meta for name, meta in plan.get("metadata", {}).items()}
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+s3_store.py – pooled object-store client for listing downloads and streaming
+
+`download_s3_images.py` used to shell out to `aws s3 ls` / `aws s3 cp` once per
+folder.  This module gives every S3 consumer one small interface:
+
+    list_prefixes(prefix)          "folders" directly under prefix
+    list_objects(prefix)           ObjectInfo(key, size, etag) for every object
+    get_bytes(key, start, end)     whole object or an inclusive byte range
+    download(key, dest)            object → file (written to dest.part, renamed)
+
+Two implementations:
+
+    S3Store          boto3 client shared by all threads (boto3 clients are
+                     thread-safe) with a connection pool sized to the transfer
+                     concurrency; `endpoint_url` points it at moto / MinIO
+    DirectoryStore   a local directory laid out like the bucket; ETag is the
+                     MD5 of the content, as S3 reports for single-part uploads.
+                     Used as the test stand-in and for already-mirrored data
+
+`open_store("s3://bucket/prefix/")` or `open_store("/path/to/mirror")` picks
+one.  `with_retry()` retries transient failures with exponential backoff and
+jitter; missing keys and other 4xx errors fail immediately.
+
+Usage:
+    store, prefix = open_store("s3://image-upload-autohdr-j/")
+    for folder in store.list_prefixes(prefix):
+        for obj in store.list_objects(f"{prefix}{folder}/processed/"):
+            with_retry(store.download, obj.key, Path("images") / obj.key)
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install boto3                  # <-- only for s3:// URLs
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import random
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from lazy_imports import lazy_module
+
+boto3 = lazy_module("boto3")
+botocore_config = lazy_module("botocore.config")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 32
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.2                 # seconds; doubles per attempt
+_RETRYABLE_CODES = {"Throttling", "ThrottlingException", "SlowDown", "RequestTimeout",
+                    "RequestTimeTooSkewed", "InternalError", "ServiceUnavailable"}
+
+
+class ObjectInfo(NamedTuple):
+    key: str
+    size: int
+    etag: str
+
+
+# ─── retry ────────────────────────────────────────────────────────────────────
+def is_retryable(exc: BaseException) -> bool:
+    """Transient network / throttling / 5xx errors; not missing keys or other 4xx."""
+    if isinstance(exc, (FileNotFoundError, KeyError, PermissionError, ValueError)):
+        return False
+    response = getattr(exc, "response", None)       # botocore ClientError
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code", "")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in _RETRYABLE_CODES or status >= 500 or status == 429
+    return True
+
+
+def with_retry(fn: Callable[..., Any], *args: Any, attempts: int = RETRY_ATTEMPTS,
+               base_delay: float = RETRY_BASE_DELAY, **kwargs: Any) -> Any:
+    """fn(*args, **kwargs), retried with exponential backoff and full jitter."""
+    for attempt in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            delay = random.uniform(0, base_delay * (2 ** attempt))
+            logger.debug("Retrying %s after %s (attempt %d, %.2fs)",
+                         getattr(fn, "__name__", fn), e, attempt + 1, delay)
+            time.sleep(delay)
+
+
+def _write_atomic(dest: Path, chunks: Iterator[bytes]) -> int:
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    n = 0
+    try:
+        with open(part, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                n += len(chunk)
+    except BaseException:
+        part.unlink(missing_ok=True)                 # a retry starts clean; dest is untouched
+        raise
+    os.replace(part, dest)
+    return n
+
+
+# ─── S3 ───────────────────────────────────────────────────────────────────────
+class S3Store:
+    """One pooled boto3 client for a bucket."""
+
+    def __init__(self, bucket: str, pool_size: int = DEFAULT_POOL_SIZE,
+                 endpoint_url: Optional[str] = None, region_name: Optional[str] = None):
+        self.bucket = bucket
+        cfg = botocore_config.Config(max_pool_connections=pool_size,
+                                     retries={"max_attempts": 1, "mode": "standard"})
+        self.client = boto3.session.Session().client(
+            "s3", endpoint_url=endpoint_url or os.environ.get("S3_ENDPOINT_URL"),
+            region_name=region_name, config=cfg)
+
+    def list_prefixes(self, prefix: str = "") -> List[str]:
+        out: List[str] = []
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=prefix, Delimiter="/")
+        for page in pages:
+            out.extend(p["Prefix"][len(prefix):].rstrip("/") for p in page.get("CommonPrefixes", []))
+        return out
+
+    def list_objects(self, prefix: str) -> List[ObjectInfo]:
+        out: List[ObjectInfo] = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            out.extend(ObjectInfo(o["Key"], int(o["Size"]), o["ETag"].strip('"'))
+                       for o in page.get("Contents", []) if not o["Key"].endswith("/"))
+        return out
+
+    def get_bytes(self, key: str, start: Optional[int] = None, end: Optional[int] = None) -> bytes:
+        kwargs = {"Bucket": self.bucket, "Key": key}
+        if start is not None or end is not None:
+            kwargs["Range"] = f"bytes={start or 0}-{'' if end is None else end}"
+        try:
+            return self.client.get_object(**kwargs)["Body"].read()
+        except self.client.exceptions.NoSuchKey as e:
+            raise FileNotFoundError(key) from e
+
+    def download(self, key: str, dest: Path) -> int:
+        body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        return _write_atomic(Path(dest), iter(lambda: body.read(1 << 20), b""))
+
+
+# ─── local stand-in ───────────────────────────────────────────────────────────
+class DirectoryStore:
+    """A directory treated as a bucket (keys are relative POSIX paths)."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        if not self.root.is_dir():
+            raise FileNotFoundError(f"Store root does not exist: {root}")
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def list_prefixes(self, prefix: str = "") -> List[str]:
+        base = self._path(prefix)
+        return sorted(p.name for p in base.iterdir() if p.is_dir()) if base.is_dir() else []
+
+    def list_objects(self, prefix: str) -> List[ObjectInfo]:
+        base = self._path(prefix)
+        if not base.is_dir():
+            return []
+        out = []
+        for p in sorted(base.rglob("*")):
+            if p.is_file() and not p.name.endswith(".part"):
+                key = p.relative_to(self.root).as_posix()
+                out.append(ObjectInfo(key, p.stat().st_size, hashlib.md5(p.read_bytes()).hexdigest()))
+        return out
+
+    def get_bytes(self, key: str, start: Optional[int] = None, end: Optional[int] = None) -> bytes:
+        with open(self._path(key), "rb") as f:
+            if start is None and end is None:
+                return f.read()
+            f.seek(start or 0)
+            return f.read(-1 if end is None else end - (start or 0) + 1)
+
+    def download(self, key: str, dest: Path) -> int:
+        with open(self._path(key), "rb") as f:
+            return _write_atomic(Path(dest), iter(lambda: f.read(1 << 20), b""))
+
+
+# ─── factory ──────────────────────────────────────────────────────────────────
+def parse_s3_url(url: str) -> Tuple[str, str]:
+    """s3://bucket/some/prefix → ("bucket", "some/prefix/")"""
+    if not url.startswith("s3://"):
+        raise ValueError(f"Not an s3:// URL: {url}")
+    bucket, _, prefix = url[len("s3://"):].partition("/")
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    return bucket, prefix
+
+
+def open_store(url: str, pool_size: int = DEFAULT_POOL_SIZE,
+               endpoint_url: Optional[str] = None) -> Tuple[Any, str]:
+    """(store, key prefix) for an s3:// URL or a local directory (the stand-in)."""
+    if url.startswith("s3://"):
+        bucket, prefix = parse_s3_url(url)
+        return S3Store(bucket, pool_size=pool_size, endpoint_url=endpoint_url), prefix
+    return DirectoryStore(url[len("file://"):] if url.startswith("file://") else url), ""
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sharded_runner.py – coordinator / worker execution across machines
+
+The nightly archive re-evaluation covers more listings than one box can finish
+(batch_scheduler.py scales to the cores of one machine).  Here:
+
+    coordinator   packs listings into shards of roughly --shard-size images
+                  (largest listing first, onto the lightest shard), queues them
+                  in a batch_scheduler.JobQueue (the checkpoint), leases them
+                  to workers, requeues shards whose lease expires, and at the
+                  end writes results.jsonl plus the merged index fragments
+    worker        pulls a shard, runs every listing through a Deduplicator
+                  (drift-fix engine by default, warm across shards) and pushes
+                  a structured payload: per-listing kept / dropped / timings
+                  and an index fragment (paths, PDQ as uint64 words, CLIP as
+                  float16) for the cross-listing index
+    transport     pluggable; both speak claim / complete / fail:
+                    QueueClient   opens the coordinator's SQLite file directly
+                                  (one machine, or a shared filesystem)
+                    SocketClient  JSON lines over TCP to the coordinator's
+                                  CoordinatorServer (one request per connection)
+
+Workers read images at the paths the coordinator discovered, so nodes need the
+listing folders mounted at the same location.
+
+`simulate` runs a coordinator and N worker processes on localhost (either
+transport) – the single-machine stand-in for a multi-node run.
+
+Usage:
+    python sharded_runner.py coordinator --root images --serve 0.0.0.0:8765 --out nightly
+    python sharded_runner.py worker --connect coordinator-host:8765          # on each node
+    python sharded_runner.py worker --db nightly/queue.sqlite                # shared-FS transport
+    python sharded_runner.py simulate --root images --workers 3 --transport socket --out sim
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from batch_scheduler import JobQueue, discover_listings, listing_cost
+from bounded_cache import engine_caches, release_paths
+
+logger = logging.getLogger(__name__)
+
+KIND = "shard"
+DEFAULT_SHARD_IMAGES = 2000
+DEFAULT_LEASE_S = 1800.0
+MAX_ATTEMPTS = 3
+FRAGMENT_FILE = "index_fragments.npz"
+
+
+# ─── sharding ─────────────────────────────────────────────────────────────────
+def make_shards(listings: Sequence[Dict[str, Any]], shard_images: int = DEFAULT_SHARD_IMAGES,
+                full_scan: bool = False) -> List[List[Dict[str, Any]]]:
+    """Greedy LPT packing of listings into ⌈total / shard_images⌉ balanced shards."""
+    total = sum(l["images"] for l in listings)
+    n = max(1, -(-total // max(1, shard_images)))
+    shards: List[List[Dict[str, Any]]] = [[] for _ in range(min(n, max(1, len(listings))))]
+    load = [0.0] * len(shards)
+    for l in sorted(listings, key=lambda l: listing_cost(l["images"], full_scan), reverse=True):
+        k = min(range(len(shards)), key=load.__getitem__)
+        shards[k].append(l)
+        load[k] += listing_cost(l["images"], full_scan)
+    return [s for s in shards if s]
+
+
+def shard_id(shard: Sequence[Dict[str, Any]], shard_images: int, full_scan: bool) -> str:
+    """
+    Content id of a shard: its listings (with image counts) and the packing
+    config.  Rerunning the same plan resumes it; a different --shard-size,
+    --full-scan or listing set gets fresh ids instead of the stale payloads.
+    """
+    plan = {"listings": sorted([l["listing"], l["images"]] for l in shard),
+            "shard_images": shard_images, "full_scan": full_scan}
+    return "shard-" + hashlib.sha1(json.dumps(plan, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# ─── index fragments ──────────────────────────────────────────────────────────
+def index_fragment(listing: str, records: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """PDQ (uint64 words) and CLIP (float16) of one listing's Phase 1 records."""
+    n = len(records)
+    pdq = np.zeros((n, 4), np.uint64)
+    pdq_ok = np.zeros(n, bool)
+    dims = {r["clip"].shape[0] for r in records if r.get("clip") is not None}
+    dim = next(iter(dims)) if len(dims) == 1 else 0
+    clip = np.zeros((n, dim), np.float16)
+    clip_ok = np.zeros(n, bool)
+    for i, r in enumerate(records):
+        if r.get("pdq") is not None and r["pdq"].size == 256:
+            pdq[i] = np.packbits(r["pdq"].astype(np.uint8)).view(np.uint64)
+            pdq_ok[i] = True
+        if dim and r.get("clip") is not None:
+            clip[i] = r["clip"]
+            clip_ok[i] = True
+    return {"paths": np.array([r["path"] for r in records], dtype=str),
+            "listings": np.array([listing] * n, dtype=str),
+            "pdq": pdq, "pdq_ok": pdq_ok, "clip": clip, "clip_ok": clip_ok}
+
+
+def concat_fragments(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    parts = [p for p in parts if len(p["paths"])]
+    if not parts:
+        return {"paths": np.zeros(0, str), "listings": np.zeros(0, str),
+                "pdq": np.zeros((0, 4), np.uint64), "pdq_ok": np.zeros(0, bool),
+                "clip": np.zeros((0, 0), np.float16), "clip_ok": np.zeros(0, bool)}
+    dim = max(p["clip"].shape[1] for p in parts)
+    for p in parts:                                  # listings without CLIP have width 0
+        if p["clip"].shape[1] != dim:
+            p["clip"], p["clip_ok"] = np.zeros((len(p["paths"]), dim), np.float16), np.zeros(len(p["paths"]), bool)
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def encode_fragment(frag: Dict[str, np.ndarray]) -> str:
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **frag)
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def decode_fragment(data: str) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(base64.b64decode(data))) as z:
+        return {k: z[k] for k in z.files}
+
+
+def load_fragments(path: str) -> Dict[str, np.ndarray]:
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+
+# ─── worker side ──────────────────────────────────────────────────────────────
+def process_shard(dedup: Any, listings: Sequence[Dict[str, Any]], full_scan: bool = False) -> Dict[str, Any]:
+    """Dedup every listing of a shard; payload = per-listing results + index fragment."""
+    results, fragments = [], []
+    for l in listings:
+        t0 = time.perf_counter()
+        paths = [str(p.resolve()) for p in sorted((Path(l["path"]) / "processed").glob("*.jpg"))]
+        try:
+            kept = [g[0] for g in dedup.dedupe([[p] for p in paths], full_scan=full_scan)]
+            fragments.append(index_fragment(l["listing"], [dedup.store.record(p) for p in paths]))
+            kept_set = set(kept)
+            results.append({"listing": l["listing"], "images": len(paths), "kept": kept,
+                            "dropped": [p for p in paths if p not in kept_set],
+                            "seconds": time.perf_counter() - t0, "error": None})
+        except Exception as e:
+            logger.error("Listing %s failed: %s", l["listing"], e)
+            results.append({"listing": l["listing"], "images": len(paths), "kept": [], "dropped": [],
+                            "seconds": time.perf_counter() - t0, "error": str(e)})
+        finally:
+            release_paths(paths, dedup.store.pairs, *engine_caches(dedup.engine))
+    return {"listings": results, "fragment": encode_fragment(concat_fragments(fragments))}
+
+
+class QueueClient:
+    """Transport: the coordinator's SQLite queue, opened directly."""
+
+    def __init__(self, db_path: str):
+        self.queue = JobQueue(db_path)
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        return self.queue.claim(KIND, worker, MAX_ATTEMPTS)
+
+    def complete(self, shard_id: str, payload: Dict[str, Any], seconds: float) -> None:
+        self.queue.complete(KIND, shard_id, payload, seconds)
+
+    def fail(self, shard_id: str, error: str) -> None:
+        self.queue.fail(KIND, shard_id, error, MAX_ATTEMPTS)
+
+
+class SocketClient:
+    """Transport: JSON lines over TCP to a CoordinatorServer."""
+
+    def __init__(self, address: str, timeout: float = 300.0):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.timeout = timeout
+
+    def _call(self, **request: Any) -> Dict[str, Any]:
+        with socket.create_connection(self.address, timeout=self.timeout) as s:
+            f = s.makefile("rwb")
+            f.write(json.dumps(request).encode() + b"\n")
+            f.flush()
+            reply = json.loads(f.readline() or b"{}")
+        if "error" in reply:
+            raise RuntimeError(f"Coordinator error: {reply['error']}")
+        return reply
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        return self._call(op="claim", worker=worker).get("job")
+
+    def complete(self, shard_id: str, payload: Dict[str, Any], seconds: float) -> None:
+        self._call(op="complete", shard=shard_id, payload=payload, seconds=seconds)
+
+    def fail(self, shard_id: str, error: str) -> None:
+        self._call(op="fail", shard=shard_id, error=error)
+
+
+def run_worker(client: Any, worker: Optional[str] = None, engine: str = "drift_fix",
+               full_scan: bool = False) -> int:
+    """Serve shards until none are left; returns the number processed."""
+    from deduplicator import Deduplicator
+
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    dedup = Deduplicator.from_engine(engine)
+    done = 0
+    while True:
+        job = client.claim(worker)
+        if job is None:
+            return done
+        t0 = time.perf_counter()
+        try:
+            payload = process_shard(dedup, json.loads(job["path"]), full_scan)
+            client.complete(job["listing"], payload, time.perf_counter() - t0)
+            done += 1
+            logger.info("%s finished %s (%d images, %.1f s)", worker, job["listing"],
+                        job["images"], time.perf_counter() - t0)
+        except Exception as e:
+            logger.error("%s failed %s: %s", worker, job["listing"], e)
+            client.fail(job["listing"], str(e))
+
+
+# ─── coordinator side ─────────────────────────────────────────────────────────
+class Coordinator:
+    """Owns the shard queue (SQLite checkpoint); serialises access for the socket server."""
+
+    def __init__(self, out_dir: str, lease_s: float = DEFAULT_LEASE_S):
+        self.out = Path(out_dir)
+        self.out.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(self.out / "queue.sqlite")
+        self.queue = JobQueue(self.db_path)
+        self.lease_s = lease_s
+        self._lock = threading.Lock()
+
+    def enqueue(self, listings: Sequence[Dict[str, Any]], shard_images: int, full_scan: bool) -> int:
+        shards = {shard_id(s, shard_images, full_scan): s for s in make_shards(listings, shard_images, full_scan)}
+        with self._lock:
+            self.queue.requeue(KIND)                  # leftovers of an interrupted run
+            if self.queue.prune(KIND, list(shards)):
+                logger.warning("Dropped queued shards of a different plan (listings or shard config changed)")
+            for sid, shard in shards.items():
+                self.queue.add(KIND, sid, json.dumps(shard), sum(l["images"] for l in shard),
+                               sum(listing_cost(l["images"], full_scan) for l in shard))
+        logger.info("%d listings in %d shards; queue %s", len(listings), len(shards), self.counts())
+        return len(shards)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return self.queue.counts(KIND)
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        with self._lock:
+            if op == "claim":
+                return {"job": self.queue.claim(KIND, request["worker"], MAX_ATTEMPTS)}
+            if op == "complete":
+                self.queue.complete(KIND, request["shard"], request["payload"], request["seconds"])
+                return {"ok": True}
+            if op == "fail":
+                self.queue.fail(KIND, request["shard"], request["error"], MAX_ATTEMPTS)
+                return {"ok": True}
+            if op == "status":
+                return {"counts": self.queue.counts(KIND)}
+        return {"error": f"unknown op {op!r}"}
+
+    def wait(self, poll_s: float = 2.0, alive: Optional[Any] = None) -> Dict[str, int]:
+        """
+        Block until no shard is pending or running (expired leases are
+        requeued), or until alive() reports that no worker is left.
+        """
+        while True:
+            with self._lock:
+                if self.queue.requeue_expired(KIND, self.lease_s):
+                    logger.warning("Requeued shards whose lease expired")
+                counts = self.queue.counts(KIND)
+            if counts["pending"] == 0 and counts["running"] == 0:
+                return counts
+            if alive is not None and not alive():
+                logger.warning("All workers exited with shards left: %s", counts)
+                return counts
+            time.sleep(poll_s)
+
+    def collect(self) -> Tuple[Path, Path]:
+        """results.jsonl (one line per listing) and the merged index fragments."""
+        with self._lock:
+            payloads = self.queue.results(KIND)
+        results_path = self.out / "results.jsonl"
+        fragments = []
+        with open(results_path, "w", encoding="utf-8") as f:
+            for payload in payloads:
+                for r in payload["listings"]:
+                    f.write(json.dumps(r) + "\n")
+                fragments.append(decode_fragment(payload["fragment"]))
+        merged = concat_fragments(fragments)
+        frag_path = self.out / FRAGMENT_FILE
+        np.savez(frag_path, **merged)
+        logger.info("Collected %d shards → %s, %d indexed images → %s",
+                    len(payloads), results_path, len(merged["paths"]), frag_path)
+        return results_path, frag_path
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            reply = self.server.coordinator.handle(json.loads(self.rfile.readline()))
+        except Exception as e:
+            reply = {"error": str(e)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], coordinator: Coordinator):
+        super().__init__(address, _Handler)
+        self.coordinator = coordinator
+
+    def start(self) -> threading.Thread:
+        t = threading.Thread(target=self.serve_forever, daemon=True, name="coordinator")
+        t.start()
+        return t
+
+
+def _worker_cmd(flag: str, target: str, engine: str, full_scan: bool) -> List[str]:
+    cmd = [sys.executable, os.path.abspath(__file__), "worker", flag, target, "--engine", engine]
+    return cmd + (["--full-scan"] if full_scan else [])
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Sharded coordinator/worker dedup across machines")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ("coordinator", "simulate"):
+        p = sub.add_parser(name)
+        p.add_argument("--root", required=True, help="Directory of listing folders (each with processed/)")
+        p.add_argument("--folders", nargs="+", default=None)
+        p.add_argument("--out", default="sharded_run", help="Queue, results.jsonl and merged fragments")
+        p.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_IMAGES, help="Images per shard")
+        p.add_argument("--lease", type=float, default=DEFAULT_LEASE_S, help="Seconds before a shard is re-leased")
+        p.add_argument("--full-scan", action="store_true")
+        p.add_argument("--engine", default="drift_fix")
+    sub.choices["coordinator"].add_argument("--serve", default=None,
+                                            help="host:port for socket workers (omit for the SQLite transport)")
+    sub.choices["simulate"].add_argument("--workers", type=int, default=3)
+    sub.choices["simulate"].add_argument("--transport", choices=["socket", "sqlite"], default="socket")
+    w = sub.add_parser("worker")
+    w.add_argument("--connect", default=None, help="Coordinator host:port")
+    w.add_argument("--db", default=None, help="Coordinator queue.sqlite (shared filesystem)")
+    w.add_argument("--engine", default="drift_fix")
+    w.add_argument("--full-scan", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "worker":
+        if not (args.connect or args.db):
+            parser.error("worker needs --connect host:port or --db path")
+        client = SocketClient(args.connect) if args.connect else QueueClient(args.db)
+        n = run_worker(client, engine=args.engine, full_scan=args.full_scan)
+        logger.info("Worker done: %d shards", n)
+        return
+
+    coordinator = Coordinator(args.out, lease_s=args.lease)
+    coordinator.enqueue(discover_listings(args.root, args.folders), args.shard_size, args.full_scan)
+    server = None
+    serve = args.serve if args.cmd == "coordinator" else ("127.0.0.1:0" if args.transport == "socket" else None)
+    if serve:
+        host, _, port = serve.rpartition(":")
+        server = CoordinatorServer((host or "0.0.0.0", int(port)), coordinator)
+        server.start()
+        logger.info("Coordinator listening on %s:%d", *server.server_address[:2])
+
+    procs = []
+    if args.cmd == "simulate":
+        flag, target = (("--connect", f"127.0.0.1:{server.server_address[1]}") if server
+                        else ("--db", coordinator.db_path))
+        procs = [subprocess.Popen(_worker_cmd(flag, target, args.engine, args.full_scan))
+                 for _ in range(args.workers)]
+        logger.info("Started %d local worker processes (%s transport)", len(procs), args.transport)
+
+    t0 = time.perf_counter()
+    counts = coordinator.wait(alive=(lambda: any(p.poll() is None for p in procs)) if procs else None)
+    for p in procs:
+        p.wait()
+    if server:
+        server.shutdown()
+    coordinator.collect()
+    logger.info("Finished in %.1f s: %s", time.perf_counter() - t0, counts)
+
+
+if __name__ == "__main__":
+    main()
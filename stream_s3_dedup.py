@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+stream_s3_dedup.py – dedup listings straight from S3, without a local copy
+
+Evaluation sweeps used to download every `processed/` folder first
+(download_s3_images.py) and then read the files back (run_test_eval.py,
+compare_deduplication_methods.py).  This pipeline overlaps the two:
+
+    fetch      objects are fetched concurrently into memory buffers on an I/O
+               thread pool (pooled s3_store client, per-object retry)
+    features   each buffer is decoded with cv2.imdecode and run through the
+               engine's Phase 1 (`_metric_worker(key, data)`) plus SIFT
+               detection on a compute pool; the bytes are then dropped
+    decide     when a listing's last object arrives its features are packed
+               into an in-memory FeatureShard and remove_near_duplicates runs
+               with `pair_metrics=shard.pair_sim`, so the decision is ready
+               immediately; nothing touches the disk unless --keep-features
+               saves the shard
+
+In-flight buffers are bounded (fetch + 2 × compute workers) and at most
+--max-listings listings are open at once, so memory stays flat however many
+listings are swept.  Results stream out in completion order.
+
+Usage:
+    python stream_s3_dedup.py s3://image-upload-autohdr-j/ --limit 200 --out stream.jsonl
+    python stream_s3_dedup.py ./fake_bucket --keep-features shards      # local stand-in
+
+    async for res in StreamDedup("s3://bucket/", engine="drift_fix").run(limit=10):
+        print(res.listing, len(res.kept))
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    pip install opencv-python numpy
+    pip install boto3                  # <-- only for s3:// sources
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bounded_cache import engine_caches, release_paths
+from deduplicator import ENGINES
+from feature_shards import FeatureShard, pack_features, save_shard, shard_meta, sift_descriptors
+from s3_store import ObjectInfo, open_store, with_retry
+from telemetry import queue_depth
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTS = (".jpg", ".jpeg")
+
+_objects_in_flight = queue_depth("stream_objects")     # fetched or fetching, features not done
+
+
+@dataclass
+class ListingResult:
+    listing: str
+    images: int = 0
+    kept: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+    bytes: int = 0
+    seconds: float = 0.0               # first request → decision
+    decide_ms: float = 0.0             # last object arrived → decision
+    shard: str = ""
+    error: str = ""
+
+
+def features_from_bytes(engine: Any, key: str, data: bytes) -> Tuple[Dict[str, Any], np.ndarray]:
+    """(_metric_worker record, SIFT descriptors) of one encoded image."""
+    m = engine._metric_worker(key, data)
+    gray = engine._load_gray.cache.get((key,))
+    if gray is None:                             # evicted between the two calls
+        gray = engine._decode_gray(key, data)
+    return m, sift_descriptors(gray)
+
+
+class StreamDedup:
+    """Fetch → features → decision for many listings, with bounded memory."""
+
+    def __init__(self, source: str, engine: Any = "drift_fix", fetch_workers: int = 32,
+                 compute_workers: int = 8, max_listings: int = 4, keep_features: Optional[str] = None,
+                 full_scan: bool = False, endpoint_url: Optional[str] = None):
+        self.engine = importlib.import_module(ENGINES.get(engine, engine)) if isinstance(engine, str) else engine
+        if not hasattr(self.engine, "_decode_gray"):
+            raise ValueError(f"Engine {self.engine.__name__} cannot compute features from bytes "
+                             f"(use one of: {', '.join(ENGINES)})")
+        self.store, self.prefix = open_store(source, pool_size=fetch_workers, endpoint_url=endpoint_url)
+        self.fetch_workers = fetch_workers
+        self.compute_workers = compute_workers
+        self.max_listings = max_listings
+        self.keep_features = keep_features
+        self.full_scan = full_scan
+        self._io = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="fetch")
+        self._cpu = ThreadPoolExecutor(max_workers=compute_workers, thread_name_prefix="features")
+        self._inflight: Optional[asyncio.Semaphore] = None
+
+    def close(self) -> None:
+        self._io.shutdown(wait=False)
+        self._cpu.shutdown(wait=False)
+
+    # ── per listing ───────────────────────────────────────────────────────────
+    async def _object_features(self, obj: ObjectInfo) -> Tuple[Tuple[Dict[str, Any], np.ndarray], int]:
+        loop = asyncio.get_running_loop()
+        async with self._inflight:
+            _objects_in_flight.inc()
+            try:
+                data = await loop.run_in_executor(self._io, with_retry, self.store.get_bytes, obj.key)
+                feats = await loop.run_in_executor(self._cpu, features_from_bytes, self.engine, obj.key, data)
+            finally:
+                _objects_in_flight.dec()
+            return feats, len(data)
+
+    def _decide(self, paths: List[str], shard: FeatureShard,
+                metadata_dict: Dict[str, Dict[str, Any]]) -> List[List[str]]:
+        return self.engine.remove_near_duplicates(
+            [[p] for p in paths], deduplication_flag=1, metadata_dict=metadata_dict,
+            full_scan=self.full_scan, pair_metrics=shard.pair_sim, experiment_logger=False)
+
+    async def run_listing(self, folder_id: str,
+                          metadata_dict: Optional[Dict[str, Dict[str, Any]]] = None) -> ListingResult:
+        loop = asyncio.get_running_loop()
+        if self._inflight is None:
+            self._inflight = asyncio.Semaphore(self.fetch_workers + 2 * self.compute_workers)
+        res = ListingResult(listing=folder_id)
+        t0 = time.perf_counter()
+        paths: List[str] = []
+        try:
+            objects = await loop.run_in_executor(self._io, with_retry, self.store.list_objects,
+                                                 f"{self.prefix}{folder_id}/processed/")
+            objects = [o for o in objects if o.key.lower().endswith(IMAGE_EXTS)]
+            paths = [o.key for o in objects]
+            res.images = len(paths)
+            done = await asyncio.gather(*(self._object_features(o) for o in objects))
+            t_last = time.perf_counter()
+            feats = [f for f, _ in done]
+            res.bytes = sum(n for _, n in done)
+
+            arrays = pack_features(feats, folder_id)
+            meta = shard_meta(self.engine, paths, feats, folder_id)
+            del feats, done
+            if self.keep_features:
+                res.shard = str(save_shard(arrays, meta, str(Path(self.keep_features) / folder_id)))
+            shard = FeatureShard.from_arrays(arrays, meta)
+            kept = await loop.run_in_executor(self._cpu, self._decide, paths, shard, metadata_dict or {})
+            res.kept = [g[0] for g in kept]
+            kept_set = set(res.kept)
+            res.dropped = [p for p in paths if p not in kept_set]
+            res.decide_ms = (time.perf_counter() - t_last) * 1000.0
+        except Exception as e:
+            logger.error("Listing %s failed: %s", folder_id, e)
+            res.error = str(e)
+        finally:
+            release_paths(paths, *engine_caches(self.engine))
+        res.seconds = time.perf_counter() - t0
+        return res
+
+    # ── sweep ─────────────────────────────────────────────────────────────────
+    async def run(self, folder_ids: Optional[Sequence[str]] = None,
+                  limit: Optional[int] = None) -> AsyncIterator[ListingResult]:
+        """Yield one ListingResult per listing, in completion order."""
+        loop = asyncio.get_running_loop()
+        if folder_ids is None:
+            folder_ids = await loop.run_in_executor(self._io, with_retry, self.store.list_prefixes, self.prefix)
+        folder_ids = list(folder_ids)[:limit] if limit is not None else list(folder_ids)
+        open_listings = asyncio.Semaphore(self.max_listings)
+
+        async def _guarded(folder_id: str) -> ListingResult:
+            async with open_listings:
+                return await self.run_listing(folder_id)
+
+        for fut in asyncio.as_completed([_guarded(f) for f in folder_ids]):
+            yield await fut
+
+
+async def _main(args: Any) -> int:
+    pipeline = StreamDedup(args.source, engine=args.engine, fetch_workers=args.fetch_workers,
+                           compute_workers=args.compute_workers, max_listings=args.max_listings,
+                           keep_features=args.keep_features, full_scan=args.full_scan,
+                           endpoint_url=args.endpoint_url)
+    out = open(args.out, "a", encoding="utf-8") if args.out else None
+    failed = total_images = total_bytes = 0
+    t0 = time.perf_counter()
+    try:
+        async for res in pipeline.run(args.folder_ids, args.limit):
+            failed += bool(res.error)
+            total_images += res.images
+            total_bytes += res.bytes
+            print(f"{res.listing}: {res.images} → {len(res.kept)} kept "
+                  f"({res.bytes / 1e6:.1f} MB, {res.seconds:.1f} s, decision {res.decide_ms:.0f} ms after last object)"
+                  + (f"  ERROR {res.error}" if res.error else ""))
+            if out:
+                out.write(json.dumps(asdict(res)) + "\n")
+                out.flush()
+    finally:
+        pipeline.close()
+        if out:
+            out.close()
+        if args.metrics_out:
+            from telemetry import write_report
+            write_report(args.metrics_out)
+    elapsed = time.perf_counter() - t0
+    print(f"{total_images} images, {total_bytes / 1e6:.1f} MB streamed in {elapsed:.1f} s "
+          f"({total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s), {failed} listings failed")
+    return 1 if failed else 0
+
+
+def main() -> None:
+    import argparse
+    import sys
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Stream listings from S3 and deduplicate without a local copy")
+    parser.add_argument("source", help="s3://bucket/prefix/ or a local directory laid out like the bucket")
+    parser.add_argument("--engine", default="drift_fix", help=f"{' | '.join(ENGINES)} (default: drift_fix)")
+    parser.add_argument("--folder-ids", nargs="+", default=None, help="Listings to process (default: all)")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--out", type=str, default=None, help="Append one JSON line per listing")
+    parser.add_argument("--keep-features", type=str, default=None,
+                        help="Save each listing's feature shard under this directory")
+    parser.add_argument("--full-scan", action="store_true")
+    parser.add_argument("--fetch-workers", type=int, default=32)
+    parser.add_argument("--compute-workers", type=int, default=8)
+    parser.add_argument("--max-listings", type=int, default=4, help="Listings in flight at once")
+    parser.add_argument("--endpoint-url", type=str, default=None, help="S3-compatible endpoint (moto, MinIO)")
+    parser.add_argument("--metrics-out", type=str, default=None, metavar="PREFIX",
+                        help="Record stage timers/queue depths; write PREFIX.prom and PREFIX.json at the end")
+    args = parser.parse_args()
+    if args.metrics_out:
+        import telemetry
+        telemetry.enable()
+    sys.exit(asyncio.run(_main(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+telemetry.py – hot-path timers, counters and histograms for the dedup engines
+
+Timing used to be visible only as wall-clock log lines, the per-pair
+timing_ms of the experiment log and the cascade's tier table; nothing said
+where Phase 1 time goes per image, how well the caches hit or how deep the
+queues run.  This module is one process-wide registry the engines report into:
+
+    dedup_feature_seconds{engine,stage}   histogram, per image: decode, clahe,
+                                          mtb, edges, ssim, pdq, clip (and sift
+                                          where it is extracted per image)
+    dedup_pair_seconds{engine,part}       histogram, per pair: total (incl. any
+                                          Phase 1 computed on demand), sift
+    dedup_pairs_total{engine,result}      counter: duplicate / kept / skipped
+    dedup_queue_depth{queue}              gauge: Phase 1 backlog, streaming
+                                          fetches in flight, service requests,
+                                          scheduler jobs
+    dedup_cache_*{cache}                  hits, misses, evictions, items, bytes
+                                          of every BoundedCache, read from the
+                                          caches' own counters at export time
+
+Off by default: every timer is a module-level flag test returning a shared
+no-op context manager (well under a microsecond against millisecond-scale
+work).  Enabled (DEDUP_METRICS=1 or enable()), an observation is two
+perf_counter() calls, a bisect and a short lock, i.e. a few microseconds per
+image stage or pair.  summary() reports the measured per-observation cost
+times the number of observations, so the overhead of a run can be checked.
+
+Exports:
+    exposition("prometheus" | "openmetrics")   text format for scraping
+    summary()                                  JSON-able dict (p50 / p95 / p99
+                                               interpolated from the buckets)
+    write_report(prefix)                       <prefix>.prom + <prefix>.json
+    serve_metrics(port)                        GET /metrics on a daemon thread
+With DEDUP_METRICS_OUT=<prefix> the report is written at interpreter exit.
+
+Usage:
+    from telemetry import feature_timers
+    _timers = feature_timers("deduplication")
+    with _timers["pdq"]:
+        bits = _pdq_bits(path)
+
+    DEDUP_METRICS=1 DEDUP_METRICS_OUT=run_metrics python dedup_fixed_drift.py
+    python dedup_fixed_drift.py --metrics-out reports/metrics/run1
+
+------------------------------------------------------------
+Dependencies
+------------------------------------------------------------
+    standard library only
+"""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STAGES = ("decode", "clahe", "mtb", "edges", "ssim", "pdq", "clip", "sift")
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+_enabled = os.environ.get("DEDUP_METRICS", "").lower() not in ("", "0", "false", "no")
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def enable(on: bool = True) -> None:
+    global _enabled
+    _enabled = bool(on)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+# ─── metric families ──────────────────────────────────────────────────────────
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._children: Dict[Labels, Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels: Any) -> Any:
+        key = tuple((n, str(labels.get(n, ""))) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._child())
+        return child
+
+    def _child(self) -> Any:
+        raise NotImplementedError
+
+    def items(self) -> List[Tuple[Labels, Any]]:
+        with self._lock:
+            return list(self._children.items())
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, n: float = 1.0) -> None:
+        if _enabled:
+            with self._lock:
+                self.value += n
+
+
+class Counter(_Family):
+    kind = "counter"
+    _child = _CounterChild
+
+
+class _GaugeChild:
+    __slots__ = ("value", "max", "fn")
+
+    def __init__(self) -> None:
+        self.value, self.max, self.fn = 0.0, 0.0, None
+
+    def set(self, v: float) -> None:
+        if _enabled:
+            self.value = float(v)
+            self.max = max(self.max, self.value)
+
+    def inc(self, n: float = 1.0) -> None:
+        if _enabled:
+            self.set(self.value + n)
+
+    def dec(self, n: float = 1.0) -> None:
+        if _enabled:
+            self.set(self.value - n)
+
+    def read(self) -> float:
+        if self.fn is not None:
+            try:
+                self.value = float(self.fn())
+                self.max = max(self.max, self.value)
+            except Exception as e:                   # a dead service must not break export
+                logger.debug("Gauge callback failed: %s", e)
+        return self.value
+
+
+class Gauge(_Family):
+    kind = "gauge"
+    _child = _GaugeChild
+
+    def set_function(self, fn: Callable[[], float], **labels: Any) -> None:
+        """Sample `fn()` at export time (always, enabled or not)."""
+        self.labels(**labels).fn = fn
+
+
+class _Timer:
+    __slots__ = ("h", "t0")
+
+    def __init__(self, h: "_HistogramChild"):
+        self.h = h
+
+    def __enter__(self) -> "_Timer":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.h.observe(time.perf_counter() - self.t0)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "min", "max", "_lock")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)   # last = +Inf
+        self.sum, self.count = 0.0, 0
+        self.min, self.max = float("inf"), 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, v: float) -> None:
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += v
+            self.count += 1
+            if v < self.min:
+                self.min = v
+            if v > self.max:
+                self.max = v
+
+    def time(self) -> Any:
+        return _Timer(self) if _enabled else _NULL_TIMER
+
+    def quantile(self, q: float) -> float:
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank, seen, lo = q * self.count, 0, 0.0
+        for b, n in zip(self.bounds + (self.max,), self.counts):
+            if n and seen + n >= rank:
+                hi = min(b, self.max)
+                lo = max(lo, self.min)
+                return lo + (hi - lo) * ((rank - seen) / n)
+            seen += n
+            lo = b
+        return self.max
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+
+class StageTimer:
+    """`with timer:` times one block into a histogram child (no-op while disabled)."""
+
+    __slots__ = ("child", "t0")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+        self.t0 = 0.0
+
+    def __enter__(self) -> "StageTimer":
+        if _enabled:
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if _enabled and self.t0:
+            self.child.observe(time.perf_counter() - self.t0)
+            self.t0 = 0.0
+
+
+class _ThreadLocalStageTimer(threading.local):
+    """Per-thread StageTimer, so one module-level timer is safe from a thread pool."""
+
+    def __init__(self, child: _HistogramChild):
+        self.timer = StageTimer(child)
+
+
+class _SharedStageTimer:
+    __slots__ = ("_local",)
+
+    def __init__(self, child: _HistogramChild):
+        self._local = _ThreadLocalStageTimer(child)
+
+    def __enter__(self) -> Any:
+        if not _enabled:
+            return _NULL_TIMER
+        return self._local.timer.__enter__()
+
+    def __exit__(self, *exc: Any) -> None:
+        if _enabled:
+            self._local.timer.__exit__(*exc)
+
+
+# ─── registry ─────────────────────────────────────────────────────────────────
+class Registry:
+    def __init__(self) -> None:
+        self._families: Dict[str, _Family] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Labels, float]]]] = []
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _get(self, cls: type, name: str, help: str, labelnames: Sequence[str], **kw: Any) -> Any:
+        with self._lock:
+            fam = self._families.get(name)
+            if fam is None:
+                fam = self._families[name] = cls(name, help, labelnames, **kw)
+            elif not isinstance(fam, cls):
+                raise ValueError(f"Metric {name} already registered as a {fam.kind}")
+            return fam
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def add_collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, Labels, float]]]) -> None:
+        """fn() → (name, kind, help, labels, value) samples computed at export time."""
+        self._collectors.append(fn)
+
+    def families(self) -> List[_Family]:
+        with self._lock:
+            return list(self._families.values())
+
+    def collected(self) -> Dict[str, Tuple[str, str, Dict[Labels, float]]]:
+        out: Dict[str, Tuple[str, str, Dict[Labels, float]]] = {}
+        for fn in self._collectors:
+            for name, kind, help, labels, value in fn():
+                entry = out.setdefault(name, (kind, help, {}))
+                entry[2][labels] = entry[2].get(labels, 0.0) + value     # same-named caches add up
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            for fam in self._families.values():
+                with fam._lock:
+                    fam._children = {k: v for k, v in fam._children.items()
+                                     if isinstance(v, _GaugeChild) and v.fn is not None}
+        self.started = time.time()
+
+
+REGISTRY = Registry()
+
+FEATURE_SECONDS = REGISTRY.histogram("dedup_feature_seconds", "Per-image Phase 1 feature time",
+                                     ("engine", "stage"))
+PAIR_SECONDS = REGISTRY.histogram("dedup_pair_seconds", "Per-pair metric time", ("engine", "part"))
+PAIRS = REGISTRY.counter("dedup_pairs", "Compared pairs by outcome", ("engine", "result"))
+QUEUE_DEPTH = REGISTRY.gauge("dedup_queue_depth", "Items waiting or in flight", ("queue",))
+
+
+def feature_timers(engine: str) -> Dict[str, _SharedStageTimer]:
+    """stage → reusable `with` timer for dedup_feature_seconds{engine, stage}."""
+    return {s: _SharedStageTimer(FEATURE_SECONDS.labels(engine=engine, stage=s)) for s in FEATURE_STAGES}
+
+
+def pair_timers(engine: str) -> Dict[str, _SharedStageTimer]:
+    """part → reusable `with` timer for dedup_pair_seconds{engine, part}."""
+    return {p: _SharedStageTimer(PAIR_SECONDS.labels(engine=engine, part=p)) for p in ("total", "sift")}
+
+
+def queue_depth(name: str) -> _GaugeChild:
+    return QUEUE_DEPTH.labels(queue=name)
+
+
+def _cache_samples() -> Iterable[Tuple[str, str, str, Labels, float]]:
+    from bounded_cache import all_caches
+    for c in all_caches():
+        i = c.info()
+        labels = (("cache", i.name),)
+        yield "dedup_cache_hits", "counter", "Cache lookups that found a value", labels, float(i.hits)
+        yield "dedup_cache_misses", "counter", "Cache lookups that had to compute", labels, float(i.misses)
+        yield "dedup_cache_evictions", "counter", "Entries evicted to stay in budget", labels, float(i.evictions)
+        yield "dedup_cache_items", "gauge", "Entries currently cached", labels, float(i.items)
+        yield "dedup_cache_bytes", "gauge", "Bytes currently cached", labels, float(i.bytes)
+
+
+REGISTRY.add_collector(_cache_samples)
+
+
+# ─── export ───────────────────────────────────────────────────────────────────
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = (lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def exposition(fmt: str = "prometheus", registry: Registry = REGISTRY) -> str:
+    """Prometheus text (0.0.4) or OpenMetrics exposition of every metric."""
+    om = fmt == "openmetrics"
+    lines: List[str] = []
+
+    def _header(name: str, kind: str, help: str) -> str:
+        family = name if (om or kind != "counter") else f"{name}_total"
+        lines.append(f"# HELP {family} {help}")
+        lines.append(f"# TYPE {family} {kind}")
+        return family
+
+    for fam in registry.families():
+        children = fam.items()
+        if not children:
+            continue
+        _header(fam.name, fam.kind, fam.help)
+        for labels, c in children:
+            if fam.kind == "counter":
+                lines.append(f"{fam.name}_total{_fmt_labels(labels)} {_fmt_value(c.value)}")
+            elif fam.kind == "gauge":
+                lines.append(f"{fam.name}{_fmt_labels(labels)} {_fmt_value(c.read())}")
+            elif c.count:
+                cum = 0
+                for b, n in zip(c.bounds + (float("inf"),), c.counts):
+                    cum += n
+                    lines.append(f"{fam.name}_bucket{_fmt_labels(labels, ('le', _fmt_value(b)))} {cum}")
+                lines.append(f"{fam.name}_sum{_fmt_labels(labels)} {_fmt_value(c.sum)}")
+                lines.append(f"{fam.name}_count{_fmt_labels(labels)} {c.count}")
+    for name, (kind, help, samples) in registry.collected().items():
+        _header(name, kind, help)
+        for labels, v in samples.items():
+            lines.append(f"{name}{'_total' if kind == 'counter' else ''}{_fmt_labels(labels)} {_fmt_value(v)}")
+    if om:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def _observation_cost(n: int = 20000) -> float:
+    """Seconds per enabled timer observation, measured on a private histogram."""
+    global _enabled
+    child, was = _HistogramChild(DEFAULT_BUCKETS), _enabled
+    _enabled = True
+    try:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with child.time():
+                pass
+        return (time.perf_counter() - t0) / n
+    finally:
+        _enabled = was
+
+
+def summary(registry: Registry = REGISTRY) -> Dict[str, Any]:
+    """JSON-able snapshot: counters, gauges (value, max), histograms (count, sum, quantiles)."""
+    def _key(labels: Labels) -> str:
+        return ",".join(f"{k}={v}" for k, v in labels) or "_"
+
+    out: Dict[str, Any] = {"enabled": _enabled, "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                           "wall_s": round(time.time() - registry.started, 3),
+                           "counters": {}, "gauges": {}, "histograms": {}}
+    observations = 0
+    timed_s = 0.0
+    for fam in registry.families():
+        for labels, c in fam.items():
+            if fam.kind == "counter":
+                out["counters"].setdefault(fam.name, {})[_key(labels)] = c.value
+            elif fam.kind == "gauge":
+                out["gauges"].setdefault(fam.name, {})[_key(labels)] = {"value": c.read(), "max": c.max}
+            elif c.count:
+                observations += c.count
+                timed_s += c.sum
+                out["histograms"].setdefault(fam.name, {})[_key(labels)] = {
+                    "count": c.count, "sum": round(c.sum, 6), "mean": round(c.sum / c.count, 6),
+                    "min": round(c.min, 6), "max": round(c.max, 6),
+                    "p50": round(c.quantile(0.50), 6), "p95": round(c.quantile(0.95), 6),
+                    "p99": round(c.quantile(0.99), 6)}
+    for name, (kind, _, samples) in registry.collected().items():
+        out["counters" if kind == "counter" else "gauges"][name] = {_key(l): v for l, v in samples.items()}
+    cost = _observation_cost() if observations else 0.0
+    out["overhead"] = {"observations": observations, "per_observation_us": round(cost * 1e6, 3),
+                       "estimated_s": round(cost * observations, 6),
+                       "fraction_of_timed": round(cost * observations / timed_s, 6) if timed_s else 0.0}
+    return out
+
+
+def write_report(prefix: str, fmt: str = "prometheus", registry: Registry = REGISTRY) -> Tuple[str, str]:
+    """<prefix>.prom (or .om) exposition + <prefix>.json summary; returns both paths."""
+    text_path = f"{prefix}.{'om' if fmt == 'openmetrics' else 'prom'}"
+    json_path = f"{prefix}.json"
+    os.makedirs(os.path.dirname(os.path.abspath(text_path)), exist_ok=True)
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write(exposition(fmt, registry))
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(summary(registry), f, indent=2)
+    logger.info("Metrics written to %s and %s", text_path, json_path)
+    return text_path, json_path
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """GET /metrics (Prometheus text, or OpenMetrics if the scraper asks) on a daemon thread."""
+    class _Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt: str, *args: Any) -> None:
+            logger.debug("[METRICS] " + fmt, *args)
+
+        def do_GET(self) -> None:
+            if self.path.split("?")[0].rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            om = "application/openmetrics-text" in self.headers.get("Accept", "")
+            data = exposition("openmetrics" if om else "prometheus", registry).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if om else PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Metrics on http://%s:%d/metrics", host, port)
+    return httpd
+
+
+if os.environ.get("DEDUP_METRICS_OUT"):
+    atexit.register(lambda: write_report(os.environ["DEDUP_METRICS_OUT"]))
@@ -0,0 +1,38 @@
+"""Make the flat top-level modules importable from the tests."""
+
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_engine():
+    """
+    Factory for an engine-module stand-in carrying only the decision
+    constants; `overrides` change them and every constant is mirrored to its
+    AERIAL_ twin unless that is overridden too.
+    """
+    def make(**overrides):
+        consts = {"COMPOSITE_DUP_THRESHOLD": 0.5, "MTB_HARD_FLOOR": 80.0, "PDQ_HD_CEIL": 100,
+                  "SIFT_MIN_MATCHES": 40, **{f"WEIGHT_{k}": 0.2 for k in ("MTB", "SSIM", "CLIP", "PDQ", "SIFT")},
+                  **overrides}
+        aerial = {f"AERIAL_{k}": v for k, v in consts.items() if not k.startswith("AERIAL_")}
+        return types.SimpleNamespace(**{**aerial, **consts})
+    return make
+
+
+@pytest.fixture
+def seeded_flann(monkeypatch):
+    """FLANN's KD-trees are randomised; seed each matcher so repeated runs count the same matches."""
+    cv2 = pytest.importorskip("cv2")
+    real = cv2.FlannBasedMatcher
+
+    def matcher(*args):
+        cv2.setRNGSeed(0)
+        return real(*args)
+
+    monkeypatch.setattr(cv2, "FlannBasedMatcher", matcher)
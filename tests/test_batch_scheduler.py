@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+import batch_scheduler
+from batch_scheduler import JobQueue, run_batch
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "queue.sqlite"))
+    yield q
+    q.close()
+
+
+def test_requeue_expired_spares_heartbeaten_jobs(queue):
+    for name in ("a", "b"):
+        queue.add("eval", name, f"/x/{name}", 3, 3.0)
+        queue.claim("eval", f"worker-{name}", 2)
+    queue.conn.execute("UPDATE jobs SET started = ?, heartbeat = NULL", (time.time() - 600,))
+    queue.heartbeat("eval", ["worker-a"])                     # a's scheduler is alive, b's is gone
+    assert queue.requeue_expired("eval", 60) == 1
+    status = dict(queue.conn.execute("SELECT listing, status FROM jobs").fetchall())
+    assert status == {"a": "running", "b": "pending"}
+
+
+def test_old_queue_gains_heartbeat_column(tmp_path):
+    import sqlite3
+    db = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(db)
+    conn.executescript(batch_scheduler._SCHEMA.replace("    heartbeat REAL,\n", ""))
+    conn.close()
+    q = JobQueue(db)
+    q.add("eval", "a", "/x/a", 1, 1.0)
+    assert q.claim("eval", "w", 2)["listing"] == "a"
+    q.close()
+
+
+def test_run_batch_stops_respawning_workers_that_die_in_warm_up(tmp_path):
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    db = str(tmp_path / "queue.sqlite")
+    other = JobQueue(db)                                      # a second scheduler, mid-listing
+    other.add("compare", "busy", "/x/busy", 5, 5.0)
+    other.claim("compare", "elsewhere-w1", 2)
+
+    listings = [{"listing": f"L{k}", "path": str(tmp_path / f"L{k}"), "images": 3} for k in range(3)]
+    with pytest.raises(RuntimeError, match="warm-up"):
+        run_batch("compare", listings, db, workers=2, options={"threads": 1})   # no "root": warm-up fails
+
+    status = dict(other.conn.execute("SELECT listing, status FROM jobs").fetchall())
+    other.close()
+    assert status == {"busy": "running", "L0": "pending", "L1": "pending", "L2": "pending"}
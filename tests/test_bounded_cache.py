@@ -0,0 +1,108 @@
+import os
+import sys
+import types
+
+import pytest
+
+from bounded_cache import BoundedCache, cache_report, engine_caches, memoize, release_paths
+from lazy_imports import is_loaded, lazy_attr, lazy_module
+
+MISSING = "dedup_test_module_that_is_not_installed"
+
+
+def _fake_engine() -> types.ModuleType:
+    engine = types.ModuleType("fake_engine")
+    engine.torch = lazy_module(MISSING)
+    engine.open_clip_create = lazy_attr(MISSING, "create_model")
+    engine._metric_store = BoundedCache(1 << 20, name="metrics")
+
+    @memoize(BoundedCache(1 << 20, name="gray"))
+    def _load_gray(path):
+        return path.upper()
+
+    engine._load_gray = _load_gray
+    return engine
+
+
+def test_engine_caches_does_not_import_lazy_modules():
+    engine = _fake_engine()
+    caches = engine_caches(engine)
+    assert [c.name for c in caches] == ["metrics", "gray"]
+    assert not is_loaded(engine.torch)
+    assert MISSING not in sys.modules
+    assert "metrics" in cache_report(engine)
+
+
+def test_release_paths_drops_path_memo_and_pair_keys():
+    engine = _fake_engine()
+    store = engine._metric_store
+    store["a.jpg"] = b"x" * 10
+    store[("a.jpg", "b.jpg")] = 0.5
+    store["c.jpg"] = b"y"
+    engine._load_gray("a.jpg")
+    release_paths(["a.jpg"], *engine_caches(engine))
+    assert list(store) == ["c.jpg"]
+    assert len(engine._load_gray.cache) == 0
+
+
+@pytest.mark.parametrize("name", ["deduplication", "dedup_fixed_drift"])
+def test_engine_caches_on_real_engines(name):
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    engine = __import__(name)
+    assert engine_caches(engine)
+    assert not is_loaded(engine.pdqhash)
+
+
+def test_overwritten_files_read_as_misses(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"first")
+    a, other = str(path), "listing/b.jpg"                      # b is not a local file
+    store = BoundedCache.from_env("metrics")
+    calls = []
+
+    @memoize(BoundedCache.from_env("pairs"))
+    def pair(x, y):
+        calls.append((x, y))
+        return store.get_or_compute(x, lambda k: open(k, "rb").read())
+
+    store[other] = b"remote"
+    assert pair(a, other) == b"first" and pair(a, other) == b"first"
+    assert len(calls) == 1 and a in store
+
+    path.write_bytes(b"second!")                               # new size
+    assert a not in store and other in store
+    assert pair(a, other) == b"second!" and len(calls) == 2
+
+    path.write_bytes(b"third!!")                               # same size, new mtime
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert pair(a, other) == b"third!!" and len(calls) == 3
+    assert store.stale >= 2
+
+
+def test_plain_caches_do_not_stat(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"first")
+    cache = BoundedCache(1 << 20)
+    cache[str(path)] = 1
+    path.write_bytes(b"changed")
+    assert cache[str(path)] == 1
+
+
+def test_engine_recomputes_features_after_overwrite(tmp_path):
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    import shutil
+
+    import dedup_fixed_drift as engine
+    from benchmark_suite import generate_listing
+
+    generate_listing(str(tmp_path), 2, rng_seed=5)
+    a, b = sorted(str(p) for p in (tmp_path / "processed").glob("*.jpg"))
+    first = engine._pair_sim(a, b)
+    assert engine._pair_sim(a, b) == first
+    shutil.copyfile(b, a)                                      # a is re-uploaded as a copy of b
+    mtb, _edge, hd, *_ = engine._pair_sim(a, b)
+    assert hd == 0 and mtb > first[0]
+    release_paths([a, b], *engine_caches(engine))
@@ -0,0 +1,91 @@
+import itertools
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from calibrate_cascade import (CONFIG_VERSION, NO_ACCEPT_CLIP, NO_REJECT_HD, _cut, build_config, calibrate,
+                               evaluate, search)
+
+
+def _exits(s):
+    return s["stage1_exits"] + s["stage2_accepts"] + s["stage2_rejects"]
+
+
+def _brute_force(hd, clip, dup, budget):
+    """Most stage 1–2 exits over every reject distance and every ordered pair of CLIP cuts."""
+    vals = np.unique(clip)
+    cuts = [_cut(vals, k, NO_ACCEPT_CLIP) for k in range(len(vals) + 1)]
+    best = -1
+    for p in np.append(np.unique(hd), NO_REJECT_HD):
+        for low, high in itertools.product(cuts, cuts):
+            s = evaluate(hd, clip, dup, p, high, low)
+            if low <= high and s["disagreements"] <= budget:
+                best = max(best, _exits(s))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_search_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(4, 16))
+    hd = rng.integers(0, 8, n) * 10
+    clip = rng.choice([55.0, 62.5, 70.0, 78.0, 85.0, 91.0, 97.0], n)
+    dup = rng.random(n) < (clip / 100.0) ** 3
+    for budget in range(4):
+        found = search(hd, clip, dup, budget)
+        assert found is not None and found["clip_low"] <= found["clip_high"]
+        s = evaluate(hd, clip, dup, found["pdq_reject"], found["clip_high"], found["clip_low"])
+        assert s["disagreements"] <= budget
+        assert _exits(s) == _brute_force(hd, clip, dup, budget), (seed, budget, found)
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    pytest.importorskip("cv2")
+    import deduplication_cascading as cascade
+    for keys in cascade._CASCADE_KEYS.values():          # restored after the test
+        for k in keys:
+            monkeypatch.setattr(cascade, k, getattr(cascade, k))
+    monkeypatch.setattr(cascade, "CASCADE_CONFIG", cascade.CASCADE_CONFIG)
+    return cascade
+
+
+def _config(n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    clip = rng.uniform(40.0, 100.0, n)
+    ref = {"run_id": np.array(["r1"] * n), "engine": np.array(["deduplication"] * n),
+           "path_a": np.array([f"/l/{k}a.jpg" for k in range(n)]), "pdq_hd": rng.integers(0, 200, n),
+           "clip": clip, "aerial": np.arange(n) % 4 == 0, "decision": clip > 80.0}
+    current = {cls: {"pdq_reject": 200, "clip_high": 85.0, "clip_low": 70.0} for cls in ("regular", "aerial")}
+    return build_config(calibrate(ref, current, min_pairs=5), ref, {"root": "store"})
+
+
+def test_config_round_trip(cascade, tmp_path):
+    assert CONFIG_VERSION == cascade.CASCADE_CONFIG_VERSION
+    cfg = _config()
+    assert cfg["regular"]["calibrated"] and cfg["aerial"]["calibrated"]
+    path = tmp_path / "cascade.json"
+    path.write_text(json.dumps(cfg), encoding="utf-8")
+    assert cascade.load_cascade_config(str(path))["config_hash"] == cfg["config_hash"]
+    for cls, (pdq_key, high_key, low_key) in cascade._CASCADE_KEYS.items():
+        t = cfg[cls]["thresholds"]
+        assert (getattr(cascade, pdq_key), getattr(cascade, high_key), getattr(cascade, low_key)) == \
+            (t["pdq_reject"], t["clip_high"], t["clip_low"])
+    assert cascade.CASCADE_CONFIG == str(path)
+
+
+@pytest.mark.parametrize("change, message", [
+    (lambda cfg: cfg.update(version=CONFIG_VERSION + 1), "version"),
+    (lambda cfg: cfg["aerial"]["thresholds"].update(clip_low=90.0, clip_high=80.0), "clip_low"),
+])
+def test_config_rejected(cascade, tmp_path, change, message):
+    before = {k: getattr(cascade, k) for keys in cascade._CASCADE_KEYS.values() for k in keys}
+    cfg = _config()
+    change(cfg)
+    path = tmp_path / "cascade.json"
+    path.write_text(json.dumps(cfg), encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        cascade.load_cascade_config(str(path))
+    assert {k: getattr(cascade, k) for k in before} == before        # nothing half-applied
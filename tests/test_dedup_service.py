@@ -0,0 +1,76 @@
+import json
+import threading
+import urllib.error
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from benchmark_suite import generate_listing
+from dedup_service import DedupService, DedupServiceClient, _make_handler
+from http.server import ThreadingHTTPServer
+
+
+@pytest.fixture(scope="module")
+def client():
+    service = DedupService(workers=2, warm_clip=False, concurrency=2)
+    service.start()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(service))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield DedupServiceClient(f"http://127.0.0.1:{httpd.server_address[1]}", timeout=120)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        service.stop()
+
+
+@pytest.fixture(scope="module")
+def paths(tmp_path_factory):
+    root = tmp_path_factory.mktemp("listing")
+    generate_listing(str(root), 10, rng_seed=3)
+    return sorted(str(p) for p in (root / "processed").glob("*.jpg"))
+
+
+def _error(call):
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        call()
+    return exc.value.code, json.loads(exc.value.read())
+
+
+def test_dedupe_round_trip(client, paths):
+    out = client.dedupe(paths)
+    assert out["input_count"] == len(paths)
+    assert out["output_count"] == len(out["kept_groups"]) <= len(paths)
+    assert len(out["comparisons"]) == len(paths) - 1
+    assert all(isinstance(r["dropped"], bool) and isinstance(r["mtb"], float)
+               for r in out["comparisons"])
+    assert {"queued_ms", "run_ms", "total_ms"} <= set(out["timing"])
+
+
+def test_dedupe_with_numpy_decisions(client, paths):
+    # Gates always pass and the score never does: _decide_pair's `dup` is np.bool_
+    config = {"threshold": 1.5, "mtb_floor": 0.0, "pdq_ceil": 1000}
+    out = client.dedupe(paths, {"config": {**config, **{f"aerial_{k}": v for k, v in config.items()}}})
+    assert out["output_count"] == len(paths)
+    assert [r["dropped"] for r in out["comparisons"]] == [False] * (len(paths) - 1)
+
+
+def test_features_and_stats(client, paths):
+    feats = client.features(paths[:2])["features"]
+    assert set(feats) == set(paths[:2])
+    assert all(f["pdq"] is None or len(f["pdq"]) == 64 for f in feats.values())
+    stats = client.stats()
+    assert stats["jobs"] >= 1 and stats["feature_store_size"] >= 2
+
+
+def test_unreadable_path_is_a_500(client, tmp_path):
+    code, body = _error(lambda: client.dedupe([str(tmp_path / "missing.jpg"), str(tmp_path / "gone.jpg")]))
+    assert code == 500 and "Failed to read" in body["error"]
+
+
+def test_unknown_engine_is_a_500(client, paths):
+    code, body = _error(lambda: client.dedupe(paths[:2], {"engine": "nope"}))
+    assert code == 500 and "Unknown engine" in body["error"]
@@ -0,0 +1,86 @@
+import shutil
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+import deduplication_cascading as cascade
+from benchmark_suite import generate_listing
+from bounded_cache import engine_caches, release_paths
+
+
+@pytest.fixture(scope="module")
+def listing(tmp_path_factory):
+    root = tmp_path_factory.mktemp("cascade")
+    generate_listing(str(root), 10, rng_seed=21)
+    paths = sorted(str(p) for p in (root / "processed").glob("*.jpg"))
+    shutil.copyfile(paths[0], str(root / "processed" / "zz_copy.jpg"))
+    return paths + [str(root / "processed" / "zz_copy.jpg")]
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches(listing):
+    yield
+    release_paths(listing, *engine_caches(cascade))
+
+
+def _pairs(paths):
+    return [(paths[i], paths[i + 1]) for i in range(len(paths) - 1)] + [(paths[0], paths[-1])]
+
+
+def _per_pair(pairs):
+    return [cascade._cascading_compare(a, b, False, {}) for a, b in pairs]
+
+
+@pytest.fixture
+def fake_clip(monkeypatch):
+    """Deterministic unit embeddings (no torch): similar scenes land between CLIP_LOW and CLIP_HIGH."""
+    def embed(path):
+        gray = cascade.cv2.resize(cascade.cv2.imread(path, cascade.cv2.IMREAD_GRAYSCALE), (8, 8))
+        v = gray.astype(np.float64).ravel() - 96.0
+        return v / np.linalg.norm(v)
+
+    monkeypatch.setattr(cascade, "USE_CLIP", True)
+    monkeypatch.setattr(cascade, "_clip_failed", False, raising=False)
+    monkeypatch.setattr(cascade, "_safe_clip_embed", embed)
+    monkeypatch.setattr(cascade, "_clip_embed_batch", lambda paths: [embed(p) for p in paths])
+
+
+def test_tiers_match_per_pair_path(listing, fake_clip):
+    pairs = _pairs(listing)
+    tiered, stats = cascade.cascade_pairs(pairs, [False] * len(pairs))
+    exact = {k for k, (a, b) in enumerate(pairs) if open(a, "rb").read() == open(b, "rb").read()}
+    assert exact and all(tiered[k]["exit_stage"] == "STAGE0_EXACT" for k in exact)
+    for k, (t, p) in enumerate(zip(tiered, _per_pair(pairs))):
+        assert t["is_duplicate"] == p["is_duplicate"], pairs[k]
+        if k not in exact:
+            assert t["exit_stage"] == p["exit_stage"], pairs[k]
+    assert stats[0].pairs_in == len(pairs)
+
+
+def test_sift_override_constants_drive_both_paths(listing, fake_clip, monkeypatch):
+    monkeypatch.setattr(cascade, "CLIP_HIGH_THRESHOLD", 101.0)      # every pair past PDQ reaches SIFT
+    monkeypatch.setattr(cascade, "CLIP_LOW_THRESHOLD", -101.0)
+    monkeypatch.setattr(cascade, "SIFT_MIN_MATCHES", 1)
+    pairs = _pairs(listing)[:-1]
+    tiered, _ = cascade.cascade_pairs(pairs, [False] * len(pairs))
+    assert any(r["exit_stage"] == "STAGE3_SIFT" for r in tiered)
+
+    monkeypatch.setattr(cascade, "SIFT_OVERRIDE_MULT", 1e9)
+    monkeypatch.setattr(cascade, "SIFT_OVERRIDE_CLIP", 1e9)
+    tiered, _ = cascade.cascade_pairs(pairs, [False] * len(pairs))
+    per_pair = _per_pair(pairs)
+    assert not any(r["exit_stage"] == "STAGE3_SIFT" for r in tiered + per_pair)
+    assert [r["is_duplicate"] for r in tiered] == [r["is_duplicate"] for r in per_pair]
+
+
+def test_without_clip_only_tier0_accepts_identical_files(listing, monkeypatch):
+    monkeypatch.setattr(cascade, "USE_CLIP", False)
+    pairs = [(listing[0], listing[-1]), (listing[0], listing[1])]
+    tiered, _ = cascade.cascade_pairs(pairs, [False, False])
+    per_pair = _per_pair(pairs)
+    assert (tiered[0]["is_duplicate"], tiered[0]["exit_stage"]) == (True, "STAGE0_EXACT")
+    assert (per_pair[0]["is_duplicate"], per_pair[0]["exit_stage"]) == (False, "STAGE2_CLIP_LOW")
+    assert tiered[1]["is_duplicate"] == per_pair[1]["is_duplicate"] is False
+    assert tiered[1]["exit_stage"] == per_pair[1]["exit_stage"]
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from benchmark_suite import generate_listing
+from deduplicator import Deduplicator, FeatureStore
+
+ENGINES = ["deduplication", "dedup_fixed_drift"]
+LOOSE = {"threshold": 0.5, "aerial_threshold": 0.5}         # fewer drops than the engine defaults
+
+
+@pytest.fixture(scope="module")
+def groups(tmp_path_factory):
+    root = tmp_path_factory.mktemp("listing")
+    generate_listing(str(root), 8, rng_seed=11)
+    return [[str(p)] for p in sorted((root / "processed").glob("*.jpg"))]
+
+
+def _run(dedup, groups):
+    log = dedup.engine.ExperimentLogger()
+    kept = dedup.dedupe(groups, experiment_logger=log)
+    return kept, [(r["img_a"], r["img_b"], r["dropped"]) for r in log.comparison_results]
+
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_concurrent_configs_match_sequential_runs(name, groups, seeded_flann):
+    engine = __import__(name)
+    consts = {k: v for k, v in vars(engine).items() if k.isupper()}
+    module_logger = engine._experiment_logger
+
+    def pair(store):
+        base = Deduplicator.from_engine(engine, store)
+        return base, base.with_config(**LOOSE)
+
+    expected = [_run(d, groups) for d in pair(FeatureStore(engine, records={}))]
+    assert len(expected[0][0]) < len(expected[1][0])         # the configs really disagree
+
+    shared = pair(FeatureStore(engine, records={}))
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda d: _run(d, groups), shared * 3))
+    assert results == expected * 3
+    assert {k: v for k, v in vars(engine).items() if k.isupper()} == consts
+    assert engine._experiment_logger is module_logger
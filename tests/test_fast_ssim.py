@@ -0,0 +1,40 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+metrics = pytest.importorskip("skimage.metrics")
+
+from fast_ssim import DATA_RANGE, _pad_to, ssim_from_stats, ssim_one_vs_many, ssim_stats
+
+TOL = 1e-6
+
+
+def _thumbs(shapes, seed=0):
+    """Noisy, blurred variants of one scene (SSIM spread over 0–1), cropped to `shapes`."""
+    rng = np.random.default_rng(seed)
+    H, W = max(s[0] for s in shapes), max(s[1] for s in shapes)
+    scene = cv2.GaussianBlur(rng.uniform(0, 255, (H, W)).astype(np.float32), (0, 0), 3)
+    out = []
+    for k, (h, w) in enumerate(shapes):
+        noisy = scene + rng.normal(0, 4 * k, (H, W))
+        out.append(np.clip(noisy, 0, 255).astype(np.uint8)[:h, :w])
+    return out
+
+
+def _reference(a, b):
+    H, W = max(a.shape[0], b.shape[0]), max(a.shape[1], b.shape[1])
+    return metrics.structural_similarity(_pad_to(a, H, W), _pad_to(b, H, W), data_range=DATA_RANGE)
+
+
+@pytest.mark.parametrize("shapes", [
+    [(48, 64)] * 5,                                         # same shape: cross term only
+    [(48, 64), (64, 48), (40, 64), (48, 57), (48, 64)],     # mismatched: zero-padded
+], ids=["same-shape", "mismatched"])
+def test_matches_skimage(shapes):
+    grays = _thumbs(shapes)
+    stats = [ssim_stats(g) for g in grays]
+    refs = [_reference(grays[0], g) for g in grays[1:]]
+    assert max(refs) - min(refs) > 0.1                      # not all trivially equal
+    for ref, s in zip(refs, stats[1:]):
+        assert abs(ssim_from_stats(stats[0], s) - ref) <= TOL
+    assert np.abs(ssim_one_vs_many(stats[0], stats[1:]) - refs).max() <= TOL
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from benchmark_suite import generate_listing
+from feature_shards import FeatureShard, ensure_shard
+
+ENGINES = ["deduplication", "dedup_fixed_drift"]
+
+
+@pytest.fixture(scope="module")
+def paths(tmp_path_factory):
+    root = tmp_path_factory.mktemp("listing")
+    generate_listing(str(root), 5, rng_seed=7)
+    return sorted(str(p) for p in (root / "processed").glob("*.jpg"))
+
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_pair_sim_matches_engine(name, paths, tmp_path):
+    engine = __import__(name)
+    shard = ensure_shard(engine, paths, str(tmp_path), listing="l0")
+    assert shard.check(engine) and sorted(shard) == paths
+    for i in range(len(paths) - 1):
+        for j in range(i + 1, len(paths)):
+            a, b = paths[i], paths[j]
+            got = shard.pair_sim(a, b)
+            mtb, edge, hd, ssim, _clip, _sift = engine._pair_sim(a, b)
+            assert got[:4] == (mtb, edge, hd, ssim), (a, b)
+            assert shard.pair_sim(a, b)[5] == got[5]          # seeded FLANN: same count every call
+    assert FeatureShard(str(shard.path)).pair_sim(paths[0], paths[1]) == shard.pair_sim(paths[0], paths[1])
@@ -0,0 +1,92 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from global_index import PDQ_CHUNKS, GlobalIndex
+from multihash import popcount
+
+RADIUS = 31
+SPREAD = np.array([0b11] * (PDQ_CHUNKS - 1) + [0b1], np.uint16)     # 31 bits; only one chunk within 1
+FULL = np.full(PDQ_CHUNKS, 0b11, np.uint16)                          # 32 bits; every chunk 2 away
+
+
+def _hash(chunks):
+    """16 uint16 chunks → one (4,) uint64 PDQ hash, in the index's chunk layout."""
+    return np.asarray(chunks, np.uint16).view(np.uint64)
+
+
+def _fragment(listing, chunks):
+    n = len(chunks)
+    return {"paths": np.array([f"/{listing}/{k}.jpg" for k in range(n)], dtype=str),
+            "listings": np.array([listing] * n, dtype=str), "pdq": np.stack([_hash(c) for c in chunks]),
+            "pdq_ok": np.ones(n, bool), "clip": np.zeros((n, 0), np.float16), "clip_ok": np.zeros(n, bool)}
+
+
+def _hits(index, listing):
+    return {k: m.index_hd for k, m in index.candidates(listing, pdq_radius=RADIUS).items()}
+
+
+def _brute_force(fragments, listing):
+    q, out = fragments[listing], {}
+    for other, frag in fragments.items():
+        if other != listing:
+            for i, a in enumerate(q["pdq"]):
+                for j in np.flatnonzero(popcount(frag["pdq"] ^ a) <= RADIUS):
+                    out[(str(q["paths"][i]), str(frag["paths"][j]))] = int(popcount(frag["pdq"][j] ^ a))
+    return out
+
+
+@pytest.fixture
+def setup(tmp_path):
+    rng = np.random.default_rng(0)
+    noise = lambda: rng.integers(0, 1 << 16, PDQ_CHUNKS, dtype=np.uint16)       # noqa: E731
+    q = noise()
+    one_chunk = q.copy()
+    one_chunk[0] ^= 0b11
+    fragments = {"q": _fragment("q", [q, noise()]),
+                 "near": _fragment("near", [q ^ SPREAD, q ^ FULL, one_chunk]),
+                 "noise": _fragment("noise", [noise() for _ in range(40)])}
+    index = GlobalIndex(str(tmp_path / "index"), engine="drift_fix", pair_metrics=lambda a, b: None)
+    for frag in fragments.values():
+        index.add_fragment(frag)
+    return index, fragments, q
+
+
+def test_distance_31_is_found_through_the_chunk_tables(setup):
+    index, fragments, _q = setup
+    expected = _brute_force(fragments, "q")
+    assert expected == {("/q/0.jpg", "/near/0.jpg"): 31, ("/q/0.jpg", "/near/2.jpg"): 2}
+    assert _hits(index, "q") == expected                   # delta rows: exact scan
+    index.compact()
+    assert index.mih is not None and not index._delta
+    assert _hits(index, "q") == expected                   # base rows: 16 chunk probes at radius 1
+    assert _hits(index, "near") == _brute_force(fragments, "near")
+
+
+def test_replaced_listing_hides_its_base_rows(setup):
+    index, fragments, q = setup
+    index.compact()
+    moved = q.copy()
+    moved[5] ^= 0b100
+    fragments["near"] = _fragment("near", [moved])
+    index.add_fragment(fragments["near"])
+    assert int(index._base_dead.sum()) == 3 and len(index) == 2 + 1 + 40
+    assert _hits(index, "q") == _brute_force(fragments, "q") == {("/q/0.jpg", "/near/0.jpg"): 1}
+    assert _hits(index, "noise") == {}
+
+
+def test_compact_keeps_query_results(setup):
+    index, fragments, q = setup
+    index.compact()
+    fragments["near"] = _fragment("near", [q ^ SPREAD, q])
+    index.add_fragment(fragments["near"])
+    fragments["late"] = _fragment("late", [q ^ FULL, q ^ SPREAD[::-1]])
+    index.add_fragment(fragments["late"])
+    before = {name: _hits(index, name) for name in fragments}
+    assert before == {name: _brute_force(fragments, name) for name in fragments}
+    index.compact()
+    assert {name: _hits(index, name) for name in fragments} == before
+    reopened = GlobalIndex(str(index.root), engine="drift_fix", pair_metrics=lambda a, b: None)
+    assert {name: _hits(reopened, name) for name in fragments} == before
+    assert len(reopened) == 2 + 2 + 40 + 2 and not reopened._base_dead.any()
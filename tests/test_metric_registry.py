@@ -0,0 +1,69 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from bounded_cache import BoundedCache
+from benchmark_suite import generate_listing
+from metric_registry import (DecisionPolicy, FeatureSpec, LazyPairEvaluator, MetricRegistry, _and3,
+                             _or3, build_registry, dedupe_groups)
+
+ENGINES = ["deduplication", "dedup_fixed_drift"]
+
+
+@pytest.fixture(scope="module")
+def paths(tmp_path_factory):
+    root = tmp_path_factory.mktemp("listing")
+    generate_listing(str(root), 6, rng_seed=5)
+    return sorted(str(p) for p in (root / "processed").glob("*.jpg"))
+
+
+def test_three_valued_logic_accepts_numpy_bools():
+    assert _and3(np.True_, True) is True
+    assert _and3(np.False_, None) is False
+    assert _or3(np.True_, None) is True
+    assert _or3(np.False_, False) is False
+    assert _and3(np.True_, None) is None
+
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_lazy_decisions_match_decide_pair(name, paths, seeded_flann):
+    engine = __import__(name)
+    ev = LazyPairEvaluator(build_registry(engine))
+    policies = {a: DecisionPolicy.from_engine(engine, aerial=a) for a in (False, True)}
+    reasons = set()
+    for i in range(len(paths) - 1):
+        for j in range(i + 1, len(paths)):
+            a, b = paths[i], paths[j]
+            aerial = engine._is_aerial(a, {}) or engine._is_aerial(b, {})
+            mtb, _edge, hd, ssim, clip, sift = engine._pair_sim(a, b)
+            r = ev.evaluate(a, b, policies[aerial])
+            if hd == 999:
+                assert r.skipped
+                continue
+            d = engine._decide_pair(mtb, hd, ssim, clip, sift, engine._policy(aerial))
+            assert r.dup == bool(d["dup"]), (a, b, d)
+            reasons.add(d["drop_reason"].split(" ")[0])
+    assert {"duplicate", "MTB"} <= reasons          # both a score and a gate decision covered
+
+
+@pytest.mark.parametrize("name", ENGINES)
+@pytest.mark.parametrize("full_scan", [False, True])
+def test_dedupe_groups_matches_remove_near_duplicates(name, full_scan, paths, seeded_flann):
+    engine = __import__(name)
+    groups = [[p] for p in paths]
+    expected = engine.remove_near_duplicates(groups, deduplication_flag=1, metadata_dict={},
+                                             full_scan=full_scan, experiment_logger=False, profiler=False)
+    kept = dedupe_groups(groups, engine, {}, full_scan=full_scan, drift=name == "dedup_fixed_drift")
+    assert kept == expected
+
+
+def test_feature_cache_is_bounded():
+    reg = MetricRegistry(cache=BoundedCache(max_bytes=1 << 20, name="test"))
+    reg.register_feature(FeatureSpec("blob", lambda p, d: np.zeros(1 << 18, np.uint8), 1.0))
+    for k in range(8):
+        reg.feature(f"/img{k}.jpg", "blob")
+    assert reg._cache.bytes <= 1 << 20
+    assert not reg.has("/img0.jpg", "blob") and reg.has("/img7.jpg", "blob")
+    reg.evict("/img7.jpg")
+    assert not reg.has("/img7.jpg", "blob")
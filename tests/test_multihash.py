@@ -0,0 +1,42 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from multihash import fingerprint_paths, hamming, hamming_matrix, pack_bits, popcount, unpack_bits
+
+
+def test_phash_matches_imagehash(tmp_path):
+    imagehash = pytest.importorskip("imagehash")
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for k in range(12):
+        if k % 2:                           # smooth scene: many DCT coefficients near the median
+            small = rng.integers(0, 256, (4 + k, 6 + k, 3), dtype=np.uint8)
+            img = Image.fromarray(small).resize((120 + 7 * k, 90 + 5 * k), Image.BICUBIC)
+        else:
+            img = Image.fromarray(rng.integers(0, 256, (64, 80, 3), dtype=np.uint8))
+        paths.append(str(tmp_path / f"{k}.png"))
+        img.save(paths[-1])
+    batch = fingerprint_paths(paths, max_workers=2)
+    assert batch.ok.all()
+    for i, p in enumerate(paths):
+        with Image.open(p) as img:
+            expected = pack_bits(imagehash.phash(img, hash_size=8).hash.reshape(-1))
+        assert batch.hashes["phash"][i].tolist() == expected.tolist(), p
+
+
+def test_popcount_and_hamming_on_packed_words():
+    rng = np.random.default_rng(1)
+    bits = rng.random((6, 256)) < 0.5
+    words = pack_bits(bits)
+    assert words.shape == (6, 4) and words.dtype == np.uint64
+    assert (unpack_bits(words) == bits).all()
+    assert pack_bits(np.eye(64, dtype=bool)[0])[0] == np.uint64(1 << 63)          # MSB first
+    assert popcount(words).tolist() == bits.sum(1).tolist()
+    assert popcount(np.array([0, 1, 2 ** 64 - 1, 0x8000000000000001], np.uint64)[:, None]).tolist() == [0, 1, 64, 2]
+    expected = (bits[:, None, :] != bits[None, :, :]).sum(-1)
+    assert (hamming_matrix(words, words) == expected).all()
+    assert all(hamming(words[i], words[j]) == expected[i, j] for i in range(6) for j in range(6))
@@ -0,0 +1,34 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pair_metric_matrix import PairMetricMatrix, policy_from_engine
+
+
+# MTB below the floor: only the SIFT override lets these pairs through
+PAIRS = PairMetricMatrix.from_rows([
+    {"mtb": 70, "ssim": 90, "clip": 80, "pdq_hd": 10, "sift": 80},    # 2 × sift_min
+    {"mtb": 70, "ssim": 90, "clip": 88, "pdq_hd": 10, "sift": 45},    # sift_min, CLIP 88
+])
+
+
+def test_sift_override_defaults(fake_engine):
+    policy = policy_from_engine(fake_engine())
+    assert (policy["sift_override_mult"], policy["sift_override_clip"]) == (1.5, 85.0)
+    assert PAIRS.evaluate(policy["weights"], policy)["decisions"].tolist() == [[True, True]]
+
+
+def test_sift_override_follows_engine_constants(fake_engine):
+    policy = policy_from_engine(fake_engine(SIFT_OVERRIDE_MULT=3.0, SIFT_OVERRIDE_CLIP=92.0))
+    assert PAIRS.evaluate(policy["weights"], policy)["decisions"].tolist() == [[False, False]]
+    assert PAIRS.evaluate(policy["weights"], policy, sift_override=False)["dropped"].tolist() == [0]
+
+
+@pytest.mark.parametrize("name", ["deduplication", "dedup_fixed_drift"])
+def test_policy_matches_engine_module(name):
+    pytest.importorskip("cv2")
+    engine = __import__(name)
+    for aerial in (False, True):
+        policy = policy_from_engine(engine, aerial)
+        assert policy["sift_override_mult"] == engine.SIFT_OVERRIDE_MULT
+        assert policy["sift_override_clip"] == engine.SIFT_OVERRIDE_CLIP
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from profiling import ListingProfiler, profile_phase
+
+
+def _busy(n=20000):
+    return sum(i * i for i in range(n))
+
+
+def test_phase_ends_when_block_raises(tmp_path):
+    prof = ListingProfiler(str(tmp_path), interval=0.001)
+    prof.listing = "L1"
+    with pytest.raises(ValueError):
+        with prof.phase("phase2"):
+            _busy()
+            raise ValueError("pair failed")
+    assert prof._phase is None
+    assert [(r.listing, r.phase) for r in prof.results] == [("L1", "phase2")]
+    assert (tmp_path / "L1" / "phase2.collapsed").exists() and (tmp_path / "L1" / "phase2.pstats").exists()
+
+
+def test_profile_phase_without_profiler_is_a_no_op():
+    with profile_phase(None, "phase1"):
+        _busy(10)
+    with profile_phase(False, "phase1"):
+        _busy(10)
+
+
+def test_profiler_refuses_a_second_thread(tmp_path):
+    prof = ListingProfiler(str(tmp_path), mode="sample")
+    errors = []
+
+    def other():
+        try:
+            prof.enter("phase1")
+        except RuntimeError as e:
+            errors.append(e)
+
+    with prof.phase("phase1"):
+        t = threading.Thread(target=other)
+        t.start()
+        t.join()
+    assert len(errors) == 1 and len(prof.results) == 1
+
+
+@pytest.mark.parametrize("name", ["deduplication", "dedup_fixed_drift"])
+def test_engine_phases_per_call(name, tmp_path):
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    engine = __import__(name)
+    groups = [[f"/listing/{k}.jpg"] for k in range(4)]
+
+    def failing_pairs(a, b):
+        raise OSError("unreadable image")
+
+    prof = ListingProfiler(str(tmp_path / "fail"), mode="sample")
+    with pytest.raises(OSError):
+        engine.remove_near_duplicates(groups, deduplication_flag=1, metadata_dict={},
+                                      pair_metrics=failing_pairs, experiment_logger=False, profiler=prof)
+    assert prof._phase is None and [r.phase for r in prof.results] == ["phase2"]
+
+    def pairs(a, b):
+        _busy(2000)
+        return 10.0, 10.0, 200, 10.0, 10.0, 0                  # never a duplicate
+
+    profilers = [ListingProfiler(str(tmp_path / "ok"), mode="sample") for _ in range(3)]
+
+    def run(k):
+        profilers[k].listing = f"L{k}"
+        kept = engine.remove_near_duplicates(groups, deduplication_flag=1, metadata_dict={},
+                                             pair_metrics=pairs, experiment_logger=False,
+                                             profiler=profilers[k])
+        assert kept == groups
+
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [[(r.listing, r.phase) for r in p.results] for p in profilers] == \
+        [[(f"L{k}", "phase2")] for k in range(3)]
+    assert engine._profiler is None
@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from replay_decisions import replay_store
+from result_store import ResultStore, engine_config
+
+# Every metric near its ceiling: a duplicate under any reachable threshold
+SAME = {"mtb": 99.0, "edge": 99.0, "ssim": 99.0, "clip": 99.0, "pdq_hd": 0, "sift": 200}
+
+
+def _store(root, aerial_flags):
+    """One two-image listing per flag; the filenames alone never look aerial."""
+    import deduplication
+    with ResultStore(str(root), engine="deduplication", config=engine_config(deduplication),
+                     fmt="jsonl") as store:
+        for n, aerial in enumerate(aerial_flags):
+            a, b = f"/l{n}/a.jpg", f"/l{n}/b.jpg"
+            store.add_pair(listing=f"l{n}", path_a=a, path_b=b, score=1.0, aerial=aerial,
+                           decision=True, drop_reason="duplicate", dropped_path=a, **SAME)
+        return store.run_id
+
+
+def test_replay_without_overrides_reproduces_stored_run(tmp_path):
+    run_id = _store(tmp_path, [True, False])
+    report = replay_store(str(tmp_path), run_id)
+    assert report["totals"]["changed_listings"] == 0
+    assert report["totals"]["computed_pairs"] == 0
+
+
+def test_replay_uses_stored_aerial_flag(tmp_path):
+    # Only the regular threshold becomes unreachable: the pair recorded as
+    # aerial keeps its aerial policy even though its filenames say otherwise
+    run_id = _store(tmp_path, [True, False])
+    report = replay_store(str(tmp_path), run_id, overrides={"COMPOSITE_DUP_THRESHOLD": 2.0})
+    flips = {r["listing"]: r["newly_kept"] for r in report["listings"]}
+    assert flips == {"l0": [], "l1": ["/l1/a.jpg"]}
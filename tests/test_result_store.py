@@ -0,0 +1,88 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from result_store import ResultStore, read_table, stored_comparisons
+
+FORMATS = ["jsonl"] + (["parquet", "arrow"] if importlib.util.find_spec("pyarrow") else [])
+
+
+def _pair(store, listing, a, b, **values):
+    store.add_pair(listing=listing, path_a=a, path_b=b, mtb=90.0, edge=80.0, ssim=70.0,
+                   clip=95.0, pdq_hd=12, sift=60, score=0.8, timing_ms=4.0, **values)
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_open_run_is_readable(tmp_path, fmt):
+    with ResultStore(str(tmp_path), engine="e", fmt=fmt, flush_every=2) as store:
+        for n in range(3):
+            _pair(store, "l0", f"/l0/{n}.jpg", f"/l0/{n + 1}.jpg")
+        assert len(store.pairs()["path_a"]) == 3          # two flushes, one buffered
+        _pair(store, "l1", "/l1/a.jpg", "/l1/b.jpg", decision=True, drop_reason="duplicate")
+        rows = stored_comparisons(store, "l1")
+    assert [(r["img_a"], r["dropped"], r["exit_stage"]) for r in rows] == [("a", True, "COMPOSITE")]
+    cols = read_table(str(tmp_path), "pairs", columns=["listing"])
+    assert sorted(cols["listing"]) == ["l0", "l0", "l0", "l1"]
+
+
+def test_experiment_log_is_rendered_from_the_store(tmp_path):
+    pytest.importorskip("cv2")
+    import deduplication
+    log = deduplication.ExperimentLogger()
+    with ResultStore(str(tmp_path / "store"), engine="deduplication", fmt="jsonl") as store:
+        log.result_store, log.listing = store, "l0"
+        log.add_comparison("/l0/a.jpg", "/l0/b.jpg", 90.0, 80.0, 70.0, 95.0, 12, 60, 0.8,
+                           dropped=True, drop_reason="duplicate", dropped_path="/l0/a.jpg")
+        log.comparison_results.clear()
+        log.write_experiment_log("exp", "", str(tmp_path / "log.md"))
+    md = (tmp_path / "log.md").read_text(encoding="utf-8")
+    assert "| a | b | 90.0 | 80.0 | 70.0 | 95.0 | 12 | 60 | 0.80 | Yes (duplicate) |" in md
+
+
+def test_listing_reads_open_only_its_parts(tmp_path, monkeypatch):
+    import result_store
+
+    with ResultStore(str(tmp_path), engine="old", fmt="jsonl") as old:
+        _pair(old, "l1", "/l1/x.jpg", "/l1/y.jpg")
+    opened = []
+    real = result_store._read_file
+    monkeypatch.setattr(result_store, "_read_file", lambda path, cols: opened.append(path) or real(path, cols))
+    with ResultStore(str(tmp_path), engine="e", fmt="jsonl", flush_every=1) as store:
+        for listing in ("l0", "l1", "l2"):
+            _pair(store, listing, f"/{listing}/a.jpg", f"/{listing}/b.jpg")
+        rows = stored_comparisons(store, "l1")
+        assert [r["img_a"] for r in rows] == ["a"]
+        assert len(opened) == 1 and opened[0].name.startswith(store.run_id)
+        opened.clear()
+        assert len(read_table(str(tmp_path), "pairs", run_id=store.run_id)["path_a"]) == 3
+        assert all(p.name.startswith(store.run_id) for p in opened)
+
+
+def test_run_test_eval_comparisons_come_from_the_store(tmp_path):
+    pytest.importorskip("cv2")
+    from benchmark_suite import generate_listing
+    from run_test_eval import generate_folder_markdown, process_folder
+
+    generate_listing(str(tmp_path / "1"), 4, rng_seed=2)
+    with ResultStore(str(tmp_path / "store"), engine="dedup_fixed_drift", fmt="jsonl") as store:
+        result = process_folder(1, tmp_path / "1", store=store)
+        assert result["comparisons"] == stored_comparisons(store, str(tmp_path / "1"))
+    assert len(result["comparisons"]) == 3
+    md = (tmp_path / generate_folder_markdown(result, tmp_path)).read_text(encoding="utf-8")
+    assert Path(result["kept_images"][0]).stem in md
+
+
+def test_visualize_groups_from_store(tmp_path):
+    pytest.importorskip("PIL")
+    from visualize_greatersift import groups_from_store
+
+    with ResultStore(str(tmp_path), engine="e", fmt="jsonl") as store:
+        for dup, sift in (("b", 200), ("c", 20)):
+            store.add_pair(listing="/l0", path_a=f"/l0/{dup}.jpg", path_b="/l0/a.jpg", mtb=90.0,
+                           edge=80.0, ssim=70.0, clip=95.0, pdq_hd=12, sift=sift, score=0.2,
+                           decision=True, drop_reason="duplicate", dropped_path=f"/l0/{dup}.jpg")
+    # score 0.2 < 0.35: only the SIFT >= 150 override keeps b as a duplicate of a
+    assert groups_from_store(str(tmp_path)) == {"/l0": {"a.jpg": ["b.jpg"]}}
@@ -0,0 +1,131 @@
+import struct
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+import run_test_eval
+from download_s3_images import sync_folders
+from s3_headers import HEADER_BYTES, PLAN_FILE, fetch_headers, parse_exif, plan_listing
+from s3_store import DirectoryStore
+
+
+def _ifd(entries, start, endian, next_ifd=0):
+    """IFD bytes at TIFF offset `start`; entries = [(tag, type, count, value bytes)]."""
+    data_at = start + 2 + 12 * len(entries) + 4
+    head, tail = struct.pack(endian + "H", len(entries)), b""
+    for tag, typ, count, value in entries:
+        if len(value) <= 4:
+            field = value.ljust(4, b"\x00")
+        else:
+            field = struct.pack(endian + "I", data_at + len(tail))
+            tail += value
+        head += struct.pack(endian + "HHI", tag, typ, count) + field
+    return head + struct.pack(endian + "I", next_ifd) + tail
+
+
+def exif_jpeg(make, model, when, thumbnail, body, byte_order=b"II"):
+    """A JPEG whose APP1 carries IFD0 (make/model), Exif IFD (DateTimeOriginal) and IFD1 (thumbnail)."""
+    e = "<" if byte_order == b"II" else ">"
+
+    def ascii_(s):
+        return s.encode() + b"\x00"
+
+    def long_(n):
+        return struct.pack(e + "I", n)
+
+    def ifd0(exif_at, next_ifd):
+        return _ifd([(0x010F, 2, len(make) + 1, ascii_(make)), (0x0110, 2, len(model) + 1, ascii_(model)),
+                     (0x8769, 4, 1, long_(exif_at))], ifd0_at, e, next_ifd)
+
+    exif_at = 8
+    exif = _ifd([(0x9003, 2, 20, ascii_(when))], exif_at, e)
+    ifd0_at = exif_at + len(exif)
+    ifd1_at = ifd0_at + len(ifd0(0, 0))
+    thumb_at = ifd1_at + 2 + 12 * 2 + 4
+    ifd1 = _ifd([(0x0201, 4, 1, long_(thumb_at)), (0x0202, 4, 1, long_(len(thumbnail)))], ifd1_at, e)
+    tiff = byte_order + struct.pack(e + "H", 42) + long_(ifd0_at) + exif + ifd0(exif_at, ifd1_at) + ifd1 + thumbnail
+    app1 = b"Exif\x00\x00" + tiff
+    return b"\xff\xd8" + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + body[2:]
+
+
+def _jpeg(img, quality=92):
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def _scene(seed):
+    rng = np.random.default_rng(seed)
+    return cv2.resize(rng.integers(0, 256, (24, 32, 3), dtype=np.uint8), (640, 480), interpolation=cv2.INTER_CUBIC)
+
+
+def _frame(seed, when, make="DJI", model="FC3411", byte_order=b"II"):
+    img = _scene(seed)
+    noise = np.random.default_rng(seed).integers(0, 256, img.shape, dtype=np.uint8)
+    body = _jpeg(cv2.addWeighted(img, 0.7, noise, 0.3, 0), quality=95)           # > HEADER_BYTES
+    return exif_jpeg(make, model, when, _jpeg(cv2.resize(img, (160, 120))), body, byte_order)
+
+
+@pytest.mark.parametrize("byte_order", [b"II", b"MM"])
+def test_parse_exif_from_ranged_header(tmp_path, byte_order):
+    data = _frame(1, "2024:05:01 10:00:00", byte_order=byte_order)
+    assert len(data) > HEADER_BYTES
+    (tmp_path / "a.jpg").write_bytes(data)
+    header = DirectoryStore(str(tmp_path)).get_bytes("a.jpg", 0, HEADER_BYTES - 1)
+    assert len(header) == HEADER_BYTES
+
+    info = parse_exif(header)
+    assert (info["make"], info["model"], info["datetime"]) == ("DJI", "FC3411", "2024-05-01T10:00:00")
+    thumb = cv2.imdecode(np.frombuffer(info["thumbnail"], np.uint8), cv2.IMREAD_COLOR)
+    assert thumb.shape == (120, 160, 3)
+
+
+def test_parse_exif_truncated_and_plain_jpegs():
+    data = _frame(1, "2024:05:01 10:00:00")
+    partial = parse_exif(data[:200])                        # IFD0 present, thumbnail cut off
+    assert partial["make"] == "DJI" and partial["thumbnail"] is None
+    assert parse_exif(_jpeg(_scene(2))) == {"make": "", "model": "", "datetime": "", "thumbnail": None}
+    assert parse_exif(b"not a jpeg")["make"] == ""
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    processed = tmp_path / "bucket" / "L1" / "processed"
+    processed.mkdir(parents=True)
+    frames = {"a.jpg": _frame(1, "2024:05:01 10:00:00"),
+              "b.jpg": _frame(1, "2024:05:01 10:00:01"),       # burst repeat of a
+              "c.jpg": _frame(7, "2024:05:01 10:00:02", make="Canon", model="EOS R5"),
+              "d.jpg": _frame(7, "2024:05:01 10:05:00", make="Canon", model="EOS R5")}   # same scene, later
+    for name, data in frames.items():
+        (processed / name).write_bytes(data)
+    return tmp_path / "bucket"
+
+
+def test_plan_prefilters_bursts(bucket):
+    store = DirectoryStore(str(bucket))
+    objects = store.list_objects("L1/processed/")
+    headers = fetch_headers(store, objects, workers=4)
+    assert all(h["header_bytes"] == HEADER_BYTES for h in headers.values())
+
+    plan = plan_listing(objects, headers)
+    assert [k.rsplit("/", 1)[-1] for k in plan.keep] == ["a.jpg", "c.jpg", "d.jpg"]
+    assert plan.skipped[0]["key"] == "L1/processed/b.jpg" and plan.skipped[0]["like"] == "L1/processed/a.jpg"
+    assert plan.metadata["c.jpg"]["make"] == "Canon"
+    assert plan.header_bytes == 4 * HEADER_BYTES
+
+
+def test_header_plan_round_trip_through_run_test_eval(bucket, tmp_path):
+    stats = sync_folders(str(bucket), str(tmp_path / "images"), manifest_file=str(tmp_path / "manifest.jsonl"),
+                         workers=4, header_first=True)
+    assert (stats["prefiltered"], stats["downloaded"]) == (1, 3)
+
+    folder = tmp_path / "images" / "L1"
+    assert (folder / PLAN_FILE).exists()
+    assert not (folder / "processed" / "b.jpg").exists()
+    metadata = run_test_eval.load_header_metadata(folder)
+    processed = (folder / "processed").resolve()
+    assert set(metadata) == {str(processed / n) for n in ("a.jpg", "b.jpg", "c.jpg", "d.jpg")}
+    assert metadata[str(processed / "a.jpg")] == {"make": "DJI", "model": "FC3411",
+                                                  "datetime": "2024-05-01T10:00:00"}
+    assert run_test_eval.load_header_metadata(Path(tmp_path / "missing")) == {}
@@ -0,0 +1,145 @@
+import json
+
+import pytest
+
+import s3_store
+from download_s3_images import Manifest, sync_folders
+from s3_store import DirectoryStore, ObjectInfo, _write_atomic, open_store, with_retry
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    root = tmp_path / "bucket"
+    for folder in ("101", "102"):
+        processed = root / folder / "processed"
+        processed.mkdir(parents=True)
+        for k in range(3):
+            (processed / f"img_{k}.jpg").write_bytes(f"{folder}-{k}".encode() * 100)
+    return root
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(s3_store.time, "sleep", delays.append)
+    monkeypatch.setattr(s3_store.random, "uniform", lambda lo, hi: hi)
+    return delays
+
+
+def _sync(bucket, tmp_path, **kwargs):
+    return sync_folders(str(bucket), str(tmp_path / "images"), manifest_file=str(tmp_path / "manifest.jsonl"),
+                        workers=4, **kwargs)
+
+
+# ─── DirectoryStore ───────────────────────────────────────────────────────────
+def test_directory_store_lists_and_reads_ranges(bucket):
+    store, prefix = open_store(f"file://{bucket}")
+    assert isinstance(store, DirectoryStore) and prefix == ""
+    assert store.list_prefixes() == ["101", "102"]
+    objs = store.list_objects("101/processed/")
+    assert [o.key for o in objs] == [f"101/processed/img_{k}.jpg" for k in range(3)]
+    assert store.get_bytes(objs[0].key, 0, 3) == b"101-"
+    assert store.get_bytes(objs[0].key, 4) == store.get_bytes(objs[0].key)[4:]
+
+
+# ─── manifest skip / resume ───────────────────────────────────────────────────
+def test_sync_skips_unchanged_and_refetches_changed(bucket, tmp_path):
+    first = _sync(bucket, tmp_path)
+    assert (first["objects"], first["downloaded"], first["skipped"]) == (6, 6, 0)
+    local = tmp_path / "images" / "101" / "processed" / "img_0.jpg"
+    assert local.read_bytes() == (bucket / "101" / "processed" / "img_0.jpg").read_bytes()
+
+    assert _sync(bucket, tmp_path)["skipped"] == 6
+
+    (bucket / "101" / "processed" / "img_1.jpg").write_bytes(b"changed")   # new ETag
+    local.unlink()                                                        # lost locally
+    again = _sync(bucket, tmp_path)
+    assert (again["downloaded"], again["skipped"]) == (2, 4)
+    assert (tmp_path / "images" / "101" / "processed" / "img_1.jpg").read_bytes() == b"changed"
+
+
+def test_manifest_survives_a_torn_last_line(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text(json.dumps({"key": "a", "etag": "e1", "size": 3}) + "\n" + '{"key": "b", "et')
+    m = Manifest(path)
+    m.record(ObjectInfo("b", 4, "e2"))
+    m.close()
+    reloaded = Manifest(path)
+    reloaded.close()
+    assert set(reloaded.entries) == {"a", "b"}
+
+
+# ─── atomic writes ────────────────────────────────────────────────────────────
+def test_interrupted_write_leaves_previous_file(tmp_path):
+    dest = tmp_path / "out" / "img.jpg"
+    assert _write_atomic(dest, iter([b"old"])) == 3
+
+    def _chunks():
+        yield b"partial"
+        raise ConnectionError("reset by peer")
+
+    with pytest.raises(ConnectionError):
+        _write_atomic(dest, _chunks())
+    assert dest.read_bytes() == b"old"
+    assert not (tmp_path / "out" / "img.jpg.part").exists()
+
+
+def test_part_files_are_not_listed(bucket):
+    (bucket / "101" / "processed" / "img_9.jpg.part").write_bytes(b"half")
+    keys = [o.key for o in DirectoryStore(str(bucket)).list_objects("101/")]
+    assert "101/processed/img_9.jpg.part" not in keys
+
+
+# ─── retry ────────────────────────────────────────────────────────────────────
+class _ClientError(Exception):
+    def __init__(self, code, status):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}
+
+
+def test_with_retry_backs_off_exponentially(no_sleep):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 4:
+            raise _ClientError("SlowDown", 503)
+        return "ok"
+
+    assert with_retry(flaky, base_delay=0.1) == "ok"
+    assert no_sleep == pytest.approx([0.1, 0.2, 0.4])
+
+
+@pytest.mark.parametrize("exc", [FileNotFoundError("k"), _ClientError("AccessDenied", 403)])
+def test_with_retry_does_not_retry_permanent_errors(no_sleep, exc):
+    def broken():
+        raise exc
+
+    with pytest.raises(type(exc)):
+        with_retry(broken)
+    assert no_sleep == []
+
+
+def test_with_retry_gives_up_after_attempts(no_sleep):
+    def down():
+        raise ConnectionError("unreachable")
+
+    with pytest.raises(ConnectionError):
+        with_retry(down, attempts=3)
+    assert len(no_sleep) == 2
+
+
+def test_sync_retries_transient_download_errors(bucket, tmp_path, no_sleep, monkeypatch):
+    real = DirectoryStore.download
+    failed = set()
+
+    def flaky(self, key, dest):
+        if key not in failed:
+            failed.add(key)
+            raise ConnectionError("connection reset")
+        return real(self, key, dest)
+
+    monkeypatch.setattr(DirectoryStore, "download", flaky)
+    stats = _sync(bucket, tmp_path)
+    assert (stats["downloaded"], stats["failed"]) == (6, 0)
+    assert len(no_sleep) == 6
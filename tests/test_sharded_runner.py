@@ -0,0 +1,65 @@
+import json
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+import sharded_runner
+from batch_scheduler import discover_listings
+from benchmark_suite import generate_listing
+from sharded_runner import Coordinator, CoordinatorServer, load_fragments, shard_id
+
+
+@pytest.fixture(scope="module")
+def listing_root(tmp_path_factory):
+    root = tmp_path_factory.mktemp("listings")
+    for k in range(3):
+        generate_listing(str(root / f"L{k}"), 5 + k, rng_seed=k)
+    return root
+
+
+def test_shard_ids_follow_content_and_config(listing_root, tmp_path):
+    listings = discover_listings(str(listing_root))
+    coordinator = Coordinator(str(tmp_path))
+    assert coordinator.enqueue(listings, 6, False) == coordinator.counts()["pending"]
+    first = {r[0] for r in coordinator.queue.conn.execute("SELECT listing FROM jobs")}
+
+    coordinator.enqueue(listings, 6, False)                   # same plan: resumed, not duplicated
+    assert {r[0] for r in coordinator.queue.conn.execute("SELECT listing FROM jobs")} == first
+
+    coordinator.enqueue(listings, 6, True)                    # full scan: fresh ids, stale ones dropped
+    rows = dict(coordinator.queue.conn.execute("SELECT listing, path FROM jobs").fetchall())
+    assert not first & set(rows)
+    for sid, payload in rows.items():
+        assert sid == shard_id(json.loads(payload), 6, True)
+
+
+def test_coordinator_with_local_workers(listing_root, tmp_path):
+    listings = discover_listings(str(listing_root))
+    coordinator = Coordinator(str(tmp_path), lease_s=120)
+    n_shards = coordinator.enqueue(listings, 6, False)
+    server = CoordinatorServer(("127.0.0.1", 0), coordinator)
+    server.start()
+    address = f"127.0.0.1:{server.server_address[1]}"
+    procs = [subprocess.Popen(sharded_runner._worker_cmd("--connect", address, "drift_fix", False))
+             for _ in range(2)]
+    try:
+        counts = coordinator.wait(poll_s=0.2, alive=lambda: any(p.poll() is None for p in procs))
+        for p in procs:
+            assert p.wait(timeout=120) == 0
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+        server.shutdown()
+    assert counts["done"] == n_shards and counts["failed"] == 0
+
+    results_path, frag_path = coordinator.collect()
+    results = [json.loads(line) for line in results_path.read_text().splitlines()]
+    assert sorted(r["listing"] for r in results) == ["L0", "L1", "L2"]
+    for r in results:
+        assert r["error"] is None
+        assert len(r["kept"]) + len(r["dropped"]) == r["images"]
+    assert len(load_fragments(str(frag_path))["paths"]) == sum(l["images"] for l in listings)
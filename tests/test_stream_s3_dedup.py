@@ -0,0 +1,70 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+import dedup_fixed_drift as engine
+from benchmark_suite import generate_listing
+from bounded_cache import engine_caches
+from stream_s3_dedup import StreamDedup
+
+
+@pytest.fixture(scope="module")
+def bucket(tmp_path_factory):
+    root = tmp_path_factory.mktemp("bucket")
+    for k in range(2):
+        generate_listing(str(root / f"L{k}"), 8, rng_seed=10 + k)
+    return root
+
+
+def _cached_keys():
+    keys = set()
+    for cache in engine_caches(engine):
+        for key in cache:
+            keys.update(key if isinstance(key, tuple) else (key,))
+    return {k for k in keys if isinstance(k, str)}
+
+
+def _stream(bucket, folder_ids):
+    async def _collect():
+        pipeline = StreamDedup(str(bucket), engine=engine, fetch_workers=4, compute_workers=2)
+        try:
+            return {r.listing: r async for r in pipeline.run(folder_ids)}
+        finally:
+            pipeline.close()
+    return asyncio.run(_collect())
+
+
+def test_stream_matches_local_run(bucket):
+    results = _stream(bucket, ["L0", "L1"])
+    for listing, res in results.items():
+        assert not res.error
+        files = sorted((bucket / listing / "processed").glob("*.jpg"))
+        assert res.images == len(files)
+        local = engine.remove_near_duplicates([[str(p)] for p in files], deduplication_flag=1,
+                                              metadata_dict={}, experiment_logger=False)
+        assert sorted(Path(k).name for k in res.kept) == sorted(Path(g[0]).name for g in local)
+        assert not _cached_keys() & set(res.kept + res.dropped)     # released after the listing
+
+
+def test_failed_listing_still_releases_caches(bucket, monkeypatch):
+    pipeline = StreamDedup(str(bucket), engine=engine, fetch_workers=2, compute_workers=1)
+    keys = [o.key for o in pipeline.store.list_objects("L1/processed/")]
+    real = pipeline.store.get_bytes
+
+    def get_bytes(key, *args):
+        if key == keys[-1]:
+            raise FileNotFoundError(key)
+        return real(key, *args)
+
+    monkeypatch.setattr(pipeline.store, "get_bytes", get_bytes)
+    try:
+        res = asyncio.run(pipeline.run_listing("L1"))
+    finally:
+        pipeline.close()
+    assert keys[-1] in res.error
+    assert res.kept == [] and res.images == len(keys)
+    assert not _cached_keys() & set(keys)
@@ -0,0 +1,21 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pair_metric_matrix import PairMetricMatrix
+from weight_search import PairSetEvaluator, engine_config, random_search
+
+MATRIX = PairMetricMatrix.from_rows([
+    {"mtb": 95, "ssim": 90, "clip": 96, "pdq_hd": 8, "sift": 150, "label": 1},
+    {"mtb": 40, "ssim": 30, "clip": 50, "pdq_hd": 140, "sift": 5, "label": 0},
+])
+
+
+def test_random_search_keeps_start_sift_override(fake_engine):
+    start = engine_config(fake_engine(MTB_HARD_FLOOR=60.0, PDQ_HD_CEIL=120,
+                                      SIFT_OVERRIDE_MULT=3.0, SIFT_OVERRIDE_CLIP=92.0))
+    results = random_search(PairSetEvaluator(MATRIX), trials=5, workers=1, start=start)
+    assert len(results) == 6
+    for r in results:
+        for group in ("regular", "aerial"):
+            assert (r.config[group]["sift_override_mult"], r.config[group]["sift_override_clip"]) == (3.0, 92.0)
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 """
 Create visualizations for SIFT >= 150 analysis results
+
+With --store DIR the duplicate groups come from a result store (see
+result_store.py, re-evaluated as reanalyze_with_sift150.py does) instead of
+being parsed back out of the _greatersift.md report.
 """
 import sys
 import re
@@ -201,9 +205,51 @@ def process_folder(folder_path):
 
     print(f"[OK] Completed: {folder_name}")
 
+def groups_from_store(store_root, run_id=None):
+    """Duplicate groups per listing from a result store → {listing: {kept: [duplicates]}}"""
+    from reanalyze_with_sift150 import comparisons_from_store, evaluate_with_sift150
+
+    out = {}
+    for listing, (comparisons, _total) in comparisons_from_store(store_root, run_id).items():
+        duplicate_groups, all_kept_images = evaluate_with_sift150(comparisons)
+        out[listing] = {kept: [c['duplicate'] for c in duplicate_groups.get(kept, [])]
+                        for kept in all_kept_images}
+    return out
+
+def visualize_store(store_root, run_id=None):
+    """Visualize every listing of a result-store run; reports are updated where reanalysis wrote them"""
+    for listing, duplicate_groups in groups_from_store(store_root, run_id).items():
+        folder = Path(listing)
+        if not duplicate_groups:
+            print(f"{folder.name}: no duplicate pairs, nothing to draw")
+            continue
+        if not folder.exists():
+            print(f"Warning: listing folder not found: {folder}")
+            continue
+        print(f"{folder.name}: {len(duplicate_groups)} duplicate groups (from store)")
+        viz_filename = f"{folder.name}_duplicates_sift150.jpg"
+        create_visualization(folder, duplicate_groups, viz_filename)
+        md_path = folder / f"{folder.name}_greatersift.md"
+        if md_path.exists():
+            update_markdown_with_visualization(md_path, viz_filename)
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        folders = sys.argv[1:]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Visualize SIFT >= 150 duplicate groups")
+    parser.add_argument("folders", nargs="*", help="Folders with <name>_greatersift.md reports")
+    parser.add_argument("--store", type=str, default=None,
+                        help="Read duplicate groups from a result store instead of markdown")
+    parser.add_argument("--run-id", type=str, default=None,
+                        help="Store run to visualize (default: latest)")
+    args = parser.parse_args()
+
+    if args.store:
+        visualize_store(args.store, args.run_id)
+        sys.exit(0)
+
+    if args.folders:
+        folders = args.folders
     else:
         folders = [
             r"000fc774-cb56-4052-a33a-9974c58a00d6",
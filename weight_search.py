@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+weight_search.py – weight/threshold tuning over cached, labelled pair metrics
+
+Replaces the manual iterate-and-rerun loop recorded in
+weight_optimization_changes.md.  Works on a PairMetricMatrix (see
+pair_metric_matrix.py) whose pairs carry labels (1 duplicate, 0 distinct) and
+jointly searches, for regular and aerial pairs separately:
+
+    WEIGHT_MTB/SSIM/CLIP/PDQ/SIFT  (on the simplex, sum = 1)
+    COMPOSITE_DUP_THRESHOLD, MTB_HARD_FLOOR, PDQ_HD_CEIL, SIFT_MIN_MATCHES
+
+Search strategies:
+    random      Dirichlet weights + uniform thresholds
+    coordinate  greedy coordinate descent from the engine's current config
+    bayes       optuna TPE, multi-objective (optional: pip install optuna)
+
+Candidates are evaluated in parallel on a thread pool; every evaluation is a
+few vectorized numpy passes over the cached metrics.
+
+Each configuration is scored on two objectives:
+    accuracy   correct decisions / labelled pairs           (maximise)
+    sift_rate  fraction of pairs whose decision depends on SIFT, i.e. differs
+               between sift=0 and sift=∞ – the pairs for which the expensive
+               SIFT match cannot be skipped                 (minimise)
+and the report lists the Pareto front of the two.
+
+Usage:
+    python weight_search.py pairs.npz --method coordinate
+    python weight_search.py pairs.npz more_pairs.npz --method random --trials 5000 --workers 8
+    python weight_search.py pairs.npz --method bayes --trials 500 --output search_report.md
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from lazy_imports import lazy_module
+from pair_metric_matrix import METRIC_COLUMNS, WEIGHT_KEYS, PairMetricMatrix, policy_from_engine
+
+optuna = lazy_module("optuna")
+
+logger = logging.getLogger(__name__)
+
+# Search ranges for the scalar knobs (inclusive)
+PARAM_RANGES = {
+    "threshold": (0.20, 0.80),
+    "mtb_floor": (30.0, 80.0),
+    "pdq_ceil": (60.0, 220.0),
+    "sift_min": (20.0, 300.0),
+}
+# Coordinate-descent step per knob (weights use WEIGHT_STEP)
+PARAM_STEPS = {"threshold": 0.02, "mtb_floor": 2.0, "pdq_ceil": 10.0, "sift_min": 10.0}
+WEIGHT_STEP = 0.05
+SIFT_INF = 1e9
+
+
+# ─── evaluation ───────────────────────────────────────────────────────────────
+@dataclass
+class SearchResult:
+    config: Dict[str, Dict[str, Any]]   # {"regular": policy, "aerial": policy}
+    accuracy: float
+    sift_rate: float
+    dropped: int
+
+    def key(self):
+        """Lexicographic objective: accuracy first, then fewer SIFT-dependent pairs."""
+        return (self.accuracy, -self.sift_rate)
+
+
+class PairSetEvaluator:
+    """Scores configurations against a labelled PairMetricMatrix."""
+
+    def __init__(self, matrix: PairMetricMatrix, sift_override: bool = True):
+        if not (matrix.labels >= 0).any():
+            raise ValueError("weight search needs labelled pairs (label 1 = duplicate, 0 = distinct)")
+        self.m = matrix
+        self.sift_override = sift_override
+        sift_col = METRIC_COLUMNS.index("sift")
+        self._no_sift = copy.deepcopy(matrix)
+        self._no_sift.metrics[:, sift_col] = 0.0
+        self._max_sift = copy.deepcopy(matrix)
+        self._max_sift.metrics[:, sift_col] = SIFT_INF
+
+    def _decide(self, m: PairMetricMatrix, config: Dict[str, Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        reg, aer = config["regular"], config["aerial"]
+        return m.evaluate(reg["weights"][None, :], reg, aer, W_aerial=aer["weights"][None, :],
+                          sift_override=self.sift_override)
+
+    def __call__(self, config: Dict[str, Dict[str, Any]]) -> SearchResult:
+        res = self._decide(self.m, config)
+        lo = self._decide(self._no_sift, config)["decisions"][0]
+        hi = self._decide(self._max_sift, config)["decisions"][0]
+        return SearchResult(config, float(res["accuracy"][0]), float(np.mean(lo != hi)),
+                            int(res["dropped"][0]))
+
+    def evaluate_many(self, configs: Sequence[Dict[str, Dict[str, Any]]],
+                      workers: int = 4) -> List[SearchResult]:
+        if workers <= 1:
+            return [self(c) for c in configs]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self, configs))
+
+
+# ─── configuration helpers ────────────────────────────────────────────────────
+def engine_config(engine: Any) -> Dict[str, Dict[str, Any]]:
+    return {"regular": policy_from_engine(engine), "aerial": policy_from_engine(engine, aerial=True)}
+
+
+def _clip_param(name: str, v: float) -> float:
+    lo, hi = PARAM_RANGES[name]
+    return float(min(hi, max(lo, v)))
+
+
+def _normalise(w: np.ndarray) -> np.ndarray:
+    w = np.clip(w, 0.0, None)
+    s = w.sum()
+    return w / s if s > 0 else np.full(len(w), 1.0 / len(w))
+
+
+def random_config(rng: np.random.Generator,
+                  base: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """Random weights and PARAM_RANGES knobs; other keys (SIFT override) come from base."""
+    cfg = {}
+    for group in ("regular", "aerial"):
+        pol = {**(base[group] if base else {}), "weights": rng.dirichlet(np.ones(len(WEIGHT_KEYS)))}
+        for name, (lo, hi) in PARAM_RANGES.items():
+            pol[name] = float(rng.uniform(lo, hi))
+        cfg[group] = pol
+    return cfg
+
+
+def _neighbours(cfg: Dict[str, Dict[str, Any]], groups: Sequence[str]) -> List[Dict[str, Dict[str, Any]]]:
+    """All single-coordinate moves (± one step) from cfg."""
+    out = []
+    for group in groups:
+        for k in range(len(WEIGHT_KEYS)):
+            for sign in (-1, 1):
+                c = copy.deepcopy(cfg)
+                w = c[group]["weights"].copy()
+                w[k] += sign * WEIGHT_STEP
+                c[group]["weights"] = _normalise(w)
+                out.append(c)
+        for name, step in PARAM_STEPS.items():
+            for sign in (-1, 1):
+                c = copy.deepcopy(cfg)
+                c[group][name] = _clip_param(name, c[group][name] + sign * step)
+                out.append(c)
+    return out
+
+
+# ─── strategies ───────────────────────────────────────────────────────────────
+def random_search(ev: PairSetEvaluator, trials: int, seed: int = 0, workers: int = 4,
+                  start: Optional[Dict[str, Dict[str, Any]]] = None) -> List[SearchResult]:
+    rng = np.random.default_rng(seed)
+    configs = ([start] if start else []) + [random_config(rng, start) for _ in range(trials)]
+    return ev.evaluate_many(configs, workers)
+
+
+def coordinate_descent(ev: PairSetEvaluator, start: Dict[str, Dict[str, Any]], max_rounds: int = 50,
+                       workers: int = 4) -> List[SearchResult]:
+    """Greedy: evaluate every ±1-step neighbour in parallel, move to the best, repeat."""
+    groups = ["regular"] + (["aerial"] if ev.m.aerial.any() else [])
+    current = ev(start)
+    history = [current]
+    for rnd in range(max_rounds):
+        cands = ev.evaluate_many(_neighbours(current.config, groups), workers)
+        history.extend(cands)
+        best = max(cands, key=SearchResult.key)
+        if best.key() <= current.key():
+            logger.info("[SEARCH] coordinate descent converged after %d rounds", rnd + 1)
+            break
+        current = best
+        logger.info("[SEARCH] round %d: accuracy=%.3f sift_rate=%.3f",
+                    rnd + 1, current.accuracy, current.sift_rate)
+    return history
+
+
+def bayes_search(ev: PairSetEvaluator, trials: int, seed: int = 0,
+                 start: Optional[Dict[str, Dict[str, Any]]] = None) -> List[SearchResult]:
+    """Multi-objective TPE via optuna (maximise accuracy, minimise sift_rate)."""
+    if not optuna:
+        raise RuntimeError("optuna is not installed (pip install optuna); use --method random/coordinate")
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    results: List[SearchResult] = []
+
+    def objective(trial):
+        cfg = {}
+        for group in ("regular", "aerial"):
+            raw = np.array([trial.suggest_float(f"{group}_w_{k}", 0.0, 1.0) for k in WEIGHT_KEYS])
+            pol = {**(start[group] if start else {}), "weights": _normalise(raw)}
+            for name, (lo, hi) in PARAM_RANGES.items():
+                pol[name] = trial.suggest_float(f"{group}_{name}", lo, hi)
+            cfg[group] = pol
+        r = ev(cfg)
+        results.append(r)
+        return r.accuracy, r.sift_rate
+
+    study = optuna.create_study(directions=["maximize", "minimize"],
+                                sampler=optuna.samplers.TPESampler(seed=seed))
+    if start:
+        study.enqueue_trial({f"{g}_{n}": float(start[g][n]) for g in start for n in PARAM_RANGES} |
+                            {f"{g}_w_{k}": float(start[g]["weights"][i])
+                             for g in start for i, k in enumerate(WEIGHT_KEYS)})
+    study.optimize(objective, n_trials=trials)
+    return results
+
+
+# ─── reporting ────────────────────────────────────────────────────────────────
+def pareto_front(results: Sequence[SearchResult]) -> List[SearchResult]:
+    """Non-dominated results (max accuracy, min sift_rate), sorted by sift_rate."""
+    front: List[SearchResult] = []
+    for r in sorted(results, key=lambda r: (r.sift_rate, -r.accuracy)):
+        if not front or r.accuracy > front[-1].accuracy:
+            front.append(r)
+    return front
+
+
+def _fmt_policy(p: Dict[str, Any]) -> str:
+    w = " / ".join(f"{v:.2f}" for v in p["weights"])
+    return (f"{w} | {p['threshold']:.2f} | {p['mtb_floor']:.0f} | "
+            f"{p['pdq_ceil']:.0f} | {p['sift_min']:.0f}")
+
+
+def config_to_json(cfg: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Engine-constant names → values, ready to paste or load."""
+    out = {}
+    for group, prefix in (("regular", ""), ("aerial", "AERIAL_")):
+        p = cfg[group]
+        for k, v in zip(WEIGHT_KEYS, p["weights"]):
+            out[f"{prefix}WEIGHT_{k.upper()}"] = round(float(v), 4)
+        out[f"{prefix}COMPOSITE_DUP_THRESHOLD"] = round(p["threshold"], 4)
+        out[f"{prefix}MTB_HARD_FLOOR"] = round(p["mtb_floor"], 1)
+        out[f"{prefix}PDQ_HD_CEIL"] = int(round(p["pdq_ceil"]))
+        out[f"{prefix}SIFT_MIN_MATCHES"] = int(round(p["sift_min"]))
+    return out
+
+
+def format_report(method: str, matrix: PairMetricMatrix, results: Sequence[SearchResult],
+                  baseline: SearchResult, elapsed: float, sift_ms: Optional[float] = None) -> str:
+    best = max(results, key=SearchResult.key)
+    front = pareto_front(results)
+    n_lab = int((matrix.labels >= 0).sum())
+    lines = [f"# Weight search ({method})", "",
+             f"**Date:** {time.strftime('%Y-%m-%d %H:%M:%S')}  ",
+             f"**Pairs:** {len(matrix)} ({n_lab} labelled, {int(matrix.aerial.sum())} aerial)  ",
+             f"**Configurations evaluated:** {len(results)} in {elapsed:.1f}s", "",
+             "## Baseline vs best", "",
+             "| Config | Accuracy | SIFT-dependent pairs | Dropped |",
+             "|--------|----------|----------------------|---------|",
+             f"| Current engine | {baseline.accuracy:.3f} | {baseline.sift_rate:.1%} | {baseline.dropped} |",
+             f"| Best found | {best.accuracy:.3f} | {best.sift_rate:.1%} | {best.dropped} |", "",
+             "## Pareto front (accuracy vs SIFT-dependent pairs)", ""]
+    cost_hdr = " Est. SIFT ms/pair |" if sift_ms else ""
+    lines += [f"| Accuracy | SIFT-dependent |{cost_hdr} Regular: weights (MTB/SSIM/CLIP/PDQ/SIFT) | thr | floor | ceil | sift_min |"
+              f" Aerial: weights | thr | floor | ceil | sift_min |",
+              "|" + "---|" * (12 + (1 if sift_ms else 0))]
+    for r in front:
+        cost = f" {r.sift_rate * sift_ms:.0f} |" if sift_ms else ""
+        lines.append(f"| {r.accuracy:.3f} | {r.sift_rate:.1%} |{cost} {_fmt_policy(r.config['regular'])} | "
+                     f"{_fmt_policy(r.config['aerial'])} |")
+    lines += ["", "## Best configuration", "", "```json",
+              json.dumps(config_to_json(best.config), indent=2), "```", ""]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Search weights/thresholds over cached labelled pair metrics")
+    parser.add_argument("matrices", nargs="+", help="PairMetricMatrix .npz files with labels")
+    parser.add_argument("--method", choices=["random", "coordinate", "bayes"], default="coordinate")
+    parser.add_argument("--trials", type=int, default=2000, help="Trials for random/bayes")
+    parser.add_argument("--rounds", type=int, default=50, help="Max rounds for coordinate descent")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel evaluation threads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-sift-override", action="store_true")
+    parser.add_argument("--sift-ms", type=float, default=None,
+                        help="Measured SIFT cost per pair (ms) to express sift_rate as time")
+    parser.add_argument("--output", type=str, default="weight_search_report.md")
+    parser.add_argument("--best-json", type=str, default=None, help="Write the best config as JSON")
+    args = parser.parse_args()
+
+    import deduplication as dedupe
+
+    matrix = PairMetricMatrix.concat([PairMetricMatrix.load(p) for p in args.matrices])
+    ev = PairSetEvaluator(matrix, sift_override=not args.no_sift_override)
+    start = engine_config(dedupe)
+    baseline = ev(start)
+
+    t0 = time.perf_counter()
+    if args.method == "random":
+        results = random_search(ev, args.trials, args.seed, args.workers, start)
+    elif args.method == "coordinate":
+        results = coordinate_descent(ev, start, args.rounds, args.workers)
+    else:
+        results = bayes_search(ev, args.trials, args.seed, start)
+    elapsed = time.perf_counter() - t0
+
+    report = format_report(args.method, matrix, results, baseline, elapsed, args.sift_ms)
+    Path(args.output).write_text(report, encoding="utf-8")
+    print(report)
+    if args.best_json:
+        best = max(results, key=SearchResult.key)
+        Path(args.best_json).write_text(json.dumps(config_to_json(best.config), indent=2), encoding="utf-8")
+    logger.info("Report written to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()